@@ -0,0 +1,359 @@
+# Benchmarks the leaderboard and course metrics completion data against the
+# previous implementation of `get_cohort_completion`, which read every task,
+# question and completion of the cohort on each request.
+#
+# Run from the sensai-ai directory (GOOGLE_CLIENT_ID and OPENAI_API_KEY need to be
+# set, e.g. through src/api/.env):
+#
+#   python experimental/benchmarks/benchmark_cohort_completion.py
+#
+# A throwaway database is created in a temporary directory, so this never touches
+# the real one.
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from statistics import median
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+import api.config
+
+# must be set before the db modules are imported as they bind the path on import
+api.config.sqlite_db_path = os.path.join(tempfile.mkdtemp(), "db.sqlite")
+
+from api.config import (
+    users_table_name,
+    organizations_table_name,
+    cohorts_table_name,
+    user_cohorts_table_name,
+    courses_table_name,
+    course_cohorts_table_name,
+    course_tasks_table_name,
+    tasks_table_name,
+    questions_table_name,
+    task_completions_table_name,
+)
+from api.db import init_db
+from api.db.analytics import get_cohort_completion, get_cohort_completion_counts
+from api.db.completion import completion_cache
+from api.db.task import mark_task_completed
+from api.models import TaskType, TaskStatus
+from api.utils.db import (
+    execute_db_operation,
+    get_new_db_connection,
+    init_db_pool,
+    close_db_pool,
+    JSON_LIST_PLACEHOLDER,
+    serialise_list_to_json,
+)
+
+LEARNER_COUNTS = [50, 500, 1000]
+NUM_LEARNING_MATERIALS = 40
+NUM_QUIZZES = 20
+QUESTIONS_PER_QUIZ = 3
+# the probability that a learner has completed a given task or question
+COMPLETION_RATE = 0.4
+RUNS = 20
+
+
+async def get_cohort_completion_legacy(
+    cohort_id: int, user_ids: List[int], course_id: int = None
+):
+    """The previous implementation, kept here for comparison"""
+    results = defaultdict(dict)
+
+    # Get completed tasks for the users from task_completions_table
+    completed_tasks = await execute_db_operation(
+        f"""
+        SELECT user_id, task_id 
+        FROM {task_completions_table_name}
+        WHERE user_id IN {JSON_LIST_PLACEHOLDER} AND task_id IS NOT NULL
+        """,
+        (serialise_list_to_json(user_ids),),
+        fetch_all=True,
+    )
+    completed_task_ids_for_user = defaultdict(set)
+    for user_id, task_id in completed_tasks:
+        completed_task_ids_for_user[user_id].add(task_id)
+
+    # Get completed questions for the users from task_completions_table
+    completed_questions = await execute_db_operation(
+        f"""
+        SELECT user_id, question_id 
+        FROM {task_completions_table_name}
+        WHERE user_id IN {JSON_LIST_PLACEHOLDER} AND question_id IS NOT NULL
+        """,
+        (serialise_list_to_json(user_ids),),
+        fetch_all=True,
+    )
+    completed_question_ids_for_user = defaultdict(set)
+    for user_id, question_id in completed_questions:
+        completed_question_ids_for_user[user_id].add(question_id)
+
+    # Get all tasks for the cohort
+    # Get learning material tasks
+    query = f"""
+        SELECT DISTINCT t.id
+        FROM {tasks_table_name} t
+        JOIN {course_tasks_table_name} ct ON t.id = ct.task_id
+        JOIN {course_cohorts_table_name} cc ON ct.course_id = cc.course_id
+        WHERE cc.cohort_id = ? AND t.deleted_at IS NULL AND t.type = '{TaskType.LEARNING_MATERIAL}' AND t.status = '{TaskStatus.PUBLISHED}' AND t.scheduled_publish_at IS NULL
+        """
+    params = (cohort_id,)
+
+    if course_id is not None:
+        query += " AND ct.course_id = ?"
+        params += (course_id,)
+
+    learning_material_tasks = await execute_db_operation(
+        query,
+        params,
+        fetch_all=True,
+    )
+
+    for user_id in user_ids:
+        for task in learning_material_tasks:
+            # For learning material, check if it's in the completed tasks list
+            results[user_id][task[0]] = {
+                "is_complete": task[0] in completed_task_ids_for_user[user_id]
+            }
+
+    # Get quiz and exam task questions
+    query = f"""
+        SELECT DISTINCT t.id as task_id, q.id as question_id
+        FROM {tasks_table_name} t
+        JOIN {course_tasks_table_name} ct ON t.id = ct.task_id
+        JOIN {course_cohorts_table_name} cc ON ct.course_id = cc.course_id
+        LEFT JOIN {questions_table_name} q ON t.id = q.task_id AND q.deleted_at IS NULL
+        WHERE cc.cohort_id = ? AND t.deleted_at IS NULL AND t.type = '{TaskType.QUIZ}' AND t.status = '{TaskStatus.PUBLISHED}' AND t.scheduled_publish_at IS NULL{
+            " AND ct.course_id = ?" if course_id is not None else ""
+        } 
+        ORDER BY t.id, q.position ASC
+        """
+    params = (cohort_id,)
+
+    if course_id is not None:
+        params += (course_id,)
+
+    quiz_exam_questions = await execute_db_operation(
+        query,
+        params,
+        fetch_all=True,
+    )
+
+    # Group questions by task_id
+    quiz_exam_tasks = defaultdict(list)
+    for row in quiz_exam_questions:
+        task_id = row[0]
+        question_id = row[1]
+
+        quiz_exam_tasks[task_id].append(question_id)
+
+    for user_id in user_ids:
+        for task_id in quiz_exam_tasks:
+            is_task_complete = True
+            question_completions = []
+
+            for question_id in quiz_exam_tasks[task_id]:
+                is_question_complete = (
+                    question_id in completed_question_ids_for_user[user_id]
+                )
+
+                question_completions.append(
+                    {
+                        "question_id": question_id,
+                        "is_complete": is_question_complete,
+                    }
+                )
+
+                if not is_question_complete:
+                    is_task_complete = False
+
+            results[user_id][task_id] = {
+                "is_complete": is_task_complete,
+                "questions": question_completions,
+            }
+
+    return results
+
+
+
+async def seed(num_learners: int) -> tuple[int, List[int], int]:
+    """Create a cohort of `num_learners` learners with one course and random completions"""
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        slug = f"org-{num_learners}"
+        await cursor.execute(
+            f"INSERT INTO {organizations_table_name} (slug, name) VALUES (?, ?)",
+            (slug, slug),
+        )
+        org_id = cursor.lastrowid
+
+        await cursor.execute(
+            f"INSERT INTO {cohorts_table_name} (name, org_id) VALUES (?, ?)",
+            (slug, org_id),
+        )
+        cohort_id = cursor.lastrowid
+
+        await cursor.execute(
+            f"INSERT INTO {courses_table_name} (org_id, name) VALUES (?, ?)",
+            (org_id, slug),
+        )
+        course_id = cursor.lastrowid
+
+        await cursor.execute(
+            f"INSERT INTO {course_cohorts_table_name} (course_id, cohort_id) VALUES (?, ?)",
+            (course_id, cohort_id),
+        )
+
+        task_ids = defaultdict(list)
+        question_ids = []
+        task_types = [str(TaskType.LEARNING_MATERIAL)] * NUM_LEARNING_MATERIALS + [
+            str(TaskType.QUIZ)
+        ] * NUM_QUIZZES
+
+        for ordering, task_type in enumerate(task_types):
+            await cursor.execute(
+                f"INSERT INTO {tasks_table_name} (org_id, type, title, status) VALUES (?, ?, ?, ?)",
+                (org_id, task_type, f"Task {ordering}", str(TaskStatus.PUBLISHED)),
+            )
+            task_id = cursor.lastrowid
+            task_ids[task_type].append(task_id)
+
+            await cursor.execute(
+                f"INSERT INTO {course_tasks_table_name} (course_id, task_id, ordering) VALUES (?, ?, ?)",
+                (course_id, task_id, ordering),
+            )
+
+            if task_type != str(TaskType.QUIZ):
+                continue
+
+            for position in range(QUESTIONS_PER_QUIZ):
+                await cursor.execute(
+                    f"""INSERT INTO {questions_table_name} (task_id, type, blocks, input_type, response_type, position, is_feedback_shown, title)
+                    VALUES (?, 'objective', '[]', 'text', 'chat', ?, 1, 'Question')""",
+                    (task_id, position),
+                )
+                question_ids.append(cursor.lastrowid)
+
+        await cursor.executemany(
+            f"INSERT INTO {users_table_name} (email) VALUES (?)",
+            [(f"learner-{num_learners}-{index}@example.com",) for index in range(num_learners)],
+        )
+        await cursor.execute(
+            f"SELECT id FROM {users_table_name} WHERE email LIKE ?",
+            (f"learner-{num_learners}-%",),
+        )
+        user_ids = [row[0] for row in await cursor.fetchall()]
+
+        await cursor.executemany(
+            f"INSERT INTO {user_cohorts_table_name} (user_id, cohort_id, role) VALUES (?, ?, 'learner')",
+            [(user_id, cohort_id) for user_id in user_ids],
+        )
+
+        rng = random.Random(num_learners)
+        await cursor.executemany(
+            f"INSERT INTO {task_completions_table_name} (user_id, task_id) VALUES (?, ?)",
+            [
+                (user_id, task_id)
+                for user_id in user_ids
+                for task_id in task_ids[str(TaskType.LEARNING_MATERIAL)]
+                if rng.random() < COMPLETION_RATE
+            ],
+        )
+        await cursor.executemany(
+            f"INSERT INTO {task_completions_table_name} (user_id, question_id) VALUES (?, ?)",
+            [
+                (user_id, question_id)
+                for user_id in user_ids
+                for question_id in question_ids
+                if rng.random() < COMPLETION_RATE
+            ],
+        )
+
+        await conn.commit()
+
+    return cohort_id, user_ids, task_ids[str(TaskType.LEARNING_MATERIAL)][0]
+
+
+async def measure(func, runs: int = RUNS) -> float:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await func()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return median(durations)
+
+
+async def leaderboard_counts_legacy(cohort_id: int, user_ids: List[int]):
+    """What the leaderboard computed from the previous implementation"""
+    task_completions = await get_cohort_completion_legacy(cohort_id, user_ids)
+    return {
+        user_id: sum(
+            task_completion["is_complete"]
+            for task_completion in task_completions[user_id].values()
+        )
+        for user_id in user_ids
+    }
+
+
+async def leaderboard_counts_after_write(
+    cohort_id: int, user_ids: List[int], task_id: int
+):
+    """A learner completes a task, which only invalidates their own row"""
+    await mark_task_completed(task_id, user_ids[0])
+    return await get_cohort_completion_counts(cohort_id, user_ids)
+
+
+async def main():
+    await init_db()
+    await init_db_pool(4, api.config.sqlite_db_path)
+
+    print(
+        f"{'learners':>9} {'legacy ms':>10} {'cold ms':>8} {'cached ms':>10} {'after write ms':>15} {'counts ms':>10}"
+    )
+
+    try:
+        for num_learners in LEARNER_COUNTS:
+            cohort_id, user_ids, task_id = await seed(num_learners)
+
+            completion_cache.clear()
+            legacy = await get_cohort_completion_legacy(cohort_id, user_ids)
+            assert await get_cohort_completion(cohort_id, user_ids) == legacy
+            assert (await get_cohort_completion_counts(cohort_id, user_ids))[
+                1
+            ] == await leaderboard_counts_legacy(cohort_id, user_ids)
+
+            legacy_ms = await measure(
+                lambda: get_cohort_completion_legacy(cohort_id, user_ids)
+            )
+
+            async def cold():
+                completion_cache.clear()
+                await get_cohort_completion(cohort_id, user_ids)
+
+            cold_ms = await measure(cold)
+            cached_ms = await measure(lambda: get_cohort_completion(cohort_id, user_ids))
+            after_write_ms = await measure(
+                lambda: leaderboard_counts_after_write(cohort_id, user_ids, task_id)
+            )
+            counts_ms = await measure(
+                lambda: get_cohort_completion_counts(cohort_id, user_ids)
+            )
+
+            print(
+                f"{num_learners:>9} {legacy_ms:>10.2f} {cold_ms:>8.2f} {cached_ms:>10.2f} {after_write_ms:>15.2f} {counts_ms:>10.2f}"
+            )
+    finally:
+        await close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
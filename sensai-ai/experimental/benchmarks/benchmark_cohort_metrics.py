@@ -0,0 +1,239 @@
+# Benchmarks the vectorized course metrics of `/cohorts/{id}/courses/{course_id}/metrics`
+# against the previous implementation, which looped over nested per-learner dicts.
+#
+# Run from the sensai-ai directory (GOOGLE_CLIENT_ID and OPENAI_API_KEY need to be
+# set, e.g. through src/api/.env):
+#
+#   python experimental/benchmarks/benchmark_cohort_metrics.py
+#
+# Only the computation is measured: the completion data is generated in memory,
+# so no database is needed.
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from statistics import median
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+from fastapi.encoders import jsonable_encoder
+from api.db.completion import CompletionMatrix
+from api.routes.cohort import get_course_metrics
+
+LEARNER_COUNTS = [50, 500, 5000]
+NUM_LEARNING_MATERIALS = 40
+NUM_QUIZZES = 20
+QUESTIONS_PER_QUIZ = 3
+NUM_MILESTONES = 6
+# the probability that a learner has completed a given task or question
+COMPLETION_RATE = 0.6
+ACTIVE_RATE = 0.8
+RUNS = 20
+COURSE_ID = 1
+
+
+def get_course_metrics_legacy(
+    course_data, learner_ids, task_completions, course_attempt_data, course_id
+):
+    """The previous implementation, kept here for comparison"""
+    task_id_to_metadata = {}
+    task_type_counts = defaultdict(int)
+
+    for milestone in course_data["milestones"]:
+        for task in milestone["tasks"]:
+            task_id_to_metadata[task["id"]] = {
+                "milestone_id": milestone["id"],
+                "milestone_name": milestone["name"],
+                "type": task["type"],
+            }
+            task_type_counts[task["type"]] += 1
+
+    num_tasks = len(task_completions[learner_ids[0]])
+
+    if not num_tasks:
+        return {}
+
+    task_type_completions = defaultdict(lambda: defaultdict(int))
+    task_type_completion_rates = defaultdict(list)
+
+    user_data = defaultdict(lambda: defaultdict(int))
+
+    for learner_id in learner_ids:
+        num_tasks_completed = 0
+
+        for task_id, task_completion_data in task_completions[learner_id].items():
+            if task_completion_data["is_complete"]:
+                if task_id not in task_id_to_metadata:
+                    continue
+
+                num_tasks_completed += 1
+                task_type_completions[task_id_to_metadata[task_id]["type"]][
+                    learner_id
+                ] += 1
+
+        user_data[learner_id]["completed"] = num_tasks_completed
+        user_data[learner_id]["completion_percentage"] = num_tasks_completed / num_tasks
+
+        for task_type in task_type_counts.keys():
+            task_type_completion_rates[task_type].append(
+                task_type_completions[task_type][learner_id]
+                / task_type_counts[task_type]
+            )
+
+    is_learner_active = {
+        learner_id: course_attempt_data[learner_id][course_id]["has_attempted"]
+        for learner_id in learner_ids
+    }
+
+    return {
+        "average_completion": np.mean(
+            [
+                user_data[learner_id]["completion_percentage"]
+                for learner_id in learner_ids
+            ]
+        ),
+        "num_tasks": num_tasks,
+        "num_active_learners": sum(is_learner_active.values()),
+        "task_type_metrics": {
+            task_type: {
+                "completion_rate": (
+                    np.mean(task_type_completion_rates[task_type])
+                    if task_type in task_type_completion_rates
+                    else 0
+                ),
+                "count": task_type_counts[task_type],
+                "completions": (
+                    task_type_completions[task_type]
+                    if task_type in task_type_completions
+                    else {learner_id: 0 for learner_id in learner_ids}
+                ),
+            }
+            for task_type in task_type_counts.keys()
+        },
+    }
+
+
+def generate(num_learners: int):
+    rng = random.Random(num_learners)
+
+    learning_material_task_ids = list(range(1, NUM_LEARNING_MATERIALS + 1))
+    quiz_task_ids = list(
+        range(NUM_LEARNING_MATERIALS + 1, NUM_LEARNING_MATERIALS + NUM_QUIZZES + 1)
+    )
+    quiz_questions = [
+        (task_id, task_id * 100 + position)
+        for task_id in quiz_task_ids
+        for position in range(QUESTIONS_PER_QUIZ)
+    ]
+
+    # interleave the task types across the milestones like a real course
+    course_tasks = [
+        {"id": task_id, "type": "learning_material"}
+        for task_id in learning_material_task_ids
+    ] + [{"id": task_id, "type": "quiz"} for task_id in quiz_task_ids]
+    rng.shuffle(course_tasks)
+    course_data = {
+        "milestones": [
+            {
+                "id": index,
+                "name": f"Milestone {index}",
+                "tasks": course_tasks[index::NUM_MILESTONES],
+            }
+            for index in range(NUM_MILESTONES)
+        ]
+    }
+
+    learner_ids = list(range(1, num_learners + 1))
+
+    matrix = CompletionMatrix(
+        [COURSE_ID],
+        learning_material_task_ids + quiz_task_ids,
+        learning_material_task_ids,
+        quiz_questions,
+    )
+    matrix.set_completions(
+        learner_ids,
+        [
+            (learner_id, task_id, None)
+            for learner_id in learner_ids
+            for task_id in learning_material_task_ids
+            if rng.random() < COMPLETION_RATE
+        ]
+        + [
+            (learner_id, None, question_id)
+            for learner_id in learner_ids
+            for _, question_id in quiz_questions
+            # so that a fair share of the quizzes is complete
+            if rng.random() < COMPLETION_RATE ** (1 / QUESTIONS_PER_QUIZ)
+        ],
+    )
+
+    course_attempt_data = {
+        learner_id: {COURSE_ID: {"has_attempted": rng.random() < ACTIVE_RATE}}
+        for learner_id in learner_ids
+    }
+
+    return course_data, learner_ids, matrix, course_attempt_data
+
+
+def measure(func, runs: int = RUNS) -> float:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return median(durations)
+
+
+def main():
+    print(
+        f"{'learners':>9} {'legacy ms':>10} {'legacy loop ms':>15} {'vectorized ms':>14} {'speedup':>8}"
+    )
+
+    for num_learners in LEARNER_COUNTS:
+        course_data, learner_ids, matrix, course_attempt_data = generate(num_learners)
+
+        def legacy(task_completions=None):
+            # the previous route built the nested dicts before looping over them
+            return get_course_metrics_legacy(
+                course_data,
+                learner_ids,
+                task_completions or matrix.to_dict(learner_ids),
+                course_attempt_data,
+                COURSE_ID,
+            )
+
+        def vectorized():
+            return get_course_metrics(
+                course_data,
+                learner_ids,
+                matrix.task_ids,
+                matrix.task_completion(learner_ids),
+                [
+                    course_attempt_data[learner_id][COURSE_ID]["has_attempted"]
+                    for learner_id in learner_ids
+                ],
+            )
+
+        assert json.dumps(jsonable_encoder(vectorized())) == json.dumps(
+            jsonable_encoder(legacy())
+        ), "implementations disagree"
+
+        task_completions = matrix.to_dict(learner_ids)
+
+        legacy_ms = measure(legacy)
+        legacy_loop_ms = measure(lambda: legacy(task_completions))
+        vectorized_ms = measure(vectorized)
+
+        print(
+            f"{num_learners:>9} {legacy_ms:>10.2f} {legacy_loop_ms:>15.2f} {vectorized_ms:>14.2f} {legacy_ms / vectorized_ms:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+# Benchmarks `get_user_courses` against the previous implementation, which issued
+# one query per cohort, one per admin org and one per course.
+#
+# Run from the sensai-ai directory (GOOGLE_CLIENT_ID and OPENAI_API_KEY need to be
+# set, e.g. through src/api/.env):
+#
+#   python experimental/benchmarks/benchmark_get_user_courses.py
+#
+# A throwaway database is created in a temporary directory, so this never touches
+# the real one.
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from statistics import median
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+import api.config
+
+# must be set before the db modules are imported as they bind the path on import
+api.config.sqlite_db_path = os.path.join(tempfile.mkdtemp(), "db.sqlite")
+
+from api.config import (
+    users_table_name,
+    organizations_table_name,
+    user_organizations_table_name,
+    cohorts_table_name,
+    user_cohorts_table_name,
+    courses_table_name,
+    course_cohorts_table_name,
+    group_role_learner,
+)
+from api.db import init_db
+from api.db.course import (
+    get_user_courses,
+    get_courses_for_cohort,
+    get_all_courses_for_org,
+    convert_course_db_to_dict,
+)
+from api.db.user import get_user_cohorts, get_user_organizations
+from api.utils.db import (
+    get_new_db_connection,
+    get_read_db_connection,
+    init_db_pool,
+    close_db_pool,
+)
+from api.utils.query_profiler import query_profiler
+
+# number of cohorts the benchmarked user is a member of
+MEMBERSHIP_COUNTS = [1, 5, 10, 25, 50, 100]
+COURSES_PER_COHORT = 3
+COURSES_PER_ORG = 5
+# the user is an admin in one org for every `COHORTS_PER_ADMIN_ORG` cohorts
+COHORTS_PER_ADMIN_ORG = 5
+# memberships of other users, so that the indexes are actually exercised
+BACKGROUND_USERS = 2000
+RUNS = 50
+
+
+async def get_user_courses_legacy(user_id: int, query_counter: list):
+    """The previous implementation, kept here for comparison"""
+    async with get_read_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        user_cohorts = await get_user_cohorts(user_id)
+        query_counter[0] += 1
+
+        course_roles = {}
+        course_to_cohort = {}
+
+        for cohort in user_cohorts:
+            cohort_courses = await get_courses_for_cohort(cohort["id"])
+            query_counter[0] += 1
+
+            for course in cohort_courses:
+                course_to_cohort[course["id"]] = cohort["id"]
+
+                if course["id"] not in course_roles or course_roles[
+                    course["id"]
+                ] not in ["admin", "owner"]:
+                    course_roles[course["id"]] = cohort["role"]
+
+        user_orgs = await get_user_organizations(user_id)
+        query_counter[0] += 1
+
+        for org in user_orgs:
+            if org["role"] not in ["admin", "owner"]:
+                continue
+
+            org_courses = await get_all_courses_for_org(org["id"])
+            query_counter[0] += 1
+
+            for course in org_courses:
+                course_roles[course["id"]] = "admin"
+
+        courses = []
+        for course_id, role in course_roles.items():
+            await cursor.execute(
+                f"SELECT c.id, c.name, o.id, o.name, o.slug FROM {courses_table_name} c JOIN {organizations_table_name} o ON c.org_id = o.id WHERE c.id = ?",
+                (course_id,),
+            )
+            query_counter[0] += 1
+
+            course_row = await cursor.fetchone()
+            if course_row:
+                course_dict = convert_course_db_to_dict(course_row)
+                course_dict["role"] = role
+
+                if role == group_role_learner:
+                    course_dict["cohort_id"] = course_to_cohort[course_id]
+
+                courses.append(course_dict)
+
+        return courses
+
+
+async def seed(membership_count: int) -> int:
+    """Create a user that is part of `membership_count` cohorts and return its id"""
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        await cursor.execute(
+            f"INSERT INTO {users_table_name} (email) VALUES (?)",
+            (f"benchmark-{membership_count}@example.com",),
+        )
+        user_id = cursor.lastrowid
+
+        num_admin_orgs = membership_count // COHORTS_PER_ADMIN_ORG
+        org_ids = []
+        for index in range(max(num_admin_orgs, 1)):
+            slug = f"org-{membership_count}-{index}"
+            await cursor.execute(
+                f"INSERT INTO {organizations_table_name} (slug, name) VALUES (?, ?)",
+                (slug, slug),
+            )
+            org_ids.append(cursor.lastrowid)
+
+        for org_id in org_ids[:num_admin_orgs]:
+            await cursor.execute(
+                f"INSERT INTO {user_organizations_table_name} (user_id, org_id, role) VALUES (?, ?, 'admin')",
+                (user_id, org_id),
+            )
+            for index in range(COURSES_PER_ORG):
+                await cursor.execute(
+                    f"INSERT INTO {courses_table_name} (org_id, name) VALUES (?, ?)",
+                    (org_id, f"Org course {index}"),
+                )
+
+        for index in range(membership_count):
+            org_id = org_ids[index % len(org_ids)]
+            await cursor.execute(
+                f"INSERT INTO {cohorts_table_name} (name, org_id) VALUES (?, ?)",
+                (f"Cohort {index}", org_id),
+            )
+            cohort_id = cursor.lastrowid
+
+            role = "learner" if index % 4 else "mentor"
+            await cursor.execute(
+                f"INSERT INTO {user_cohorts_table_name} (user_id, cohort_id, role) VALUES (?, ?, ?)",
+                (user_id, cohort_id, role),
+            )
+
+            for course_index in range(COURSES_PER_COHORT):
+                await cursor.execute(
+                    f"INSERT INTO {courses_table_name} (org_id, name) VALUES (?, ?)",
+                    (org_id, f"Cohort course {course_index}"),
+                )
+                await cursor.execute(
+                    f"INSERT INTO {course_cohorts_table_name} (course_id, cohort_id) VALUES (?, ?)",
+                    (cursor.lastrowid, cohort_id),
+                )
+
+        await conn.commit()
+
+    return user_id
+
+
+async def seed_background_users():
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        await cursor.execute(
+            f"INSERT INTO {organizations_table_name} (slug, name) VALUES ('background', 'background')"
+        )
+        org_id = cursor.lastrowid
+
+        await cursor.execute(
+            f"INSERT INTO {cohorts_table_name} (name, org_id) VALUES ('background', ?)",
+            (org_id,),
+        )
+        cohort_id = cursor.lastrowid
+
+        await cursor.executemany(
+            f"INSERT INTO {users_table_name} (email) VALUES (?)",
+            [(f"background-{index}@example.com",) for index in range(BACKGROUND_USERS)],
+        )
+        await cursor.execute(
+            f"""INSERT INTO {user_cohorts_table_name} (user_id, cohort_id, role)
+            SELECT id, ?, 'learner' FROM {users_table_name} WHERE email LIKE 'background-%'""",
+            (cohort_id,),
+        )
+
+        await conn.commit()
+
+
+async def measure(func, runs: int = RUNS) -> float:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await func()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return median(durations)
+
+
+async def main():
+    await init_db()
+    await init_db_pool(4, api.config.sqlite_db_path)
+    await seed_background_users()
+
+    query_profiler.sample_rate = 1.0
+
+    print(
+        f"{'cohorts':>8} {'courses':>8} {'legacy ms':>10} {'legacy queries':>15} {'set-based ms':>13} {'set-based queries':>18} {'speedup':>8}"
+    )
+
+    try:
+        for membership_count in MEMBERSHIP_COUNTS:
+            user_id = await seed(membership_count)
+
+            legacy_queries = [0]
+            legacy_courses = await get_user_courses_legacy(user_id, legacy_queries)
+
+            query_profiler.reset()
+            courses = await get_user_courses(user_id)
+            set_based_queries = sum(
+                query["count"] for query in query_profiler.get_stats()["queries"]
+            )
+
+            assert courses == legacy_courses, "implementations disagree"
+
+            legacy_ms = await measure(
+                lambda: get_user_courses_legacy(user_id, [0])
+            )
+            set_based_ms = await measure(lambda: get_user_courses(user_id))
+
+            print(
+                f"{membership_count:>8} {len(courses):>8} {legacy_ms:>10.2f} {legacy_queries[0]:>15} {set_based_ms:>13.2f} {set_based_queries:>18} {legacy_ms / set_based_ms:>7.1f}x"
+            )
+    finally:
+        await close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
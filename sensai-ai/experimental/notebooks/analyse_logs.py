@@ -1,168 +1,115 @@
 # %%
+import json
 from datetime import datetime
+import pandas as pd
+import requests
 
 # %%
-log_path = "./app.log"
-
-# %%
-logs = open(log_path, "r").read()
-
-# %%
-log_lines = logs.split("\n2025")
-
-# %%
-for index in range(1, len(log_lines)):
-    log_lines[index] = {"log": "2025" + log_lines[index]}
-
-# %%
-log_lines[0] = {"log": log_lines[0]}
-
-# %%
-for line in log_lines:
-    line["datetime"] = datetime.strptime(line["log"].split(",")[0], "%Y-%m-%d %H:%M:%S")
-
-# %%
-relevant_log_lines = [
-    line
-    for line in log_lines
-    if line["datetime"] >= datetime(2025, 1, 28, 9, 30, 0)
-    and line["datetime"] <= datetime(2025, 1, 28, 11, 0, 0)
-]
-
-# %%
-read_queries = [line for line in relevant_log_lines if "SELECT" in line["log"]]
-
-# %%
-len(read_queries)
-
-# %%
-write_queries = [line for line in relevant_log_lines if "INSERT" in line["log"]]
-
-# %%
-other_queries = [
-    line
-    for line in relevant_log_lines
-    if "SELECT" not in line["log"] and "INSERT" not in line["log"]
-    # and "UPDATE" not in line["log"]
-    # and "DELETE" not in line["log"]
-    and "BEGIN" not in line["log"]
-    and "COMMIT" not in line["log"]
-    and "You are" not in line["log"]
-    and "Task:\n" not in line["log"]
-]
-
-# %%
-len(other_queries)
-
-# %%
-time_diffs = [
-    relevant_log_lines[index]["datetime"] - relevant_log_lines[index - 1]["datetime"]
-    for index in range(1, len(relevant_log_lines))
-]
+# The backend keeps a sampled profile of every SQL statement it runs, grouped by
+# statement fingerprint. Either fetch it from a running backend or load a snapshot
+# saved earlier with `curl <backend_url>/admin/db/query_stats > query_stats.json`.
+backend_url = "http://localhost:8001"
+query_stats_path = None  # e.g. "./query_stats.json"
 
 # %%
-import sqlite3
+if query_stats_path:
+    query_stats = json.load(open(query_stats_path, "r"))
+else:
+    query_stats = requests.get(f"{backend_url}/admin/db/query_stats").json()
 
+print(
+    f"Profile since {query_stats['since']} with a sample rate of {query_stats['sample_rate']}"
+)
 
 # %%
-# %%
-def extract_query(log_line):
-    """Extract the SQL query from a log line"""
-    # Assuming the query is after a comma in the log
-    return log_line["log"].split("Executing operation:")[-1].strip()
+queries = pd.DataFrame(query_stats["queries"])
 
+# counts are sampled, so scale them back up to estimate the real volume
+queries["estimated_count"] = queries["count"] / query_stats["sample_rate"]
+queries["rows_per_query"] = queries["rows"] / queries["count"]
 
 # %%
-def measure_query_times(queries, db_path="./db.sqlite.prod"):
-    """Run queries and measure their execution times"""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    results = []
-    for query_line in queries:
-        query = extract_query(query_line)
+bucket_bounds = query_stats["histogram_buckets_ms"] + [float("inf")]
 
-        # Start timing
-        cursor.execute("SELECT sqlite_version()")  # Warm up connection
-        start_time = datetime.now()
 
-        # Execute query
-        cursor.execute(query)
+def histogram_percentile(histogram: dict, percentile: float) -> float:
+    """Upper bound of the histogram bucket containing the given percentile"""
+    counts = list(histogram.values())
+    target = sum(counts) * percentile / 100
 
-        # End timing
-        end_time = datetime.now()
-        execution_time = (end_time - start_time).total_seconds()
+    cumulative = 0
+    for bound, count in zip(bucket_bounds, counts):
+        cumulative += count
+        if cumulative >= target:
+            return bound
 
-        results.append(
-            {
-                "query": query,
-                "execution_time": execution_time,
-                "timestamp": query_line["datetime"],
-            }
-        )
+    return bucket_bounds[-1]
 
-    conn.close()
-    return results
 
+for percentile in [50, 90, 95, 99]:
+    queries[f"p{percentile}_ms"] = queries["histogram"].apply(
+        lambda histogram: histogram_percentile(histogram, percentile)
+    )
 
-print(len(read_queries))
 # %%
-# read_query_times = measure_query_times(read_queries)
-
-# %%
-# times = [time["execution_time"] for time in read_query_times]
-
-# %%
-import numpy as np
-
-# Calculate percentiles
-# p90 = np.percentile(times, 90)
-# p95 = np.percentile(times, 95)
-# p99 = np.percentile(times, 99)
-
-# print(f"P90: {p90:.3f}s")
-# print(f"P95: {p95:.3f}s")
-# print(f"P99: {p99:.3f}s")
+# where the database time goes
+queries.sort_values("total_ms", ascending=False)[
+    [
+        "fingerprint",
+        "estimated_count",
+        "mean_ms",
+        "p50_ms",
+        "p95_ms",
+        "p99_ms",
+        "max_ms",
+        "rows_per_query",
+    ]
+].head(20)
 
 # %%
+read_queries = queries[queries["fingerprint"].str.match(r"(?i)^\s*(SELECT|WITH)")]
+write_queries = queries[~queries.index.isin(read_queries.index)]
 
+print(f"Read time: {read_queries['total_ms'].sum():.1f}ms")
+print(f"Write time: {write_queries['total_ms'].sum():.1f}ms")
 
 # %%
-write_query_times = measure_query_times(write_queries)
+slow_queries = pd.DataFrame(query_stats["slow_queries"])
+slow_queries
 
 # %%
+# Slow queries are also written to the log as JSON, which survives restarts
+log_path = "./app.log"
 
-print(len(write_query_times))
-times = [time["execution_time"] for time in write_query_times]
-
-# %%
-import numpy as np
-
-# Calculate percentiles
-p90 = np.percentile(times, 90)
-p95 = np.percentile(times, 95)
-p99 = np.percentile(times, 99)
-
-print(f"P90: {p90:.3f}s")
-print(f"P95: {p95:.3f}s")
-print(f"P99: {p99:.3f}s")
 
-# %%
+def load_slow_queries_from_log(log_path: str) -> pd.DataFrame:
+    slow_queries = []
 
+    for line in open(log_path, "r"):
+        if "Slow query: " not in line:
+            continue
 
-# %%
+        slow_queries.append(json.loads(line.split("Slow query: ", 1)[1]))
 
+    slow_queries = pd.DataFrame(slow_queries)
+    if not slow_queries.empty:
+        slow_queries["timestamp"] = pd.to_datetime(slow_queries["timestamp"])
 
-# %%
+    return slow_queries
 
 
 # %%
-
+logged_slow_queries = load_slow_queries_from_log(log_path)
 
 # %%
-
+relevant_slow_queries = logged_slow_queries[
+    (logged_slow_queries["timestamp"] >= pd.Timestamp(datetime(2025, 1, 28, 4, 0, 0), tz="UTC"))
+    & (logged_slow_queries["timestamp"] <= pd.Timestamp(datetime(2025, 1, 28, 5, 30, 0), tz="UTC"))
+]
 
 # %%
-
+relevant_slow_queries.groupby("fingerprint")["duration_ms"].describe(
+    percentiles=[0.9, 0.95, 0.99]
+).sort_values("count", ascending=False)
 
 # %%
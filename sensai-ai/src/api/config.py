@@ -54,6 +54,10 @@ course_generation_jobs_table_name = "course_generation_jobs"
 task_generation_jobs_table_name = "task_generation_jobs"
 org_api_keys_table_name = "org_api_keys"
 code_drafts_table_name = "code_drafts"
+daily_activity_table_name = "daily_activity"
+routing_decisions_table_name = "routing_decisions"
+semantic_cache_table_name = "semantic_cache"
+generation_events_table_name = "generation_events"
 
 UPLOAD_FOLDER_NAME = "uploads"
 
@@ -66,4 +70,5 @@ openai_plan_to_model_name = {
     "text-mini": "gpt-4.1-mini-2025-04-14",
     "audio": "gpt-4o-audio-preview-2024-12-17",
     "router": "gpt-4.1-mini-2025-04-14",
+    "embedding": "text-embedding-3-small",
 }
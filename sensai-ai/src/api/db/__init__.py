@@ -27,7 +27,12 @@ from api.config import (
     task_generation_jobs_table_name,
     org_api_keys_table_name,
     code_drafts_table_name,
+    daily_activity_table_name,
+    routing_decisions_table_name,
+    semantic_cache_table_name,
+    generation_events_table_name,
 )
+from api.db.activity import rebuild_daily_activity
 
 
 async def create_organizations_table(cursor):
@@ -358,14 +363,6 @@ async def create_chat_history_table(cursor):
                 )"""
     )
 
-    await cursor.execute(
-        f"""CREATE INDEX IF NOT EXISTS idx_chat_history_user_id ON {chat_history_table_name} (user_id)"""
-    )
-
-    await cursor.execute(
-        f"""CREATE INDEX IF NOT EXISTS idx_chat_history_question_id ON {chat_history_table_name} (question_id)"""
-    )
-
 
 async def create_task_completion_table(cursor):
     await cursor.execute(
@@ -383,10 +380,6 @@ async def create_task_completion_table(cursor):
             )"""
     )
 
-    await cursor.execute(
-        f"""CREATE INDEX IF NOT EXISTS idx_task_completion_user_id ON {task_completions_table_name} (user_id)"""
-    )
-
     await cursor.execute(
         f"""CREATE INDEX IF NOT EXISTS idx_task_completion_task_id ON {task_completions_table_name} (task_id)"""
     )
@@ -462,6 +455,202 @@ async def create_code_drafts_table(cursor):
     )
 
 
+async def create_daily_activity_table(cursor):
+    # one row per day on which a member of a cohort was active in one of its courses,
+    # with the length of the streak of consecutive active days ending on that day
+    await cursor.execute(
+        f"""CREATE TABLE IF NOT EXISTS {daily_activity_table_name} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                cohort_id INTEGER NOT NULL,
+                ist_date DATE NOT NULL,
+                streak INTEGER NOT NULL DEFAULT 1,
+                UNIQUE(cohort_id, user_id, ist_date),
+                FOREIGN KEY (user_id) REFERENCES {users_table_name}(id) ON DELETE CASCADE,
+                FOREIGN KEY (cohort_id) REFERENCES {cohorts_table_name}(id) ON DELETE CASCADE
+            )"""
+    )
+
+
+async def create_routing_decisions_table(cursor):
+    # whether the chat router picked the reasoning model for a question, for the
+    # content of the question and the number of turns the chat had at the time
+    await cursor.execute(
+        f"""CREATE TABLE IF NOT EXISTS {routing_decisions_table_name} (
+                question_id INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                turn_bucket INTEGER NOT NULL,
+                use_reasoning_model BOOLEAN NOT NULL,
+                last_used_at REAL NOT NULL,
+                PRIMARY KEY (question_id, content_hash, turn_bucket),
+                FOREIGN KEY (question_id) REFERENCES {questions_table_name}(id) ON DELETE CASCADE
+            )"""
+    )
+
+    # least recently used decisions are evicted first
+    await cursor.execute(
+        f"""CREATE INDEX IF NOT EXISTS idx_routing_decisions_last_used_at ON {routing_decisions_table_name} (last_used_at)"""
+    )
+
+
+async def create_semantic_cache_table(cursor):
+    # responses to learning material chats, looked up by the similarity of the
+    # embedding of the (rewritten) query of the student to those of earlier ones
+    await cursor.execute(
+        f"""CREATE TABLE IF NOT EXISTS {semantic_cache_table_name} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                org_id INTEGER NOT NULL,
+                task_id INTEGER NOT NULL,
+                material_hash TEXT NOT NULL,
+                query_embedding BLOB NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                FOREIGN KEY (org_id) REFERENCES {organizations_table_name}(id) ON DELETE CASCADE,
+                FOREIGN KEY (task_id) REFERENCES {tasks_table_name}(id) ON DELETE CASCADE
+            )"""
+    )
+
+    await cursor.execute(
+        f"""CREATE INDEX IF NOT EXISTS idx_semantic_cache_org_id_task_id_material_hash ON {semantic_cache_table_name} (org_id, task_id, material_hash, created_at)"""
+    )
+
+    # expired responses are deleted across all tasks
+    await cursor.execute(
+        f"""CREATE INDEX IF NOT EXISTS idx_semantic_cache_created_at ON {semantic_cache_table_name} (created_at)"""
+    )
+
+
+async def create_generation_events_table(cursor):
+    # the progress of generation jobs run by separate workers, for the API
+    # processes to relay to the websockets of the course
+    await cursor.execute(
+        f"""CREATE TABLE IF NOT EXISTS {generation_events_table_name} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                course_id INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+    )
+
+    await cursor.execute(
+        f"""CREATE INDEX IF NOT EXISTS idx_generation_events_created_at ON {generation_events_table_name} (created_at)"""
+    )
+
+
+async def add_composite_indexes(cursor):
+    # chat history is read per learner in time order (activity, chat history)
+    # and per question and learner (the chat of a question)
+    await cursor.execute(
+        f"""CREATE INDEX IF NOT EXISTS idx_chat_history_user_id_created_at ON {chat_history_table_name} (user_id, created_at)"""
+    )
+    await cursor.execute(
+        f"""CREATE INDEX IF NOT EXISTS idx_chat_history_question_id_user_id ON {chat_history_table_name} (question_id, user_id)"""
+    )
+
+    # covers the completion reads of a set of learners without touching the table
+    await cursor.execute(
+        f"""CREATE INDEX IF NOT EXISTS idx_task_completion_user_id_task_id ON {task_completions_table_name} (user_id, task_id, question_id)"""
+    )
+
+    # every lookup that used these is served by a prefix of the indexes above
+    await cursor.execute("DROP INDEX IF EXISTS idx_chat_history_user_id")
+    await cursor.execute("DROP INDEX IF EXISTS idx_chat_history_question_id")
+    await cursor.execute("DROP INDEX IF EXISTS idx_task_completion_user_id")
+
+
+async def add_generation_job_leases(cursor):
+    for table_name in [
+        course_generation_jobs_table_name,
+        task_generation_jobs_table_name,
+    ]:
+        # see `api.db.job_queue`; the jobs started before this are claimable at once
+        await cursor.execute(
+            f"ALTER TABLE {table_name} ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+        )
+        await cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN locked_by TEXT")
+        await cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN locked_until REAL")
+        await cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN last_error TEXT")
+
+    await cursor.execute(
+        f"""CREATE INDEX IF NOT EXISTS idx_course_generation_job_status_locked_until ON {course_generation_jobs_table_name} (status, locked_until)"""
+    )
+    await cursor.execute(
+        f"""CREATE INDEX IF NOT EXISTS idx_task_generation_job_status_locked_until ON {task_generation_jobs_table_name} (status, locked_until)"""
+    )
+
+
+async def add_chat_history_org_id(cursor):
+    # the org of a message, which is that of the task of its question, so that
+    # the history of an org is read along an index instead of across every org
+    await cursor.execute(
+        f"ALTER TABLE {chat_history_table_name} ADD COLUMN org_id INTEGER"
+    )
+    await cursor.execute(
+        f"""UPDATE {chat_history_table_name} SET org_id = (
+            SELECT task.org_id FROM {questions_table_name} question
+            INNER JOIN {tasks_table_name} task ON question.task_id = task.id
+            WHERE question.id = {chat_history_table_name}.question_id
+        )"""
+    )
+    await cursor.execute(
+        f"""CREATE INDEX IF NOT EXISTS idx_chat_history_org_id_id ON {chat_history_table_name} (org_id, id)"""
+    )
+
+
+# migration `i` takes the schema from `PRAGMA user_version` i to i + 1, so new
+# migrations must only ever be appended; the tables created above are version 0
+schema_migrations = [
+    add_composite_indexes,
+    add_generation_job_leases,
+    add_chat_history_org_id,
+]
+
+
+async def run_schema_migrations(conn):
+    """
+    Runs the migrations the database has not had yet, each in a transaction of
+    its own along with the bump of `user_version`, so that a failed migration
+    leaves the database as it was before that migration and is retried on the
+    next start.
+    """
+    cursor = await conn.cursor()
+
+    await cursor.execute("PRAGMA user_version")
+    version = (await cursor.fetchone())[0]
+
+    for next_version, migration in enumerate(
+        schema_migrations[version:], start=version + 1
+    ):
+        # sqlite3 does not open a transaction by itself for DDL statements
+        await cursor.execute("BEGIN")
+
+        try:
+            await migration(cursor)
+            await cursor.execute(f"PRAGMA user_version = {next_version}")
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+
+async def create_daily_activity_table_with_backfill(conn):
+    cursor = await conn.cursor()
+
+    if await check_table_exists(daily_activity_table_name, cursor):
+        return
+
+    await cursor.execute("BEGIN")
+
+    try:
+        await create_daily_activity_table(cursor)
+        # backfill the rollup from the existing activity
+        await rebuild_daily_activity(cursor)
+        await conn.commit()
+    except Exception:
+        await conn.rollback()
+        raise
+
+
 async def init_db():
     # Ensure the database folder exists
     db_folder = os.path.dirname(sqlite_db_path)
@@ -496,6 +685,9 @@ async def init_db():
             await create_course_generation_jobs_table(cursor)
             await create_task_generation_jobs_table(cursor)
             await create_code_drafts_table(cursor)
+            await create_routing_decisions_table(cursor)
+            await create_semantic_cache_table(cursor)
+            await create_generation_events_table(cursor)
 
             await conn.commit()
 
@@ -505,6 +697,11 @@ async def init_db():
                 os.remove(sqlite_db_path)
             raise exception
 
+        # these change the data of an existing database, so a failure must only
+        # roll back their own transaction and never delete the database
+        await create_daily_activity_table_with_backfill(conn)
+        await run_schema_migrations(conn)
+
 
 async def delete_useless_tables():
     from api.config import (
@@ -0,0 +1,137 @@
+from typing import List, Tuple
+from datetime import datetime
+from api.config import (
+    daily_activity_table_name,
+    chat_history_table_name,
+    task_completions_table_name,
+    questions_table_name,
+    course_tasks_table_name,
+    course_cohorts_table_name,
+    user_cohorts_table_name,
+)
+from api.utils.db import (
+    get_new_db_connection,
+    JSON_LIST_PLACEHOLDER,
+    serialise_list_to_json,
+)
+
+# Activity is bucketed by the calendar day in IST, the timezone that streaks are shown in
+IST_DATE_SQL = "DATE(datetime({}, '+5 hours', '+30 minutes'))"
+
+
+def get_record_activity_command(
+    user_id: int,
+    question_id: int | None = None,
+    task_id: int | None = None,
+    created_at: datetime | None = None,
+) -> Tuple[str, Tuple]:
+    """
+    Build the statement that records activity by a user on a question (or task) in
+    the daily activity rollup of every cohort the user is a member of that contains
+    it. It is meant to be run in the same transaction as the write that it records.
+
+    The streak of the new day extends the streak of the previous day, so the rollup
+    assumes activity is recorded as it happens. `rebuild_daily_activity` recomputes
+    it from scratch.
+    """
+    if question_id is not None:
+        task_filter = f"ct.task_id = (SELECT task_id FROM {questions_table_name} WHERE id = ?)"
+        task_param = question_id
+    else:
+        task_filter = "ct.task_id = ?"
+        task_param = task_id
+
+    return (
+        f"""
+        INSERT INTO {daily_activity_table_name} (user_id, cohort_id, ist_date, streak)
+        SELECT uc.user_id, uc.cohort_id, activity.ist_date, 1 + COALESCE(
+            (
+                SELECT previous.streak FROM {daily_activity_table_name} previous
+                WHERE previous.cohort_id = uc.cohort_id AND previous.user_id = uc.user_id
+                AND previous.ist_date = DATE(activity.ist_date, '-1 day')
+            ),
+            0
+        )
+        FROM (SELECT {IST_DATE_SQL.format("COALESCE(?, 'now')")} AS ist_date) activity
+        JOIN {user_cohorts_table_name} uc ON uc.user_id = ?
+        WHERE uc.cohort_id IN (
+            SELECT cc.cohort_id FROM {course_cohorts_table_name} cc
+            JOIN {course_tasks_table_name} ct ON ct.course_id = cc.course_id
+            WHERE {task_filter}
+        )
+        ON CONFLICT (cohort_id, user_id, ist_date) DO NOTHING
+        """,
+        (created_at, user_id, task_param),
+    )
+
+
+async def rebuild_daily_activity(
+    cursor,
+    cohort_ids: List[int] | None = None,
+    user_ids: List[int] | None = None,
+):
+    """
+    Recompute the daily activity rollup (and the streak of every day) from the chat
+    history and task completions, optionally only for some cohorts and/or users.
+    Runs on the given cursor so that it is part of the caller's transaction.
+    """
+    filters = ""
+    params = []
+
+    if cohort_ids is not None:
+        filters += f" AND cohort_id IN {JSON_LIST_PLACEHOLDER}"
+        params.append(serialise_list_to_json(cohort_ids))
+
+    if user_ids is not None:
+        filters += f" AND user_id IN {JSON_LIST_PLACEHOLDER}"
+        params.append(serialise_list_to_json(user_ids))
+
+    await cursor.execute(
+        f"DELETE FROM {daily_activity_table_name} WHERE 1=1{filters}", tuple(params)
+    )
+
+    # consecutive days share the same `julianday - row number` value, which makes
+    # each run of consecutive days a group whose row numbers are the streak lengths
+    await cursor.execute(
+        f"""
+        WITH members AS (
+            SELECT user_id, cohort_id FROM {user_cohorts_table_name} WHERE 1=1{filters}
+        ),
+        activity AS (
+            SELECT m.user_id, m.cohort_id, {IST_DATE_SQL.format("ch.created_at")} AS ist_date
+            FROM members m
+            JOIN {course_cohorts_table_name} cc ON cc.cohort_id = m.cohort_id
+            JOIN {course_tasks_table_name} ct ON ct.course_id = cc.course_id
+            JOIN {questions_table_name} q ON q.task_id = ct.task_id
+            JOIN {chat_history_table_name} ch ON ch.question_id = q.id AND ch.user_id = m.user_id
+
+            UNION
+
+            SELECT m.user_id, m.cohort_id, {IST_DATE_SQL.format("tc.created_at")} AS ist_date
+            FROM members m
+            JOIN {course_cohorts_table_name} cc ON cc.cohort_id = m.cohort_id
+            JOIN {course_tasks_table_name} ct ON ct.course_id = cc.course_id
+            JOIN {task_completions_table_name} tc ON tc.task_id = ct.task_id AND tc.user_id = m.user_id
+        ),
+        runs AS (
+            SELECT user_id, cohort_id, ist_date,
+                julianday(ist_date) - ROW_NUMBER() OVER (PARTITION BY user_id, cohort_id ORDER BY ist_date) AS run
+            FROM activity
+        )
+        INSERT INTO {daily_activity_table_name} (user_id, cohort_id, ist_date, streak)
+        SELECT user_id, cohort_id, ist_date,
+            ROW_NUMBER() OVER (PARTITION BY user_id, cohort_id, run ORDER BY ist_date)
+        FROM runs
+        """,
+        tuple(params),
+    )
+
+
+async def refresh_daily_activity(
+    cohort_ids: List[int] | None = None, user_ids: List[int] | None = None
+):
+    """Rebuild the daily activity rollup in a transaction of its own"""
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+        await rebuild_daily_activity(cursor, cohort_ids, user_ids)
+        await conn.commit()
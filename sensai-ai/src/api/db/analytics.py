@@ -1,6 +1,12 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
-from api.utils.db import execute_db_operation
+from datetime import timedelta
+import numpy as np
+from api.utils.db import (
+    execute_db_operation,
+    JSON_LIST_PLACEHOLDER,
+    serialise_list_to_json,
+)
 from api.config import (
     chat_history_table_name,
     questions_table_name,
@@ -8,12 +14,13 @@ from api.config import (
     organizations_table_name,
     task_completions_table_name,
     course_tasks_table_name,
-    course_cohorts_table_name,
     users_table_name,
     user_cohorts_table_name,
+    daily_activity_table_name,
 )
-from api.models import LeaderboardViewType, TaskType, TaskStatus
-from api.db.user import get_user_streak_from_usage_dates
+from api.models import LeaderboardViewType
+from api.db.user import get_current_streak, get_ist_today
+from api.db.completion import get_completion_matrix
 
 
 async def get_usage_summary_by_organization(
@@ -84,124 +91,38 @@ async def get_cohort_completion(
             }
         }
     """
-    results = defaultdict(dict)
-
-    # user_in_cohort = await is_user_in_cohort(user_id, cohort_id)
-    # if not user_in_cohort:
-    #     results[user_id] = {}
-    #     continue
+    matrix = await get_completion_matrix(cohort_id, user_ids, course_id)
+    return defaultdict(dict, matrix.to_dict(user_ids))
 
-    # Get completed tasks for the users from task_completions_table
-    completed_tasks = await execute_db_operation(
-        f"""
-        SELECT user_id, task_id 
-        FROM {task_completions_table_name}
-        WHERE user_id in ({','.join(map(str, user_ids))}) AND task_id IS NOT NULL
-        """,
-        fetch_all=True,
-    )
-    completed_task_ids_for_user = defaultdict(set)
-    for user_id, task_id in completed_tasks:
-        completed_task_ids_for_user[user_id].add(task_id)
 
-    # Get completed questions for the users from task_completions_table
-    completed_questions = await execute_db_operation(
-        f"""
-        SELECT user_id, question_id 
-        FROM {task_completions_table_name}
-        WHERE user_id in ({','.join(map(str, user_ids))}) AND question_id IS NOT NULL
-        """,
-        fetch_all=True,
-    )
-    completed_question_ids_for_user = defaultdict(set)
-    for user_id, question_id in completed_questions:
-        completed_question_ids_for_user[user_id].add(question_id)
-
-    # Get all tasks for the cohort
-    # Get learning material tasks
-    query = f"""
-        SELECT DISTINCT t.id
-        FROM {tasks_table_name} t
-        JOIN {course_tasks_table_name} ct ON t.id = ct.task_id
-        JOIN {course_cohorts_table_name} cc ON ct.course_id = cc.course_id
-        WHERE cc.cohort_id = ? AND t.deleted_at IS NULL AND t.type = '{TaskType.LEARNING_MATERIAL}' AND t.status = '{TaskStatus.PUBLISHED}' AND t.scheduled_publish_at IS NULL
-        """
-    params = (cohort_id,)
-
-    if course_id is not None:
-        query += " AND ct.course_id = ?"
-        params += (course_id,)
-
-    learning_material_tasks = await execute_db_operation(
-        query,
-        params,
-        fetch_all=True,
-    )
+async def get_cohort_task_completion(
+    cohort_id: int, user_ids: List[int], course_id: int = None
+) -> Tuple[List[int], np.ndarray]:
+    """
+    Retrieves the completion data of `get_cohort_completion` as a dense matrix.
 
-    for user_id in user_ids:
-        for task in learning_material_tasks:
-            # For learning material, check if it's in the completed tasks list
-            results[user_id][task[0]] = {
-                "is_complete": task[0] in completed_task_ids_for_user[user_id]
-            }
+    Returns:
+        The IDs of the tasks and a boolean matrix with one row per user (in the
+        order of `user_ids`) and one column per task (in the order of the task IDs).
+    """
+    matrix = await get_completion_matrix(cohort_id, user_ids, course_id)
+    return matrix.task_ids, matrix.task_completion(user_ids)
 
-    # Get quiz and exam task questions
-    query = f"""
-        SELECT DISTINCT t.id as task_id, q.id as question_id
-        FROM {tasks_table_name} t
-        JOIN {course_tasks_table_name} ct ON t.id = ct.task_id
-        JOIN {course_cohorts_table_name} cc ON ct.course_id = cc.course_id
-        LEFT JOIN {questions_table_name} q ON t.id = q.task_id AND q.deleted_at IS NULL
-        WHERE cc.cohort_id = ? AND t.deleted_at IS NULL AND t.type = '{TaskType.QUIZ}' AND t.status = '{TaskStatus.PUBLISHED}' AND t.scheduled_publish_at IS NULL{
-            " AND ct.course_id = ?" if course_id else ""
-        } 
-        ORDER BY t.id, q.position ASC
-        """
-    params = (cohort_id,)
-
-    if course_id is not None:
-        params += (course_id,)
-
-    quiz_exam_questions = await execute_db_operation(
-        query,
-        params,
-        fetch_all=True,
-    )
 
-    # Group questions by task_id
-    quiz_exam_tasks = defaultdict(list)
-    for row in quiz_exam_questions:
-        task_id = row[0]
-        question_id = row[1]
-
-        quiz_exam_tasks[task_id].append(question_id)
-
-    for user_id in user_ids:
-        for task_id in quiz_exam_tasks:
-            is_task_complete = True
-            question_completions = []
-
-            for question_id in quiz_exam_tasks[task_id]:
-                is_question_complete = (
-                    question_id in completed_question_ids_for_user[user_id]
-                )
-
-                question_completions.append(
-                    {
-                        "question_id": question_id,
-                        "is_complete": is_question_complete,
-                    }
-                )
-
-                if not is_question_complete:
-                    is_task_complete = False
-
-            results[user_id][task_id] = {
-                "is_complete": is_task_complete,
-                "questions": question_completions,
-            }
+async def get_cohort_completion_counts(
+    cohort_id: int, user_ids: List[int], course_id: int = None
+) -> Tuple[int, Dict[int, int]]:
+    """
+    Counts the tasks completed by each user in a cohort (or one of its courses)
+    without building the full completion data of `get_cohort_completion`.
 
-    return results
+    Returns:
+        The number of tasks and a dictionary mapping user IDs to the number of
+        tasks they have completed.
+    """
+    matrix = await get_completion_matrix(cohort_id, user_ids, course_id)
+    counts = matrix.count_completed_tasks(user_ids).tolist()
+    return matrix.num_tasks, dict(zip(user_ids, counts))
 
 
 async def get_cohort_course_attempt_data(cohort_learner_ids: List[int], course_id: int):
@@ -238,7 +159,7 @@ async def get_cohort_course_attempt_data(cohort_learner_ids: List[int], course_i
             "has_attempted": False,
         }
 
-    cohort_learner_ids_str = ",".join(map(str, cohort_learner_ids))
+    cohort_learner_ids_json = serialise_list_to_json(cohort_learner_ids)
 
     # Get all learning material tasks attempted for this course
     task_completions = await execute_db_operation(
@@ -246,10 +167,10 @@ async def get_cohort_course_attempt_data(cohort_learner_ids: List[int], course_i
         SELECT DISTINCT tc.user_id
         FROM {task_completions_table_name} tc
         JOIN {course_tasks_table_name} ct ON tc.task_id = ct.task_id
-        WHERE tc.user_id IN ({cohort_learner_ids_str}) AND ct.course_id = ?
+        WHERE tc.user_id IN {JSON_LIST_PLACEHOLDER} AND ct.course_id = ?
         ORDER BY tc.created_at ASC
         """,
-        (course_id,),
+        (cohort_learner_ids_json, course_id),
         fetch_all=True,
     )
 
@@ -265,10 +186,10 @@ async def get_cohort_course_attempt_data(cohort_learner_ids: List[int], course_i
         JOIN {questions_table_name} q ON ch.question_id = q.id
         JOIN {tasks_table_name} t ON q.task_id = t.id
         JOIN {course_tasks_table_name} ct ON t.id = ct.task_id
-        WHERE ch.user_id IN ({cohort_learner_ids_str}) AND ct.course_id = ?
+        WHERE ch.user_id IN {JSON_LIST_PLACEHOLDER} AND ct.course_id = ?
         GROUP BY ch.user_id
         """,
-        (course_id,),
+        (cohort_learner_ids_json, course_id),
         fetch_all=True,
     )
 
@@ -284,14 +205,17 @@ async def get_cohort_course_attempt_data(cohort_learner_ids: List[int], course_i
 async def get_cohort_streaks(
     view: LeaderboardViewType = LeaderboardViewType.ALL_TIME, cohort_id: int = None
 ):
-    # Build date filter based on duration
-    date_filter = ""
+    # Only count the days of the streak that fall in the selected period, with
+    # the period starting on the same IST days as the daily activity rollup
+    window_start = None
+    today = get_ist_today()
     if view == LeaderboardViewType.WEEKLY:
-        date_filter = "AND DATE(datetime(timestamp, '+5 hours', '+30 minutes')) > DATE('now', 'weekday 0', '-7 days')"
+        # monday of the current week
+        window_start = today - timedelta(days=today.weekday())
     elif view == LeaderboardViewType.MONTHLY:
-        date_filter = "AND strftime('%Y-%m', datetime(timestamp, '+5 hours', '+30 minutes')) = strftime('%Y-%m', 'now')"
+        window_start = today.replace(day=1)
 
-    # Get all user interactions, ordered by user and timestamp
+    # the latest day of activity of each learner along with the streak ending on it
     usage_per_user = await execute_db_operation(
         f"""
     SELECT 
@@ -300,36 +224,19 @@ async def get_cohort_streaks(
         u.first_name,
         u.middle_name,
         u.last_name,
-        GROUP_CONCAT(t.created_at) as created_ats
-    FROM {users_table_name} u
-    LEFT JOIN (
-        -- Chat history interactions
-        SELECT user_id, MAX(datetime(created_at, '+5 hours', '+30 minutes')) as created_at
-        FROM {chat_history_table_name}
-        WHERE 1=1 {date_filter} AND question_id IN (SELECT id FROM {questions_table_name} WHERE task_id IN (SELECT task_id FROM {course_tasks_table_name} WHERE course_id IN (SELECT course_id FROM {course_cohorts_table_name} WHERE cohort_id = ?)))
-        GROUP BY user_id, DATE(datetime(created_at, '+5 hours', '+30 minutes'))
-        
-        UNION
-        
-        -- Task completions
-        SELECT user_id, MAX(datetime(created_at, '+5 hours', '+30 minutes')) as created_at
-        FROM {task_completions_table_name}
-        WHERE 1=1 {date_filter} AND task_id IN (
-            SELECT task_id FROM {course_tasks_table_name} 
-            WHERE course_id IN (SELECT course_id FROM {course_cohorts_table_name} WHERE cohort_id = ?)
-        )
-        GROUP BY user_id, DATE(datetime(created_at, '+5 hours', '+30 minutes'))
-        
-        ORDER BY created_at DESC, user_id
-    ) t ON u.id = t.user_id
-    WHERE u.id IN (
-        -- Users who are in the cohort as learners
-        SELECT user_id FROM {user_cohorts_table_name} WHERE cohort_id = ? and role = 'learner'
-       
+        da.ist_date,
+        da.streak
+    FROM {user_cohorts_table_name} uc
+    JOIN {users_table_name} u ON u.id = uc.user_id
+    LEFT JOIN {daily_activity_table_name} da ON da.id = (
+        SELECT id FROM {daily_activity_table_name}
+        WHERE cohort_id = uc.cohort_id AND user_id = uc.user_id
+        ORDER BY ist_date DESC LIMIT 1
     )
-    GROUP BY u.id, u.email, u.first_name, u.middle_name, u.last_name
+    WHERE uc.cohort_id = ? AND uc.role = 'learner'
+    ORDER BY u.id
     """,
-        (cohort_id, cohort_id, cohort_id),
+        (cohort_id,),
         fetch_all=True,
     )
 
@@ -341,16 +248,9 @@ async def get_cohort_streaks(
         user_first_name,
         user_middle_name,
         user_last_name,
-        user_usage_dates_str,
+        last_active_date,
+        streak,
     ) in usage_per_user:
-
-        if user_usage_dates_str:
-            user_usage_dates = user_usage_dates_str.split(",")
-            user_usage_dates = sorted(user_usage_dates, reverse=True)
-            streak_count = len(get_user_streak_from_usage_dates(user_usage_dates))
-        else:
-            streak_count = 0
-
         streaks.append(
             {
                 "user": {
@@ -360,7 +260,9 @@ async def get_cohort_streaks(
                     "middle_name": user_middle_name,
                     "last_name": user_last_name,
                 },
-                "streak_count": streak_count,
+                "streak_count": len(
+                    get_current_streak(last_active_date, streak, window_start)
+                ),
             }
         )
 
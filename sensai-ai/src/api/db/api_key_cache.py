@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from api.settings import settings
+
+
+class ApiKeyCache:
+    """
+    An LRU cache from the SHA-256 hash of a verified API key to the id of its org,
+    whose entries expire `ttl` seconds after they were verified.
+
+    Only keys that verified are cached. Creating a key bumps `version` so that a
+    verification that raced with it is answered but never cached. A key whose
+    row is deleted keeps being accepted until its entry expires.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        # hashed key -> (org id, monotonic time it expires at)
+        self._org_ids: OrderedDict[str, Tuple[int, float]] = OrderedDict()
+
+    def get(self, hashed_key: str) -> Optional[int]:
+        entry = self._org_ids.get(hashed_key)
+
+        if entry is not None and entry[1] <= time.monotonic():
+            del self._org_ids[hashed_key]
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._org_ids.move_to_end(hashed_key)
+        return entry[0]
+
+    def put(self, hashed_key: str, org_id: int, version: int):
+        if version != self.version or self.max_size <= 0 or self.ttl <= 0:
+            return
+
+        self._org_ids[hashed_key] = (org_id, time.monotonic() + self.ttl)
+        self._org_ids.move_to_end(hashed_key)
+
+        while len(self._org_ids) > self.max_size:
+            self._org_ids.popitem(last=False)
+
+    def invalidate_keys(self, hashed_keys: Iterable[str]):
+        """Keys were created"""
+        self.version += 1
+
+        for hashed_key in hashed_keys:
+            self._org_ids.pop(hashed_key, None)
+
+    def clear(self):
+        self.version += 1
+        self._org_ids.clear()
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self._org_ids),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+
+api_key_cache = ApiKeyCache(
+    settings.api_key_cache_size, settings.api_key_cache_ttl_seconds
+)
@@ -1,6 +1,11 @@
-from typing import List, Tuple
-from datetime import datetime
-from api.utils.db import get_new_db_connection, execute_db_operation
+from typing import AsyncIterator, Dict, List, Tuple
+from datetime import datetime, timezone
+from api.utils.db import (
+    execute_db_operation,
+    execute_group_committed_operations,
+    JSON_LIST_PLACEHOLDER,
+    serialise_list_to_json,
+)
 from api.config import (
     chat_history_table_name,
     questions_table_name,
@@ -10,6 +15,8 @@ from api.config import (
 )
 from api.models import StoreMessageRequest, ChatMessage, TaskType
 from api.db.task import get_basic_task_details
+from api.db.activity import get_record_activity_command
+from api.db.completion import completion_cache
 
 
 async def store_messages(
@@ -18,48 +25,61 @@ async def store_messages(
     question_id: int,
     is_complete: bool,
 ):
-    async with get_new_db_connection() as conn:
-        cursor = await conn.cursor()
-
-        new_row_ids = []
-
-        for message in messages:
-            # Insert the new message
-            await cursor.execute(
-                f"""
-            INSERT INTO {chat_history_table_name} (user_id, question_id, role, content, response_type, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
+    commands_and_params = [
+        (
+            f"""
+            INSERT INTO {chat_history_table_name} (user_id, question_id, role, content, response_type, created_at, org_id)
+            VALUES (?, ?, ?, ?, ?, ?, (
+                SELECT task.org_id FROM {questions_table_name} question
+                INNER JOIN {tasks_table_name} task ON question.task_id = task.id
+                WHERE question.id = ?
+            ))
             """,
-                (
-                    user_id,
-                    question_id,
-                    message.role,
-                    message.content,
-                    message.response_type,
-                    message.created_at,
-                ),
-            )
-
-            new_row_id = cursor.lastrowid
-            new_row_ids.append(new_row_id)
+            (
+                user_id,
+                question_id,
+                message.role,
+                message.content,
+                message.response_type,
+                message.created_at,
+                question_id,
+            ),
+        )
+        for message in messages
+    ]
 
-        if is_complete:
-            await cursor.execute(
+    if is_complete:
+        commands_and_params.append(
+            (
                 f"""
                 INSERT INTO {task_completions_table_name} (user_id, question_id)
                 VALUES (?, ?) ON CONFLICT(user_id, question_id) DO NOTHING
                 """,
                 (user_id, question_id),
             )
+        )
+
+    commands_and_params.extend(
+        get_record_activity_command(
+            user_id, question_id=question_id, created_at=message.created_at
+        )
+        for message in messages
+    )
+
+    # may share a transaction with other learners' writes if group commit is enabled
+    row_ids = await execute_group_committed_operations(commands_and_params)
+    new_row_ids = row_ids[: len(messages)]
 
-        await conn.commit()
+    if is_complete:
+        completion_cache.invalidate_users([user_id])
 
     # Fetch the newly inserted row
     new_rows = await execute_db_operation(
         f"""SELECT id, created_at, user_id, question_id, role, content, response_type
     FROM {chat_history_table_name}
-    WHERE id IN ({','.join(map(str, new_row_ids))})
+    WHERE id IN {JSON_LIST_PLACEHOLDER}
     """,
+        (serialise_list_to_json(new_row_ids),),
         fetch_all=True,
     )
 
@@ -78,35 +98,106 @@ async def store_messages(
     ]
 
 
-async def get_all_chat_history(org_id: int):
-    chat_history = await execute_db_operation(
+def get_all_chat_history_query(
+    org_id: int,
+    after_id: int = None,
+    since: datetime = None,
+    limit: int = None,
+) -> Tuple[str, Tuple]:
+    filters = ["message.org_id = ?", "task.deleted_at IS NULL"]
+    params = [org_id]
+
+    # keyset pagination: the next page starts after the last id already seen
+    if after_id is not None:
+        filters.append("message.id > ?")
+        params.append(after_id)
+
+    if since is not None:
+        if since.tzinfo is not None:
+            # created_at is stored in UTC without an offset
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+
+        filters.append("message.created_at >= ?")
+        params.append(since.isoformat(" "))
+
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT ?"
+        params.append(limit)
+
+    # the messages of the org are walked in id order along their (org_id, id)
+    # index, and CROSS JOIN keeps SQLite from starting from the tasks of the org
+    # instead, so rows come out as they are read: a page stops after `limit`
+    # rows and an export never sorts the history of a whole org
+    return (
         f"""
         SELECT message.id, message.created_at, user.id AS user_id, user.email AS user_email, message.question_id, task.id AS task_id, message.role, message.content, message.response_type
         FROM {chat_history_table_name} message
-        INNER JOIN {questions_table_name} question ON message.question_id = question.id
-        INNER JOIN {tasks_table_name} task ON question.task_id = task.id
+        CROSS JOIN {questions_table_name} question ON message.question_id = question.id
+        CROSS JOIN {tasks_table_name} task ON question.task_id = task.id
         INNER JOIN {users_table_name} user ON message.user_id = user.id 
-        WHERE task.deleted_at IS NULL AND task.org_id = ?
-        ORDER BY message.created_at ASC
+        WHERE {" AND ".join(filters)}
+        ORDER BY message.id ASC
+        {limit_clause}
         """,
-        (org_id,),
+        tuple(params),
+    )
+
+
+def convert_org_chat_message_to_dict(row: Tuple) -> Dict:
+    return {
+        "id": row[0],
+        "created_at": row[1],
+        "user_id": row[2],
+        "user_email": row[3],
+        "question_id": row[4],
+        "task_id": row[5],
+        "role": row[6],
+        "content": row[7],
+        "response_type": row[8],
+    }
+
+
+async def get_all_chat_history(
+    org_id: int,
+    after_id: int = None,
+    since: datetime = None,
+    limit: int = None,
+):
+    chat_history = await execute_db_operation(
+        *get_all_chat_history_query(org_id, after_id, since, limit),
         fetch_all=True,
     )
 
-    return [
-        {
-            "id": row[0],
-            "created_at": row[1],
-            "user_id": row[2],
-            "user_email": row[3],
-            "question_id": row[4],
-            "task_id": row[5],
-            "role": row[6],
-            "content": row[7],
-            "response_type": row[8],
-        }
-        for row in chat_history
-    ]
+    return [convert_org_chat_message_to_dict(row) for row in chat_history]
+
+
+async def iterate_all_chat_history(
+    org_id: int,
+    after_id: int = None,
+    since: datetime = None,
+    limit: int = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[List[Dict]]:
+    """
+    Yields the chat history of an org in batches of messages, reading each
+    batch as a page of its own that starts after the last message of the
+    previous one. No connection is held while the caller consumes a batch, so
+    a slow consumer never holds on to a reader or to an open read transaction.
+    """
+    while limit is None or limit > 0:
+        page_size = batch_size if limit is None else min(batch_size, limit)
+        messages = await get_all_chat_history(org_id, after_id, since, page_size)
+
+        if messages:
+            yield messages
+
+        if len(messages) < page_size:
+            return
+
+        after_id = messages[-1]["id"]
+        if limit is not None:
+            limit -= len(messages)
 
 
 def convert_chat_message_to_dict(message: Tuple) -> ChatMessage:
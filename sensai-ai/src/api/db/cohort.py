@@ -7,21 +7,27 @@ from api.config import (
     cohorts_table_name,
     course_cohorts_table_name,
     courses_table_name,
-    tasks_table_name,
     chat_history_table_name,
     user_cohorts_table_name,
     organizations_table_name,
     user_organizations_table_name,
     users_table_name,
+    daily_activity_table_name,
+    questions_table_name,
+    task_completions_table_name,
 )
 from api.utils.db import (
     execute_db_operation,
     execute_many_db_operation,
     execute_multiple_db_operations,
     get_new_db_connection,
+    JSON_LIST_PLACEHOLDER,
+    serialise_list_to_json,
 )
 from api.db.user import insert_or_return_user
 from api.db.course import get_course
+from api.db.activity import rebuild_daily_activity, refresh_daily_activity
+from api.db.completion import completion_cache
 from api.slack import send_slack_notification_for_learner_added_to_cohort
 
 
@@ -53,6 +59,11 @@ async def add_courses_to_cohort(
         values,
     )
 
+    completion_cache.invalidate_cohorts([cohort_id])
+
+    # activity in the new courses now counts towards the streaks in the cohort
+    await refresh_daily_activity(cohort_ids=[cohort_id])
+
 
 async def add_course_to_cohorts(
     course_id: int,
@@ -82,6 +93,10 @@ async def add_course_to_cohorts(
         values,
     )
 
+    completion_cache.invalidate_cohorts(cohort_ids)
+
+    await refresh_daily_activity(cohort_ids=cohort_ids)
+
 
 async def remove_course_from_cohorts(course_id: int, cohort_ids: List[int]):
     await execute_many_db_operation(
@@ -89,6 +104,10 @@ async def remove_course_from_cohorts(course_id: int, cohort_ids: List[int]):
         [(course_id, cohort_id) for cohort_id in cohort_ids],
     )
 
+    completion_cache.invalidate_cohorts(cohort_ids)
+
+    await refresh_daily_activity(cohort_ids=cohort_ids)
+
 
 async def remove_courses_from_cohort(cohort_id: int, course_ids: List[int]):
     await execute_many_db_operation(
@@ -96,6 +115,10 @@ async def remove_courses_from_cohort(cohort_id: int, course_ids: List[int]):
         [(cohort_id, course_id) for course_id in course_ids],
     )
 
+    completion_cache.invalidate_cohorts([cohort_id])
+
+    await refresh_daily_activity(cohort_ids=[cohort_id])
+
 
 async def update_cohort_name(cohort_id: int, name: str):
     await execute_db_operation(
@@ -119,6 +142,10 @@ async def delete_cohort(cohort_id: int):
                 f"DELETE FROM {user_cohorts_table_name} WHERE cohort_id = ?",
                 (cohort_id,),
             ),
+            (
+                f"DELETE FROM {daily_activity_table_name} WHERE cohort_id = ?",
+                (cohort_id,),
+            ),
             (
                 f"DELETE FROM {course_cohorts_table_name} WHERE cohort_id = ?",
                 (cohort_id,),
@@ -130,6 +157,8 @@ async def delete_cohort(cohort_id: int):
         ]
     )
 
+    completion_cache.invalidate_cohorts([cohort_id])
+
 
 def drop_cohorts_table():
     execute_db_operation(f"DROP TABLE IF EXISTS {cohorts_table_name}")
@@ -194,9 +223,9 @@ async def add_members_to_cohort(
         JOIN {user_organizations_table_name} uo ON u.id = uo.user_id
         WHERE uo.org_id = ?
         AND (uo.role = 'admin' OR uo.role = 'owner')
-        AND u.email IN ({','.join(['?' for _ in emails])})
+        AND u.email IN {JSON_LIST_PLACEHOLDER}
         """,
-        (org_id, *emails),
+        (org_id, serialise_list_to_json(emails)),
         fetch_all=True,
     )
 
@@ -218,9 +247,9 @@ async def add_members_to_cohort(
 
         await cursor.execute(
             f"""
-            SELECT 1 FROM {user_cohorts_table_name} WHERE user_id IN ({','.join(['?' for _ in [user["id"] for user in users_to_add]])}) AND cohort_id = ?
+            SELECT 1 FROM {user_cohorts_table_name} WHERE user_id IN {JSON_LIST_PLACEHOLDER} AND cohort_id = ?
             """,
-            (*[user["id"] for user in users_to_add], cohort_id),
+            (serialise_list_to_json(user["id"] for user in users_to_add), cohort_id),
         )
 
         user_exists = await cursor.fetchone()
@@ -242,6 +271,13 @@ async def add_members_to_cohort(
             [(user["id"], cohort_id, role) for user, role in zip(users_to_add, roles)],
         )
 
+        # bring in any earlier activity of the new members in the cohort's courses
+        await rebuild_daily_activity(
+            cursor,
+            cohort_ids=[cohort_id],
+            user_ids=[user["id"] for user in users_to_add],
+        )
+
         await conn.commit()
 
 
@@ -249,9 +285,9 @@ async def remove_members_from_cohort(cohort_id: int, member_ids: List[int]):
     members_in_cohort = await execute_db_operation(
         f"""
         SELECT user_id FROM {user_cohorts_table_name}
-        WHERE cohort_id = ? AND user_id IN ({','.join(['?' for _ in member_ids])})
+        WHERE cohort_id = ? AND user_id IN {JSON_LIST_PLACEHOLDER}
         """,
-        (cohort_id, *member_ids),
+        (cohort_id, serialise_list_to_json(member_ids)),
         fetch_all=True,
     )
 
@@ -263,14 +299,24 @@ async def remove_members_from_cohort(cohort_id: int, member_ids: List[int]):
             (
                 f"""
             DELETE FROM {user_cohorts_table_name}
-            WHERE user_id IN ({','.join(['?' for _ in member_ids])})
+            WHERE user_id IN {JSON_LIST_PLACEHOLDER}
+            AND cohort_id = ?
+            """,
+                (serialise_list_to_json(member_ids), cohort_id),
+            ),
+            (
+                f"""
+            DELETE FROM {daily_activity_table_name}
+            WHERE user_id IN {JSON_LIST_PLACEHOLDER}
             AND cohort_id = ?
             """,
-                (*member_ids, cohort_id),
+                (serialise_list_to_json(member_ids), cohort_id),
             ),
         ]
     )
 
+    completion_cache.forget_members(cohort_id, member_ids)
+
 
 async def get_cohorts_for_org(org_id: int) -> List[Dict]:
     """Get all cohorts that belong to an organization"""
@@ -391,15 +437,17 @@ async def get_cohort_analytics_metrics_for_tasks(cohort_id: int, task_ids: List[
             SELECT
                 cl.id as user_id,
                 cl.email,
-                ch.task_id,
-                MAX(COALESCE(ch.is_solved, 0)) as is_solved
+                q.task_id,
+                MAX(tc.id IS NOT NULL) as is_solved
             FROM cohort_learners cl
             INNER JOIN {chat_history_table_name} ch
                 ON cl.id = ch.user_id
-                AND ch.task_id IN ({','.join('?' * len(task_ids))})
-            INNER JOIN {tasks_table_name} t
-                ON ch.task_id = t.id
-            GROUP BY cl.id, cl.email, ch.task_id, t.name
+            INNER JOIN {questions_table_name} q
+                ON ch.question_id = q.id
+                AND q.task_id IN ({','.join('?' * len(task_ids))})
+            LEFT JOIN {task_completions_table_name} tc
+                ON tc.user_id = cl.id AND tc.task_id = q.task_id
+            GROUP BY cl.id, cl.email, q.task_id
         )
         SELECT
             user_id,
@@ -463,15 +511,15 @@ async def get_cohort_attempt_data_for_tasks(cohort_id: int, task_ids: List[int])
             SELECT 
                 cl.id as user_id,
                 cl.email,
-                ch.task_id,
+                q.task_id,
                 CASE WHEN COUNT(ch.id) > 0 THEN 1 ELSE 0 END as has_attempted
             FROM cohort_learners cl
             INNER JOIN {chat_history_table_name} ch 
                 ON cl.id = ch.user_id 
-                AND ch.task_id IN ({','.join('?' * len(task_ids))})
-            INNER JOIN {tasks_table_name} t
-                ON ch.task_id = t.id
-            GROUP BY cl.id, cl.email, ch.task_id, t.name
+            INNER JOIN {questions_table_name} q
+                ON ch.question_id = q.id
+                AND q.task_id IN ({','.join('?' * len(task_ids))})
+            GROUP BY cl.id, cl.email, q.task_id
         )
         SELECT 
             user_id,
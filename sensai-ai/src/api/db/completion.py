@@ -0,0 +1,421 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from api.config import (
+    tasks_table_name,
+    questions_table_name,
+    course_tasks_table_name,
+    course_cohorts_table_name,
+    task_completions_table_name,
+)
+from api.models import TaskType, TaskStatus
+from api.settings import settings
+from api.utils.db import (
+    execute_db_operation,
+    JSON_LIST_PLACEHOLDER,
+    serialise_list_to_json,
+)
+
+
+class CompletionMatrix:
+    """
+    Which learners have completed which tasks of a cohort (or of one course in it).
+
+    Learning material tasks and quiz questions are the columns of two boolean
+    matrices with one row per learner. A quiz is complete when all of its questions
+    are, which is computed on the fly from the (contiguous) columns of its questions.
+    """
+
+    def __init__(
+        self,
+        course_ids: Iterable[int],
+        linked_task_ids: Iterable[int],
+        learning_material_task_ids: List[int],
+        quiz_questions: List[Tuple[int, Optional[int]]],
+    ):
+        # every course and task (including drafts) that the matrix was built from,
+        # used to tell which edits make it stale
+        self.course_ids = set(course_ids)
+        self.linked_task_ids = set(linked_task_ids)
+
+        self.learning_material_task_ids = learning_material_task_ids
+        self.quiz_task_ids = list(dict.fromkeys(task_id for task_id, _ in quiz_questions))
+        # a quiz without questions has a single `None` question that is never complete
+        self.question_ids = [question_id for _, question_id in quiz_questions]
+
+        self._task_columns = {
+            task_id: index for index, task_id in enumerate(learning_material_task_ids)
+        }
+        self._question_columns = {
+            question_id: index
+            for index, question_id in enumerate(self.question_ids)
+            if question_id is not None
+        }
+
+        quiz_task_index = {task_id: index for index, task_id in enumerate(self.quiz_task_ids)}
+        self._question_task_index = np.array(
+            [quiz_task_index[task_id] for task_id, _ in quiz_questions], dtype=np.int64
+        )
+        # the first question column of every quiz
+        self._quiz_starts = np.searchsorted(
+            self._question_task_index, np.arange(len(self.quiz_task_ids))
+        )
+
+        self._user_rows: Dict[int, int] = {}
+        self._free_rows: List[int] = []
+        self._task_completion = np.zeros(
+            (0, len(learning_material_task_ids)), dtype=bool
+        )
+        self._question_completion = np.zeros((0, len(self.question_ids)), dtype=bool)
+
+    @property
+    def num_tasks(self) -> int:
+        return len(self.learning_material_task_ids) + len(self.quiz_task_ids)
+
+    @property
+    def task_ids(self) -> List[int]:
+        """The tasks in the column order of `task_completion`"""
+        return self.learning_material_task_ids + self.quiz_task_ids
+
+    def copy_structure(self) -> "CompletionMatrix":
+        """A matrix over the same tasks without any learners"""
+        return CompletionMatrix(
+            self.course_ids,
+            self.linked_task_ids,
+            self.learning_material_task_ids,
+            [
+                (self.quiz_task_ids[quiz_index], question_id)
+                for quiz_index, question_id in zip(
+                    self._question_task_index.tolist(), self.question_ids
+                )
+            ],
+        )
+
+    def missing_user_ids(self, user_ids: List[int]) -> List[int]:
+        return [
+            user_id for user_id in dict.fromkeys(user_ids) if user_id not in self._user_rows
+        ]
+
+    def set_completions(
+        self,
+        user_ids: List[int],
+        completions: Iterable[Tuple[int, Optional[int], Optional[int]]],
+    ):
+        """
+        Fill in the rows of the given users from their `(user_id, task_id, question_id)`
+        rows in the task completions table.
+        """
+        rows = self._allocate_rows(user_ids)
+        self._task_completion[rows] = False
+        self._question_completion[rows] = False
+
+        task_cells = ([], [])
+        question_cells = ([], [])
+
+        for user_id, task_id, question_id in completions:
+            row = self._user_rows.get(user_id)
+            if row is None:
+                continue
+
+            if task_id in self._task_columns:
+                task_cells[0].append(row)
+                task_cells[1].append(self._task_columns[task_id])
+
+            if question_id in self._question_columns:
+                question_cells[0].append(row)
+                question_cells[1].append(self._question_columns[question_id])
+
+        self._task_completion[task_cells] = True
+        self._question_completion[question_cells] = True
+
+    def forget_users(self, user_ids: Iterable[int]):
+        for user_id in user_ids:
+            row = self._user_rows.pop(user_id, None)
+            if row is not None:
+                self._free_rows.append(row)
+
+    def _allocate_rows(self, user_ids: List[int]) -> np.ndarray:
+        new_user_ids = self.missing_user_ids(user_ids)
+
+        num_rows_needed = len(new_user_ids) - len(self._free_rows)
+        if num_rows_needed > 0:
+            num_rows = len(self._task_completion)
+            self._task_completion = np.vstack(
+                [
+                    self._task_completion,
+                    np.zeros((num_rows_needed, self._task_completion.shape[1]), dtype=bool),
+                ]
+            )
+            self._question_completion = np.vstack(
+                [
+                    self._question_completion,
+                    np.zeros(
+                        (num_rows_needed, self._question_completion.shape[1]), dtype=bool
+                    ),
+                ]
+            )
+            self._free_rows.extend(range(num_rows, num_rows + num_rows_needed))
+
+        for user_id in new_user_ids:
+            self._user_rows[user_id] = self._free_rows.pop()
+
+        return self._rows(user_ids)
+
+    def _rows(self, user_ids: List[int]) -> np.ndarray:
+        return np.array([self._user_rows[user_id] for user_id in user_ids], dtype=np.int64)
+
+    def _quiz_completion(self, rows: np.ndarray) -> np.ndarray:
+        if not len(self.quiz_task_ids):
+            return np.zeros((len(rows), 0), dtype=bool)
+
+        return np.logical_and.reduceat(
+            self._question_completion[rows], self._quiz_starts, axis=1
+        )
+
+    def task_completion(self, user_ids: List[int]) -> np.ndarray:
+        """A dense users × tasks matrix of whether each user has completed each task"""
+        rows = self._rows(user_ids)
+        return np.hstack([self._task_completion[rows], self._quiz_completion(rows)])
+
+    def count_completed_tasks(self, user_ids: List[int]) -> np.ndarray:
+        """The number of tasks completed by each of the given users"""
+        rows = self._rows(user_ids)
+        return self._task_completion[rows].sum(axis=1) + self._quiz_completion(
+            rows
+        ).sum(axis=1)
+
+    def to_dict(self, user_ids: List[int]) -> Dict:
+        """The completion of the given users in the format of `get_cohort_completion`"""
+        results = {}
+
+        if not self.num_tasks:
+            return results
+
+        rows = self._rows(user_ids)
+        task_completion = self._task_completion[rows].tolist()
+        question_completion = self._question_completion[rows].tolist()
+        quiz_completion = self._quiz_completion(rows).tolist()
+        quiz_starts = self._quiz_starts.tolist()
+        quiz_ends = quiz_starts[1:] + [len(self.question_ids)]
+
+        for index, user_id in enumerate(user_ids):
+            user_results = {
+                task_id: {"is_complete": is_complete}
+                for task_id, is_complete in zip(
+                    self.learning_material_task_ids, task_completion[index]
+                )
+            }
+
+            for quiz_index, task_id in enumerate(self.quiz_task_ids):
+                start, end = quiz_starts[quiz_index], quiz_ends[quiz_index]
+                user_results[task_id] = {
+                    "is_complete": quiz_completion[index][quiz_index],
+                    "questions": [
+                        {"question_id": question_id, "is_complete": is_complete}
+                        for question_id, is_complete in zip(
+                            self.question_ids[start:end],
+                            question_completion[index][start:end],
+                        )
+                    ],
+                }
+
+            results[user_id] = user_results
+
+        return results
+
+
+class CompletionCache:
+    """
+    An LRU cache of completion matrices keyed by `(cohort_id, course_id)`, where a
+    `course_id` of `None` covers all the courses of the cohort.
+
+    Writes invalidate exactly the matrices (or the rows of a matrix) that they
+    affect. Every invalidation bumps `version` so that a load that raced with a
+    write is answered but never cached.
+
+    Invalidations only reach the cache of the process that made the write, so
+    matrices also expire `ttl` seconds after they were loaded, which bounds how
+    stale the matrices of the other processes can get.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = 0
+        # key -> (matrix, monotonic time it expires at)
+        self._matrices: OrderedDict[
+            Tuple[int, Optional[int]], Tuple[CompletionMatrix, float]
+        ] = OrderedDict()
+
+    def get(self, key: Tuple[int, Optional[int]]) -> Optional[CompletionMatrix]:
+        entry = self._matrices.get(key)
+
+        if entry is None:
+            return None
+
+        if entry[1] <= time.monotonic():
+            del self._matrices[key]
+            return None
+
+        self._matrices.move_to_end(key)
+        return entry[0]
+
+    def put(
+        self, key: Tuple[int, Optional[int]], matrix: CompletionMatrix, version: int
+    ):
+        if version != self.version or self.max_size <= 0 or self.ttl <= 0:
+            return
+
+        self._matrices[key] = (matrix, time.monotonic() + self.ttl)
+        self._matrices.move_to_end(key)
+
+        while len(self._matrices) > self.max_size:
+            self._matrices.popitem(last=False)
+
+    def _drop(self, should_drop):
+        self.version += 1
+
+        for key in [
+            key
+            for key, (matrix, _) in self._matrices.items()
+            if should_drop(key, matrix)
+        ]:
+            del self._matrices[key]
+
+    def invalidate_users(self, user_ids: Iterable[int]):
+        """A learner's completions changed"""
+        self.version += 1
+        user_ids = list(user_ids)
+
+        for matrix, _ in self._matrices.values():
+            matrix.forget_users(user_ids)
+
+    def forget_members(self, cohort_id: int, user_ids: Iterable[int]):
+        """Learners left a cohort, so their rows in its matrices are not needed anymore"""
+        user_ids = list(user_ids)
+
+        for key, (matrix, _) in self._matrices.items():
+            if key[0] == cohort_id:
+                matrix.forget_users(user_ids)
+
+    def invalidate_tasks(self, task_ids: Iterable[int]):
+        """A task was published, scheduled, deleted or restored, or its questions changed"""
+        task_ids = set(task_ids)
+        self._drop(lambda key, matrix: not matrix.linked_task_ids.isdisjoint(task_ids))
+
+    def invalidate_courses(self, course_ids: Iterable[int]):
+        """Tasks were added to or removed from a course"""
+        course_ids = set(course_ids)
+        self._drop(lambda key, matrix: not matrix.course_ids.isdisjoint(course_ids))
+
+    def invalidate_cohorts(self, cohort_ids: Iterable[int]):
+        """Courses were added to or removed from a cohort, or it was deleted"""
+        cohort_ids = set(cohort_ids)
+        self._drop(lambda key, matrix: key[0] in cohort_ids)
+
+    def clear(self):
+        self._drop(lambda key, matrix: True)
+
+
+completion_cache = CompletionCache(
+    settings.completion_cache_size, settings.completion_cache_ttl_seconds
+)
+
+
+async def _load_completion_matrix(
+    cohort_id: int, course_id: int | None
+) -> CompletionMatrix:
+    query = f"""
+        SELECT DISTINCT t.id, t.type, t.deleted_at IS NULL AND t.status = '{TaskStatus.PUBLISHED}' AND t.scheduled_publish_at IS NULL, q.id
+        FROM {course_cohorts_table_name} cc
+        JOIN {course_tasks_table_name} ct ON ct.course_id = cc.course_id
+        JOIN {tasks_table_name} t ON t.id = ct.task_id
+        LEFT JOIN {questions_table_name} q ON q.task_id = t.id AND q.deleted_at IS NULL AND t.type = '{TaskType.QUIZ}'
+        WHERE cc.cohort_id = ?{" AND cc.course_id = ?" if course_id is not None else ""}
+        ORDER BY t.id, q.position ASC
+        """
+    params = (cohort_id,) if course_id is None else (cohort_id, course_id)
+
+    rows = await execute_db_operation(query, params, fetch_all=True) or []
+
+    if course_id is None:
+        course_ids = [
+            row[0]
+            for row in await execute_db_operation(
+                f"SELECT course_id FROM {course_cohorts_table_name} WHERE cohort_id = ?",
+                (cohort_id,),
+                fetch_all=True,
+            )
+            or []
+        ]
+    else:
+        course_ids = [course_id]
+
+    learning_material_task_ids = []
+    quiz_questions = []
+
+    for task_id, task_type, is_live, question_id in rows:
+        if not is_live:
+            continue
+
+        if task_type == str(TaskType.LEARNING_MATERIAL):
+            learning_material_task_ids.append(task_id)
+        elif task_type == str(TaskType.QUIZ):
+            quiz_questions.append((task_id, question_id))
+
+    return CompletionMatrix(
+        course_ids,
+        [row[0] for row in rows],
+        learning_material_task_ids,
+        quiz_questions,
+    )
+
+
+async def _load_completions(user_ids: List[int]) -> List[Tuple]:
+    return (
+        await execute_db_operation(
+            f"""
+            SELECT user_id, task_id, question_id
+            FROM {task_completions_table_name}
+            WHERE user_id IN {JSON_LIST_PLACEHOLDER}
+            """,
+            (serialise_list_to_json(user_ids),),
+            fetch_all=True,
+        )
+        or []
+    )
+
+
+async def get_completion_matrix(
+    cohort_id: int, user_ids: List[int], course_id: int | None = None
+) -> CompletionMatrix:
+    """
+    The completion matrix of a cohort (or one of its courses) with rows for the
+    given users. Only the parts that are not cached already are read.
+    """
+    key = (cohort_id, course_id)
+    version = completion_cache.version
+
+    matrix = completion_cache.get(key)
+    if matrix is None:
+        matrix = await _load_completion_matrix(cohort_id, course_id)
+        completion_cache.put(key, matrix, version)
+
+    missing_user_ids = matrix.missing_user_ids(user_ids)
+    if not missing_user_ids:
+        return matrix
+
+    completions = await _load_completions(missing_user_ids)
+
+    if completion_cache.version != version:
+        # a write landed while reading, so the cached rows of the other users may
+        # have been invalidated too: answer from a private matrix instead
+        matrix = matrix.copy_structure()
+        if len(missing_user_ids) != len(set(user_ids)):
+            missing_user_ids = matrix.missing_user_ids(user_ids)
+            completions = await _load_completions(missing_user_ids)
+
+    matrix.set_completions(missing_user_ids, completions)
+
+    return matrix
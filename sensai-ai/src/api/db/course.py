@@ -6,6 +6,7 @@ import json
 import itertools
 from collections import defaultdict
 from api.config import (
+    chat_history_table_name,
     courses_table_name,
     course_generation_jobs_table_name,
     course_milestones_table_name,
@@ -20,25 +21,23 @@ from api.config import (
     uncategorized_milestone_name,
     task_generation_jobs_table_name,
     organizations_table_name,
+    user_cohorts_table_name,
+    user_organizations_table_name,
     group_role_learner,
 )
-from api.db.task import (
-    get_task,
-    create_draft_task_for_course,
-    update_learning_material_task,
-    update_draft_quiz,
-    get_scorecard,
-    create_scorecard,
-)
+from api.db.task import convert_question_db_to_dict
+from api.db.completion import completion_cache
 from api.db.utils import EnumEncoder, get_org_id_for_course
 from api.utils.db import (
     execute_db_operation,
     get_new_db_connection,
+    get_read_db_connection,
     execute_multiple_db_operations,
     execute_many_db_operation,
     deserialise_list_from_str,
+    JSON_LIST_PLACEHOLDER,
+    serialise_list_to_json,
 )
-from api.db.user import get_user_cohorts, get_user_organizations
 from api.db.org import get_org_by_id
 from api.slack import send_slack_notification_for_new_course
 from api.models import (
@@ -157,10 +156,11 @@ async def get_courses_for_cohort(
     if not include_tree:
         return courses
 
+    course_trees = await get_courses([course["id"] for course in courses])
+
     for index, course in enumerate(courses):
-        course_details = await get_course(course["id"])
         course_details = await calculate_milestone_unlock_dates(
-            course_details, course["drip_config"], joined_at
+            course_trees[course["id"]], course["drip_config"], joined_at
         )
         courses[index] = course_details
 
@@ -189,7 +189,7 @@ async def store_course_generation_request(course_id: int, job_details: Dict) ->
 
 
 async def get_course_generation_job_details(job_uuid: str) -> Dict:
-    async with get_new_db_connection() as conn:
+    async with get_read_db_connection() as conn:
         cursor = await conn.cursor()
 
         await cursor.execute(
@@ -205,75 +205,217 @@ async def get_course_generation_job_details(job_uuid: str) -> Dict:
         return json.loads(job[0])
 
 
-async def duplicate_course_to_org(course_id: int, org_id: int):
-    course = await get_course(course_id)
+def _next_id_expression(table_name: str) -> str:
+    """
+    SQL expression for the id that AUTOINCREMENT would hand out next for a table,
+    so that ids can be assigned up front when copying rows in bulk
+    """
+    return f"""MAX(
+        COALESCE((SELECT seq FROM sqlite_sequence WHERE name = '{table_name}'), 0),
+        COALESCE((SELECT MAX(id) FROM {table_name}), 0)
+    )"""
+
+
+async def duplicate_courses_to_org(course_ids: List[int], org_id: int) -> Dict:
+    """
+    Copy the published content of one or more courses (milestones, tasks, questions
+    and the scorecards they use) into another organization.
+
+    Everything is copied with `INSERT ... SELECT` statements inside a single
+    transaction, so either all the courses are copied or none of them are. New ids
+    are assigned in bulk through a temporary table mapping each source row to its
+    copy, instead of inserting one row at a time to learn its id.
+
+    Args:
+        course_ids: The IDs of the courses to copy
+        org_id: The ID of the organization to copy the courses into
+
+    Returns:
+        A dictionary with the ID of the copy of each source course under
+        "course_ids" and the number of rows copied per entity under "counts"
+    """
+    org = await get_org_by_id(org_id)
+
+    if not org:
+        raise Exception(f"Organization with id '{org_id}' not found")
+
+    course_ids_json = serialise_list_to_json(set(course_ids))
 
-    new_course_id = await create_course(course["name"], org_id)
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
 
-    for milestone in course["milestones"]:
-        new_milestone_id, _ = await add_milestone_to_course(
-            new_course_id, milestone["name"], milestone["color"]
+        await cursor.execute("DROP TABLE IF EXISTS temp.course_copy_map")
+        await cursor.execute(
+            """CREATE TEMP TABLE course_copy_map (
+                entity TEXT NOT NULL,
+                source_course_id INTEGER NOT NULL,
+                old_id INTEGER NOT NULL,
+                new_id INTEGER NOT NULL,
+                position INTEGER,
+                PRIMARY KEY (entity, source_course_id, old_id)
+            )"""
         )
 
-        for task in milestone["tasks"]:
-            task_details = await get_task(task["id"])
+        # courses
+        await cursor.execute(
+            f"""INSERT INTO course_copy_map (entity, source_course_id, old_id, new_id)
+            SELECT 'course', c.id, c.id, {_next_id_expression(courses_table_name)} + ROW_NUMBER() OVER (ORDER BY c.id)
+            FROM {courses_table_name} c
+            WHERE c.id IN {JSON_LIST_PLACEHOLDER}""",
+            (course_ids_json,),
+        )
+        await cursor.execute(
+            f"""INSERT INTO {courses_table_name} (id, name, org_id)
+            SELECT m.new_id, c.name, ?
+            FROM course_copy_map m
+            JOIN {courses_table_name} c ON c.id = m.old_id
+            WHERE m.entity = 'course'""",
+            (org_id,),
+        )
 
-            new_task_id, _ = await create_draft_task_for_course(
-                task_details["title"],
-                task_details["type"],
-                new_course_id,
-                new_milestone_id,
-            )
+        # milestones, renumbered from 0 in their original order
+        await cursor.execute(
+            f"""INSERT INTO course_copy_map (entity, source_course_id, old_id, new_id, position)
+            SELECT 'milestone', cm.course_id, cm.milestone_id,
+                {_next_id_expression(milestones_table_name)} + ROW_NUMBER() OVER (ORDER BY cm.course_id, cm.ordering, cm.id),
+                ROW_NUMBER() OVER (PARTITION BY cm.course_id ORDER BY cm.ordering, cm.id) - 1
+            FROM {course_milestones_table_name} cm
+            JOIN {milestones_table_name} ms ON ms.id = cm.milestone_id
+            WHERE cm.course_id IN {JSON_LIST_PLACEHOLDER}""",
+            (course_ids_json,),
+        )
+        await cursor.execute(
+            f"""INSERT INTO {milestones_table_name} (id, name, color, org_id)
+            SELECT m.new_id, ms.name, ms.color, ?
+            FROM course_copy_map m
+            JOIN {milestones_table_name} ms ON ms.id = m.old_id
+            WHERE m.entity = 'milestone'""",
+            (org_id,),
+        )
+        await cursor.execute(
+            f"""INSERT INTO {course_milestones_table_name} (course_id, milestone_id, ordering)
+            SELECT cm.new_id, m.new_id, m.position
+            FROM course_copy_map m
+            JOIN course_copy_map cm ON cm.entity = 'course' AND cm.old_id = m.source_course_id
+            WHERE m.entity = 'milestone'"""
+        )
 
-            if task_details["type"] == TaskType.LEARNING_MATERIAL:
-                await update_learning_material_task(
-                    new_task_id,
-                    task_details["title"],
-                    task_details["blocks"],
-                    None,
-                    TaskStatus.PUBLISHED,
-                )
-            else:
-                # Handle quiz tasks with scorecard duplication
-                scorecard_mapping = {}  # Map original scorecard_id to new scorecard_id
-
-                for question in task_details["questions"]:
-                    if question.get("scorecard_id") is not None:
-                        original_scorecard_id = question["scorecard_id"]
-
-                        # Check if we've already duplicated this scorecard
-                        if original_scorecard_id not in scorecard_mapping:
-                            # Get the original scorecard
-                            original_scorecard = await get_scorecard(
-                                original_scorecard_id
-                            )
-
-                            # Create new scorecard for the new org
-                            new_scorecard = await create_scorecard(
-                                {
-                                    "title": original_scorecard["title"],
-                                    "criteria": original_scorecard["criteria"],
-                                    "org_id": org_id,
-                                },
-                                ScorecardStatus.PUBLISHED,
-                            )
-
-                            scorecard_mapping[original_scorecard_id] = new_scorecard[
-                                "id"
-                            ]
-
-                        # Update question to use the new scorecard
-                        question["scorecard_id"] = scorecard_mapping[
-                            original_scorecard_id
-                        ]
-
-                await update_draft_quiz(
-                    new_task_id,
-                    task_details["title"],
-                    task_details["questions"],
-                    None,
-                    TaskStatus.PUBLISHED,
-                )
+        # published tasks that belong to one of the copied milestones
+        await cursor.execute(
+            f"""INSERT INTO course_copy_map (entity, source_course_id, old_id, new_id, position)
+            SELECT 'task', ct.course_id, ct.task_id,
+                {_next_id_expression(tasks_table_name)} + ROW_NUMBER() OVER (ORDER BY ct.course_id, ct.milestone_id, ct.ordering, ct.id),
+                ROW_NUMBER() OVER (PARTITION BY ct.course_id, ct.milestone_id ORDER BY ct.ordering, ct.id) - 1
+            FROM {course_tasks_table_name} ct
+            JOIN {tasks_table_name} t ON t.id = ct.task_id
+            JOIN course_copy_map mm ON mm.entity = 'milestone' AND mm.source_course_id = ct.course_id AND mm.old_id = ct.milestone_id
+            WHERE ct.course_id IN {JSON_LIST_PLACEHOLDER} AND t.deleted_at IS NULL
+            AND t.status = '{TaskStatus.PUBLISHED}' AND t.scheduled_publish_at IS NULL""",
+            (course_ids_json,),
+        )
+        await cursor.execute(
+            f"""INSERT INTO {tasks_table_name} (id, org_id, type, blocks, title, status)
+            SELECT m.new_id, ?, t.type,
+                CASE WHEN t.type = '{TaskType.LEARNING_MATERIAL}' THEN COALESCE(t.blocks, '[]') ELSE NULL END,
+                t.title, '{TaskStatus.PUBLISHED}'
+            FROM course_copy_map m
+            JOIN {tasks_table_name} t ON t.id = m.old_id
+            WHERE m.entity = 'task'""",
+            (org_id,),
+        )
+        await cursor.execute(
+            f"""INSERT INTO {course_tasks_table_name} (course_id, task_id, milestone_id, ordering)
+            SELECT cm.new_id, m.new_id, mm.new_id, m.position
+            FROM course_copy_map m
+            JOIN {course_tasks_table_name} ct ON ct.course_id = m.source_course_id AND ct.task_id = m.old_id
+            JOIN course_copy_map cm ON cm.entity = 'course' AND cm.old_id = m.source_course_id
+            JOIN course_copy_map mm ON mm.entity = 'milestone' AND mm.source_course_id = m.source_course_id AND mm.old_id = ct.milestone_id
+            WHERE m.entity = 'task'"""
+        )
+
+        # questions of the copied quizzes, renumbered from 0 within each quiz
+        await cursor.execute(
+            f"""INSERT INTO course_copy_map (entity, source_course_id, old_id, new_id, position)
+            SELECT 'question', m.source_course_id, q.id,
+                {_next_id_expression(questions_table_name)} + ROW_NUMBER() OVER (ORDER BY m.source_course_id, q.task_id, q.position, q.id),
+                ROW_NUMBER() OVER (PARTITION BY m.source_course_id, q.task_id ORDER BY q.position, q.id) - 1
+            FROM course_copy_map m
+            JOIN {tasks_table_name} t ON t.id = m.old_id
+            JOIN {questions_table_name} q ON q.task_id = t.id
+            WHERE m.entity = 'task' AND t.type = '{TaskType.QUIZ}'"""
+        )
+        await cursor.execute(
+            f"""INSERT INTO {questions_table_name} (id, task_id, type, blocks, answer, input_type, response_type, coding_language, generation_model, context, position, max_attempts, is_feedback_shown, title)
+            SELECT m.new_id, tm.new_id, q.type, q.blocks, q.answer, q.input_type, q.response_type, q.coding_language, NULL, q.context, m.position, q.max_attempts, q.is_feedback_shown, q.title
+            FROM course_copy_map m
+            JOIN {questions_table_name} q ON q.id = m.old_id
+            JOIN course_copy_map tm ON tm.entity = 'task' AND tm.source_course_id = m.source_course_id AND tm.old_id = q.task_id
+            WHERE m.entity = 'question'"""
+        )
+
+        # scorecards used by the copied questions, copied once per course
+        await cursor.execute(
+            f"""INSERT INTO course_copy_map (entity, source_course_id, old_id, new_id)
+            SELECT 'scorecard', source_course_id, scorecard_id,
+                {_next_id_expression(scorecards_table_name)} + ROW_NUMBER() OVER (ORDER BY source_course_id, scorecard_id)
+            FROM (
+                SELECT DISTINCT m.source_course_id, qs.scorecard_id
+                FROM course_copy_map m
+                JOIN {question_scorecards_table_name} qs ON qs.question_id = m.old_id
+                JOIN {scorecards_table_name} s ON s.id = qs.scorecard_id
+                WHERE m.entity = 'question'
+            )"""
+        )
+        await cursor.execute(
+            f"""INSERT INTO {scorecards_table_name} (id, org_id, title, criteria, status)
+            SELECT m.new_id, ?, s.title, s.criteria, '{ScorecardStatus.PUBLISHED}'
+            FROM course_copy_map m
+            JOIN {scorecards_table_name} s ON s.id = m.old_id
+            WHERE m.entity = 'scorecard'""",
+            (org_id,),
+        )
+        await cursor.execute(
+            f"""INSERT INTO {question_scorecards_table_name} (question_id, scorecard_id)
+            SELECT qm.new_id, sm.new_id
+            FROM course_copy_map qm
+            JOIN {question_scorecards_table_name} qs ON qs.question_id = qm.old_id
+            JOIN course_copy_map sm ON sm.entity = 'scorecard' AND sm.source_course_id = qm.source_course_id AND sm.old_id = qs.scorecard_id
+            WHERE qm.entity = 'question'"""
+        )
+
+        await cursor.execute(
+            f"""SELECT m.old_id, m.new_id, c.name
+            FROM course_copy_map m
+            JOIN {courses_table_name} c ON c.id = m.old_id
+            WHERE m.entity = 'course'"""
+        )
+        copied_courses = await cursor.fetchall()
+
+        await cursor.execute(
+            "SELECT entity, COUNT(*) FROM course_copy_map GROUP BY entity"
+        )
+        counts = dict(await cursor.fetchall())
+
+        await cursor.execute("DROP TABLE temp.course_copy_map")
+
+        await conn.commit()
+
+    for _, new_course_id, course_name in copied_courses:
+        await send_slack_notification_for_new_course(
+            course_name, new_course_id, org["slug"], org_id
+        )
+
+    return {
+        "course_ids": {old_id: new_id for old_id, new_id, _ in copied_courses},
+        "counts": {
+            f"{entity}s": counts.get(entity, 0)
+            for entity in ["course", "milestone", "task", "question", "scorecard"]
+        },
+    }
+
+
+async def duplicate_course_to_org(course_id: int, org_id: int) -> Dict:
+    return await duplicate_courses_to_org([course_id], org_id)
 
 
 async def update_course_generation_job_status_and_details(
@@ -304,25 +446,6 @@ async def update_course_generation_job_status(
         await conn.commit()
 
 
-async def get_all_pending_course_structure_generation_jobs() -> List[Dict]:
-    async with get_new_db_connection() as conn:
-        cursor = await conn.cursor()
-
-        await cursor.execute(
-            f"SELECT uuid, course_id, job_details FROM {course_generation_jobs_table_name} WHERE status = ?",
-            (str(GenerateCourseJobStatus.STARTED),),
-        )
-
-        return [
-            {
-                "uuid": row[0],
-                "course_id": row[1],
-                "job_details": json.loads(row[2]),
-            }
-            for row in await cursor.fetchall()
-        ]
-
-
 async def add_course_modules(course_id: int, modules: List[Dict]):
     import random
 
@@ -351,54 +474,56 @@ async def add_course_modules(course_id: int, modules: List[Dict]):
 
 
 async def transfer_course_to_org(course_id: int, org_id: int):
-    await execute_db_operation(
-        f"UPDATE {courses_table_name} SET org_id = ? WHERE id = ?",
-        (org_id, course_id),
-    )
-
-    milestones = await execute_db_operation(
-        f"SELECT cm.milestone_id FROM {course_milestones_table_name} cm INNER JOIN {courses_table_name} c ON cm.course_id = c.id WHERE c.id = ?",
-        (course_id,),
-        fetch_all=True,
-    )
+    """
+    Move a course and everything it contains (milestones, tasks, the scorecards
+    used by its questions and their chat history) to another organization in a
+    single transaction.
+    """
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
 
-    for milestone in milestones:
-        await execute_db_operation(
-            f"UPDATE {milestones_table_name} SET org_id = ? WHERE id = ?",
-            (org_id, milestone[0]),
+        await cursor.execute(
+            f"UPDATE {courses_table_name} SET org_id = ? WHERE id = ?",
+            (org_id, course_id),
         )
 
-    tasks = await execute_db_operation(
-        f"SELECT ct.task_id FROM {course_tasks_table_name} ct INNER JOIN {courses_table_name} c ON ct.course_id = c.id WHERE c.id = ?",
-        (course_id,),
-        fetch_all=True,
-    )
-
-    task_ids = [task[0] for task in tasks]
-
-    questions = await execute_db_operation(
-        f"SELECT q.id FROM {questions_table_name} q INNER JOIN {tasks_table_name} t ON q.task_id = t.id WHERE t.id IN ({', '.join(map(str, task_ids))})",
-        fetch_all=True,
-    )
-
-    question_ids = [question[0] for question in questions]
+        await cursor.execute(
+            f"""UPDATE {milestones_table_name} SET org_id = ? WHERE id IN (
+                SELECT milestone_id FROM {course_milestones_table_name} WHERE course_id = ?
+            )""",
+            (org_id, course_id),
+        )
 
-    scorecards = await execute_db_operation(
-        f"SELECT qs.scorecard_id FROM {question_scorecards_table_name} qs INNER JOIN {questions_table_name} q ON qs.question_id = q.id WHERE q.id IN ({', '.join(map(str, question_ids))})",
-        fetch_all=True,
-    )
+        await cursor.execute(
+            f"""UPDATE {scorecards_table_name} SET org_id = ? WHERE id IN (
+                SELECT qs.scorecard_id
+                FROM {course_tasks_table_name} ct
+                JOIN {questions_table_name} q ON q.task_id = ct.task_id
+                JOIN {question_scorecards_table_name} qs ON qs.question_id = q.id
+                WHERE ct.course_id = ?
+            )""",
+            (org_id, course_id),
+        )
 
-    scorecard_ids = [scorecard[0] for scorecard in scorecards]
+        await cursor.execute(
+            f"""UPDATE {tasks_table_name} SET org_id = ? WHERE id IN (
+                SELECT task_id FROM {course_tasks_table_name} WHERE course_id = ?
+            )""",
+            (org_id, course_id),
+        )
 
-    await execute_db_operation(
-        f"UPDATE {scorecards_table_name} SET org_id = ? WHERE id IN ({', '.join(map(str, scorecard_ids))})",
-        (org_id,),
-    )
+        # the chat history of the tasks goes with them
+        await cursor.execute(
+            f"""UPDATE {chat_history_table_name} SET org_id = ? WHERE question_id IN (
+                SELECT q.id
+                FROM {course_tasks_table_name} ct
+                JOIN {questions_table_name} q ON q.task_id = ct.task_id
+                WHERE ct.course_id = ?
+            )""",
+            (org_id, course_id),
+        )
 
-    await execute_db_operation(
-        f"UPDATE {tasks_table_name} SET org_id = ? WHERE id IN ({', '.join(map(str, task_ids))})",
-        (org_id,),
-    )
+        await conn.commit()
 
 
 async def get_cohorts_for_course(course_id: int):
@@ -541,6 +666,8 @@ async def delete_course(course_id: int):
         ]
     )
 
+    completion_cache.invalidate_courses([course_id])
+
 
 def delete_all_courses_for_org(org_id: int):
     execute_multiple_db_operations(
@@ -660,86 +787,205 @@ async def get_course_org_id(course_id: int) -> int:
     return course[0]
 
 
-async def get_course(course_id: int, only_published: bool = True) -> Dict:
-    course = await execute_db_operation(
-        f"SELECT c.id, c.name, cgj.status as course_generation_status FROM {courses_table_name} c LEFT JOIN {course_generation_jobs_table_name} cgj ON c.id = cgj.course_id WHERE c.id = ?",
-        (course_id,),
-        fetch_one=True,
+async def get_courses(
+    course_ids: List[int],
+    only_published: bool = True,
+    include_task_details: bool = False,
+    include_scorecards: bool = False,
+) -> Dict[int, Dict]:
+    """
+    Load the full tree (milestones and tasks) of several courses with a fixed
+    number of set-based queries, irrespective of the number of courses, tasks
+    or questions.
+
+    Args:
+        course_ids: The IDs of the courses to load
+        only_published: Only include tasks that are published and not scheduled
+        include_task_details: Also load the blocks of learning material tasks and
+            the questions of quiz tasks (as returned by `get_task`)
+        include_scorecards: With `include_task_details`, also attach the scorecard
+            of each question under the "scorecard" key
+
+    Returns:
+        A dictionary mapping each course ID that exists to its tree, in the same
+        shape as `get_course`
+    """
+    if not course_ids:
+        return {}
+
+    course_ids_json = serialise_list_to_json(course_ids)
+
+    courses = await execute_db_operation(
+        f"""SELECT c.id, c.name, cgj.status as course_generation_status
+            FROM {courses_table_name} c
+            LEFT JOIN {course_generation_jobs_table_name} cgj ON c.id = cgj.course_id
+            WHERE c.id IN {JSON_LIST_PLACEHOLDER}""",
+        (course_ids_json,),
+        fetch_all=True,
     )
 
-    if not course:
-        return None
+    if not courses:
+        return {}
 
-    # Fix the milestones query to match the actual schema
     milestones = await execute_db_operation(
-        f"""SELECT m.id, m.name, m.color, cm.ordering 
+        f"""SELECT cm.course_id, m.id, m.name, m.color, cm.ordering
             FROM {course_milestones_table_name} cm
-            JOIN milestones m ON cm.milestone_id = m.id
-            WHERE cm.course_id = ? ORDER BY cm.ordering""",
-        (course_id,),
+            JOIN {milestones_table_name} m ON cm.milestone_id = m.id
+            WHERE cm.course_id IN {JSON_LIST_PLACEHOLDER}
+            ORDER BY cm.course_id, cm.ordering""",
+        (course_ids_json,),
         fetch_all=True,
     )
 
-    # Fetch all tasks for this course
     tasks = await execute_db_operation(
-        f"""SELECT t.id, t.title, t.type, t.status, t.scheduled_publish_at, ct.milestone_id, ct.ordering,
+        f"""SELECT ct.course_id, t.id, t.title, t.type, t.status, t.scheduled_publish_at, ct.milestone_id, ct.ordering,
             (CASE WHEN t.type = '{TaskType.QUIZ}' THEN 
                 (SELECT COUNT(*) FROM {questions_table_name} q 
                  WHERE q.task_id = t.id)
              ELSE NULL END) as num_questions,
-            tgj.status as task_generation_status
+            tgj.status as task_generation_status{", t.blocks" if include_task_details else ""}
             FROM {course_tasks_table_name} ct
             JOIN {tasks_table_name} t ON ct.task_id = t.id
             LEFT JOIN {task_generation_jobs_table_name} tgj ON t.id = tgj.task_id
-            WHERE ct.course_id = ? AND t.deleted_at IS NULL
+            WHERE ct.course_id IN {JSON_LIST_PLACEHOLDER} AND t.deleted_at IS NULL
             {
                 f"AND t.status = '{TaskStatus.PUBLISHED}' AND t.scheduled_publish_at IS NULL"
                 if only_published
                 else ""
             }
-            ORDER BY ct.milestone_id, ct.ordering""",
-        (course_id,),
+            ORDER BY ct.course_id, ct.milestone_id, ct.ordering""",
+        (course_ids_json,),
         fetch_all=True,
     )
 
-    # Group tasks by milestone_id
+    questions_by_task_id = defaultdict(list)
+
+    if include_task_details:
+        questions_by_task_id = await _get_questions_for_course_tasks(
+            course_ids_json, include_scorecards
+        )
+
+    # Group tasks by course and milestone
     tasks_by_milestone = defaultdict(list)
     for task in tasks:
-        milestone_id = task[5]
+        task_dict = {
+            "id": task[1],
+            "title": task[2],
+            "type": task[3],
+            "status": task[4],
+            "scheduled_publish_at": task[5],
+            "ordering": task[7],
+            "num_questions": task[8],
+            "is_generating": task[9] is not None
+            and task[9] == GenerateTaskJobStatus.STARTED,
+        }
+
+        if include_task_details:
+            if task_dict["type"] == TaskType.LEARNING_MATERIAL:
+                task_dict["blocks"] = json.loads(task[10]) if task[10] else []
+            elif task_dict["type"] == TaskType.QUIZ:
+                task_dict["questions"] = questions_by_task_id[task_dict["id"]]
+
+        tasks_by_milestone[(task[0], task[6])].append(task_dict)
+
+    course_trees = {}
+    for course in courses:
+        if course[0] in course_trees:
+            continue
+
+        course_trees[course[0]] = {
+            "id": course[0],
+            "name": course[1],
+            "course_generation_status": course[2],
+            "milestones": [],
+        }
 
-        tasks_by_milestone[milestone_id].append(
+    for milestone in milestones:
+        course_id, milestone_id = milestone[0], milestone[1]
+
+        if course_id not in course_trees:
+            continue
+
+        course_trees[course_id]["milestones"].append(
             {
-                "id": task[0],
-                "title": task[1],
-                "type": task[2],
-                "status": task[3],
-                "scheduled_publish_at": task[4],
-                "ordering": task[6],
-                "num_questions": task[7],
-                "is_generating": task[8] is not None
-                and task[8] == GenerateTaskJobStatus.STARTED,
+                "id": milestone_id,
+                "name": milestone[2],
+                "color": milestone[3],
+                "ordering": milestone[4],
+                "tasks": tasks_by_milestone.get((course_id, milestone_id), []),
             }
         )
 
-    course_dict = {
-        "id": course[0],
-        "name": course[1],
-        "course_generation_status": course[2],
-    }
-    course_dict["milestones"] = []
+    return course_trees
 
-    for milestone in milestones:
-        milestone_id = milestone[0]
-        milestone_dict = {
-            "id": milestone_id,
-            "name": milestone[1],
-            "color": milestone[2],
-            "ordering": milestone[3],
-            "tasks": tasks_by_milestone.get(milestone_id, []),
+
+async def _get_questions_for_course_tasks(
+    course_ids_json: str, include_scorecards: bool
+) -> Dict[int, List[Dict]]:
+    questions = await execute_db_operation(
+        f"""
+        SELECT q.task_id, q.id, q.type, q.blocks, q.answer, q.input_type, q.response_type, qs.scorecard_id, q.context, q.coding_language, q.max_attempts, q.is_feedback_shown, q.title
+        FROM {questions_table_name} q
+        LEFT JOIN {question_scorecards_table_name} qs ON q.id = qs.question_id
+        WHERE q.task_id IN (
+            SELECT ct.task_id FROM {course_tasks_table_name} ct WHERE ct.course_id IN {JSON_LIST_PLACEHOLDER}
+        )
+        ORDER BY q.task_id, q.position ASC
+        """,
+        (course_ids_json,),
+        fetch_all=True,
+    )
+
+    questions_by_task_id = defaultdict(list)
+    for question in questions:
+        questions_by_task_id[question[0]].append(
+            convert_question_db_to_dict(question[1:])
+        )
+
+    if not include_scorecards:
+        return questions_by_task_id
+
+    scorecards = await execute_db_operation(
+        f"""
+        SELECT DISTINCT s.id, s.title, s.criteria, s.status
+        FROM {scorecards_table_name} s
+        JOIN {question_scorecards_table_name} qs ON s.id = qs.scorecard_id
+        JOIN {questions_table_name} q ON qs.question_id = q.id
+        JOIN {course_tasks_table_name} ct ON q.task_id = ct.task_id
+        WHERE ct.course_id IN {JSON_LIST_PLACEHOLDER}
+        """,
+        (course_ids_json,),
+        fetch_all=True,
+    )
+
+    scorecards_by_id = {
+        scorecard[0]: {
+            "id": scorecard[0],
+            "title": scorecard[1],
+            "criteria": json.loads(scorecard[2]),
+            "status": scorecard[3],
         }
-        course_dict["milestones"].append(milestone_dict)
+        for scorecard in scorecards
+    }
+
+    for task_questions in questions_by_task_id.values():
+        for question in task_questions:
+            if question["scorecard_id"] is not None:
+                question["scorecard"] = scorecards_by_id.get(question["scorecard_id"])
+
+    return questions_by_task_id
+
 
-    return course_dict
+async def get_course(
+    course_id: int, only_published: bool = True, include_task_details: bool = False
+) -> Dict:
+    course_trees = await get_courses(
+        [course_id],
+        only_published=only_published,
+        include_task_details=include_task_details,
+    )
+
+    return course_trees.get(course_id)
 
 
 async def update_course_name(course_id: int, name: str):
@@ -825,6 +1071,8 @@ async def add_tasks_to_courses(course_tasks_to_add: List[Tuple[int, int, int]]):
 
         await conn.commit()
 
+    completion_cache.invalidate_courses(course_to_tasks.keys())
+
 
 async def remove_tasks_from_courses(course_tasks_to_remove: List[Tuple[int, int]]):
     await execute_many_db_operation(
@@ -832,6 +1080,10 @@ async def remove_tasks_from_courses(course_tasks_to_remove: List[Tuple[int, int]
         params_list=course_tasks_to_remove,
     )
 
+    completion_cache.invalidate_courses(
+        course_id for _, course_id in course_tasks_to_remove
+    )
+
 
 async def update_task_orders(task_orders: List[Tuple[int, int]]):
     await execute_many_db_operation(
@@ -876,6 +1128,157 @@ async def add_milestone_to_course(
         return milestone_id, next_order
 
 
+async def add_generated_course_items(
+    course_id: int, modules: List[Dict], job_uuid: Optional[str] = None
+) -> List[Dict]:
+    """
+    Adds the modules and draft tasks that a course structure generation streamed
+    in since its last write, in a single transaction. Each of `modules` is
+    `{"id", "name", "color", "tasks": [{"name", "type"}]}`, with an `id` of None
+    for a module that is to be added, and modules are added in the given order.
+
+    The ids of the modules added are kept in the details of the generation job
+    `job_uuid`, if given, for `delete_generated_course_items` to undo them.
+
+    Returns, for each module, its `id` and `ordering` (None if it already
+    existed) and the `(id, ordering)` of each of its tasks, the ordering of a
+    task being its index among the tasks of the module that are not deleted.
+    """
+    org_id = await get_org_id_for_course(course_id)
+    added_modules = []
+
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        await cursor.execute(
+            f"SELECT COALESCE(MAX(ordering), -1) FROM {course_milestones_table_name} WHERE course_id = ?",
+            (course_id,),
+        )
+        next_module_ordering = (await cursor.fetchone())[0] + 1
+
+        for module in modules:
+            module_id = module["id"]
+            module_ordering = None
+
+            if module_id is None:
+                await cursor.execute(
+                    f"INSERT INTO {milestones_table_name} (name, color, org_id) VALUES (?, ?, ?)",
+                    (module["name"], module["color"], org_id),
+                )
+                module_id = cursor.lastrowid
+                module_ordering = next_module_ordering
+                next_module_ordering += 1
+
+                await cursor.execute(
+                    f"INSERT INTO {course_milestones_table_name} (course_id, milestone_id, ordering) VALUES (?, ?, ?)",
+                    (course_id, module_id, module_ordering),
+                )
+
+            tasks = []
+
+            if module["tasks"]:
+                await cursor.execute(
+                    f"""SELECT COALESCE(MAX(ct.ordering), -1), COUNT(t.id)
+                    FROM {course_tasks_table_name} ct
+                    LEFT JOIN {tasks_table_name} t ON ct.task_id = t.id AND t.deleted_at IS NULL
+                    WHERE ct.course_id = ? AND ct.milestone_id = ?""",
+                    (course_id, module_id),
+                )
+                max_ordering, num_visible_tasks = await cursor.fetchone()
+
+                for index, task in enumerate(module["tasks"]):
+                    await cursor.execute(
+                        f"INSERT INTO {tasks_table_name} (org_id, type, title, status) VALUES (?, ?, ?, ?)",
+                        (org_id, str(task["type"]), task["name"], "draft"),
+                    )
+                    task_id = cursor.lastrowid
+
+                    await cursor.execute(
+                        f"INSERT INTO {course_tasks_table_name} (course_id, task_id, milestone_id, ordering) VALUES (?, ?, ?, ?)",
+                        (course_id, task_id, module_id, max_ordering + 1 + index),
+                    )
+                    tasks.append((task_id, num_visible_tasks + index))
+
+            added_modules.append(
+                {"id": module_id, "ordering": module_ordering, "tasks": tasks}
+            )
+
+        new_module_ids = [
+            added_module["id"]
+            for module, added_module in zip(modules, added_modules)
+            if module["id"] is None
+        ]
+
+        if job_uuid is not None and new_module_ids:
+            await cursor.execute(
+                f"""UPDATE {course_generation_jobs_table_name}
+                SET job_details = json_set(job_details, '$.written_module_ids', json((
+                    SELECT json_group_array(value) FROM (
+                        SELECT value FROM json_each(job_details, '$.written_module_ids')
+                        UNION ALL SELECT value FROM json_each(?)
+                    )
+                )))
+                WHERE uuid = ?""",
+                (serialise_list_to_json(new_module_ids), job_uuid),
+            )
+
+        await conn.commit()
+
+    completion_cache.invalidate_courses([course_id])
+
+    return added_modules
+
+
+async def delete_generated_course_items(course_id: int, job_uuid: str):
+    """
+    Removes the modules, and their draft tasks, that the earlier attempts of the
+    course structure generation job `job_uuid` added to the course, so that an
+    attempt that starts the structure over does not add them a second time.
+    """
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        await cursor.execute(
+            f"SELECT json_extract(job_details, '$.written_module_ids') FROM {course_generation_jobs_table_name} WHERE uuid = ?",
+            (job_uuid,),
+        )
+        row = await cursor.fetchone()
+
+        if not row or not row[0]:
+            return
+
+        module_ids = row[0]
+
+        await cursor.execute(
+            f"""UPDATE {tasks_table_name} SET deleted_at = ?
+            WHERE id IN (
+                SELECT task_id FROM {course_tasks_table_name}
+                WHERE course_id = ? AND milestone_id IN {JSON_LIST_PLACEHOLDER}
+            ) AND deleted_at IS NULL""",
+            (datetime.now(), course_id, module_ids),
+        )
+        await cursor.execute(
+            f"DELETE FROM {course_tasks_table_name} WHERE course_id = ? AND milestone_id IN {JSON_LIST_PLACEHOLDER}",
+            (course_id, module_ids),
+        )
+        await cursor.execute(
+            f"DELETE FROM {course_milestones_table_name} WHERE course_id = ? AND milestone_id IN {JSON_LIST_PLACEHOLDER}",
+            (course_id, module_ids),
+        )
+        await cursor.execute(
+            f"DELETE FROM {milestones_table_name} WHERE id IN {JSON_LIST_PLACEHOLDER}",
+            (module_ids,),
+        )
+        await cursor.execute(
+            f"UPDATE {course_generation_jobs_table_name} SET job_details = json_remove(job_details, '$.written_module_ids') WHERE uuid = ?",
+            (job_uuid,),
+        )
+
+        await conn.commit()
+
+    completion_cache.invalidate_courses([course_id])
+
+
 async def update_milestone_orders(milestone_orders: List[Tuple[int, int]]):
     await execute_many_db_operation(
         f"UPDATE {course_milestones_table_name} SET ordering = ? WHERE id = ?",
@@ -889,73 +1292,55 @@ async def get_user_courses(user_id: int) -> List[Dict]:
     1. Courses where the user is a learner or mentor through cohorts
     2. All courses from organizations where the user is an admin or owner
 
+    Both sources are fetched with a single query so the number of queries does
+    not grow with the number of cohorts or organizations the user belongs to.
+
     Args:
         user_id: The ID of the user
 
     Returns:
         List of course dictionaries with their details and user's role
     """
-    async with get_new_db_connection() as conn:
-        cursor = await conn.cursor()
+    rows = await execute_db_operation(
+        f"""
+        SELECT c.id, c.name, o.id, o.name, o.slug, uc.cohort_id, uc.role, 0 AS source, uc.id AS membership_order, cc.id AS course_order
+        FROM {user_cohorts_table_name} uc
+        JOIN {cohorts_table_name} ch ON ch.id = uc.cohort_id
+        JOIN {course_cohorts_table_name} cc ON cc.cohort_id = uc.cohort_id
+        JOIN {courses_table_name} c ON c.id = cc.course_id
+        JOIN {organizations_table_name} o ON o.id = c.org_id
+        WHERE uc.user_id = ?
+        UNION ALL
+        SELECT c.id, c.name, o.id, o.name, o.slug, NULL, 'admin', 1, -uo.id, -c.id
+        FROM {user_organizations_table_name} uo
+        JOIN {courses_table_name} c ON c.org_id = uo.org_id
+        JOIN {organizations_table_name} o ON o.id = c.org_id
+        WHERE uo.user_id = ? AND uo.role IN ('admin', 'owner')
+        ORDER BY source, membership_order, course_order
+        """,
+        (user_id, user_id),
+        fetch_all=True,
+    )
 
-        # Get all courses where the user is a learner or mentor through cohorts
-        user_cohorts = await get_user_cohorts(user_id)
-
-        # Dictionary to track user's role in each course
-        course_roles = {}
-        course_to_cohort = {}
-
-        # Add courses from user's cohorts with their roles
-        for cohort in user_cohorts:
-            cohort_id = cohort["id"]
-            user_role_in_cohort = cohort.get("role")  # Get user's role in this cohort
-
-            cohort_courses = await get_courses_for_cohort(cohort_id)
-            for course in cohort_courses:
-                course_id = course["id"]
-                course_to_cohort[course_id] = cohort_id
-
-                # Only update role if not already an admin/owner
-                if course_id not in course_roles or course_roles[course_id] not in [
-                    "admin",
-                    "owner",
-                ]:
-                    course_roles[course_id] = user_role_in_cohort
-
-        # Get organizations where the user is an admin or owner
-        user_orgs = await get_user_organizations(user_id)
-        admin_owner_org_ids = [
-            org["id"] for org in user_orgs if org["role"] in ["admin", "owner"]
-        ]
+    courses = {}
 
-        # Add all courses from organizations where user is admin or owner
-        for org_id in admin_owner_org_ids:
-            org_courses = await get_all_courses_for_org(org_id)
-            for course in org_courses:
-                course_id = course["id"]
-                # Admin/owner role takes precedence
-                course_roles[course_id] = "admin"
-
-        # If no courses found, return empty list
-        if not course_roles:
-            return []
-
-        # Fetch detailed information for all course IDs
-        courses = []
-        for course_id, role in course_roles.items():
-            # Fetch course from DB including org_id
-            await cursor.execute(
-                f"SELECT c.id, c.name, o.id, o.name, o.slug FROM {courses_table_name} c JOIN {organizations_table_name} o ON c.org_id = o.id WHERE c.id = ?",
-                (course_id,),
-            )
-            course_row = await cursor.fetchone()
-            if course_row:
-                course_dict = convert_course_db_to_dict(course_row)
-                course_dict["role"] = role  # Add user's role to the course dictionary
+    for row in rows:
+        course_id, cohort_id, role = row[0], row[5], row[6]
 
-                if role == group_role_learner:
-                    course_dict["cohort_id"] = course_to_cohort[course_id]
+        if course_id not in courses:
+            courses[course_id] = convert_course_db_to_dict(row[:5])
 
-                courses.append(course_dict)
+        course = courses[course_id]
 
-        return courses
+        # Admin/owner role takes precedence over any cohort role
+        if course.get("role") == "admin":
+            continue
+
+        course["role"] = role
+
+        if role == group_role_learner:
+            course["cohort_id"] = cohort_id
+        else:
+            course.pop("cohort_id", None)
+
+    return list(courses.values())
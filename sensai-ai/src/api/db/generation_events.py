@@ -0,0 +1,48 @@
+import json
+import time
+from typing import Dict, List, Tuple
+from api.config import generation_events_table_name
+from api.utils.db import execute_db_operation, execute_many_db_operation
+
+
+async def store_generation_event(course_id: int, event: Dict):
+    await execute_db_operation(
+        f"INSERT INTO {generation_events_table_name} (course_id, event, created_at) VALUES (?, ?, ?)",
+        (course_id, json.dumps(event), time.time()),
+    )
+
+
+async def store_generation_events(course_id: int, events: List[Dict]):
+    now = time.time()
+
+    await execute_many_db_operation(
+        f"INSERT INTO {generation_events_table_name} (course_id, event, created_at) VALUES (?, ?, ?)",
+        params_list=[(course_id, json.dumps(event), now) for event in events],
+    )
+
+
+async def get_last_generation_event_id() -> int:
+    row = await execute_db_operation(
+        f"SELECT MAX(id) FROM {generation_events_table_name}", fetch_one=True
+    )
+
+    return row[0] or 0
+
+
+async def get_generation_events_after(
+    event_id: int, limit: int
+) -> List[Tuple[int, int, Dict]]:
+    rows = await execute_db_operation(
+        f"SELECT id, course_id, event FROM {generation_events_table_name} WHERE id > ? ORDER BY id LIMIT ?",
+        (event_id, limit),
+        fetch_all=True,
+    )
+
+    return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+
+async def delete_generation_events_before(timestamp: float):
+    await execute_db_operation(
+        f"DELETE FROM {generation_events_table_name} WHERE created_at < ?",
+        (timestamp,),
+    )
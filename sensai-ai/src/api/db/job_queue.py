@@ -0,0 +1,175 @@
+import json
+import os
+import socket
+import time
+from enum import Enum
+from typing import Dict, List, Optional, Type
+from uuid import uuid4
+from api.config import (
+    course_generation_jobs_table_name,
+    task_generation_jobs_table_name,
+)
+from api.models import GenerateCourseJobStatus, GenerateTaskJobStatus
+from api.settings import settings
+from api.utils.db import execute_db_operation
+
+# identifies the leases of this process among those of every other worker
+worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+class GenerationJobQueue:
+    """
+    Hands out the `started` jobs of a generation jobs table to workers under
+    leases, so that several processes can run the jobs of one database.
+
+    A worker claims the jobs that nobody holds, or whose lease has run out, with
+    a single `UPDATE ... RETURNING`, so no job is ever given to two workers at
+    once, and keeps extending the leases of the jobs it holds with heartbeats.
+    The jobs of a worker that dies are handed out again once their lease runs
+    out, and a job that has been attempted `max_attempts` times is moved to the
+    `dead` status instead of being retried forever.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        statuses: Type[Enum],
+        lease_seconds: float,
+        max_attempts: int,
+        worker_id: str,
+    ):
+        self.table_name = table_name
+        self.statuses = statuses
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id
+
+    async def claim(self, limit: int) -> List[Dict]:
+        if limit <= 0:
+            return []
+
+        now = time.time()
+
+        rows = await execute_db_operation(
+            f"""UPDATE {self.table_name}
+            SET locked_by = ?, locked_until = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM {self.table_name}
+                WHERE status = ? AND (locked_until IS NULL OR locked_until < ?)
+                AND attempts < ?
+                ORDER BY id LIMIT ?
+            )
+            RETURNING id, uuid, course_id, job_details, attempts""",
+            (
+                self.worker_id,
+                now + self.lease_seconds,
+                str(self.statuses.STARTED),
+                now,
+                self.max_attempts,
+                limit,
+            ),
+            fetch_all=True,
+        )
+
+        return [
+            {
+                "uuid": row[1],
+                "course_id": row[2],
+                "job_details": json.loads(row[3]),
+                "attempts": row[4],
+            }
+            for row in sorted(rows)
+        ]
+
+    async def heartbeat(self) -> int:
+        """Extends the leases of the jobs this worker still holds, returning how many"""
+        rows = await execute_db_operation(
+            f"""UPDATE {self.table_name} SET locked_until = ?
+            WHERE locked_by = ? AND status = ?
+            RETURNING uuid""",
+            (
+                time.time() + self.lease_seconds,
+                self.worker_id,
+                str(self.statuses.STARTED),
+            ),
+            fetch_all=True,
+        )
+
+        return len(rows)
+
+    async def release(self, job_uuid: str, error: str) -> Optional[str]:
+        """
+        Gives up this worker's lease on a job that failed, for another attempt to
+        claim it, or moves it to `dead` if it has no attempts left. Returns the
+        new status of the job, or None if the worker no longer held it.
+        """
+        row = await execute_db_operation(
+            f"""UPDATE {self.table_name}
+            SET locked_by = NULL, locked_until = NULL, last_error = ?,
+            status = CASE WHEN attempts >= ? THEN ? ELSE status END
+            WHERE uuid = ? AND locked_by = ? AND status = ?
+            RETURNING status""",
+            (
+                error,
+                self.max_attempts,
+                str(self.statuses.DEAD),
+                job_uuid,
+                self.worker_id,
+                str(self.statuses.STARTED),
+            ),
+            fetch_one=True,
+        )
+
+        return row[0] if row else None
+
+    async def abandon(self):
+        """Gives back every job this worker holds, without counting the attempt, on shutdown"""
+        await execute_db_operation(
+            f"""UPDATE {self.table_name}
+            SET locked_by = NULL, locked_until = NULL, attempts = MAX(attempts - 1, 0)
+            WHERE locked_by = ? AND status = ?""",
+            (self.worker_id, str(self.statuses.STARTED)),
+        )
+
+    async def dead_letter_expired(self) -> List[Dict]:
+        """Moves the jobs whose last attempt ran out of its lease and of attempts to `dead`"""
+        rows = await execute_db_operation(
+            f"""UPDATE {self.table_name}
+            SET status = ?, locked_by = NULL, locked_until = NULL,
+            last_error = 'lease expired'
+            WHERE status = ? AND locked_until < ? AND attempts >= ?
+            RETURNING uuid, course_id, job_details""",
+            (
+                str(self.statuses.DEAD),
+                str(self.statuses.STARTED),
+                time.time(),
+                self.max_attempts,
+            ),
+            fetch_all=True,
+        )
+
+        return [
+            {
+                "uuid": row[0],
+                "course_id": row[1],
+                "job_details": json.loads(row[2]),
+            }
+            for row in rows
+        ]
+
+
+course_generation_job_queue = GenerationJobQueue(
+    course_generation_jobs_table_name,
+    GenerateCourseJobStatus,
+    lease_seconds=settings.generation_job_lease_seconds,
+    max_attempts=settings.generation_job_max_attempts,
+    worker_id=worker_id,
+)
+
+task_generation_job_queue = GenerationJobQueue(
+    task_generation_jobs_table_name,
+    GenerateTaskJobStatus,
+    lease_seconds=settings.generation_job_lease_seconds,
+    max_attempts=settings.generation_job_max_attempts,
+    worker_id=worker_id,
+)
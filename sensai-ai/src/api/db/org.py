@@ -4,8 +4,11 @@ import hashlib
 
 from api.utils.db import (
     get_new_db_connection,
+    get_read_db_connection,
     execute_db_operation,
     execute_multiple_db_operations,
+    JSON_LIST_PLACEHOLDER,
+    serialise_list_to_json,
 )
 from api.config import (
     organizations_table_name,
@@ -13,6 +16,7 @@ from api.config import (
     org_api_keys_table_name,
 )
 from api.db.user import get_user_by_id, insert_or_return_user
+from api.db.api_key_cache import api_key_cache
 from api.slack import (
     send_slack_notification_for_new_org,
     send_slack_notification_for_member_added_to_org,
@@ -20,7 +24,7 @@ from api.slack import (
 
 
 async def get_all_orgs() -> List[Dict]:
-    async with get_new_db_connection() as conn:
+    async with get_read_db_connection() as conn:
         cursor = await conn.cursor()
 
         await cursor.execute(f"SELECT id, name, slug FROM {organizations_table_name}")
@@ -60,7 +64,9 @@ async def create_org_api_key(org_id: int) -> str:
 
         await conn.commit()
 
-        return api_key
+    api_key_cache.invalidate_keys([hashed_key])
+
+    return api_key
 
 
 async def get_org_id_from_api_key(api_key: str) -> int:
@@ -74,6 +80,15 @@ async def get_org_id_from_api_key(api_key: str) -> int:
     except ValueError:
         raise ValueError("Invalid API key")
 
+    hashed_key = hashlib.sha256(api_key.encode()).hexdigest()
+
+    # the org id is part of the hashed key, so a cached key always belongs to it
+    cached_org_id = api_key_cache.get(hashed_key)
+    if cached_org_id is not None:
+        return cached_org_id
+
+    version = api_key_cache.version
+
     rows = await execute_db_operation(
         f"SELECT hashed_key FROM {org_api_keys_table_name} WHERE org_id = ?",
         (org_id,),
@@ -83,10 +98,9 @@ async def get_org_id_from_api_key(api_key: str) -> int:
     if not rows:
         raise ValueError("Invalid API key")
 
-    hashed_key = hashlib.sha256(api_key.encode()).hexdigest()
-
     for row in rows:
         if hashed_key == row[0]:
+            api_key_cache.put(hashed_key, org_id, version)
             return org_id
 
     raise ValueError("Invalid API key")
@@ -195,8 +209,8 @@ async def is_user_hva_learner(user_id: int) -> bool:
 
     num_hva_users_matching_user_id = (
         await execute_db_operation(
-            f"SELECT COUNT(*) FROM user_cohorts WHERE user_id = ? AND cohort_id IN ({', '.join(map(str, hva_cohort_ids))}) AND role = 'learner'",
-            (user_id,),
+            f"SELECT COUNT(*) FROM user_cohorts WHERE user_id = ? AND cohort_id IN {JSON_LIST_PLACEHOLDER} AND role = 'learner'",
+            (user_id, serialise_list_to_json(hva_cohort_ids)),
             fetch_one=True,
         )
     )[0]
@@ -231,13 +245,11 @@ async def add_users_to_org_by_email(
             )
 
         # Check if any of the users are already in the organization
-        placeholders = ", ".join(["?" for _ in user_ids])
-
         await cursor.execute(
             f"""SELECT user_id FROM {user_organizations_table_name} 
-            WHERE org_id = ? AND user_id IN ({placeholders})
+            WHERE org_id = ? AND user_id IN {JSON_LIST_PLACEHOLDER}
             """,
-            (org_id, *user_ids),
+            (org_id, serialise_list_to_json(user_ids)),
         )
 
         existing_user_ids = await cursor.fetchall()
@@ -255,8 +267,8 @@ async def add_users_to_org_by_email(
 
 
 async def remove_members_from_org(org_id: int, user_ids: List[int]):
-    query = f"DELETE FROM {user_organizations_table_name} WHERE org_id = ? AND user_id IN ({', '.join(map(str, user_ids))})"
-    await execute_db_operation(query, (org_id,))
+    query = f"DELETE FROM {user_organizations_table_name} WHERE org_id = ? AND user_id IN {JSON_LIST_PLACEHOLDER}"
+    await execute_db_operation(query, (org_id, serialise_list_to_json(user_ids)))
 
 
 def convert_user_organization_db_to_dict(user_organization: Tuple):
@@ -0,0 +1,121 @@
+import hashlib
+import time
+from typing import Dict, Optional
+from api.config import routing_decisions_table_name
+from api.settings import settings
+from api.utils.db import execute_db_operation, execute_multiple_db_operations
+
+
+def hash_question_content(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def get_chat_turn_bucket(num_turns: int) -> int:
+    """0, 1, 2-3, 4-7 and 8 or more previous turns fall into buckets 0 to 4"""
+    return min(num_turns.bit_length(), 4)
+
+
+class RoutingDecisionCache:
+    """
+    An LRU cache, persisted in SQLite so that it survives restarts and is shared
+    between processes, of whether the chat router picked the reasoning model for
+    a question, keyed by the question, a hash of its content (task, solution and
+    scoring criteria) and the bucket of the number of turns the chat has had.
+
+    Editing a question or its scorecard deletes its decisions (see `api.db.task`),
+    and a changed hash stops any decision that escaped that from matching.
+
+    Lookups only read, from the read-only pool, and a decision is marked as used
+    again only once its last use is `touch_interval` seconds old, so that a chat
+    turn rarely waits on the writer: recency is tracked to that interval.
+    """
+
+    def __init__(self, max_size: int, touch_interval: float = 60):
+        self.max_size = max_size
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+
+    async def get(
+        self, question_id: int, content_hash: str, turn_bucket: int
+    ) -> Optional[bool]:
+        if self.max_size <= 0:
+            return None
+
+        row = await execute_db_operation(
+            f"""SELECT use_reasoning_model, last_used_at FROM {routing_decisions_table_name}
+            WHERE question_id = ? AND content_hash = ? AND turn_bucket = ?""",
+            (question_id, content_hash, turn_bucket),
+            fetch_one=True,
+        )
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        now = time.time()
+        if now - row[1] >= self.touch_interval:
+            await execute_db_operation(
+                f"""UPDATE {routing_decisions_table_name} SET last_used_at = ?
+                WHERE question_id = ? AND content_hash = ? AND turn_bucket = ?""",
+                (now, question_id, content_hash, turn_bucket),
+            )
+
+        return bool(row[0])
+
+    async def put(
+        self,
+        question_id: int,
+        content_hash: str,
+        turn_bucket: int,
+        use_reasoning_model: bool,
+    ):
+        if self.max_size <= 0:
+            return
+
+        await execute_multiple_db_operations(
+            [
+                (
+                    f"""INSERT OR REPLACE INTO {routing_decisions_table_name}
+                    (question_id, content_hash, turn_bucket, use_reasoning_model, last_used_at)
+                    VALUES (?, ?, ?, ?, ?)""",
+                    (
+                        question_id,
+                        content_hash,
+                        turn_bucket,
+                        use_reasoning_model,
+                        time.time(),
+                    ),
+                ),
+                (
+                    f"""DELETE FROM {routing_decisions_table_name} WHERE last_used_at <= (
+                        SELECT last_used_at FROM {routing_decisions_table_name}
+                        ORDER BY last_used_at DESC LIMIT 1 OFFSET ?
+                    )""",
+                    (self.max_size,),
+                ),
+            ]
+        )
+
+    async def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        size = await execute_db_operation(
+            f"SELECT COUNT(*) FROM {routing_decisions_table_name}", fetch_one=True
+        )
+
+        return {
+            "size": size[0],
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+
+routing_decision_cache = RoutingDecisionCache(settings.routing_cache_size)
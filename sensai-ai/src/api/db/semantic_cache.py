@@ -0,0 +1,131 @@
+import hashlib
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from api.config import semantic_cache_table_name
+from api.settings import settings
+from api.utils.db import execute_db_operation, execute_multiple_db_operations
+
+
+def hash_material(material: str) -> str:
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def normalize_embedding(embedding: List[float]) -> np.ndarray:
+    embedding = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(embedding)
+
+    return embedding / norm if norm else embedding
+
+
+class SemanticCache:
+    """
+    Responses to learning material chats, stored in SQLite with the normalized
+    embedding of the query they answered and looked up by cosine similarity.
+
+    Entries are only ever compared with those of the same org, task and version
+    of the learning material (by hash), so an edit to the material or a query
+    from another org never matches, and they expire `ttl` seconds after they
+    were stored. Each (org, task, material) keeps its `max_entries` latest.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float,
+        ttl: float,
+        max_entries: int,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    async def get(
+        self,
+        org_id: int,
+        task_id: int,
+        material_hash: str,
+        query_embedding: np.ndarray,
+    ) -> Tuple[Optional[Dict], float]:
+        """The closest cached response and its similarity, if it is above the threshold"""
+        rows = await execute_db_operation(
+            f"""SELECT query_embedding, response FROM {semantic_cache_table_name}
+            WHERE org_id = ? AND task_id = ? AND material_hash = ? AND created_at > ?""",
+            (org_id, task_id, material_hash, time.time() - self.ttl),
+            fetch_all=True,
+        )
+
+        if not rows:
+            return None, 0.0
+
+        embeddings = np.stack(
+            [np.frombuffer(embedding, dtype=np.float32) for embedding, _ in rows]
+        )
+        similarities = embeddings @ query_embedding
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+
+        if similarity < self.similarity_threshold:
+            return None, similarity
+
+        return json.loads(rows[best][1]), similarity
+
+    async def put(
+        self,
+        org_id: int,
+        task_id: int,
+        material_hash: str,
+        query_embedding: np.ndarray,
+        response: Dict,
+    ):
+        now = time.time()
+
+        await execute_multiple_db_operations(
+            [
+                (
+                    f"""INSERT INTO {semantic_cache_table_name}
+                    (org_id, task_id, material_hash, query_embedding, response, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)""",
+                    (
+                        org_id,
+                        task_id,
+                        material_hash,
+                        query_embedding.astype(np.float32).tobytes(),
+                        json.dumps(response),
+                        now,
+                    ),
+                ),
+                (
+                    f"DELETE FROM {semantic_cache_table_name} WHERE created_at <= ?",
+                    (now - self.ttl,),
+                ),
+                (
+                    f"""DELETE FROM {semantic_cache_table_name}
+                    WHERE org_id = ? AND task_id = ? AND material_hash = ? AND created_at <= (
+                        SELECT created_at FROM {semantic_cache_table_name}
+                        WHERE org_id = ? AND task_id = ? AND material_hash = ?
+                        ORDER BY created_at DESC LIMIT 1 OFFSET ?
+                    )""",
+                    (
+                        org_id,
+                        task_id,
+                        material_hash,
+                        org_id,
+                        task_id,
+                        material_hash,
+                        self.max_entries,
+                    ),
+                ),
+            ]
+        )
+
+
+semantic_cache = SemanticCache(
+    similarity_threshold=settings.semantic_cache_similarity_threshold,
+    ttl=settings.semantic_cache_ttl_seconds,
+    max_entries=settings.semantic_cache_max_entries_per_task,
+)
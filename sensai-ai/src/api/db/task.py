@@ -16,11 +16,16 @@ from api.config import (
     course_cohorts_table_name,
     task_completions_table_name,
     task_generation_jobs_table_name,
+    routing_decisions_table_name,
 )
 from api.utils.db import (
     get_new_db_connection,
+    execute_group_committed_operations,
+    get_read_db_connection,
     execute_db_operation,
-    serialise_list_to_str,
+    execute_multiple_db_operations,
+    JSON_LIST_PLACEHOLDER,
+    serialise_list_to_json,
 )
 from api.models import (
     TaskType,
@@ -33,6 +38,8 @@ from api.models import (
     BaseScorecard,
 )
 from api.db.utils import convert_blocks_to_right_format
+from api.db.activity import get_record_activity_command
+from api.db.completion import completion_cache
 
 
 async def create_draft_task_for_course(
@@ -83,6 +90,8 @@ async def create_draft_task_for_course(
 
         await conn.commit()
 
+        completion_cache.invalidate_courses([course_id])
+
         # Compute the "visible" ordering (i.e., the index among non-deleted tasks)
         visible_ordering_row = await execute_db_operation(
             f"""
@@ -332,6 +341,8 @@ async def update_learning_material_task(
 
         await conn.commit()
 
+        completion_cache.invalidate_tasks([task_id])
+
         return await get_task(task_id)
 
 
@@ -358,6 +369,11 @@ async def update_draft_quiz(
     async with get_new_db_connection() as conn:
         cursor = await conn.cursor()
 
+        await cursor.execute(
+            f"DELETE FROM {routing_decisions_table_name} WHERE question_id IN (SELECT id FROM {questions_table_name} WHERE task_id = ?)",
+            (task_id,),
+        )
+
         await cursor.execute(
             f"DELETE FROM {question_scorecards_table_name} WHERE question_id IN (SELECT id FROM {questions_table_name} WHERE task_id = ?)",
             (task_id,),
@@ -428,8 +444,11 @@ async def update_draft_quiz(
 
         if scorecards_to_publish:
             await cursor.execute(
-                f"UPDATE {scorecards_table_name} SET status = ? WHERE id IN ({','.join(map(str, scorecards_to_publish))})",
-                (str(ScorecardStatus.PUBLISHED),),
+                f"UPDATE {scorecards_table_name} SET status = ? WHERE id IN {JSON_LIST_PLACEHOLDER}",
+                (
+                    str(ScorecardStatus.PUBLISHED),
+                    serialise_list_to_json(scorecards_to_publish),
+                ),
             )
 
         # Update task status to published
@@ -440,6 +459,8 @@ async def update_draft_quiz(
 
         await conn.commit()
 
+        completion_cache.invalidate_tasks([task_id])
+
         return await get_task(task_id)
 
 
@@ -483,6 +504,11 @@ async def update_published_quiz(
                 ),
             )
 
+            await cursor.execute(
+                f"DELETE FROM {routing_decisions_table_name} WHERE question_id = ?",
+                (question["id"],),
+            )
+
             if question.get("scorecard_id") is not None:
                 # First check if there's an existing scorecard mapping
                 await cursor.execute(
@@ -516,8 +542,11 @@ async def update_published_quiz(
 
         if scorecards_to_publish:
             await cursor.execute(
-                f"UPDATE {scorecards_table_name} SET status = ? WHERE id IN ({','.join(map(str, scorecards_to_publish))})",
-                (str(ScorecardStatus.PUBLISHED),),
+                f"UPDATE {scorecards_table_name} SET status = ? WHERE id IN {JSON_LIST_PLACEHOLDER}",
+                (
+                    str(ScorecardStatus.PUBLISHED),
+                    serialise_list_to_json(scorecards_to_publish),
+                ),
             )
 
         # Update task status to published
@@ -528,6 +557,8 @@ async def update_published_quiz(
 
         await conn.commit()
 
+        completion_cache.invalidate_tasks([task_id])
+
         return await get_task(task_id)
 
 
@@ -599,17 +630,19 @@ async def delete_task(task_id: int):
         (datetime.now(), task_id),
     )
 
+    completion_cache.invalidate_tasks([task_id])
 
-async def delete_tasks(task_ids: List[int]):
-    task_ids_as_str = serialise_list_to_str(map(str, task_ids))
 
+async def delete_tasks(task_ids: List[int]):
     await execute_db_operation(
         f"""
-        UPDATE {tasks_table_name} SET deleted_at = ? WHERE id IN ({task_ids_as_str}) AND deleted_at IS NULL
+        UPDATE {tasks_table_name} SET deleted_at = ? WHERE id IN {JSON_LIST_PLACEHOLDER} AND deleted_at IS NULL
         """,
-        (datetime.now(),),
+        (datetime.now(), serialise_list_to_json(task_ids)),
     )
 
+    completion_cache.invalidate_tasks(task_ids)
+
 
 async def get_solved_tasks_for_user(
     user_id: int,
@@ -662,14 +695,21 @@ async def get_solved_tasks_for_user(
 
 async def mark_task_completed(task_id: int, user_id: int):
     # Update task completion table using INSERT OR IGNORE to handle duplicates gracefully
-    await execute_db_operation(
-        f"""
+    await execute_group_committed_operations(
+        [
+            (
+                f"""
         INSERT OR IGNORE INTO {task_completions_table_name} (user_id, task_id)
         VALUES (?, ?)
         """,
-        (user_id, task_id),
+                (user_id, task_id),
+            ),
+            get_record_activity_command(user_id, task_id=task_id),
+        ]
     )
 
+    completion_cache.invalidate_users([user_id])
+
 
 async def delete_completion_history_for_task(
     task_id: int, question_id: int, user_id: int
@@ -710,6 +750,8 @@ async def schedule_module_tasks(
 
         await conn.commit()
 
+    completion_cache.invalidate_tasks(task[0] for task in course_module_tasks)
+
 
 async def drop_task_generation_jobs_table():
     async with get_new_db_connection() as conn:
@@ -757,7 +799,7 @@ async def update_task_generation_job_status(
 
 
 async def get_course_task_generation_jobs_status(course_id: int) -> List[str]:
-    async with get_new_db_connection() as conn:
+    async with get_read_db_connection() as conn:
         cursor = await conn.cursor()
 
         await cursor.execute(
@@ -777,24 +819,6 @@ async def get_course_task_generation_jobs_status(course_id: int) -> List[str]:
         }
 
 
-async def get_all_pending_task_generation_jobs() -> List[Dict]:
-    async with get_new_db_connection() as conn:
-        cursor = await conn.cursor()
-
-        await cursor.execute(
-            f"SELECT uuid, job_details FROM {task_generation_jobs_table_name} WHERE status = ?",
-            (str(GenerateTaskJobStatus.STARTED),),
-        )
-
-        return [
-            {
-                "uuid": row[0],
-                "job_details": json.loads(row[1]),
-            }
-            for row in await cursor.fetchall()
-        ]
-
-
 async def drop_task_completions_table():
     async with get_new_db_connection() as conn:
         cursor = await conn.cursor()
@@ -848,9 +872,18 @@ async def create_scorecard(
 async def update_scorecard(scorecard_id: int, scorecard: BaseScorecard):
     scorecard = scorecard.model_dump()
 
-    await execute_db_operation(
-        f"UPDATE {scorecards_table_name} SET title = ?, criteria = ? WHERE id = ?",
-        (scorecard["title"], json.dumps(scorecard["criteria"]), scorecard_id),
+    await execute_multiple_db_operations(
+        [
+            (
+                f"UPDATE {scorecards_table_name} SET title = ?, criteria = ? WHERE id = ?",
+                (scorecard["title"], json.dumps(scorecard["criteria"]), scorecard_id),
+            ),
+            # the scoring criteria are part of what the chat router decides on
+            (
+                f"DELETE FROM {routing_decisions_table_name} WHERE question_id IN (SELECT question_id FROM {question_scorecards_table_name} WHERE scorecard_id = ?)",
+                (scorecard_id,),
+            ),
+        ]
     )
 
     return await get_scorecard(scorecard_id)
@@ -867,6 +900,8 @@ async def undo_task_delete(task_id: int):
 
         await conn.commit()
 
+    completion_cache.invalidate_tasks([task_id])
+
 
 async def publish_scheduled_tasks():
     """Publish all tasks whose scheduled time has arrived"""
@@ -888,7 +923,10 @@ async def publish_scheduled_tasks():
         fetch_all=True,
     )
 
-    return [task[0] for task in tasks] if tasks else []
+    published_task_ids = [task[0] for task in tasks] if tasks else []
+    completion_cache.invalidate_tasks(published_task_ids)
+
+    return published_task_ids
 
 
 async def add_generated_learning_material(task_id: int, task_details: Dict):
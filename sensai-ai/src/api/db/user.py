@@ -1,5 +1,5 @@
 from typing import Dict, List, Tuple
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 from api.config import (
     users_table_name,
     cohorts_table_name,
@@ -8,11 +8,8 @@ from api.config import (
     group_role_learner,
     courses_table_name,
     chat_history_table_name,
-    questions_table_name,
-    course_tasks_table_name,
-    course_cohorts_table_name,
-    task_completions_table_name,
     user_organizations_table_name,
+    daily_activity_table_name,
 )
 from api.slack import send_slack_notification_for_new_user
 from api.models import UserCohort
@@ -243,77 +240,37 @@ async def get_user_cohorts(user_id: int) -> List[Dict]:
 
 
 async def get_user_active_in_last_n_days(user_id: int, n: int, cohort_id: int):
-    activity_per_day = await execute_db_operation(
+    active_days = await execute_db_operation(
         f"""
-    WITH chat_activity AS (
-        SELECT DATE(datetime(created_at, '+5 hours', '+30 minutes')) as activity_date, COUNT(*) as count
-        FROM {chat_history_table_name}
-        WHERE user_id = ? 
-        AND DATE(datetime(created_at, '+5 hours', '+30 minutes')) >= DATE(datetime('now', '+5 hours', '+30 minutes'), '-{n} days') 
-        AND question_id IN (
-            SELECT question_id 
-            FROM {questions_table_name} 
-            WHERE task_id IN (
-                SELECT task_id 
-                FROM {course_tasks_table_name} 
-                WHERE course_id IN (
-                    SELECT course_id 
-                    FROM {course_cohorts_table_name} 
-                    WHERE cohort_id = ?
-                )
-            )
-        )
-        GROUP BY activity_date
-    ),
-    task_activity AS (
-        SELECT DATE(datetime(created_at, '+5 hours', '+30 minutes')) as activity_date, COUNT(*) as count
-        FROM {task_completions_table_name}
-        WHERE user_id = ? 
-        AND DATE(datetime(created_at, '+5 hours', '+30 minutes')) >= DATE(datetime('now', '+5 hours', '+30 minutes'), '-{n} days')
-        AND task_id IN (
-            SELECT task_id 
-            FROM {course_tasks_table_name} 
-            WHERE course_id IN (
-                SELECT course_id 
-                FROM {course_cohorts_table_name} 
-                WHERE cohort_id = ?
-            )
-        )
-        GROUP BY activity_date
-    )
-    SELECT activity_date, count FROM chat_activity
-    UNION
-    SELECT activity_date, count FROM task_activity
-    ORDER BY activity_date
-    """,
-        (user_id, cohort_id, user_id, cohort_id),
+        SELECT ist_date FROM {daily_activity_table_name}
+        WHERE user_id = ? AND cohort_id = ?
+        AND ist_date >= DATE(datetime('now', '+5 hours', '+30 minutes'), ?)
+        ORDER BY ist_date
+        """,
+        (user_id, cohort_id, f"-{n} days"),
         fetch_all=True,
     )
 
-    active_days = set()
-
-    for date, count in activity_per_day:
-        if count > 0:
-            active_days.add(date)
-
-    return list(active_days)
+    return [active_day for active_day, in active_days]
 
 
 async def get_user_activity_for_year(user_id: int, year: int):
-    # Get all chat messages for the user in the given year, grouped by day
+    # Get all chat messages for the user in the given year, grouped by day; the
+    # year is turned into a range of UTC timestamps so that it is an index range
     activity_per_day = await execute_db_operation(
         f"""
         SELECT 
-            strftime('%j', datetime(timestamp, '+5 hours', '+30 minutes')) as day_of_year,
+            strftime('%j', datetime(created_at, '+5 hours', '+30 minutes')) as day_of_year,
             COUNT(*) as message_count
         FROM {chat_history_table_name}
         WHERE user_id = ? 
-        AND strftime('%Y', datetime(timestamp, '+5 hours', '+30 minutes')) = ?
+        AND created_at >= datetime(?, '-5 hours', '-30 minutes')
+        AND created_at < datetime(?, '-5 hours', '-30 minutes')
         AND role = 'user'
         GROUP BY day_of_year
         ORDER BY day_of_year
         """,
-        (user_id, str(year)),
+        (user_id, f"{year}-01-01", f"{year + 1}-01-01"),
         fetch_all=True,
     )
 
@@ -359,30 +316,59 @@ def get_user_streak_from_usage_dates(user_usage_dates: List[str]) -> int:
     return current_streak
 
 
+# the timezone that the days of activity are bucketed and streaks are shown in
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+def get_ist_today() -> date:
+    return datetime.now(IST).date()
+
+
+def get_current_streak(
+    last_active_date: str | None,
+    streak: int | None,
+    window_start: date | None = None,
+) -> List[str]:
+    """
+    Get the days of the current streak of a user from the last day they were
+    active on and the length of the streak ending on that day, as stored in the
+    daily activity rollup. Only the days on or after `window_start` are counted
+    if it is given.
+    """
+    if not last_active_date:
+        return []
+
+    today = get_ist_today()
+    last_active_date = date.fromisoformat(last_active_date)
+
+    if (today - last_active_date).days > 1:
+        # the user has not used the app yesterday or today, so the streak is broken
+        return []
+
+    if window_start is not None:
+        if last_active_date < window_start:
+            return []
+
+        streak = min(streak, (last_active_date - window_start).days + 1)
+
+    return [
+        datetime.strftime(last_active_date - timedelta(days=index), "%Y-%m-%d")
+        for index in range(streak)
+    ]
+
+
 async def get_user_streak(user_id: int, cohort_id: int):
-    user_usage_dates = await execute_db_operation(
+    latest_activity = await execute_db_operation(
         f"""
-    SELECT MAX(datetime(created_at, '+5 hours', '+30 minutes')) as created_at
-    FROM {chat_history_table_name}
-    WHERE user_id = ? AND question_id IN (SELECT id FROM {questions_table_name} WHERE task_id IN (SELECT task_id FROM {course_tasks_table_name} WHERE course_id IN (SELECT course_id FROM {course_cohorts_table_name} WHERE cohort_id = ?)))
-    GROUP BY DATE(datetime(created_at, '+5 hours', '+30 minutes'))
-    
-    UNION
-    
-    SELECT MAX(datetime(created_at, '+5 hours', '+30 minutes')) as created_at
-    FROM {task_completions_table_name}
-    WHERE user_id = ? AND task_id IN (
-        SELECT task_id FROM {course_tasks_table_name} 
-        WHERE course_id IN (SELECT course_id FROM {course_cohorts_table_name} WHERE cohort_id = ?)
-    )
-    GROUP BY DATE(datetime(created_at, '+5 hours', '+30 minutes'))
-    
-    ORDER BY created_at DESC
-    """,
-        (user_id, cohort_id, user_id, cohort_id),
-        fetch_all=True,
+        SELECT ist_date, streak FROM {daily_activity_table_name}
+        WHERE user_id = ? AND cohort_id = ?
+        ORDER BY ist_date DESC LIMIT 1
+        """,
+        (user_id, cohort_id),
+        fetch_one=True,
     )
 
-    return get_user_streak_from_usage_dates(
-        [date_str for date_str, in user_usage_dates]
-    )
+    if not latest_activity:
+        return []
+
+    return get_current_streak(*latest_activity)
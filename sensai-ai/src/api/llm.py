@@ -1,12 +1,23 @@
-from typing import Dict, List
+import asyncio
+import functools
+import hashlib
+import importlib.util
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 import backoff
+import httpx
 import openai
 import instructor
+from tenacity import AsyncRetrying, retry_if_not_exception_type, stop_after_attempt
 
 from openai import OpenAI
 
 from pydantic import BaseModel
 
+from api.settings import settings
+from api.utils.concurrency import RateLimitBudget, RateLimitedScheduler
 from api.utils.logging import logger
 
 # Test log message
@@ -26,6 +37,291 @@ def is_reasoning_model(model: str) -> bool:
     ]
 
 
+def assemble_messages(
+    system_prompt: str, static_contents: List, turns: List[Dict]
+) -> List[Dict]:
+    """
+    The system prompt, then the content that stays the same across the turns of a
+    conversation (reference material, task, solution, scoring criteria), then the
+    turns themselves, so that OpenAI's prompt cache, which only matches on the
+    longest shared prefix, covers everything but the latest turns.
+    """
+    return (
+        [{"role": "system", "content": system_prompt}]
+        + [{"role": "user", "content": content} for content in static_contents]
+        + turns
+    )
+
+
+def log_prompt_cache_usage(model: str, usage):
+    if usage is None:
+        return
+
+    details = usage.prompt_tokens_details
+    cached_tokens = (details.cached_tokens or 0) if details else 0
+
+    logger.info(
+        f"Prompt tokens for {model}: {usage.prompt_tokens} ({cached_tokens} cached)"
+    )
+
+
+async def _log_stream_prompt_cache_usage(stream, model: str):
+    try:
+        async for chunk in stream:
+            if chunk.usage is not None:
+                log_prompt_cache_usage(model, chunk.usage)
+
+            yield chunk
+    finally:
+        await stream.close()
+
+
+def with_prompt_cache_logging(create):
+    """Wraps `chat.completions.create` to log how many prompt tokens were cached"""
+
+    @functools.wraps(create)
+    async def create_with_prompt_cache_logging(*args, **kwargs):
+        if kwargs.get("stream"):
+            # the usage is only sent, in a final chunk, when asked for
+            kwargs.setdefault("stream_options", {"include_usage": True})
+            stream = await create(*args, **kwargs)
+            return _log_stream_prompt_cache_usage(stream, kwargs.get("model"))
+
+        response = await create(*args, **kwargs)
+        log_prompt_cache_usage(kwargs.get("model"), response.usage)
+        return response
+
+    return create_with_prompt_cache_logging
+
+
+@dataclass
+class OpenAIClients:
+    """The clients of one API key, of which only the async client is always made"""
+
+    client: openai.AsyncOpenAI
+    instructor_client: Optional[instructor.AsyncInstructor] = None
+    scheduled_instructor_client: Optional[instructor.AsyncInstructor] = None
+    sync_client: Optional[openai.OpenAI] = None
+
+
+class AsyncHttpxClient(openai.DefaultAsyncHttpxClient):
+    """
+    Closed once nothing refers to it any more, which is only after the last
+    request made with it has finished, as the OpenAI SDK does for its own
+    default client.
+    """
+
+    def __del__(self):
+        if self.is_closed:
+            return
+
+        try:
+            asyncio.get_running_loop().create_task(self.aclose())
+        except Exception:
+            pass
+
+
+class HttpxClient(openai.DefaultHttpxClient):
+    def __del__(self):
+        if self.is_closed:
+            return
+
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+def build_instructor_client(client: openai.AsyncOpenAI) -> instructor.AsyncInstructor:
+    # what `instructor.from_openai` builds, around a `create` that logs usage
+    return instructor.AsyncInstructor(
+        client=client,
+        create=instructor.patch(
+            create=with_prompt_cache_logging(client.chat.completions.create),
+            mode=instructor.Mode.TOOLS,
+        ),
+        mode=instructor.Mode.TOOLS,
+        provider=instructor.Provider.OPENAI,
+    )
+
+
+def retry_unless_rate_limited(max_attempts: int = 3) -> AsyncRetrying:
+    """
+    The `max_retries` of an instructor call run by a `RateLimitedScheduler`: an
+    invalid response is still asked for again, but a 429 is raised as it is on
+    its first attempt for the scheduler to back off from.
+    """
+    return AsyncRetrying(
+        stop=stop_after_attempt(max_attempts),
+        retry=retry_if_not_exception_type(openai.RateLimitError),
+    )
+
+
+class OpenAIClientRegistry:
+    """
+    One OpenAI client per API key (the platform key and the keys of orgs) for the
+    whole process, so that requests reuse the keep-alive connections, and with
+    them the TLS sessions, of the clients before them.
+
+    The clients of at most `max_keys` keys are kept, by the SHA-256 hash of the
+    key rather than the key itself. The clients of the least recently used key
+    are dropped to make room for a new one, and closed by the garbage collector
+    once the requests still using them are done, so `max_keys` should be well
+    above the number of keys in use at the same time.
+
+    HTTP/2 is used when the optional `h2` package is installed, which lets
+    concurrent requests with the same key share a single connection.
+
+    The rate limit headers of every response are kept per key and model, as the
+    budget that the jobs calling that model are scheduled against.
+    """
+
+    def __init__(
+        self,
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+        http2: bool,
+        max_keys: int = 64,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self.max_keys = max_keys
+        # hashed key -> its clients, least recently used first
+        self._clients: OrderedDict[str, OpenAIClients] = OrderedDict()
+        self._rate_limit_budgets: Dict[Tuple[str, str], RateLimitBudget] = {}
+
+    def get_rate_limit_budget(self, api_key: str, model: str) -> RateLimitBudget:
+        return self._get_rate_limit_budget(hash_api_key(api_key), model)
+
+    def _get_rate_limit_budget(self, hashed_key: str, model: str) -> RateLimitBudget:
+        budget = self._rate_limit_budgets.get((hashed_key, model))
+
+        if budget is None:
+            budget = RateLimitBudget()
+            self._rate_limit_budgets[(hashed_key, model)] = budget
+
+        return budget
+
+    def _track_rate_limits(self, hashed_key: str):
+        async def on_response(response: httpx.Response):
+            if "x-ratelimit-remaining-requests" not in response.headers:
+                return
+
+            try:
+                model = json.loads(response.request.content)["model"]
+            except (ValueError, KeyError, TypeError):
+                return
+
+            self._get_rate_limit_budget(hashed_key, model).update(response.headers)
+
+        return on_response
+
+    def _get_clients(self, api_key: str) -> OpenAIClients:
+        hashed_key = hash_api_key(api_key)
+        clients = self._clients.get(hashed_key)
+
+        if clients is not None:
+            self._clients.move_to_end(hashed_key)
+            return clients
+
+        clients = OpenAIClients(
+            client=openai.AsyncOpenAI(
+                api_key=api_key,
+                http_client=AsyncHttpxClient(
+                    http2=self.http2,
+                    limits=self.limits,
+                    event_hooks={"response": [self._track_rate_limits(hashed_key)]},
+                ),
+            )
+        )
+        self._clients[hashed_key] = clients
+
+        while len(self._clients) > max(self.max_keys, 1):
+            evicted_key, _ = self._clients.popitem(last=False)
+            self._forget_rate_limit_budgets(evicted_key)
+
+        return clients
+
+    def _forget_rate_limit_budgets(self, hashed_key: str):
+        for key in [key for key in self._rate_limit_budgets if key[0] == hashed_key]:
+            del self._rate_limit_budgets[key]
+
+    def get_client(self, api_key: str) -> openai.AsyncOpenAI:
+        return self._get_clients(api_key).client
+
+    def get_instructor_client(self, api_key: str) -> instructor.AsyncInstructor:
+        clients = self._get_clients(api_key)
+
+        if clients.instructor_client is None:
+            clients.instructor_client = build_instructor_client(clients.client)
+
+        return clients.instructor_client
+
+    def get_scheduled_instructor_client(
+        self, api_key: str
+    ) -> instructor.AsyncInstructor:
+        """
+        An instructor client for calls run by a `RateLimitedScheduler`. It shares
+        the connections of `get_client`, but the OpenAI SDK does not retry its
+        429s itself: the scheduler has to see them to back off and slow down.
+        """
+        clients = self._get_clients(api_key)
+
+        if clients.scheduled_instructor_client is None:
+            clients.scheduled_instructor_client = build_instructor_client(
+                clients.client.with_options(max_retries=0)
+            )
+
+        return clients.scheduled_instructor_client
+
+    def get_sync_client(self, api_key: str) -> openai.OpenAI:
+        clients = self._get_clients(api_key)
+
+        if clients.sync_client is None:
+            clients.sync_client = openai.OpenAI(
+                api_key=api_key,
+                http_client=HttpxClient(
+                    http2=self.http2, limits=self.limits
+                ),
+            )
+
+        return clients.sync_client
+
+    async def close(self):
+        all_clients = list(self._clients.values())
+        self._clients.clear()
+        self._rate_limit_budgets.clear()
+
+        await asyncio.gather(*[clients.client.close() for clients in all_clients])
+
+        for clients in all_clients:
+            if clients.sync_client is not None:
+                clients.sync_client.close()
+
+
+openai_clients = OpenAIClientRegistry(
+    max_connections=settings.openai_max_connections,
+    max_keepalive_connections=settings.openai_max_keepalive_connections,
+    keepalive_expiry=settings.openai_keepalive_expiry_seconds,
+    http2=settings.openai_http2,
+    max_keys=settings.openai_client_cache_size,
+)
+
+task_generation_scheduler = RateLimitedScheduler(
+    max_concurrency=settings.task_generation_max_concurrency,
+    max_retries=settings.task_generation_max_rate_limit_retries,
+)
+
+
 def validate_openai_api_key(openai_api_key: str) -> bool:
     client = OpenAI(api_key=openai_api_key)
     try:
@@ -48,7 +344,7 @@ async def run_llm_with_instructor(
     response_model: BaseModel,
     max_completion_tokens: int,
 ):
-    client = instructor.from_openai(openai.AsyncOpenAI(api_key=api_key))
+    client = openai_clients.get_instructor_client(api_key)
 
     model_kwargs = {}
 
@@ -74,7 +370,7 @@ async def stream_llm_with_instructor(
     max_completion_tokens: int,
     **kwargs,
 ):
-    client = instructor.from_openai(openai.AsyncOpenAI(api_key=api_key))
+    client = openai_clients.get_instructor_client(api_key)
 
     model_kwargs = {}
 
@@ -94,6 +390,15 @@ async def stream_llm_with_instructor(
     )
 
 
+@backoff.on_exception(backoff.expo, Exception, max_tries=5, factor=2)
+async def get_embedding(api_key: str, model: str, text: str) -> List[float]:
+    client = openai_clients.get_client(api_key)
+
+    response = await client.embeddings.create(model=model, input=text)
+
+    return response.data[0].embedding
+
+
 @backoff.on_exception(backoff.expo, Exception, max_tries=5, factor=2)
 def stream_llm_with_openai(
     api_key: str,
@@ -101,7 +406,7 @@ def stream_llm_with_openai(
     messages: List,
     max_completion_tokens: int,
 ):
-    client = openai.OpenAI(api_key=api_key)
+    client = openai_clients.get_sync_client(api_key)
 
     model_kwargs = {}
 
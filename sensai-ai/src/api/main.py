@@ -8,6 +8,7 @@ import os
 from os.path import exists
 from api.config import UPLOAD_FOLDER_NAME
 from api.routes import (
+    admin,
     auth,
     code,
     cohort,
@@ -24,14 +25,13 @@ from api.routes import (
     lessonplan,
     student,
 )
-from api.routes.ai import (
-    resume_pending_task_generation_jobs,
-    resume_pending_course_structure_generation_jobs,
-)
-from api.websockets import router as websocket_router
+from api.routes.ai import run_generation_jobs
+from api.websockets import router as websocket_router, relay_generation_events
 from api.scheduler import scheduler
 from api.settings import settings
 from api.db import init_db
+from api.utils.db import init_db_pool, close_db_pool, start_group_commit
+from api.llm import openai_clients
 import bugsnag
 from bugsnag.asgi import BugsnagMiddleware
 
@@ -41,6 +41,13 @@ async def lifespan(app: FastAPI):
     # Initialize database first
     await init_db()
 
+    # Keep a pool of warm connections for the lifetime of the app
+    await init_db_pool(settings.db_pool_size)
+
+    if settings.db_group_commit_window_ms > 0:
+        # Batch chat and completion writes arriving close together into one commit
+        start_group_commit(settings.db_group_commit_window_ms / 1000)
+
     # Ensure scheduler is stopped before starting
     if scheduler.running:
         scheduler.shutdown()
@@ -51,14 +58,24 @@ async def lifespan(app: FastAPI):
     # Create the uploads directory if it doesn't exist
     os.makedirs(settings.local_upload_folder, exist_ok=True)
 
-    # Add recovery logic for interrupted tasks
-    asyncio.create_task(resume_pending_task_generation_jobs())
-    asyncio.create_task(resume_pending_course_structure_generation_jobs())
-    
+    if settings.generation_worker_enabled:
+        # Generation jobs run in `api.worker`; relay their progress to the websockets
+        generation_jobs = asyncio.create_task(relay_generation_events())
+    else:
+        # Claim the generation jobs that no other worker holds, including the ones
+        # interrupted by a restart once their lease runs out
+        generation_jobs = asyncio.create_task(run_generation_jobs())
 
     yield
     scheduler.shutdown()
 
+    # Give the jobs this process holds back to the other workers
+    generation_jobs.cancel()
+    await asyncio.wait([generation_jobs])
+
+    await openai_clients.close()
+    await close_db_pool()
+
 
 if settings.bugsnag_api_key:
     bugsnag.configure(
@@ -130,6 +147,7 @@ app.include_router(code.router, prefix="/code", tags=["code"])
 app.include_router(hva.router, prefix="/hva", tags=["hva"])
 app.include_router(lessonplan.router, prefix="/lessonplan", tags=["lessonplan"])
 app.include_router(student.router, prefix="/student", tags=["student"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
 
 
 app.include_router(websocket_router, prefix="/ws", tags=["websockets"])
@@ -334,6 +334,8 @@ class GenerateCourseJobStatus(str, Enum):
     PENDING = "pending"
     COMPLETED = "completed"
     FAILED = "failed"
+    # failed every attempt, or stopped heartbeating on the last one
+    DEAD = "dead"
 
     def __str__(self):
         return self.value
@@ -350,6 +352,8 @@ class GenerateTaskJobStatus(str, Enum):
     STARTED = "started"
     COMPLETED = "completed"
     FAILED = "failed"
+    # failed every attempt, or stopped heartbeating on the last one
+    DEAD = "dead"
 
     def __str__(self):
         return self.value
@@ -445,6 +449,14 @@ class ChatResponseType(str, Enum):
     AUDIO = "audio"
 
 
+class ChatStreamFormat(str, Enum):
+    # every line is the whole partial response
+    SNAPSHOT = "snapshot"
+    # every line is the list of operations of `api.utils.json_patch` that turn
+    # the previous partial response into the next one
+    PATCH = "patch"
+
+
 class ChatMessage(BaseModel):
     id: int
     created_at: str
@@ -649,6 +661,7 @@ class AIChatRequest(BaseModel):
     user_id: int
     task_id: int
     response_type: Optional[ChatResponseType] = None
+    stream_format: ChatStreamFormat = ChatStreamFormat.SNAPSHOT
 
 
 class MarkTaskCompletedRequest(BaseModel):
@@ -1,23 +1,26 @@
+from datetime import datetime
 from typing import Annotated, Dict, List, Optional, Tuple
-from fastapi import FastAPI, Body, Header, HTTPException, Depends
+from fastapi import FastAPI, Body, Header, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from api.models import (
     PublicAPIChatMessage,
     CourseWithMilestonesAndTaskDetails,
-    TaskType,
 )
 from api.db.chat import (
     get_all_chat_history as get_all_chat_history_from_db,
+    iterate_all_chat_history,
 )
 from api.db.course import (
     get_course as get_course_from_db,
     get_course_org_id,
 )
-from api.db.task import get_task as get_task_from_db
 from api.db.org import get_org_id_from_api_key
 
 
 app = FastAPI()
 
+MAX_CHAT_HISTORY_PAGE_SIZE = 10000
+
 
 async def validate_api_key(api_key: str, org_id: int) -> None:
     """
@@ -45,10 +48,38 @@ async def validate_api_key(api_key: str, org_id: int) -> None:
 async def get_all_chat_history(
     org_id: int,
     api_key: str = Header(...),
+    after_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_CHAT_HISTORY_PAGE_SIZE),
+    stream: bool = False,
 ) -> List[PublicAPIChatMessage]:
+    """
+    Messages are returned in the order of their ids. To page through them,
+    pass `limit` and then the id of the last message received as `after_id`
+    until a page has fewer than `limit` messages. With `stream`, every message
+    is sent as its own line of NDJSON, read from the database in batches.
+    `since` only returns messages created at or after the given time.
+    """
     # Validate the API key for the given org_id
     await validate_api_key(api_key=api_key, org_id=org_id)
-    return await get_all_chat_history_from_db(org_id)
+
+    if not stream:
+        return await get_all_chat_history_from_db(
+            org_id, after_id=after_id, since=since, limit=limit
+        )
+
+    async def stream_chat_history():
+        async for messages in iterate_all_chat_history(
+            org_id, after_id=after_id, since=since, limit=limit
+        ):
+            yield "".join(
+                PublicAPIChatMessage(**message).model_dump_json() + "\n"
+                for message in messages
+            )
+
+    return StreamingResponse(
+        stream_chat_history(), media_type="application/x-ndjson"
+    )
 
 
 @app.get(
@@ -70,24 +101,12 @@ async def get_tasks_for_course(
     except ValueError:
         raise HTTPException(status_code=404, detail="Course not found")
 
+    # the key was verified above, so it only has to belong to the org of the course
     if org_id != course_org_id:
         raise HTTPException(
             status_code=403,
             detail="Invalid API key",
         )
 
-    # Validate the API key for the given org_id
-    await validate_api_key(api_key=api_key, org_id=org_id)
-
-    course = await get_course_from_db(course_id=course_id)
-
-    for milestone in course["milestones"]:
-        for task in milestone["tasks"]:
-            task_details = await get_task_from_db(task["id"])
-
-            if task["type"] == TaskType.LEARNING_MATERIAL:
-                task["blocks"] = task_details["blocks"]
-            else:
-                task["questions"] = task_details["questions"]
-
-    return course
+    # blocks and questions for every task are loaded along with the course tree
+    return await get_course_from_db(course_id=course_id, include_task_details=True)
@@ -0,0 +1,40 @@
+from typing import Dict
+from fastapi import APIRouter
+from api.utils.query_profiler import query_profiler
+from api.db.api_key_cache import api_key_cache
+from api.db.routing import routing_decision_cache
+
+router = APIRouter()
+
+
+@router.get("/db/query_stats")
+async def get_db_query_stats() -> Dict:
+    return query_profiler.get_stats()
+
+
+@router.delete("/db/query_stats")
+async def reset_db_query_stats():
+    query_profiler.reset()
+    return {"success": True}
+
+
+@router.get("/api_key_cache/stats")
+async def get_api_key_cache_stats() -> Dict:
+    return api_key_cache.get_stats()
+
+
+@router.delete("/api_key_cache/stats")
+async def reset_api_key_cache_stats():
+    api_key_cache.reset_stats()
+    return {"success": True}
+
+
+@router.get("/routing_cache/stats")
+async def get_routing_cache_stats() -> Dict:
+    return await routing_decision_cache.get_stats()
+
+
+@router.delete("/routing_cache/stats")
+async def reset_routing_cache_stats():
+    routing_decision_cache.reset_stats()
+    return {"success": True}
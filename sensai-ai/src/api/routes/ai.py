@@ -4,12 +4,12 @@ import tempfile
 import random
 from collections import defaultdict
 import asyncio
+import functools
+import time
 from fastapi import APIRouter, HTTPException, Body, BackgroundTasks
 from fastapi.responses import StreamingResponse
-from typing import List, Optional, Dict, Literal, AsyncGenerator
+from typing import List, Optional, Dict, Literal, AsyncGenerator, Coroutine
 import json
-import instructor
-import openai
 from pydantic import BaseModel, Field
 from langchain_core.output_parsers import PydanticOutputParser
 from api.config import openai_plan_to_model_name
@@ -17,45 +17,66 @@ from api.models import (
     TaskAIResponseType,
     AIChatRequest,
     ChatResponseType,
+    ChatStreamFormat,
     TaskType,
     GenerateCourseStructureRequest,
     GenerateCourseJobStatus,
     GenerateTaskJobStatus,
     QuestionType,
 )
-from api.llm import run_llm_with_instructor, stream_llm_with_instructor
+from api.llm import (
+    run_llm_with_instructor,
+    stream_llm_with_instructor,
+    get_embedding,
+    assemble_messages,
+    openai_clients,
+    retry_unless_rate_limited,
+    task_generation_scheduler,
+)
 from api.settings import settings
 from api.utils.logging import logger
-from api.utils.concurrency import async_batch_gather
+from api.utils.concurrency import discard_task, prefetch_stream
 from api.websockets import get_manager
 from api.db.task import (
     get_task_metadata,
     get_question,
     get_task,
     get_scorecard,
-    create_draft_task_for_course,
     store_task_generation_request,
     update_task_generation_job_status,
     get_course_task_generation_jobs_status,
     add_generated_learning_material,
     add_generated_quiz,
-    get_all_pending_task_generation_jobs,
 )
 from api.db.course import (
     store_course_generation_request,
     get_course_generation_job_details,
     update_course_generation_job_status_and_details,
     update_course_generation_job_status,
-    get_all_pending_course_structure_generation_jobs,
-    add_milestone_to_course,
+    add_generated_course_items,
+    delete_generated_course_items,
 )
 from api.db.chat import get_question_chat_history_for_user
+from api.db.generation_events import delete_generation_events_before
+from api.db.job_queue import course_generation_job_queue, task_generation_job_queue
+from api.db.semantic_cache import (
+    semantic_cache,
+    hash_material,
+    normalize_query,
+    normalize_embedding,
+)
+from api.db.routing import (
+    routing_decision_cache,
+    hash_question_content,
+    get_chat_turn_bucket,
+)
 from api.db.utils import construct_description_from_blocks
 from api.utils.s3 import (
     download_file_from_s3_as_bytes,
     get_media_upload_s3_key_from_uuid,
 )
 from api.utils.audio import prepare_audio_input_for_ai
+from api.utils.json_patch import diff_json
 from api.settings import tracer
 from opentelemetry.trace import StatusCode, Status
 from openinference.instrumentation import using_attributes
@@ -245,214 +266,400 @@ async def ai_response_for_question(request: AIChatRequest):
                 f"""\n\nScoring Criteria:\n```\n{scoring_criteria_as_prompt}\n```"""
             )
 
-    chat_history = (
-        chat_history
-        + [user_message]
-        + [
-            {
-                "role": "user",
-                "content": question_details,
-            }
-        ]
-    )
+    # students asking the same thing about the same learning material can be sent
+    # the response to an earlier, similar enough query
+    semantic_cache_key = None
+    semantic_cache_lookup = {}
+    if (
+        request.task_type == TaskType.LEARNING_MATERIAL
+        and settings.semantic_cache_enabled
+    ):
+        semantic_cache_key = (
+            task["org_id"],
+            request.task_id,
+            hash_material(reference_material),
+        )
 
-    # Define an async generator for streaming
-    async def stream_response() -> AsyncGenerator[str, None]:
-        with tracer.start_as_current_span(
-            "ai_chat", openinference_span_kind="llm"
-        ) as span:
-            span.set_input(chat_history)
+    # the router decides from the question and how long the chat has gone on for,
+    # so its decision is reused for the later turns of chats on the same question
+    routing_cache_key = None
+    if request.task_type == TaskType.QUIZ and request.question_id:
+        routing_cache_key = (
+            request.question_id,
+            hash_question_content(question_details),
+            get_chat_turn_bucket(
+                sum(message["role"] == "user" for message in chat_history)
+            ),
+        )
 
-            if request.task_type == TaskType.LEARNING_MATERIAL:
-                with using_attributes(
-                    session_id=session_id,
-                    user_id=str(request.user_id),
-                    metadata={"stage": "query_rewrite", **metadata},
-                ):
-                    system_prompt = f"""You are a very good communicator.\n\nYou will receive:\n- A Reference Material\n- Conversation history with a student\n- The student's latest query/message.\n\nYour role: You need to rewrite the student's latest query/message by taking the reference material and the conversation history into consideration so that the query becomes more specific, detailed and clear, reflecting the actual intent of the student."""
+    chat_history = chat_history + [user_message]
 
-                    model = openai_plan_to_model_name["text-mini"]
+    async def rewrite_query() -> Optional[str]:
+        if request.task_type != TaskType.LEARNING_MATERIAL:
+            return None
 
-                    messages = [
-                        {"role": "system", "content": system_prompt}
-                    ] + chat_history
+        with using_attributes(
+            session_id=session_id,
+            user_id=str(request.user_id),
+            metadata={"stage": "query_rewrite", **metadata},
+        ):
+            system_prompt = f"""You are a very good communicator.\n\nYou will receive:\n- A Reference Material\n- Conversation history with a student\n- The student's latest query/message.\n\nYour role: You need to rewrite the student's latest query/message by taking the reference material and the conversation history into consideration so that the query becomes more specific, detailed and clear, reflecting the actual intent of the student."""
 
-                    class Output(BaseModel):
-                        rewritten_query: str = Field(
-                            description="The rewritten query/message of the student"
-                        )
+            model = openai_plan_to_model_name["text-mini"]
 
-                    pred = await run_llm_with_instructor(
-                        api_key=settings.openai_api_key,
-                        model=model,
-                        messages=messages,
-                        response_model=Output,
-                        max_completion_tokens=8192,
+            messages = assemble_messages(system_prompt, [question_details], chat_history)
+
+            class Output(BaseModel):
+                rewritten_query: str = Field(
+                    description="The rewritten query/message of the student"
+                )
+
+            pred = await run_llm_with_instructor(
+                api_key=settings.openai_api_key,
+                model=model,
+                messages=messages,
+                response_model=Output,
+                max_completion_tokens=8192,
+            )
+
+            return pred.rewritten_query
+
+    def get_routed_model(use_reasoning_model: bool) -> str:
+        if use_reasoning_model:
+            return openai_plan_to_model_name["reasoning"]
+
+        return openai_plan_to_model_name["text"]
+
+    async def get_cached_route() -> Optional[str]:
+        if request.response_type == ChatResponseType.AUDIO:
+            return openai_plan_to_model_name["audio"]
+
+        if routing_cache_key is None:
+            return None
+
+        use_reasoning_model = await routing_decision_cache.get(*routing_cache_key)
+
+        if use_reasoning_model is None:
+            return None
+
+        return get_routed_model(use_reasoning_model)
+
+    async def route() -> str:
+        class Output(BaseModel):
+            use_reasoning_model: bool = Field(
+                description="Whether to use a reasoning model to evaluate the student's response"
+            )
+
+        format_instructions = PydanticOutputParser(
+            pydantic_object=Output
+        ).get_format_instructions()
+
+        system_prompt = f"""You are an intelligent routing agent that decides which type of language model should be used to evaluate a student's response to a given task. You will receive the details of a task, the conversation history with the student and the student's latest query/message.\n\nYou have two options:\n- Reasoning Model (e.g. o3): Best for complex tasks involving logical deduction, problem-solving, code generation, mathematics, research reasoning, multi-step analysis, or edge-case handling.\n- General-Purpose Model (e.g. gpt-4o): Best for everyday conversation, writing help, summaries, rephrasing, explanations, casual queries, grammar correction, and general knowledge Q&A.\n\nYour job is to classify which of the two options is best suited to evaluate the student's response for the given task. If a task can be solved by a general purpose model, avoid using a reasoning model as it takes longer and costs more. At the same time, accuracy cannot be compromised.\n\n{format_instructions}"""
+
+        messages = assemble_messages(system_prompt, [question_details], chat_history)
+
+        with using_attributes(
+            session_id=session_id,
+            user_id=str(request.user_id),
+            metadata={"stage": "router", **metadata},
+        ):
+            router_output = await run_llm_with_instructor(
+                api_key=settings.openai_api_key,
+                model=openai_plan_to_model_name["router"],
+                messages=messages,
+                response_model=Output,
+                max_completion_tokens=4096,
+            )
+
+        if routing_cache_key is not None:
+            await routing_decision_cache.put(
+                *routing_cache_key, router_output.use_reasoning_model
+            )
+
+        return get_routed_model(router_output.use_reasoning_model)
+
+    async def get_knowledge_base() -> Optional[str]:
+        if request.task_type != TaskType.QUIZ or not question["context"]:
+            return None
+
+        linked_learning_material_ids = question["context"]["linkedMaterialIds"]
+        knowledge_blocks = question["context"]["blocks"]
+
+        if linked_learning_material_ids:
+            linked_tasks = await asyncio.gather(
+                *[get_task(int(id)) for id in linked_learning_material_ids]
+            )
+            for task in linked_tasks:
+                if task:
+                    knowledge_blocks += task["blocks"]
+
+        return construct_description_from_blocks(knowledge_blocks)
+
+    def get_feedback_request(knowledge_base: Optional[str]):
+        """The messages for the feedback and the model its response is parsed into"""
+        if request.task_type == TaskType.QUIZ:
+            if question["type"] == QuestionType.OBJECTIVE:
+
+                class Output(BaseModel):
+                    analysis: str = Field(
+                        description="A detailed analysis of the student's response"
+                    )
+                    feedback: str = Field(
+                        description="Feedback on the student's response; add newline characters to the feedback to make it more readable where necessary"
+                    )
+                    is_correct: bool = Field(
+                        description="Whether the student's response correctly solves the original task that the student is supposed to solve. For this to be true, the original task needs to be completely solved and not just partially solved. Giving the right answer to one step of the task does not count as solving the entire task."
                     )
 
-                    chat_history[-2]["content"] = get_user_message_for_chat_history(
-                        pred.rewritten_query
+            else:
+
+                class Feedback(BaseModel):
+                    correct: Optional[str] = Field(
+                        description="What worked well in the student's response for this category based on the scoring criteria"
+                    )
+                    wrong: Optional[str] = Field(
+                        description="What needs improvement in the student's response for this category based on the scoring criteria"
                     )
 
-            output_buffer = []
+                class Row(BaseModel):
+                    category: str = Field(
+                        description="Category from the scoring criteria for which the feedback is being provided"
+                    )
+                    feedback: Feedback = Field(
+                        description="Detailed feedback for the student's response for this category"
+                    )
+                    score: int = Field(
+                        description="Score given within the min/max range for this category based on the student's response - the score given should be in alignment with the feedback provided"
+                    )
+                    max_score: int = Field(
+                        description="Maximum score possible for this category as per the scoring criteria"
+                    )
+                    pass_score: int = Field(
+                        description="Pass score possible for this category as per the scoring criteria"
+                    )
 
-            try:
-                if request.response_type == ChatResponseType.AUDIO:
-                    model = openai_plan_to_model_name["audio"]
-                else:
+                class Output(BaseModel):
+                    feedback: str = Field(
+                        description="A single, comprehensive summary based on the scoring criteria"
+                    )
+                    scorecard: Optional[List[Row]] = Field(
+                        description="List of rows with one row for each category from scoring criteria; only include this in the response if the student's response is an answer to the task"
+                    )
 
-                    class Output(BaseModel):
-                        use_reasoning_model: bool = Field(
-                            description="Whether to use a reasoning model to evaluate the student's response"
-                        )
+        else:
 
-                    format_instructions = PydanticOutputParser(
-                        pydantic_object=Output
-                    ).get_format_instructions()
+            class Output(BaseModel):
+                response: str = Field(
+                    description="Response to the student's query; add proper formatting to the response to make it more readable where necessary"
+                )
 
-                    system_prompt = f"""You are an intelligent routing agent that decides which type of language model should be used to evaluate a student's response to a given task. You will receive the details of a task, the conversation history with the student and the student's latest query/message.\n\nYou have two options:\n- Reasoning Model (e.g. o3): Best for complex tasks involving logical deduction, problem-solving, code generation, mathematics, research reasoning, multi-step analysis, or edge-case handling.\n- General-Purpose Model (e.g. gpt-4o): Best for everyday conversation, writing help, summaries, rephrasing, explanations, casual queries, grammar correction, and general knowledge Q&A.\n\nYour job is to classify which of the two options is best suited to evaluate the student's response for the given task. If a task can be solved by a general purpose model, avoid using a reasoning model as it takes longer and costs more. At the same time, accuracy cannot be compromised.\n\n{format_instructions}"""
+        parser = PydanticOutputParser(pydantic_object=Output)
+        format_instructions = parser.get_format_instructions()
 
-                    messages = [
-                        {
-                            "role": "system",
-                            "content": system_prompt,
-                        }
-                    ] + chat_history
+        if request.task_type == TaskType.QUIZ:
+            context_instructions = ""
+            if knowledge_base:
+                context_instructions = f"""\n- Context for the task\n\nMake sure to use only the information provided in the Context for responding to the student while ignoring any other information that contradicts the information provided."""
 
-                    with using_attributes(
-                        session_id=session_id,
-                        user_id=str(request.user_id),
-                        metadata={"stage": "router", **metadata},
-                    ):
-                        router_output = await run_llm_with_instructor(
-                            api_key=settings.openai_api_key,
-                            model=openai_plan_to_model_name["router"],
-                            messages=messages,
-                            response_model=Output,
-                            max_completion_tokens=4096,
-                        )
+            if question["type"] == QuestionType.OBJECTIVE:
+                system_prompt = f"""You are a Socratic tutor who guides a student step-by-step as a coach would, encouraging them to arrive at the correct answer on their own without ever giving away the right answer to the student straight away.\n\nYou will receive:\n\n- Task description\n- Conversation history with the student\n- Task solution (for your reference only; do not reveal){context_instructions}\n\nYou need to evaluate the student's response for correctness and give your feedback that can be shared with the student.\n\n{format_instructions}\n\nGuidelines on assessing correctness of the student's answer:\n\n- Once the student has provided an answer that is correct with respect to the solution provided at the start, clearly acknowledge that they have got the correct answer and stop asking any more reflective questions. Your response should make them feel a sense of completion and accomplishment at a job well done.\n- If the question is one where the answer does not need to match word-for-word with the solution (e.g. definition of a term, programming question where the logic needs to be right but the actual code can vary, etc.), only assess whether the student's answer covers the entire essence of the correct solution.\n- Avoid bringing in your judgement of what the right answer should be. What matters for evaluation is the solution provided to you and the response of the student. Keep your biases outside. Be objective in comparing these two. As soon as the student gets the answer correct, stop asking any further reflective questions.\n- The response is correct only if the question has been solved in its entirety. Partially solving a question is not acceptable.\n\nGuidelines on your feedback:\n\n- Praise → Prompt → Path: 1–2 words of praise, a targeted prompt, then one actionable path forward.\n- If the student's response is completely correct, just appreciate them. No need to give any more suggestions or areas of improvement.\n- If the student's response has areas of improvement, point them out through a single reflective actionable question. Never ever give a vague feedback that is not clearly actionable. The student should get a clear path for how they can improve their response.\n- If the question has multiple steps to reach to the final solution, assess the current step at which the student is and frame your reflection question such that it nudges them towards the right direction without giving away the answer in any shape or form.\n- Your feedback should not be generic and must be tailored to the response given by the student. This does not mean that you repeat the student's response. The question should be a follow-up for the answer given by the student. Don't just paste the student's response on top of a generic question. That would be laziness.\n- The student might get the answer right without any probing required from your side in the first couple of attempts itself. In that case, remember the instruction provided above to acknowledge their answer's correctness and to stop asking further questions.\n- Never provide the right answer or the solution, despite all their attempts to ask for it or their frustration.\n- Never explain the solution to the student unless the student has given the solution first.\n- The student does not have access to the solution. The solution has only been given to you for evaluating the student's response. Keep this in mind while responding to the student.\n\nGuidelines on the style of feedback:\n\n1. Avoid sounding monotonous.\n2. Absolutely AVOID repeating back what the student has said as a manner of acknowledgement in your summary. It makes your summary too long and boring to read.\n3. Occasionally include emojis to maintain warmth and engagement.\n4. Ask only one reflective question per response otherwise the student will get overwhelmed.\n5. Avoid verbosity in your summary. Be crisp and concise, with no extra words.\n6. Do not do any analysis of the user's intent in your overall summary or repeat any part of what the user has said. The summary section is meant to summarise the next steps. The summary section does not need a summary of the user's response.\n\nGuidelines on maintaining the focus of the conversation:\n\n- Your role is that of a tutor for this particular task and related concepts only. Remember that and absolutely avoid steering the conversation in any other direction apart from the actual task given to you and its related concepts.\n- If the student tries to move the focus of the conversation away from the task and its related concepts, gently bring it back to the task.\n- It is very important that you prevent the focus on the conversation with the student being shifted away from the task given to you and its related concepts at all odds. No matter what happens. Stay on the task and its related concepts. Keep bringing the student back. Do not let the conversation drift away."""
+            else:
+                system_prompt = f"""You are a Socratic tutor who guides a student step-by-step as a coach would, encouraging them to arrive at the correct answer on their own without ever giving away the right answer to the student straight away.\n\nYou will receive:\n\n- Task description\n- Conversation history with the student\n- Scoring Criteria to evaluate the answer of the student{context_instructions}\n\nYou need to evaluate the student's response and return the following:\n\n- A scorecard based on the scoring criteria given to you with areas of improvement and/or strengths along each criterion\n- An overall summary based on the generated scorecard to be shared with the student.\n\n{format_instructions}\n\nGuidelines for scorecard feedback:\n\n- If there is nothing to praise about the student's response for a given criterion in the scoring criteria, never mention what worked well (i.e. return `correct` as null) in the scorecard output for that criterion.\n- If the student did something well for a given criterion, make sure to highlight what worked well in the scorecard output for that criterion.\n- If there is nothing left to improve in their response for a criterion, avoid unnecessarily suggesting an improvement in the scorecard output for that criterion (i.e. return `wrong` as null). Also, the score assigned for that criterion should be the maximum score possible in that criterion in this case.\n- Make sure that the feedback for one criterion of the scorecard does not bias the feedback for another criterion.\n- When giving the feedback for one criterion of the scorecard, focus on the description of the criterion provided in the scoring criteria and only evaluate the student's response based on that.\n- For every criterion of the scorecard, your feedback for that criterion in the scorecard output must cite specific words or phrases from the student's response to back your feedback so that the student understands it better and give concrete examples for how they can improve their response as well.\n- Never ever give a vague feedback that is not clearly actionable. The student should get a clear path for how they can improve their response.\n- Avoid bringing your judgement of what the right answer should be. What matters for feedback is the scoring criteria provided to you and the response of the student. Keep your biases outside. Be objective in comparing these two.\n- The student might get the answer right without any probing required from your side in the first couple of attempts itself. In that case, remember the instruction provided above to acknowledge their answer's correctness and to stop asking further questions.\n- If you don't assign the maximum score to the student's response for any criterion in the scorecard, make sure to always include the area of improvement containing concrete steps they can take to improve their response in your feedback for that criterion in the scorecard output (i.e. `wrong` cannot be null).\n\nGuidelines for scorecard feedback style:\n\n1. Avoid sounding monotonous.\n2. Be crisp and concise, with no extra words.\n\nGuidelines for summary:\n- Praise → Prompt → Path: 1–2 words of praise, a targeted prompt, then one actionable path forward.\n- It should clearly outline what the next steps need to be based on the scoring criteria. It should be very crisp and only contain the summary of the next steps outlined in the scorecard feedback.\n- Your overall summary does not need to quote specific words from the user's response or reflect back what the user's response means. Keep that for the feedback in the scorecard output.\n- If the student's response is completely correct, just appreciate them. No need to give any more suggestions or areas of improvement.\n- If the student's response has areas of improvement, point them out through a single reflective actionable question.\n- Your summary and follow-up question should not be generic and must be tailored to the response given by the student. This does not mean that you repeat the student's response. The question should be a follow-up for the answer given by the student. Don't just paste the student's response on top of a generic question. That would be laziness.\n- Never provide the right answer or the solution, despite all their attempts to ask for it or their frustration.\n- Never explain the solution to the student unless the student has given the solution first.\n\nGuidelines for style of summary:\n\n1. Avoid sounding monotonous.\n2. Absolutely AVOID repeating back what the student has said as a manner of acknowledgement in your summary. It makes your summary too long and boring to read.\n3. Occasionally include emojis to maintain warmth and engagement.\n4. Ask only one reflective question per response otherwise the student will get overwhelmed.\n5. Avoid verbosity in your summary.\n6. Do not do any analysis of the user's intent in your overall summary or repeat any part of what the user has said. The summary section is meant to summarise the next steps. The summary section does not need a summary of the user's response.\n\nGuidelines on maintaining the focus of the conversation:\n\n- Your role is that of a tutor for this particular task and related concepts only. Remember that and absolutely avoid steering the conversation in any other direction apart from the actual task given to you and its related concepts.\n- If the student tries to move the focus of the conversation away from the task and its related concepts, gently bring it back to the task.\n- It is very important that you prevent the focus on the conversation with the student being shifted away from the task given to you and its related concepts at all odds. No matter what happens. Stay on the task and its related concepts. Keep bringing the student back. Do not let the conversation drift away.\n\nGuidelines on when to show the scorecard:\n\n- If the response by the student is not a valid answer to the actual task given to them (e.g. if their response is an acknowledgement of the previous messages or a doubt or a question or something irrelevant to the task), do not provide any scorecard in that case and only return a summary addressing their response.\n- For messages of acknowledgement, you do not need to explicitly call it out as an acknowledgement. Simply respond to it normally."""
+        else:
+            system_prompt = f"""You are a teaching assistant.\n\nYou will receive:\n- A Reference Material\n- Conversation history with a student\n- The student's latest query/message.\n\nYour role:\n- You need to respond to the student's message based on the content in the reference material provided to you.\n- If the student's query is absolutely not relevant to the reference material or goes beyond the scope of the reference material, clearly saying so without indulging their irrelevant queries. The only exception is when they are asking deeper questions related to the learning material that might not be mentioned in the reference material itself to clarify their conceptual doubts. In this case, you can provide the answer and help them.\n- Remember that the reference material is in read-only mode for the student. So, they cannot make any changes to it.\n\n{format_instructions}\n\nGuidelines on your response style:\n- Be crisp, concise and to the point.\n- Vary your phrasing to avoid monotony; occasionally include emojis to maintain warmth and engagement.\n- Playfully redirect irrelevant responses back to the task without judgment.\n- If the task involves code, format code snippets or variable/function names with backticks (`example`).\n- If including HTML, wrap tags in backticks (`<html>`).\n- If your response includes rich text format like lists, font weights, tables, etc. always render them as markdown.\n- Avoid being unnecessarily verbose in your response.\n\nGuideline on maintaining focus:\n- Your role is that of a teaching assistant for this particular task and its related concepts only. Remember that and absolutely avoid steering the conversation in any other direction apart from the actual task and its related concepts give to you.\n- If the student tries to move the focus of the conversation away from the task and its related concepts, gently bring it back.\n- It is very important that you prevent the focus on the conversation with the student being shifted away from the task and its related concepts given to you at all odds. No matter what happens. Stay on the task and its related concepts. Keep bringing the student back to the task and its related concepts. Do not let the conversation drift away."""
 
-                    if router_output.use_reasoning_model:
-                        model = openai_plan_to_model_name["reasoning"]
-                    else:
-                        model = openai_plan_to_model_name["text"]
+        static_contents = [question_details]
+        if request.task_type == TaskType.QUIZ and knowledge_base:
+            static_contents.append(f"""Context:\n```\n{knowledge_base}\n```""")
 
-                # print(f"Using model: {model}")
+        messages = assemble_messages(system_prompt, static_contents, chat_history)
 
-                if request.task_type == TaskType.QUIZ:
-                    if question["type"] == QuestionType.OBJECTIVE:
+        return messages, Output
 
-                        class Output(BaseModel):
-                            analysis: str = Field(
-                                description="A detailed analysis of the student's response"
-                            )
-                            feedback: str = Field(
-                                description="Feedback on the student's response; add newline characters to the feedback to make it more readable where necessary"
-                            )
-                            is_correct: bool = Field(
-                                description="Whether the student's response correctly solves the original task that the student is supposed to solve. For this to be true, the original task needs to be completely solved and not just partially solved. Giving the right answer to one step of the task does not count as solving the entire task."
-                            )
+    async def get_semantic_cache_hit(
+        query: Optional[str], response_model: BaseModel
+    ) -> Optional[AsyncGenerator]:
+        if semantic_cache_key is None or query is None:
+            return None
 
-                    else:
+        try:
+            with using_attributes(
+                session_id=session_id,
+                user_id=str(request.user_id),
+                metadata={"stage": "semantic_cache", **metadata},
+            ):
+                query_embedding = normalize_embedding(
+                    await get_embedding(
+                        api_key=settings.openai_api_key,
+                        model=openai_plan_to_model_name["embedding"],
+                        text=normalize_query(query),
+                    )
+                )
 
-                        class Feedback(BaseModel):
-                            correct: Optional[str] = Field(
-                                description="What worked well in the student's response for this category based on the scoring criteria"
-                            )
-                            wrong: Optional[str] = Field(
-                                description="What needs improvement in the student's response for this category based on the scoring criteria"
-                            )
-
-                        class Row(BaseModel):
-                            category: str = Field(
-                                description="Category from the scoring criteria for which the feedback is being provided"
-                            )
-                            feedback: Feedback = Field(
-                                description="Detailed feedback for the student's response for this category"
-                            )
-                            score: int = Field(
-                                description="Score given within the min/max range for this category based on the student's response - the score given should be in alignment with the feedback provided"
-                            )
-                            max_score: int = Field(
-                                description="Maximum score possible for this category as per the scoring criteria"
-                            )
-                            pass_score: int = Field(
-                                description="Pass score possible for this category as per the scoring criteria"
-                            )
-
-                        class Output(BaseModel):
-                            feedback: str = Field(
-                                description="A single, comprehensive summary based on the scoring criteria"
-                            )
-                            scorecard: Optional[List[Row]] = Field(
-                                description="List of rows with one row for each category from scoring criteria; only include this in the response if the student's response is an answer to the task"
-                            )
+            response, similarity = await semantic_cache.get(
+                *semantic_cache_key, query_embedding
+            )
+        except Exception as error:
+            # the cache must never keep a student from getting a response
+            logger.error(f"Semantic cache lookup failed: {error}")
+            return None
+
+        semantic_cache_lookup.update(
+            query_embedding=query_embedding,
+            similarity=similarity,
+            hit=response is not None,
+        )
 
-                else:
+        if response is None:
+            return None
 
-                    class Output(BaseModel):
-                        response: str = Field(
-                            description="Response to the student's query; add proper formatting to the response to make it more readable where necessary"
-                        )
+        async def replay_response():
+            yield response_model.model_validate(response)
 
-                parser = PydanticOutputParser(pydantic_object=Output)
-                format_instructions = parser.get_format_instructions()
+        return replay_response()
 
-                if request.task_type == TaskType.QUIZ:
-                    knowledge_base = None
+    async def start_feedback_stream(
+        model: str, messages: List[Dict], response_model: BaseModel
+    ) -> AsyncGenerator:
+        return await stream_llm_with_instructor(
+            api_key=settings.openai_api_key,
+            model=model,
+            messages=messages,
+            response_model=response_model,
+            max_completion_tokens=4096,
+        )
 
-                    if question["context"]:
-                        linked_learning_material_ids = question["context"][
-                            "linkedMaterialIds"
-                        ]
-                        knowledge_blocks = question["context"]["blocks"]
+    async def start_pipelined_feedback_stream():
+        # the router decides on the query as the student wrote it instead of
+        # waiting for the rewrite, and the feedback from the default model is
+        # started while the router is still deciding and thrown away if the
+        # router picks the reasoning model
+        model = await get_cached_route()
+        router_task = asyncio.create_task(route()) if model is None else None
+        speculative_task = None
 
-                        if linked_learning_material_ids:
-                            for id in linked_learning_material_ids:
-                                task = await get_task(int(id))
-                                if task:
-                                    knowledge_blocks += task["blocks"]
+        try:
+            rewritten_query, knowledge_base = await asyncio.gather(
+                rewrite_query(), get_knowledge_base()
+            )
 
-                        knowledge_base = construct_description_from_blocks(
-                            knowledge_blocks
-                        )
+            if rewritten_query is not None:
+                chat_history[-1] = {
+                    "role": "user",
+                    "content": get_user_message_for_chat_history(rewritten_query),
+                }
 
-                    context_instructions = ""
-                    if knowledge_base:
-                        context_instructions = f"""\n\nMake sure to use only the information provided within ``` below for responding to the student while ignoring any other information that contradicts the information provided:\n\n```\n{knowledge_base}\n```"""
+            messages, Output = get_feedback_request(knowledge_base)
 
-                    if question["type"] == QuestionType.OBJECTIVE:
-                        system_prompt = f"""You are a Socratic tutor who guides a student step-by-step as a coach would, encouraging them to arrive at the correct answer on their own without ever giving away the right answer to the student straight away.\n\nYou will receive:\n\n- Task description\n- Conversation history with the student\n- Task solution (for your reference only; do not reveal){context_instructions}\n\nYou need to evaluate the student's response for correctness and give your feedback that can be shared with the student.\n\n{format_instructions}\n\nGuidelines on assessing correctness of the student's answer:\n\n- Once the student has provided an answer that is correct with respect to the solution provided at the start, clearly acknowledge that they have got the correct answer and stop asking any more reflective questions. Your response should make them feel a sense of completion and accomplishment at a job well done.\n- If the question is one where the answer does not need to match word-for-word with the solution (e.g. definition of a term, programming question where the logic needs to be right but the actual code can vary, etc.), only assess whether the student's answer covers the entire essence of the correct solution.\n- Avoid bringing in your judgement of what the right answer should be. What matters for evaluation is the solution provided to you and the response of the student. Keep your biases outside. Be objective in comparing these two. As soon as the student gets the answer correct, stop asking any further reflective questions.\n- The response is correct only if the question has been solved in its entirety. Partially solving a question is not acceptable.\n\nGuidelines on your feedback:\n\n- Praise → Prompt → Path: 1–2 words of praise, a targeted prompt, then one actionable path forward.\n- If the student's response is completely correct, just appreciate them. No need to give any more suggestions or areas of improvement.\n- If the student's response has areas of improvement, point them out through a single reflective actionable question. Never ever give a vague feedback that is not clearly actionable. The student should get a clear path for how they can improve their response.\n- If the question has multiple steps to reach to the final solution, assess the current step at which the student is and frame your reflection question such that it nudges them towards the right direction without giving away the answer in any shape or form.\n- Your feedback should not be generic and must be tailored to the response given by the student. This does not mean that you repeat the student's response. The question should be a follow-up for the answer given by the student. Don't just paste the student's response on top of a generic question. That would be laziness.\n- The student might get the answer right without any probing required from your side in the first couple of attempts itself. In that case, remember the instruction provided above to acknowledge their answer's correctness and to stop asking further questions.\n- Never provide the right answer or the solution, despite all their attempts to ask for it or their frustration.\n- Never explain the solution to the student unless the student has given the solution first.\n- The student does not have access to the solution. The solution has only been given to you for evaluating the student's response. Keep this in mind while responding to the student.\n\nGuidelines on the style of feedback:\n\n1. Avoid sounding monotonous.\n2. Absolutely AVOID repeating back what the student has said as a manner of acknowledgement in your summary. It makes your summary too long and boring to read.\n3. Occasionally include emojis to maintain warmth and engagement.\n4. Ask only one reflective question per response otherwise the student will get overwhelmed.\n5. Avoid verbosity in your summary. Be crisp and concise, with no extra words.\n6. Do not do any analysis of the user's intent in your overall summary or repeat any part of what the user has said. The summary section is meant to summarise the next steps. The summary section does not need a summary of the user's response.\n\nGuidelines on maintaining the focus of the conversation:\n\n- Your role is that of a tutor for this particular task and related concepts only. Remember that and absolutely avoid steering the conversation in any other direction apart from the actual task given to you and its related concepts.\n- If the student tries to move the focus of the conversation away from the task and its related concepts, gently bring it back to the task.\n- It is very important that you prevent the focus on the conversation with the student being shifted away from the task given to you and its related concepts at all odds. No matter what happens. Stay on the task and its related concepts. Keep bringing the student back. Do not let the conversation drift away."""
-                    else:
-                        system_prompt = f"""You are a Socratic tutor who guides a student step-by-step as a coach would, encouraging them to arrive at the correct answer on their own without ever giving away the right answer to the student straight away.\n\nYou will receive:\n\n- Task description\n- Conversation history with the student\n- Scoring Criteria to evaluate the answer of the student{context_instructions}\n\nYou need to evaluate the student's response and return the following:\n\n- A scorecard based on the scoring criteria given to you with areas of improvement and/or strengths along each criterion\n- An overall summary based on the generated scorecard to be shared with the student.\n\n{format_instructions}\n\nGuidelines for scorecard feedback:\n\n- If there is nothing to praise about the student's response for a given criterion in the scoring criteria, never mention what worked well (i.e. return `correct` as null) in the scorecard output for that criterion.\n- If the student did something well for a given criterion, make sure to highlight what worked well in the scorecard output for that criterion.\n- If there is nothing left to improve in their response for a criterion, avoid unnecessarily suggesting an improvement in the scorecard output for that criterion (i.e. return `wrong` as null). Also, the score assigned for that criterion should be the maximum score possible in that criterion in this case.\n- Make sure that the feedback for one criterion of the scorecard does not bias the feedback for another criterion.\n- When giving the feedback for one criterion of the scorecard, focus on the description of the criterion provided in the scoring criteria and only evaluate the student's response based on that.\n- For every criterion of the scorecard, your feedback for that criterion in the scorecard output must cite specific words or phrases from the student's response to back your feedback so that the student understands it better and give concrete examples for how they can improve their response as well.\n- Never ever give a vague feedback that is not clearly actionable. The student should get a clear path for how they can improve their response.\n- Avoid bringing your judgement of what the right answer should be. What matters for feedback is the scoring criteria provided to you and the response of the student. Keep your biases outside. Be objective in comparing these two.\n- The student might get the answer right without any probing required from your side in the first couple of attempts itself. In that case, remember the instruction provided above to acknowledge their answer's correctness and to stop asking further questions.\n- If you don't assign the maximum score to the student's response for any criterion in the scorecard, make sure to always include the area of improvement containing concrete steps they can take to improve their response in your feedback for that criterion in the scorecard output (i.e. `wrong` cannot be null).\n\nGuidelines for scorecard feedback style:\n\n1. Avoid sounding monotonous.\n2. Be crisp and concise, with no extra words.\n\nGuidelines for summary:\n- Praise → Prompt → Path: 1–2 words of praise, a targeted prompt, then one actionable path forward.\n- It should clearly outline what the next steps need to be based on the scoring criteria. It should be very crisp and only contain the summary of the next steps outlined in the scorecard feedback.\n- Your overall summary does not need to quote specific words from the user's response or reflect back what the user's response means. Keep that for the feedback in the scorecard output.\n- If the student's response is completely correct, just appreciate them. No need to give any more suggestions or areas of improvement.\n- If the student's response has areas of improvement, point them out through a single reflective actionable question.\n- Your summary and follow-up question should not be generic and must be tailored to the response given by the student. This does not mean that you repeat the student's response. The question should be a follow-up for the answer given by the student. Don't just paste the student's response on top of a generic question. That would be laziness.\n- Never provide the right answer or the solution, despite all their attempts to ask for it or their frustration.\n- Never explain the solution to the student unless the student has given the solution first.\n\nGuidelines for style of summary:\n\n1. Avoid sounding monotonous.\n2. Absolutely AVOID repeating back what the student has said as a manner of acknowledgement in your summary. It makes your summary too long and boring to read.\n3. Occasionally include emojis to maintain warmth and engagement.\n4. Ask only one reflective question per response otherwise the student will get overwhelmed.\n5. Avoid verbosity in your summary.\n6. Do not do any analysis of the user's intent in your overall summary or repeat any part of what the user has said. The summary section is meant to summarise the next steps. The summary section does not need a summary of the user's response.\n\nGuidelines on maintaining the focus of the conversation:\n\n- Your role is that of a tutor for this particular task and related concepts only. Remember that and absolutely avoid steering the conversation in any other direction apart from the actual task given to you and its related concepts.\n- If the student tries to move the focus of the conversation away from the task and its related concepts, gently bring it back to the task.\n- It is very important that you prevent the focus on the conversation with the student being shifted away from the task given to you and its related concepts at all odds. No matter what happens. Stay on the task and its related concepts. Keep bringing the student back. Do not let the conversation drift away.\n\nGuidelines on when to show the scorecard:\n\n- If the response by the student is not a valid answer to the actual task given to them (e.g. if their response is an acknowledgement of the previous messages or a doubt or a question or something irrelevant to the task), do not provide any scorecard in that case and only return a summary addressing their response.\n- For messages of acknowledgement, you do not need to explicitly call it out as an acknowledgement. Simply respond to it normally."""
-                else:
-                    system_prompt = f"""You are a teaching assistant.\n\nYou will receive:\n- A Reference Material\n- Conversation history with a student\n- The student's latest query/message.\n\nYour role:\n- You need to respond to the student's message based on the content in the reference material provided to you.\n- If the student's query is absolutely not relevant to the reference material or goes beyond the scope of the reference material, clearly saying so without indulging their irrelevant queries. The only exception is when they are asking deeper questions related to the learning material that might not be mentioned in the reference material itself to clarify their conceptual doubts. In this case, you can provide the answer and help them.\n- Remember that the reference material is in read-only mode for the student. So, they cannot make any changes to it.\n\n{format_instructions}\n\nGuidelines on your response style:\n- Be crisp, concise and to the point.\n- Vary your phrasing to avoid monotony; occasionally include emojis to maintain warmth and engagement.\n- Playfully redirect irrelevant responses back to the task without judgment.\n- If the task involves code, format code snippets or variable/function names with backticks (`example`).\n- If including HTML, wrap tags in backticks (`<html>`).\n- If your response includes rich text format like lists, font weights, tables, etc. always render them as markdown.\n- Avoid being unnecessarily verbose in your response.\n\nGuideline on maintaining focus:\n- Your role is that of a teaching assistant for this particular task and its related concepts only. Remember that and absolutely avoid steering the conversation in any other direction apart from the actual task and its related concepts give to you.\n- If the student tries to move the focus of the conversation away from the task and its related concepts, gently bring it back.\n- It is very important that you prevent the focus on the conversation with the student being shifted away from the task and its related concepts given to you at all odds. No matter what happens. Stay on the task and its related concepts. Keep bringing the student back to the task and its related concepts. Do not let the conversation drift away."""
+            cached_stream = await get_semantic_cache_hit(rewritten_query, Output)
+            if cached_stream is not None:
+                return cached_stream, False
 
-                messages = [{"role": "system", "content": system_prompt}] + chat_history
+            default_model = openai_plan_to_model_name["text"]
 
+            if router_task is not None and not router_task.done():
+                speculative_task = asyncio.create_task(
+                    prefetch_stream(
+                        await start_feedback_stream(default_model, messages, Output)
+                    )
+                )
+
+            if router_task is not None:
+                model = await router_task
+
+            if speculative_task is not None and model == default_model:
+                stream = await speculative_task
+                speculative_task = None
+                return stream, True
+
+            return await start_feedback_stream(model, messages, Output), False
+        finally:
+            if router_task is not None:
+                await discard_task(router_task)
+
+            if speculative_task is not None:
+                await discard_task(speculative_task)
+
+    async def start_sequential_feedback_stream():
+        rewritten_query = await rewrite_query()
+
+        if rewritten_query is not None:
+            chat_history[-1]["content"] = get_user_message_for_chat_history(
+                rewritten_query
+            )
+
+        messages, Output = get_feedback_request(await get_knowledge_base())
+
+        cached_stream = await get_semantic_cache_hit(rewritten_query, Output)
+        if cached_stream is not None:
+            return cached_stream, False
+
+        model = await get_cached_route() or await route()
+
+        return await start_feedback_stream(model, messages, Output), False
+
+    # Define an async generator for streaming
+    async def stream_response() -> AsyncGenerator[str, None]:
+        with tracer.start_as_current_span(
+            "ai_chat", openinference_span_kind="llm"
+        ) as span:
+            span.set_input([{"role": "user", "content": question_details}] + chat_history)
+
+            output = None
+
+            try:
                 with using_attributes(
                     session_id=f"{session_id}",
                     user_id=str(request.user_id),
                     metadata={"stage": "feedback", **metadata},
                 ):
-                    stream = await stream_llm_with_instructor(
-                        api_key=settings.openai_api_key,
-                        model=model,
-                        messages=messages,
-                        response_model=Output,
-                        max_completion_tokens=4096,
-                    )
+                    if settings.chat_pipeline_enabled:
+                        start_stream = start_pipelined_feedback_stream
+                    else:
+                        start_stream = start_sequential_feedback_stream
+
+                    stream, is_speculative = await start_stream()
+
+                    span.set_attribute("speculative_feedback", is_speculative)
+
+                    if semantic_cache_lookup:
+                        span.set_attribute(
+                            "semantic_cache_hit", semantic_cache_lookup["hit"]
+                        )
+                        span.set_attribute(
+                            "semantic_cache_similarity",
+                            semantic_cache_lookup["similarity"],
+                        )
+
                     # Process the async generator
+                    chunk = None
                     async for chunk in stream:
-                        content = json.dumps(chunk.model_dump()) + "\n"
-                        output_buffer = content
-                        yield content
+                        previous_output, output = output, chunk.model_dump()
+
+                        if request.stream_format == ChatStreamFormat.PATCH:
+                            # only send what changed since the previous chunk
+                            operations = diff_json(previous_output or {}, output)
+                            if operations:
+                                yield json.dumps(operations) + "\n"
+                        else:
+                            yield json.dumps(output) + "\n"
+
+                if (
+                    semantic_cache_lookup
+                    and not semantic_cache_lookup["hit"]
+                    and chunk is not None
+                ):
+                    await semantic_cache.put(
+                        *semantic_cache_key,
+                        semantic_cache_lookup["query_embedding"],
+                        output,
+                    )
             except Exception as error:
                 span.record_exception(error)
                 span.set_status(Status(StatusCode.ERROR))
                 raise error
             else:
-                span.set_output("".join(output_buffer))
+                span.set_output(json.dumps(output) + "\n" if output is not None else "")
                 span.set_status(Status(StatusCode.OK))
 
     # Return a streaming response
@@ -553,67 +760,173 @@ The final output should be a JSON in the following format:
     return blocks
 
 
-async def add_generated_module(course_id: int, module: BaseModel):
-    websocket_manager = get_manager()
-    color = random.choice(
-        [
-            "#2d3748",  # Slate blue
-            "#433c4c",  # Deep purple
-            "#4a5568",  # Cool gray
-            "#312e51",  # Indigo
-            "#364135",  # Forest green
-            "#4c393a",  # Burgundy
-            "#334155",  # Navy blue
-            "#553c2d",  # Rust brown
-            "#37303f",  # Plum
-            "#3c4b64",  # Steel blue
-            "#463c46",  # Mauve
-            "#3c322d",  # Coffee
-        ]
-    )
-    module_id, ordering = await add_milestone_to_course(course_id, module.name, color)
+MODULE_COLORS = [
+    "#2d3748",  # Slate blue
+    "#433c4c",  # Deep purple
+    "#4a5568",  # Cool gray
+    "#312e51",  # Indigo
+    "#364135",  # Forest green
+    "#4c393a",  # Burgundy
+    "#334155",  # Navy blue
+    "#553c2d",  # Rust brown
+    "#37303f",  # Plum
+    "#3c4b64",  # Steel blue
+    "#463c46",  # Mauve
+    "#3c322d",  # Coffee
+]
+
+
+class CourseStructureWriter:
+    """
+    Buffers the modules and tasks that appear as a course structure streams in
+    and writes them in one transaction every `max_chunks` chunks or `max_delay`
+    seconds, and once more at the end, in the background, so that reading the
+    stream is not held up by a round of writes for every new item.
+
+    Batches are written one after the other and their websocket updates, the
+    same as for items written one by one, are sent together once the batch is
+    committed, in the order the items appeared. Until then, the ids of modules
+    and tasks are None. The modules are recorded against the generation job
+    `job_uuid`, if given, so that a failed attempt can be undone.
+    """
+
+    def __init__(
+        self,
+        course_id: int,
+        max_chunks: int,
+        max_delay: float,
+        job_uuid: Optional[str] = None,
+    ):
+        self.course_id = course_id
+        self.job_uuid = job_uuid
+        self.max_chunks = max_chunks
+        self.max_delay = max_delay
+        self._pending = []
+        self._chunks = 0
+        self._first_pending_at = None
+        self._write_task: Optional[asyncio.Task] = None
+
+    def add_module(self, module: BaseModel) -> Dict:
+        written_module = {
+            "id": None,
+            "name": module.name,
+            "color": random.choice(MODULE_COLORS),
+        }
+        self._add(("module", written_module, None))
+        return written_module
+
+    def add_task(self, module: Dict, task: BaseModel) -> Dict:
+        written_task = {"id": None, "name": task.name, "type": task.type}
+        self._add(("task", module, written_task))
+        return written_task
+
+    def _add(self, item):
+        if not self._pending:
+            self._first_pending_at = time.monotonic()
+
+        self._pending.append(item)
+
+    def chunk_done(self):
+        """Starts writing what the chunks since the last write added, once there are enough of them or they are old enough"""
+        self._chunks += 1
+
+        if self._pending and (
+            self._chunks >= self.max_chunks
+            or time.monotonic() - self._first_pending_at >= self.max_delay
+        ):
+            self._start_write()
+
+    def _start_write(self):
+        items, self._pending = self._pending, []
+        self._chunks = 0
+        self._write_task = asyncio.create_task(self._write(self._write_task, items))
+
+    async def _write(self, previous_write: Optional[asyncio.Task], items: List):
+        if previous_write is not None:
+            # the modules of this batch may have been added by the previous one,
+            # which also stops anything being written after a batch that failed
+            await previous_write
+
+        batch = {}
+        for _, module, task in items:
+            batch.setdefault(id(module), (module, []))
+            if task is not None:
+                batch[id(module)][1].append(task)
+
+        added_modules = await add_generated_course_items(
+            self.course_id,
+            [
+                {
+                    "id": module["id"],
+                    "name": module["name"],
+                    "color": module["color"],
+                    "tasks": tasks,
+                }
+                for module, tasks in batch.values()
+            ],
+            job_uuid=self.job_uuid,
+        )
 
-    # Send WebSocket update after each module is created
-    await websocket_manager.send_item_update(
-        course_id,
-        {
-            "event": "module_created",
-            "module": {
-                "id": module_id,
-                "name": module.name,
-                "color": color,
-                "ordering": ordering,
-            },
-        },
-    )
+        module_orderings = {}
+        for (module, tasks), added_module in zip(batch.values(), added_modules):
+            module["id"] = added_module["id"]
+            module_orderings[id(module)] = added_module["ordering"]
 
-    return module_id
+            for task, (task_id, ordering) in zip(tasks, added_module["tasks"]):
+                task["id"] = task_id
+                task["ordering"] = ordering
 
+        updates = []
+        for kind, module, task in items:
+            if kind == "module":
+                updates.append(
+                    {
+                        "event": "module_created",
+                        "module": {
+                            "id": module["id"],
+                            "name": module["name"],
+                            "color": module["color"],
+                            "ordering": module_orderings[id(module)],
+                        },
+                    }
+                )
+            else:
+                updates.append(
+                    {
+                        "event": "task_created",
+                        "task": {
+                            "id": task["id"],
+                            "module_id": module["id"],
+                            "ordering": task["ordering"],
+                            "type": str(task["type"]),
+                            "name": task["name"],
+                        },
+                    }
+                )
 
-async def add_generated_draft_task(course_id: int, module_id: int, task: BaseModel):
-    task_id, task_ordering = await create_draft_task_for_course(
-        task.name,
-        task.type,
-        course_id,
-        module_id,
-    )
+        await get_manager().send_item_updates(self.course_id, updates)
 
-    websocket_manager = get_manager()
+    async def close(self):
+        """Writes what is left and waits for every write, raising the error of any that failed"""
+        if self._pending:
+            self._start_write()
 
-    await websocket_manager.send_item_update(
-        course_id,
-        {
-            "event": "task_created",
-            "task": {
-                "id": task_id,
-                "module_id": module_id,
-                "ordering": task_ordering,
-                "type": str(task.type),
-                "name": task.name,
-            },
-        },
-    )
-    return task_id
+        if self._write_task is not None:
+            await self._write_task
+
+    async def abort(self):
+        """Drops what is left after the stream failed and waits for the write already running, logging rather than raising its error"""
+        self._pending = []
+
+        if self._write_task is None:
+            return
+
+        try:
+            await self._write_task
+        except Exception as exception:
+            logger.error(
+                f"Error writing the structure of course {self.course_id}: {exception}"
+            )
 
 
 async def _generate_course_structure(
@@ -703,59 +1016,75 @@ Do not include the type of task in the name of the task."""
         max_completion_tokens=16000,
     )
 
-    module_ids = []
+    writer = CourseStructureWriter(
+        course_id,
+        max_chunks=settings.course_structure_write_batch_chunks,
+        max_delay=settings.course_structure_write_batch_ms / 1000,
+        job_uuid=course_job_uuid,
+    )
+
+    modules = []
 
     module_concepts = defaultdict(lambda: defaultdict(list))
 
     output = None
 
-    async for chunk in stream:
-        if not chunk or not chunk.modules:
-            continue
-
-        for index, module in enumerate(chunk.modules):
-            if not module or not module.name or not module.concepts:
+    try:
+        async for chunk in stream:
+            if not chunk or not chunk.modules:
                 continue
 
-            if index >= len(module_ids):
-                module_id = await add_generated_module(course_id, module)
-                module_ids.append(module_id)
-            else:
-                module_id = module_ids[index]
+            for index, module in enumerate(chunk.modules):
+                if not module or not module.name or not module.concepts:
+                    continue
 
-            task_index = 0
+                if index >= len(modules):
+                    written_module = writer.add_module(module)
+                    modules.append(written_module)
+                else:
+                    written_module = modules[index]
 
-            for concept_index, concept in enumerate(module.concepts):
-                if (
-                    not concept
-                    or not concept.tasks
-                    or concept_index < len(module_concepts[module_id]) - 1
-                ):
-                    continue
+                task_index = 0
 
-                for task_index, task in enumerate(concept.tasks):
+                for concept_index, concept in enumerate(module.concepts):
                     if (
-                        not task
-                        or not task.name
-                        or not task.type
-                        or task.type not in [TaskType.LEARNING_MATERIAL, TaskType.QUIZ]
-                        or task_index < len(module_concepts[module_id][concept_index])
+                        not concept
+                        or not concept.tasks
+                        or concept_index < len(module_concepts[index]) - 1
                     ):
                         continue
 
-                    task_id = await add_generated_draft_task(course_id, module_id, task)
-                    module_concepts[module_id][concept_index].append(task_id)
+                    for task_index, task in enumerate(concept.tasks):
+                        if (
+                            not task
+                            or not task.name
+                            or not task.type
+                            or task.type
+                            not in [TaskType.LEARNING_MATERIAL, TaskType.QUIZ]
+                            or task_index < len(module_concepts[index][concept_index])
+                        ):
+                            continue
+
+                        module_concepts[index][concept_index].append(
+                            writer.add_task(written_module, task)
+                        )
+
+            writer.chunk_done()
+    except BaseException:
+        # the error of the stream is the one to report, not that of a write
+        await writer.abort()
+        raise
 
-        # output = chunk
+    await writer.close()
 
     output = chunk.model_dump()
 
     for index, module in enumerate(output["modules"]):
-        module["id"] = module_ids[index]
+        module["id"] = modules[index]["id"]
 
         for concept_index, concept in enumerate(module["concepts"]):
             for task_index, task in enumerate(concept["tasks"]):
-                task["id"] = module_concepts[module["id"]][concept_index][task_index]
+                task["id"] = module_concepts[index][concept_index][task_index]["id"]
 
     job_details["course_structure"] = output
     await update_course_generation_job_status_and_details(
@@ -781,9 +1110,7 @@ async def generate_course_structure(
     background_tasks: BackgroundTasks,
     request: GenerateCourseStructureRequest,
 ):
-    openai_client = openai.AsyncOpenAI(
-        api_key=settings.openai_api_key,
-    )
+    openai_client = openai_clients.get_client(settings.openai_api_key)
 
     if settings.s3_folder_name:
         reference_material = download_file_from_s3_as_bytes(
@@ -814,16 +1141,9 @@ async def generate_course_structure(
         job_details,
     )
 
-    background_tasks.add_task(
-        _generate_course_structure,
-        request.course_description,
-        request.intended_audience,
-        request.instructions,
-        file.id,
-        course_id,
-        job_uuid,
-        job_details,
-    )
+    if not settings.generation_worker_enabled:
+        # the job runs on whichever worker claims it first, most likely this one
+        background_tasks.add_task(claim_course_structure_generation_jobs)
 
     return {"job_uuid": job_uuid}
 
@@ -971,6 +1291,9 @@ The final output should be a JSON in the following format:
     return system_prompt
 
 
+TASK_GENERATION_MAX_COMPLETION_TOKENS = 16000
+
+
 async def generate_course_task(
     client,
     task: Dict,
@@ -1019,8 +1342,9 @@ Task to generate:
         model=model,
         messages=messages,
         response_model=response_model,
-        max_completion_tokens=16000,
+        max_completion_tokens=TASK_GENERATION_MAX_COMPLETION_TOKENS,
         store=True,
+        max_retries=retry_unless_rate_limited(),
     )
 
     task["details"] = output.model_dump(exclude_none=True)
@@ -1055,26 +1379,47 @@ Task to generate:
         )
 
 
+def schedule_course_task_generation(
+    client,
+    task: Dict,
+    concept: Dict,
+    file_id: str,
+    task_job_uuid: str,
+    course_job_uuid: str,
+    course_id: int,
+) -> asyncio.Future:
+    model = openai_plan_to_model_name["text"]
+
+    return task_generation_scheduler.submit(
+        functools.partial(
+            generate_course_task,
+            client,
+            task,
+            concept,
+            file_id,
+            task_job_uuid,
+            course_job_uuid,
+            course_id,
+        ),
+        group=course_id,
+        budget=openai_clients.get_rate_limit_budget(settings.openai_api_key, model),
+        # the rate limits count the most a request may generate, not what it does
+        tokens=TASK_GENERATION_MAX_COMPLETION_TOKENS,
+    )
+
+
 @router.post("/generate/course/{course_id}/tasks")
 async def generate_course_tasks(
     course_id: int,
+    background_tasks: BackgroundTasks,
     job_uuid: str = Body(..., embed=True),
 ):
     job_details = await get_course_generation_job_details(job_uuid)
 
-    client = instructor.from_openai(
-        openai.AsyncOpenAI(
-            api_key=settings.openai_api_key,
-        )
-    )
-
-    # Create a list to hold all task coroutines
-    tasks = []
-
     for module in job_details["course_structure"]["modules"]:
         for concept in module["concepts"]:
             for task in concept["tasks"]:
-                task_job_uuid = await store_task_generation_request(
+                await store_task_generation_request(
                     task["id"],
                     course_id,
                     {
@@ -1085,88 +1430,153 @@ async def generate_course_tasks(
                         "course_id": course_id,
                     },
                 )
-                # Add task to the list instead of adding to background_tasks
-                tasks.append(
-                    generate_course_task(
-                        client,
-                        task,
-                        concept,
-                        job_details["openai_file_id"],
-                        task_job_uuid,
-                        job_uuid,
-                        course_id,
-                    )
-                )
-
-    # Create a function to run all tasks in parallel
-    async def run_tasks_in_parallel():
-        try:
-            # Run all tasks concurrently using asyncio.gather
-            await async_batch_gather(tasks, description="Generating tasks")
-        except Exception as e:
-            logger.error(f"Error in parallel task execution: {e}")
 
-    # Start the parallel execution in the background without awaiting it
-    asyncio.create_task(run_tasks_in_parallel())
+    if not settings.generation_worker_enabled:
+        # the jobs run on whichever workers claim them, starting with this one
+        background_tasks.add_task(claim_task_generation_jobs)
 
     return {
         "success": True,
     }
 
 
-async def resume_pending_course_structure_generation_jobs():
-    incomplete_course_structure_jobs = (
-        await get_all_pending_course_structure_generation_jobs()
-    )
+async def mark_course_generation_completed_if_done(
+    course_id: int, course_job_uuid: str
+):
+    course_jobs_status = await get_course_task_generation_jobs_status(course_id)
 
-    if not incomplete_course_structure_jobs:
-        return
+    if not course_jobs_status[str(GenerateTaskJobStatus.STARTED)]:
+        await update_course_generation_job_status(
+            course_job_uuid, GenerateCourseJobStatus.COMPLETED
+        )
 
-    tasks = []
-
-    for job in incomplete_course_structure_jobs:
-        tasks.append(
-            _generate_course_structure(
-                job["job_details"]["course_description"],
-                job["job_details"]["intended_audience"],
-                job["job_details"]["instructions"],
-                job["job_details"]["openai_file_id"],
-                job["course_id"],
-                job["uuid"],
-                job["job_details"],
-            )
+
+async def run_course_structure_generation_job(job: Dict):
+    try:
+        if "written_module_ids" in job["job_details"]:
+            # an earlier attempt failed, or its worker stopped, part way through
+            # the structure, which is generated again from the start
+            await delete_generated_course_items(job["course_id"], job["uuid"])
+            del job["job_details"]["written_module_ids"]
+
+        await _generate_course_structure(
+            job["job_details"]["course_description"],
+            job["job_details"]["intended_audience"],
+            job["job_details"]["instructions"],
+            job["job_details"]["openai_file_id"],
+            job["course_id"],
+            job["uuid"],
+            job["job_details"],
+        )
+    except Exception as exception:
+        logger.error(f"Error in course structure generation job {job['uuid']}: {exception}")
+        await course_generation_job_queue.release(job["uuid"], str(exception))
+
+
+async def run_course_task_generation_job(client, job: Dict):
+    job_details = job["job_details"]
+
+    try:
+        await schedule_course_task_generation(
+            client,
+            job_details["task"],
+            job_details["concept"],
+            job_details["openai_file_id"],
+            job["uuid"],
+            job_details["course_job_uuid"],
+            job_details["course_id"],
         )
+    except Exception as exception:
+        logger.error(f"Error in task generation job {job['uuid']}: {exception}")
+        status = await task_generation_job_queue.release(job["uuid"], str(exception))
+
+        if status == str(GenerateTaskJobStatus.DEAD):
+            await mark_course_generation_completed_if_done(
+                job_details["course_id"], job_details["course_job_uuid"]
+            )
+
+
+# the jobs claimed by this worker, kept here until they finish so that they are
+# not garbage collected while running
+running_course_structure_generation_jobs = set()
+running_task_generation_jobs = set()
+
+
+def run_generation_job(running_jobs: set, job: Coroutine):
+    task = asyncio.create_task(job)
+    running_jobs.add(task)
+    task.add_done_callback(running_jobs.discard)
+
 
-    await async_batch_gather(
-        tasks, description="Resuming course structure generation jobs"
+async def claim_course_structure_generation_jobs():
+    jobs = await course_generation_job_queue.claim(
+        settings.course_structure_generation_max_concurrency
+        - len(running_course_structure_generation_jobs)
     )
 
+    for job in jobs:
+        run_generation_job(
+            running_course_structure_generation_jobs,
+            run_course_structure_generation_job(job),
+        )
+
 
-async def resume_pending_task_generation_jobs():
-    incomplete_course_jobs = await get_all_pending_task_generation_jobs()
+async def claim_task_generation_jobs():
+    # a window's worth of jobs beyond what is running is claimed ahead so that
+    # the scheduler never runs dry between two polls
+    jobs = await task_generation_job_queue.claim(
+        2 * task_generation_scheduler.max_concurrency
+        - len(running_task_generation_jobs)
+    )
 
-    if not incomplete_course_jobs:
+    if not jobs:
         return
 
-    tasks = []
+    client = openai_clients.get_scheduled_instructor_client(settings.openai_api_key)
 
-    client = instructor.from_openai(
-        openai.AsyncOpenAI(
-            api_key=settings.openai_api_key,
+    for job in jobs:
+        run_generation_job(
+            running_task_generation_jobs, run_course_task_generation_job(client, job)
         )
-    )
 
-    for job in incomplete_course_jobs:
-        tasks.append(
-            generate_course_task(
-                client,
-                job["job_details"]["task"],
-                job["job_details"]["concept"],
-                job["job_details"]["openai_file_id"],
-                job["uuid"],
-                job["job_details"]["course_job_uuid"],
-                job["job_details"]["course_id"],
-            )
+
+async def dead_letter_expired_generation_jobs():
+    for job in await course_generation_job_queue.dead_letter_expired():
+        logger.error(f"Course structure generation job {job['uuid']} is dead")
+
+    for job in await task_generation_job_queue.dead_letter_expired():
+        logger.error(f"Task generation job {job['uuid']} is dead")
+        await mark_course_generation_completed_if_done(
+            job["course_id"], job["job_details"]["course_job_uuid"]
         )
 
-    await async_batch_gather(tasks, description="Resuming task generation jobs")
+
+async def run_generation_jobs():
+    """
+    Keeps the leases of the generation jobs this worker holds alive and claims
+    more as it has room for them, until cancelled, after which the jobs it held
+    are given back for other workers to pick up.
+    """
+    try:
+        while True:
+            try:
+                await course_generation_job_queue.heartbeat()
+                await task_generation_job_queue.heartbeat()
+                await dead_letter_expired_generation_jobs()
+                await claim_course_structure_generation_jobs()
+                await claim_task_generation_jobs()
+
+                if settings.generation_worker_enabled:
+                    await delete_generation_events_before(
+                        time.time() - settings.generation_event_retention_seconds
+                    )
+            except Exception as exception:
+                logger.error(f"Error in claiming generation jobs: {exception}")
+
+            await asyncio.sleep(settings.generation_job_poll_interval_seconds)
+    finally:
+        for job in running_course_structure_generation_jobs | running_task_generation_jobs:
+            job.cancel()
+
+        await course_generation_job_queue.abandon()
+        await task_generation_job_queue.abandon()
@@ -1,4 +1,3 @@
-from collections import defaultdict
 from datetime import datetime
 from fastapi import APIRouter, HTTPException, Query
 from typing import List, Dict
@@ -20,6 +19,8 @@ from api.db.cohort import (
 from api.db.course import get_courses_for_cohort as get_courses_for_cohort_from_db
 from api.db.analytics import (
     get_cohort_completion as get_cohort_completion_from_db,
+    get_cohort_completion_counts as get_cohort_completion_counts_from_db,
+    get_cohort_task_completion as get_cohort_task_completion_from_db,
     get_cohort_course_attempt_data as get_cohort_course_attempt_data_from_db,
     get_cohort_streaks as get_cohort_streaks_from_db,
 )
@@ -154,19 +155,12 @@ async def get_leaderboard_data(cohort_id: int):
     if not user_ids:
         return {}
 
-    task_completions = await get_cohort_completion_from_db(cohort_id, user_ids)
-
-    num_tasks = len(task_completions[user_ids[0]])
+    num_tasks, tasks_completed = await get_cohort_completion_counts_from_db(
+        cohort_id, user_ids
+    )
 
     for user_data in leaderboard_data:
-        user_id = user_data["user"]["id"]
-        num_tasks_completed = 0
-
-        for task_completion_data in task_completions[user_id].values():
-            if task_completion_data["is_complete"]:
-                num_tasks_completed += 1
-
-        user_data["tasks_completed"] = num_tasks_completed
+        user_data["tasks_completed"] = tasks_completed[user_data["user"]["id"]]
 
     leaderboard_data = sorted(
         leaderboard_data,
@@ -182,6 +176,64 @@ async def get_leaderboard_data(cohort_id: int):
     }
 
 
+def get_course_metrics(
+    course_data: Dict,
+    learner_ids: List[int],
+    task_ids: List[int],
+    task_completion: np.ndarray,
+    is_learner_active: List[bool],
+) -> Dict:
+    """
+    Completion metrics of the learners of a cohort in a course, computed from their
+    learners × tasks completion matrix (rows in the order of `learner_ids`, columns
+    in the order of `task_ids`). Completed tasks that are not in the course tree do
+    not count towards any metric other than `num_tasks`.
+    """
+    course_tasks = [
+        task for milestone in course_data["milestones"] for task in milestone["tasks"]
+    ]
+    task_types = list(dict.fromkeys(task["type"] for task in course_tasks))
+    task_type_index = {task_type: index for index, task_type in enumerate(task_types)}
+    task_id_to_type_index = {
+        task["id"]: task_type_index[task["type"]] for task in course_tasks
+    }
+
+    task_type_counts = np.bincount(
+        [task_type_index[task["type"]] for task in course_tasks],
+        minlength=len(task_types),
+    )
+
+    # one-hot encoded type of every column of the completion matrix
+    column_task_types = np.zeros((len(task_ids), len(task_types)), dtype=np.int64)
+    for column, task_id in enumerate(task_ids):
+        if task_id in task_id_to_type_index:
+            column_task_types[column, task_id_to_type_index[task_id]] = 1
+
+    # learners × task types
+    task_type_completions = task_completion.astype(np.int64) @ column_task_types
+    completion_percentages = task_type_completions.sum(axis=1) / len(task_ids)
+    task_type_completion_rates = task_type_completions / task_type_counts
+
+    return {
+        "average_completion": np.mean(completion_percentages),
+        "num_tasks": len(task_ids),
+        "num_active_learners": int(np.count_nonzero(is_learner_active)),
+        "task_type_metrics": {
+            task_type: {
+                # contiguous so that the mean is summed in the same order as before
+                "completion_rate": np.mean(
+                    np.ascontiguousarray(task_type_completion_rates[:, index])
+                ),
+                "count": int(task_type_counts[index]),
+                "completions": dict(
+                    zip(learner_ids, task_type_completions[:, index].tolist())
+                ),
+            }
+            for index, task_type in enumerate(task_types)
+        },
+    }
+
+
 @router.get("/{cohort_id}/courses/{course_id}/metrics")
 async def get_cohort_metrics_for_course(cohort_id: int, course_id: int):
     course_data = await get_course_from_db(course_id, only_published=True)
@@ -193,18 +245,6 @@ async def get_cohort_metrics_for_course(cohort_id: int, course_id: int):
     if not cohort_data:
         raise HTTPException(status_code=404, detail="Cohort not found")
 
-    task_id_to_metadata = {}
-    task_type_counts = defaultdict(int)
-
-    for milestone in course_data["milestones"]:
-        for task in milestone["tasks"]:
-            task_id_to_metadata[task["id"]] = {
-                "milestone_id": milestone["id"],
-                "milestone_name": milestone["name"],
-                "type": task["type"],
-            }
-            task_type_counts[task["type"]] += 1
-
     learner_ids = [
         member["id"]
         for member in cohort_data["members"]
@@ -214,7 +254,7 @@ async def get_cohort_metrics_for_course(cohort_id: int, course_id: int):
     if not learner_ids:
         return {}
 
-    task_completions = await get_cohort_completion_from_db(
+    task_ids, task_completion = await get_cohort_task_completion_from_db(
         cohort_id, learner_ids, course_id
     )
 
@@ -222,69 +262,19 @@ async def get_cohort_metrics_for_course(cohort_id: int, course_id: int):
         learner_ids, course_id
     )
 
-    num_tasks = len(task_completions[learner_ids[0]])
-
-    if not num_tasks:
+    if not task_ids:
         return {}
 
-    task_type_completions = defaultdict(lambda: defaultdict(int))
-    task_type_completion_rates = defaultdict(list)
-
-    user_data = defaultdict(lambda: defaultdict(int))
-
-    for learner_id in learner_ids:
-        num_tasks_completed = 0
-
-        for task_id, task_completion_data in task_completions[learner_id].items():
-            if task_completion_data["is_complete"]:
-                if task_id not in task_id_to_metadata:
-                    continue
-
-                num_tasks_completed += 1
-                task_type_completions[task_id_to_metadata[task_id]["type"]][
-                    learner_id
-                ] += 1
-
-        user_data[learner_id]["completed"] = num_tasks_completed
-        user_data[learner_id]["completion_percentage"] = num_tasks_completed / num_tasks
-
-        for task_type in task_type_counts.keys():
-            task_type_completion_rates[task_type].append(
-                task_type_completions[task_type][learner_id]
-                / task_type_counts[task_type]
-            )
-
-    is_learner_active = {
-        learner_id: course_attempt_data[learner_id][course_id]["has_attempted"]
-        for learner_id in learner_ids
-    }
-
-    return {
-        "average_completion": np.mean(
-            [
-                user_data[learner_id]["completion_percentage"]
-                for learner_id in learner_ids
-            ]
-        ),
-        "num_tasks": num_tasks,
-        "num_active_learners": sum(is_learner_active.values()),
-        "task_type_metrics": {
-            task_type: {
-                "completion_rate": (
-                    np.mean(task_type_completion_rates[task_type])
-                    if task_type in task_type_completion_rates
-                    else 0
-                ),
-                "count": task_type_counts[task_type],
-                "completions": (
-                    task_type_completions[task_type]
-                    if task_type in task_type_completions
-                    else {learner_id: 0 for learner_id in learner_ids}
-                ),
-            }
-            for task_type in task_type_counts.keys()
-        },
-    }
+    return get_course_metrics(
+        course_data,
+        learner_ids,
+        task_ids,
+        task_completion,
+        [
+            course_attempt_data[learner_id][course_id]["has_attempted"]
+            for learner_id in learner_ids
+        ],
+    )
 
 
 @router.get("/{cohort_id}/streaks", response_model=Streaks)
@@ -27,7 +27,36 @@ class Settings(BaseSettings):
     slack_usage_stats_webhook_url: str | None = None
     phoenix_endpoint: str | None = None
     phoenix_api_key: str | None = None
-    
+    db_pool_size: int = 10
+    db_group_commit_window_ms: int = 0  # 0 disables group commit
+    db_query_profile_sample_rate: float = 0.1
+    db_slow_query_threshold_ms: float = 100
+    completion_cache_size: int = 256  # 0 disables the cache
+    completion_cache_ttl_seconds: float = 30
+    api_key_cache_size: int = 1024  # 0 disables the cache
+    api_key_cache_ttl_seconds: float = 300
+    openai_http2: bool = True  # only used when h2 is installed
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry_seconds: float = 60
+    openai_client_cache_size: int = 64
+    chat_pipeline_enabled: bool = False
+    routing_cache_size: int = 100000  # 0 disables the cache
+    semantic_cache_enabled: bool = False
+    semantic_cache_similarity_threshold: float = 0.95
+    semantic_cache_ttl_seconds: float = 7 * 24 * 60 * 60
+    semantic_cache_max_entries_per_task: int = 1000
+    task_generation_max_concurrency: int = 50
+    task_generation_max_rate_limit_retries: int = 5
+    course_structure_generation_max_concurrency: int = 4
+    generation_job_lease_seconds: float = 120
+    generation_job_max_attempts: int = 3
+    generation_job_poll_interval_seconds: float = 2
+    generation_worker_enabled: bool = False
+    course_structure_write_batch_chunks: int = 50
+    course_structure_write_batch_ms: float = 250
+    generation_event_poll_interval_seconds: float = 0.25
+    generation_event_retention_seconds: float = 60 * 60
 
 
     model_config = SettingsConfigDict(
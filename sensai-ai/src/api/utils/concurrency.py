@@ -1,5 +1,21 @@
-from typing import List, Coroutine
+from typing import (
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Dict,
+    Hashable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+)
+from dataclasses import dataclass
 import asyncio
+import heapq
+import itertools
+import re
+import time
 from tqdm.asyncio import tqdm_asyncio
 
 
@@ -36,3 +52,326 @@ async def async_batch_gather(
 async def async_index_wrapper(func, index, *args, **kwargs):
     output = await func(*args, **kwargs)
     return index, output
+
+
+class PrefetchedStream:
+    """
+    An async generator whose first item has already been awaited, so that the
+    request behind it is under way before anyone iterates over it.
+    """
+
+    def __init__(self, stream: AsyncGenerator, first_items: List):
+        self.stream = stream
+        self.first_items = first_items
+
+    async def __aiter__(self):
+        for item in self.first_items:
+            yield item
+
+        async for item in self.stream:
+            yield item
+
+    async def aclose(self):
+        await self.stream.aclose()
+
+
+async def prefetch_stream(stream: AsyncGenerator) -> PrefetchedStream:
+    try:
+        first_items = [await anext(stream)]
+    except StopAsyncIteration:
+        first_items = []
+
+    return PrefetchedStream(stream, first_items)
+
+
+async def discard_task(task: asyncio.Task):
+    """Cancels a task that is no longer needed and waits for it, closing the stream it returned if it had already finished"""
+    task.cancel()
+
+    try:
+        result = await task
+    except (asyncio.CancelledError, Exception):
+        return
+
+    if hasattr(result, "aclose"):
+        await result.aclose()
+
+
+RATE_LIMIT_RESET_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_rate_limit_reset(value: str) -> float:
+    """Seconds in the duration of an OpenAI reset header, e.g. `120ms`, `1s` or `6m0s`"""
+    return sum(
+        float(amount) * RATE_LIMIT_RESET_UNITS[unit]
+        for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    )
+
+
+class RateLimitBudget:
+    """
+    The requests and tokens left in the current rate limit window of a model, as
+    reported by the `x-ratelimit-*` headers of its latest response, less what the
+    requests started since have reserved. Once a window resets, the budget is
+    unknown, and nothing is held back, until the next response.
+    """
+
+    def __init__(self):
+        self.remaining_requests: Optional[float] = None
+        self.remaining_tokens: Optional[float] = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+
+    def update(self, headers: Mapping[str, str]):
+        now = time.monotonic()
+
+        if "x-ratelimit-remaining-requests" in headers:
+            self.remaining_requests = float(headers["x-ratelimit-remaining-requests"])
+            self.requests_reset_at = now + parse_rate_limit_reset(
+                headers.get("x-ratelimit-reset-requests", "")
+            )
+
+        if "x-ratelimit-remaining-tokens" in headers:
+            self.remaining_tokens = float(headers["x-ratelimit-remaining-tokens"])
+            self.tokens_reset_at = now + parse_rate_limit_reset(
+                headers.get("x-ratelimit-reset-tokens", "")
+            )
+
+    def _expire(self):
+        now = time.monotonic()
+
+        if now >= self.requests_reset_at:
+            self.remaining_requests = None
+
+        if now >= self.tokens_reset_at:
+            self.remaining_tokens = None
+
+    def get_delay(self, tokens: int) -> float:
+        """Seconds until a request of `tokens` tokens fits in the budget"""
+        self._expire()
+        now = time.monotonic()
+        delay = 0.0
+
+        if self.remaining_requests is not None and self.remaining_requests < 1:
+            delay = max(delay, self.requests_reset_at - now)
+
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens:
+            delay = max(delay, self.tokens_reset_at - now)
+
+        return delay
+
+    def reserve(self, tokens: int):
+        self._expire()
+
+        if self.remaining_requests is not None:
+            self.remaining_requests -= 1
+
+        if self.remaining_tokens is not None:
+            self.remaining_tokens -= tokens
+
+
+def find_rate_limit_error(exception: BaseException) -> Optional[BaseException]:
+    """
+    The 429 error that `exception` is or wraps, if any. Clients that retry
+    calls themselves wrap the error of their last attempt: instructor raises
+    an `InstructorRetryException` with it as its first argument, raised from a
+    tenacity `RetryError` that holds it as its last attempt.
+    """
+    pending = [exception]
+    seen = set()
+
+    while pending:
+        error = pending.pop()
+        if error is None or id(error) in seen:
+            continue
+        seen.add(id(error))
+
+        if getattr(error, "status_code", None) == 429:
+            return error
+
+        pending.extend(arg for arg in error.args if isinstance(arg, BaseException))
+        pending.extend([error.__cause__, error.__context__])
+
+        last_attempt = getattr(error, "last_attempt", None)
+        if last_attempt is not None and last_attempt.failed:
+            pending.append(last_attempt.exception())
+
+    return None
+
+
+def is_rate_limit_error(exception: Exception) -> bool:
+    return find_rate_limit_error(exception) is not None
+
+
+def get_retry_after(exception: Exception) -> Optional[float]:
+    """Seconds the API asked to wait for in the headers of an error response"""
+    error = find_rate_limit_error(exception) or exception
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+
+    return None
+
+
+@dataclass
+class ScheduledJob:
+    run: Callable[[], Awaitable]
+    future: asyncio.Future
+    group: Hashable
+    round: int
+    sequence: int
+    budget: Optional[RateLimitBudget] = None
+    tokens: int = 0
+    attempts: int = 0
+
+    def __lt__(self, other: "ScheduledJob") -> bool:
+        return (self.round, self.sequence) < (other.round, other.sequence)
+
+
+class RateLimitedScheduler:
+    """
+    Runs jobs with at most `max_concurrency` of them in flight, starting the next
+    one as soon as any of them finishes, and only once the rate limit budget of
+    the model it calls has room for the tokens it may use.
+
+    Jobs are started round robin across their groups (e.g. courses), so that a
+    small course is not stuck behind a large one submitted just before it. A 429
+    from the API sends the job back to the queue, pauses every job for as long as
+    the response asked (or an exponential backoff) and halves the concurrency,
+    which then grows back by one with every job that succeeds.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_retries: int = 5,
+        min_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.concurrency = float(max_concurrency)
+        self.running = 0
+        self._queue: List[ScheduledJob] = []
+        self._sequence = itertools.count()
+        self._next_rounds: Dict[Hashable, int] = {}
+        self._current_round = 0
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def submit(
+        self,
+        run: Callable[[], Awaitable],
+        group: Hashable = None,
+        budget: Optional[RateLimitBudget] = None,
+        tokens: int = 0,
+    ) -> asyncio.Future:
+        """
+        Queues `run`, a function returning a new coroutine on every call so that a
+        rate limited job can be retried, and returns a future for its result
+        """
+        # a group joining late starts at the round being run, not ahead of it
+        job_round = max(self._next_rounds.get(group, 0), self._current_round)
+        self._next_rounds[group] = job_round + 1
+
+        job = ScheduledJob(
+            run=run,
+            future=asyncio.get_running_loop().create_future(),
+            group=group,
+            round=job_round,
+            sequence=next(self._sequence),
+            budget=budget,
+            tokens=tokens,
+        )
+        heapq.heappush(self._queue, job)
+        self._dispatch()
+
+        return job.future
+
+    def _dispatch(self):
+        while self._queue and self.running < int(self.concurrency):
+            job = self._queue[0]
+            delay = self._paused_until - time.monotonic()
+
+            if job.budget is not None:
+                delay = max(delay, job.budget.get_delay(job.tokens))
+
+            if delay > 0:
+                self._wake_up_in(delay)
+                return
+
+            heapq.heappop(self._queue)
+
+            if job.future.done():
+                # cancelled by whoever submitted it
+                continue
+
+            self._current_round = job.round
+
+            if job.budget is not None:
+                job.budget.reserve(job.tokens)
+
+            self.running += 1
+            task = asyncio.create_task(self._run(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if not self._queue:
+            self._next_rounds.clear()
+
+    def _wake_up_in(self, delay: float):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+
+        self._wakeup = asyncio.get_running_loop().call_later(delay, self._wake_up)
+
+    def _wake_up(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def _back_off(self, exception: Exception, attempts: int):
+        self.concurrency = max(1.0, self.concurrency / 2)
+
+        delay = get_retry_after(exception)
+        if delay is None:
+            delay = min(self.max_backoff, self.min_backoff * 2 ** (attempts - 1))
+
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    async def _run(self, job: ScheduledJob):
+        try:
+            result = await job.run()
+        except asyncio.CancelledError:
+            self.running -= 1
+            job.future.cancel()
+            raise
+        except Exception as exception:
+            if is_rate_limit_error(exception) and job.attempts < self.max_retries:
+                job.attempts += 1
+                self._back_off(exception, job.attempts)
+                heapq.heappush(self._queue, job)
+            elif not job.future.done():
+                job.future.set_exception(exception)
+        else:
+            self.concurrency = min(float(self.max_concurrency), self.concurrency + 1)
+
+            if not job.future.done():
+                job.future.set_result(result)
+
+        self.running -= 1
+        self._dispatch()
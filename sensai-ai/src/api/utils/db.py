@@ -1,23 +1,405 @@
+import asyncio
+import json
+import re
 import sqlite3
-from typing import List, Tuple
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Iterable, List, Tuple
+from urllib.parse import quote
 from api.config import sqlite_db_path
 from api.utils.logging import logger
+from api.utils.query_profiler import query_profiler
 import aiosqlite
 from contextlib import asynccontextmanager
 
 
-def trace_callback(sql):
-    # Record the start time and SQL
-    logger.info(f"Executing operation: {sql}")
+# persistent connections keep this many prepared statements warm
+STATEMENT_CACHE_SIZE = 256
+
+
+async def configure_connection(conn: aiosqlite.Connection):
+    await conn.execute("PRAGMA synchronous=NORMAL;")
+
+
+def _get_row_count(cursor, result=None, fetch_one=False, fetch_all=False):
+    if fetch_one:
+        return 1 if result else 0
+
+    if fetch_all:
+        return len(result) if isinstance(result, list) else None
+
+    # -1 for statements that do not modify rows
+    return cursor.rowcount if isinstance(cursor.rowcount, int) else None
+
+
+def record_query(sql: str, started_at: float, row_count: int | None = None):
+    query_profiler.record(sql, time.perf_counter() - started_at, row_count)
+
+
+async def open_db_connection(
+    db_path: str = sqlite_db_path, read_only: bool = False
+) -> aiosqlite.Connection:
+    if read_only:
+        # readers can never take the write lock, even by accident
+        conn = await aiosqlite.connect(
+            f"file:{quote(db_path)}?mode=ro",
+            uri=True,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+    else:
+        conn = await aiosqlite.connect(
+            db_path, cached_statements=STATEMENT_CACHE_SIZE
+        )
+
+    try:
+        await configure_connection(conn)
+        if read_only:
+            await conn.execute("PRAGMA query_only=ON;")
+    except Exception:
+        await conn.close()
+        raise
+
+    return conn
+
+
+class DBConnectionPool:
+    """
+    Bounded pool of long-lived aiosqlite connections.
+
+    Connections are opened lazily up to `size`, configured once when they are
+    opened and handed out LIFO so that the hottest connections get reused. A
+    connection that has been idle for longer than `health_check_interval`
+    seconds is probed with `SELECT 1` before being handed out and replaced if
+    the probe fails. With `read_only` set, connections are opened with
+    `mode=ro` and `query_only` so that they never compete for the write lock.
+    """
+
+    def __init__(
+        self,
+        db_path: str = sqlite_db_path,
+        size: int = 10,
+        health_check_interval: float = 30.0,
+        read_only: bool = False,
+    ):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+
+        self.db_path = db_path
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.read_only = read_only
+        self._idle = deque()
+        self._semaphore = asyncio.Semaphore(size)
+        self._num_open = 0
+        self._closed = False
+
+    @property
+    def num_open(self) -> int:
+        return self._num_open
+
+    @property
+    def num_idle(self) -> int:
+        return len(self._idle)
+
+    async def _open_connection(self) -> aiosqlite.Connection:
+        conn = await open_db_connection(self.db_path, self.read_only)
+        self._num_open += 1
+        return conn
+
+    async def _close_connection(self, conn: aiosqlite.Connection):
+        self._num_open -= 1
+        try:
+            await conn.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled database connection: {e}")
+
+    async def _is_healthy(self, conn: aiosqlite.Connection) -> bool:
+        try:
+            await conn.execute("SELECT 1")
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding unhealthy pooled database connection: {e}")
+            return False
+
+    async def open(self):
+        # open one connection upfront so that a misconfigured database fails at startup
+        conn = await self.acquire()
+        await self.release(conn)
+
+    async def acquire(self) -> aiosqlite.Connection:
+        if self._closed:
+            raise RuntimeError("Database connection pool is closed")
+
+        await self._semaphore.acquire()
+
+        try:
+            while self._idle:
+                conn, last_used_at = self._idle.pop()
+
+                if (
+                    time.monotonic() - last_used_at < self.health_check_interval
+                    or await self._is_healthy(conn)
+                ):
+                    return conn
+
+                await self._close_connection(conn)
+
+            return await self._open_connection()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    async def release(self, conn: aiosqlite.Connection, discard: bool = False):
+        try:
+            if not discard and conn.in_transaction:
+                # never hand out a connection with a half-finished transaction
+                await conn.rollback()
+        except Exception:
+            discard = True
+
+        if discard or self._closed:
+            await self._close_connection(conn)
+        else:
+            self._idle.append((conn, time.monotonic()))
+
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire()
+        discard = False
+        try:
+            yield conn
+        except Exception:
+            try:
+                await conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            await self.release(conn, discard=discard)
+
+    async def close(self):
+        self._closed = True
+
+        while self._idle:
+            conn, _ = self._idle.pop()
+            await self._close_connection(conn)
+
+
+# task currently holding the writer connection, used to make leases re-entrant
+_writer_owner: ContextVar[asyncio.Task | None] = ContextVar(
+    "_writer_owner", default=None
+)
+
+
+class NestedWriterConnection:
+    """
+    The writer connection as seen from a nested lease, whose work runs in a
+    savepoint of the transaction of the enclosing lease. Committing is left to
+    the enclosing lease, so `commit` only marks the nested work as done and
+    `rollback` only undoes the nested work.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, savepoint: str):
+        self._conn = conn
+        self._savepoint = savepoint
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        await self._conn.execute(f"ROLLBACK TO {self._savepoint}")
+
+
+class DBWriter:
+    """
+    Single SQLite writer connection shared by the whole process.
+
+    SQLite only ever allows one writer at a time, so instead of letting every
+    request race for the write lock (and fail with `database is locked`),
+    callers queue up for a lease on one long-lived connection. A worker task
+    grants leases in FIFO order and waits for each lease to be released before
+    granting the next one. Leases are re-entrant within the same task: a
+    nested lease runs in a savepoint, so that it can neither commit nor roll
+    back the unfinished transaction of the lease it is nested in.
+    """
+
+    def __init__(self, db_path: str = sqlite_db_path):
+        self.db_path = db_path
+        self._conn: aiosqlite.Connection | None = None
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._depth = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        self._conn = await open_db_connection(self.db_path)
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            granted, released = await self._queue.get()
+
+            if granted.done():
+                # the caller gave up while waiting in the queue
+                continue
+
+            granted.set_result(self._conn)
+            await released.wait()
+
+    @asynccontextmanager
+    async def connection(self):
+        current_task = asyncio.current_task()
+
+        if _writer_owner.get() is current_task:
+            async with self._nested_connection() as conn:
+                yield conn
+            return
+
+        if not self.is_running:
+            raise RuntimeError("Database writer is not running")
+
+        granted = asyncio.get_running_loop().create_future()
+        released = asyncio.Event()
+        self._queue.put_nowait((granted, released))
+
+        try:
+            conn = await granted
+        except asyncio.CancelledError:
+            if granted.done() and not granted.cancelled():
+                released.set()
+            raise
+
+        token = _writer_owner.set(current_task)
+        try:
+            yield conn
+        except Exception:
+            await conn.rollback()
+            raise
+        finally:
+            _writer_owner.reset(token)
+            try:
+                if conn.in_transaction:
+                    # never leave the shared connection with a half-finished transaction
+                    await conn.rollback()
+            finally:
+                released.set()
+
+    @asynccontextmanager
+    async def _nested_connection(self):
+        # only the task holding the lease can get here, so the depth is its own
+        self._depth += 1
+        savepoint = f"lease_{self._depth}"
+        await self._conn.execute(f"SAVEPOINT {savepoint}")
+
+        try:
+            yield NestedWriterConnection(self._conn, savepoint)
+        except BaseException:
+            await self._conn.execute(f"ROLLBACK TO {savepoint}")
+            raise
+        finally:
+            self._depth -= 1
+            # if the enclosing lease had no transaction open, the savepoint
+            # started one and releasing it commits the nested work
+            await self._conn.execute(f"RELEASE {savepoint}")
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+_db_pool: DBConnectionPool | None = None
+_db_writer: DBWriter | None = None
+
+
+def get_db_pool() -> DBConnectionPool | None:
+    return _db_pool
+
+
+def get_db_writer() -> DBWriter | None:
+    return _db_writer
+
+
+async def init_db_pool(size: int, db_path: str = sqlite_db_path) -> DBConnectionPool:
+    """
+    Start the process-wide writer connection and a pool of `size` read-only
+    connections. Returns the read pool.
+    """
+    global _db_pool, _db_writer
+
+    await close_db_pool()
+
+    # the writer goes first so that the WAL files exist before any reader opens
+    writer = DBWriter(db_path)
+    await writer.start()
+
+    pool = DBConnectionPool(db_path, size, read_only=True)
+    try:
+        await pool.open()
+    except Exception:
+        await writer.close()
+        raise
+
+    _db_writer = writer
+    _db_pool = pool
+
+    return pool
+
+
+async def close_db_pool():
+    global _db_pool, _db_writer
+
+    # flush any pending group-committed writes while the writer is still up
+    await stop_group_commit()
+
+    pool, writer = _db_pool, _db_writer
+    _db_pool, _db_writer = None, None
+
+    if pool is not None:
+        await pool.close()
+
+    if writer is not None:
+        await writer.close()
 
 
 @asynccontextmanager
 async def get_new_db_connection():
+    """
+    Connection for anything that may write. Leases the shared writer
+    connection when it is running.
+    """
+    if _db_writer is not None:
+        async with _db_writer.connection() as conn:
+            yield conn
+        return
+
+    # no pool running (scripts, migrations, tests): use a one-off connection
     conn = None
     try:
         conn = await aiosqlite.connect(sqlite_db_path)
-        await conn.execute("PRAGMA synchronous=NORMAL;")
-        await conn.set_trace_callback(trace_callback)
+        await configure_connection(conn)
         yield conn
     except Exception as e:
         if conn:
@@ -28,6 +410,39 @@ async def get_new_db_connection():
             await conn.close()
 
 
+@asynccontextmanager
+async def get_read_db_connection():
+    """
+    Read-only connection from the reader pool. Falls back to a regular
+    connection when the pool is not running.
+    """
+    if _db_pool is None:
+        async with get_new_db_connection() as conn:
+            yield conn
+        return
+
+    async with _db_pool.connection() as conn:
+        yield conn
+
+
+_write_keywords_pattern = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b", re.IGNORECASE
+)
+
+
+def is_read_only_query(operation: str) -> bool:
+    statement = operation.lstrip().upper()
+
+    if statement.startswith("SELECT"):
+        return True
+
+    if statement.startswith("WITH"):
+        # a CTE can prefix a mutation
+        return _write_keywords_pattern.search(operation) is None
+
+    return False
+
+
 def set_db_defaults():
     conn = sqlite3.connect(sqlite_db_path)
 
@@ -49,8 +464,14 @@ async def execute_db_operation(
     fetch_all=False,
     get_last_row_id=False,
 ):
-    async with get_new_db_connection() as conn:
+    if (fetch_one or fetch_all) and is_read_only_query(operation):
+        connection = get_read_db_connection()
+    else:
+        connection = get_new_db_connection()
+
+    async with connection as conn:
         cursor = await conn.cursor()
+        started_at = time.perf_counter()
 
         if params:
             await cursor.execute(operation, params)
@@ -64,6 +485,12 @@ async def execute_db_operation(
         else:
             result = None
 
+        record_query(
+            operation,
+            started_at,
+            _get_row_count(cursor, result, fetch_one, fetch_all),
+        )
+
         await conn.commit()
 
         if get_last_row_id:
@@ -75,8 +502,11 @@ async def execute_db_operation(
 async def execute_many_db_operation(operation, params_list):
     async with get_new_db_connection() as conn:
         cursor = await conn.cursor()
+        started_at = time.perf_counter()
 
         await cursor.executemany(operation, params_list)
+        record_query(operation, started_at, _get_row_count(cursor))
+
         await conn.commit()
 
 
@@ -90,10 +520,185 @@ async def execute_multiple_db_operations(commands_and_params: List[Tuple[str, Tu
         cursor = await conn.cursor()
 
         for command, params in commands_and_params:
+            started_at = time.perf_counter()
+            await cursor.execute(command, params)
+            record_query(command, started_at, _get_row_count(cursor))
+
+        await conn.commit()
+
+
+class GroupCommitter:
+    """
+    Coalesces small, independent write units into shared transactions.
+
+    Units submitted within `max_delay` seconds of the first unit in a batch
+    (up to `max_batch_size` of them) are executed in one transaction on the
+    writer connection, so that a burst of writers pays for a single commit.
+    Each unit runs inside its own savepoint: a failing unit is rolled back
+    and only its caller sees the error. Callers are resolved only after the
+    batch has been committed, with the `lastrowid` of each of their commands.
+    """
+
+    def __init__(self, max_delay: float = 0.005, max_batch_size: int = 256):
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+        self.num_batches = 0
+        self.num_units = 0
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None:
+            return
+
+        # let the worker drain everything that was submitted before stopping
+        self._queue.put_nowait(None)
+        await self._worker
+        self._worker = None
+
+    async def submit(self, commands_and_params: List[Tuple[str, Tuple]]) -> List[int]:
+        if self._worker is None or self._worker.done():
+            raise RuntimeError("Group committer is not running")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((commands_and_params, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+                if item is None:
+                    stopping = True
+                    break
+
+                batch.append(item)
+
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: List[Tuple[List[Tuple[str, Tuple]], asyncio.Future]]):
+        results = []
+
+        try:
+            async with get_new_db_connection() as conn:
+                cursor = await conn.cursor()
+
+                # explicit BEGIN so that releasing a savepoint does not commit
+                await cursor.execute("BEGIN")
+
+                for index, (commands_and_params, _) in enumerate(batch):
+                    await cursor.execute(f"SAVEPOINT unit_{index}")
+
+                    try:
+                        row_ids = []
+                        for command, params in commands_and_params:
+                            started_at = time.perf_counter()
+                            await cursor.execute(command, params)
+                            record_query(command, started_at, _get_row_count(cursor))
+                            row_ids.append(cursor.lastrowid)
+                        results.append(row_ids)
+                    except Exception as e:
+                        await cursor.execute(f"ROLLBACK TO unit_{index}")
+                        results.append(e)
+
+                    await cursor.execute(f"RELEASE unit_{index}")
+
+                await conn.commit()
+        except Exception as e:
+            logger.error(f"Group commit of {len(batch)} writes failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.num_batches += 1
+        self.num_units += len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                # the caller was cancelled; its write has still been committed
+                continue
+
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+_group_committer: GroupCommitter | None = None
+
+
+def get_group_committer() -> GroupCommitter | None:
+    return _group_committer
+
+
+def start_group_commit(max_delay: float, max_batch_size: int = 256) -> GroupCommitter:
+    global _group_committer
+
+    committer = GroupCommitter(max_delay, max_batch_size)
+    committer.start()
+    _group_committer = committer
+
+    return committer
+
+
+async def stop_group_commit():
+    global _group_committer
+
+    committer = _group_committer
+    _group_committer = None
+
+    if committer is not None:
+        await committer.stop()
+
+
+async def execute_group_committed_operations(
+    commands_and_params: List[Tuple[str, Tuple]],
+) -> List[int]:
+    """
+    Execute the commands atomically and return the lastrowid of each of them.
+    When group commit is enabled, the commands may share a transaction with
+    other concurrent writers; otherwise they run in a transaction of their own.
+    """
+    if _group_committer is not None:
+        return await _group_committer.submit(commands_and_params)
+
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        row_ids = []
+        for command, params in commands_and_params:
+            started_at = time.perf_counter()
             await cursor.execute(command, params)
+            record_query(command, started_at, _get_row_count(cursor))
+            row_ids.append(cursor.lastrowid)
 
         await conn.commit()
 
+    return row_ids
+
 
 async def check_table_exists(table_name: str, cursor):
     await cursor.execute(
@@ -116,3 +721,14 @@ def deserialise_list_from_str(str_to_deserialise: str):
         return str_to_deserialise.split(",")
 
     return []
+
+
+# Binds a whole list to a single parameter (see `serialise_list_to_json`). Unlike
+# inlined values or one `?` per item, the statement text stays the same for every
+# list, so its prepared statement and query plan get reused across calls.
+# Usage: f"WHERE id IN {JSON_LIST_PLACEHOLDER}", (serialise_list_to_json(ids),)
+JSON_LIST_PLACEHOLDER = "(SELECT value FROM json_each(?))"
+
+
+def serialise_list_to_json(values: Iterable) -> str:
+    return json.dumps(list(values))
@@ -0,0 +1,104 @@
+"""
+Describes how one JSON value changed into another as a list of operations, so
+that a stream of partial responses can send only what each response added.
+
+The operations follow JSON Patch (RFC 6902) - `add`, `replace` and `remove` at
+a JSON Pointer `path` - with one addition: `append`, which extends the string
+at `path` by `value`. A partial response mostly grows by a few characters at
+the end of one string, which `append` sends without repeating the string.
+"""
+
+from typing import Any, Dict, List
+
+
+def escape_json_pointer_token(token: Any) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def unescape_json_pointer_token(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff_json(old: Any, new: Any, path: str = "") -> List[Dict]:
+    """Returns the operations that turn `old` into `new`"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = []
+
+        for key in old:
+            if key not in new:
+                operations.append(
+                    {"op": "remove", "path": f"{path}/{escape_json_pointer_token(key)}"}
+                )
+
+        for key, value in new.items():
+            key_path = f"{path}/{escape_json_pointer_token(key)}"
+
+            if key not in old:
+                operations.append({"op": "add", "path": key_path, "value": value})
+            else:
+                operations.extend(diff_json(old[key], value, key_path))
+
+        return operations
+
+    if isinstance(old, list) and isinstance(new, list):
+        operations = []
+
+        for index in range(len(old) - 1, len(new) - 1, -1):
+            operations.append({"op": "remove", "path": f"{path}/{index}"})
+
+        for index, value in enumerate(new):
+            if index < len(old):
+                operations.extend(diff_json(old[index], value, f"{path}/{index}"))
+            else:
+                operations.append({"op": "add", "path": f"{path}/-", "value": value})
+
+        return operations
+
+    if (
+        isinstance(old, str)
+        and isinstance(new, str)
+        and len(new) > len(old)
+        and new.startswith(old)
+    ):
+        return [{"op": "append", "path": path, "value": new[len(old) :]}]
+
+    # `True == 1` in python, but they are different JSON values
+    if old == new and type(old) is type(new):
+        return []
+
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def apply_json_patch(document: Any, operations: List[Dict]) -> Any:
+    """Applies the operations of `diff_json` to `document`, returning the new document"""
+    for operation in operations:
+        tokens = [
+            unescape_json_pointer_token(token)
+            for token in operation["path"].split("/")[1:]
+        ]
+
+        if not tokens:
+            if operation["op"] == "append":
+                document += operation["value"]
+            else:
+                document = operation["value"]
+            continue
+
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token) if isinstance(parent, list) else token]
+
+        key = tokens[-1]
+        if isinstance(parent, list):
+            key = len(parent) if key == "-" else int(key)
+
+        if operation["op"] == "remove":
+            del parent[key]
+        elif operation["op"] == "append":
+            parent[key] += operation["value"]
+        elif operation["op"] == "add" and isinstance(parent, list):
+            parent.insert(key, operation["value"])
+        else:
+            parent[key] = operation["value"]
+
+    return document
@@ -0,0 +1,160 @@
+import json
+import random
+import re
+from collections import deque
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, List
+from api.settings import settings
+from api.utils.logging import logger
+
+# upper bounds (in milliseconds) of the duration histogram buckets
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+_comment_pattern = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_string_literal_pattern = re.compile(r"'(?:[^']|'')*'")
+_number_literal_pattern = re.compile(r"\b\d+(?:\.\d+)?\b")
+_in_list_pattern = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_whitespace_pattern = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint_query(sql: str) -> str:
+    """
+    Normalise a statement so that queries differing only in their literal
+    values map to the same fingerprint.
+    """
+    fingerprint = _comment_pattern.sub(" ", sql)
+    fingerprint = _string_literal_pattern.sub("?", fingerprint)
+    fingerprint = _number_literal_pattern.sub("?", fingerprint)
+    fingerprint = _in_list_pattern.sub("IN (...)", fingerprint)
+    return _whitespace_pattern.sub(" ", fingerprint).strip()
+
+
+class QueryStats:
+    """
+    Statistics of the statements of one fingerprint. Each recorded statement
+    stands for `weight` statements, the inverse of the chance it had of being
+    sampled, so that the counts, totals and histogram estimate every statement.
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self.count = 0.0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0.0
+        # one slot per bucket plus an overflow slot
+        self.histogram = [0.0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+
+    def add(self, duration_ms: float, row_count: int | None, weight: float = 1.0):
+        self.samples += 1
+        self.count += weight
+        self.total_ms += duration_ms * weight
+        self.max_ms = max(self.max_ms, duration_ms)
+
+        if row_count is not None and row_count > 0:
+            self.rows += row_count * weight
+
+        for index, bucket in enumerate(HISTOGRAM_BUCKETS_MS):
+            if duration_ms <= bucket:
+                self.histogram[index] += weight
+                return
+
+        self.histogram[-1] += weight
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": round(self.count),
+            "samples": self.samples,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0,
+            "max_ms": round(self.max_ms, 3),
+            "rows": round(self.rows),
+            "histogram": {
+                **{
+                    f"le_{bucket}ms": round(self.histogram[index])
+                    for index, bucket in enumerate(HISTOGRAM_BUCKETS_MS)
+                },
+                "inf": round(self.histogram[-1]),
+            },
+        }
+
+
+class QueryProfiler:
+    """
+    In-memory profile of the SQL executed by the db helpers.
+
+    Every statement is timed, but only a `sample_rate` fraction of the fast
+    ones is added to the per-fingerprint statistics, each counting for
+    `1 / sample_rate` statements. Statements slower than
+    `slow_query_threshold_ms` are always added, counting for themselves only,
+    and are also kept and logged as a JSON line.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 1.0,
+        slow_query_threshold_ms: float = 100.0,
+        max_slow_queries: int = 100,
+    ):
+        self.sample_rate = sample_rate
+        self.slow_query_threshold_ms = slow_query_threshold_ms
+        self._stats: Dict[str, QueryStats] = {}
+        self._slow_queries = deque(maxlen=max_slow_queries)
+        self._started_at = datetime.now(timezone.utc)
+
+    def record(self, sql: str, duration: float, row_count: int | None = None):
+        """Record a statement that took `duration` seconds to run."""
+        duration_ms = duration * 1000
+        is_slow = duration_ms >= self.slow_query_threshold_ms
+
+        if is_slow:
+            weight = 1.0
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            weight = 1 / self.sample_rate
+        else:
+            return
+
+        fingerprint = fingerprint_query(sql)
+
+        if fingerprint not in self._stats:
+            self._stats[fingerprint] = QueryStats()
+
+        self._stats[fingerprint].add(duration_ms, row_count, weight)
+
+        if is_slow:
+            slow_query = {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "fingerprint": fingerprint,
+                "duration_ms": round(duration_ms, 3),
+                "rows": row_count,
+            }
+            self._slow_queries.append(slow_query)
+            logger.warning(f"Slow query: {json.dumps(slow_query)}")
+
+    def get_stats(self) -> Dict:
+        queries: List[Dict] = [
+            {"fingerprint": fingerprint, **stats.to_dict()}
+            for fingerprint, stats in self._stats.items()
+        ]
+
+        return {
+            "since": self._started_at.isoformat(),
+            "sample_rate": self.sample_rate,
+            "slow_query_threshold_ms": self.slow_query_threshold_ms,
+            "histogram_buckets_ms": HISTOGRAM_BUCKETS_MS,
+            "queries": sorted(queries, key=lambda query: -query["total_ms"]),
+            "slow_queries": list(self._slow_queries),
+        }
+
+    def reset(self):
+        self._stats.clear()
+        self._slow_queries.clear()
+        self._started_at = datetime.now(timezone.utc)
+
+
+query_profiler = QueryProfiler(
+    sample_rate=settings.db_query_profile_sample_rate,
+    slow_query_threshold_ms=settings.db_slow_query_threshold_ms,
+)
@@ -1,6 +1,15 @@
-from typing import Dict, Set
+import asyncio
+from typing import Dict, List, Set
 from fastapi import WebSocket, WebSocketDisconnect
 from fastapi.routing import APIRouter
+from api.db.generation_events import (
+    store_generation_event,
+    store_generation_events,
+    get_last_generation_event_id,
+    get_generation_events_after,
+)
+from api.settings import settings
+from api.utils.logging import logger
 
 router = APIRouter()
 
@@ -39,10 +48,42 @@ class ConnectionManager:
             for websocket in disconnected_websockets:
                 self.disconnect(websocket, course_id)
 
+    async def send_item_updates(self, course_id: int, items_data: List[Dict]):
+        """Sends a batch of updates, in order, to each websocket of the course in turn"""
+        if course_id not in self.active_connections:
+            return
+
+        disconnected_websockets = set()
+        for websocket in self.active_connections[course_id]:
+            try:
+                for item_data in items_data:
+                    await websocket.send_json(item_data)
+            except Exception as exception:
+                logger.error(
+                    f"Error sending updates for course {course_id}: {exception}"
+                )
+
+                disconnected_websockets.add(websocket)
+
+        for websocket in disconnected_websockets:
+            self.disconnect(websocket, course_id)
+
+
+# Stands in for the connection manager in generation workers, which have no
+# websockets, storing the updates for the API processes to relay
+class StoredUpdatePublisher:
+    async def send_item_update(self, course_id: int, item_data: Dict):
+        await store_generation_event(course_id, item_data)
+
+    async def send_item_updates(self, course_id: int, items_data: List[Dict]):
+        await store_generation_events(course_id, items_data)
+
 
 # Create a connection manager instance
 manager = ConnectionManager()
 
+stored_update_publisher = StoredUpdatePublisher()
+
 
 # WebSocket endpoint for course generation updates
 @router.websocket("/course/{course_id}/generation")
@@ -60,4 +101,29 @@ async def websocket_course_generation(websocket: WebSocket, course_id: int):
 
 # Function to get the connection manager instance
 def get_manager() -> ConnectionManager:
+    if settings.generation_worker_enabled:
+        # generation runs in `api.worker`, whose updates reach the websockets
+        # through `relay_generation_events`
+        return stored_update_publisher
+
     return manager
+
+
+async def relay_generation_events(batch_size: int = 500):
+    """Sends the updates stored by generation workers to the websockets of this process"""
+    last_event_id = await get_last_generation_event_id()
+
+    while True:
+        events = []
+
+        try:
+            events = await get_generation_events_after(last_event_id, batch_size)
+
+            for event_id, course_id, event in events:
+                await manager.send_item_update(course_id, event)
+                last_event_id = event_id
+        except Exception as exception:
+            logger.error(f"Error in relaying generation events: {exception}")
+
+        if len(events) < batch_size:
+            await asyncio.sleep(settings.generation_event_poll_interval_seconds)
@@ -0,0 +1,52 @@
+"""
+Runs the course structure and task generation jobs stored in the database in a
+process of its own, so that they do not compete with the requests of the API
+for its event loop:
+
+    cd src; python -m api.worker
+
+Set `GENERATION_WORKER_ENABLED=true` for both the API and the workers. The API
+then only stores the jobs and relays their progress to the websockets, and any
+number of workers share the jobs through their leases (see `api.db.job_queue`).
+"""
+
+import asyncio
+import signal
+from api.db import init_db
+from api.llm import openai_clients
+from api.routes.ai import run_generation_jobs
+from api.settings import settings
+from api.utils.db import init_db_pool, close_db_pool
+from api.utils.logging import logger
+
+
+async def main():
+    await init_db()
+    await init_db_pool(settings.db_pool_size)
+
+    generation_jobs = asyncio.create_task(run_generation_jobs())
+
+    # give the jobs this worker holds back on a stop, rather than wait for
+    # their leases to run out
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, generation_jobs.cancel)
+
+    logger.info("Generation worker started")
+
+    try:
+        await asyncio.wait([generation_jobs])
+    finally:
+        await openai_clients.close()
+        await close_db_pool()
+
+    logger.info("Generation worker stopped")
+
+
+if __name__ == "__main__":
+    if not settings.generation_worker_enabled:
+        logger.warning(
+            "GENERATION_WORKER_ENABLED is not set: the progress of the jobs of this worker will not reach the websockets"
+        )
+
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+import pytest
+import aiosqlite
+from datetime import datetime
+from unittest.mock import patch
+from src.api.db.activity import (
+    get_record_activity_command,
+    rebuild_daily_activity,
+    refresh_daily_activity,
+)
+from src.api.db import (
+    create_cohort_tables,
+    create_course_cohorts_table,
+    create_course_tasks_table,
+    create_chat_history_table,
+    create_task_completion_table,
+    create_daily_activity_table,
+    create_questions_table,
+)
+
+
+@pytest.fixture
+async def activity_db_path(sqlite_db):
+    """A real SQLite database with user 1 in cohorts 1 and 2 and user 2 in cohort 1"""
+    # course 1 (task 1, question 1) is in both cohorts, course 2 (task 2) only in cohort 2
+    return await sqlite_db(
+        create_cohort_tables,
+        create_course_cohorts_table,
+        create_course_tasks_table,
+        create_questions_table,
+        create_chat_history_table,
+        create_task_completion_table,
+        create_daily_activity_table,
+        script="""
+        INSERT INTO cohorts (id, name, org_id) VALUES (1, 'Cohort 1', 1), (2, 'Cohort 2', 1);
+        INSERT INTO user_cohorts (user_id, cohort_id, role) VALUES (1, 1, 'learner'), (1, 2, 'learner'), (2, 1, 'learner');
+        INSERT INTO course_cohorts (course_id, cohort_id) VALUES (1, 1), (1, 2), (2, 2);
+        INSERT INTO course_tasks (course_id, task_id, ordering) VALUES (1, 1, 0), (2, 2, 0);
+        INSERT INTO questions (id, task_id, type, blocks, input_type, response_type, position, is_feedback_shown, title) VALUES
+            (1, 1, 'subjective', '[]', 'text', 'chat', 0, 1, 'Question');
+        """,
+    )
+
+
+async def fetch_activity(db_path):
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute(
+            "SELECT cohort_id, user_id, ist_date, streak FROM daily_activity ORDER BY cohort_id, user_id, ist_date"
+        )
+        return await cursor.fetchall()
+
+
+async def record(db_path, user_id, created_at, question_id=None, task_id=None):
+    """Record activity the way the chat and task modules do: next to the write itself"""
+    async with aiosqlite.connect(db_path) as conn:
+        if question_id is not None:
+            await conn.execute(
+                "INSERT INTO chat_history (user_id, question_id, role, content, created_at) VALUES (?, ?, 'user', 'hi', ?)",
+                (user_id, question_id, created_at),
+            )
+        else:
+            await conn.execute(
+                "INSERT INTO task_completions (user_id, task_id, created_at) VALUES (?, ?, ?)",
+                (user_id, task_id, created_at),
+            )
+
+        await conn.execute(
+            *get_record_activity_command(
+                user_id, question_id=question_id, task_id=task_id, created_at=created_at
+            )
+        )
+        await conn.commit()
+
+
+@pytest.mark.asyncio
+class TestDailyActivity:
+    async def test_record_activity_builds_streaks(self, activity_db_path):
+        # 2024-01-01 20:00 UTC is already 2024-01-02 in IST
+        await record(activity_db_path, 1, datetime(2024, 1, 1, 10), question_id=1)
+        await record(activity_db_path, 1, datetime(2024, 1, 1, 12), question_id=1)
+        await record(activity_db_path, 1, datetime(2024, 1, 1, 20), question_id=1)
+        await record(activity_db_path, 1, datetime(2024, 1, 3, 10), task_id=2)
+        await record(activity_db_path, 1, datetime(2024, 1, 5, 10), question_id=1)
+        await record(activity_db_path, 2, datetime(2024, 1, 5, 10), task_id=2)
+
+        assert await fetch_activity(activity_db_path) == [
+            (1, 1, "2024-01-01", 1),
+            (1, 1, "2024-01-02", 2),
+            (1, 1, "2024-01-05", 1),
+            (2, 1, "2024-01-01", 1),
+            (2, 1, "2024-01-02", 2),
+            (2, 1, "2024-01-03", 3),
+            (2, 1, "2024-01-05", 1),
+        ]
+
+    async def test_rebuild_matches_incremental_rollup(self, activity_db_path):
+        for user_id, created_at, question_id, task_id in [
+            (1, datetime(2024, 1, 1, 10), 1, None),
+            (1, datetime(2024, 1, 1, 20), 1, None),
+            (1, datetime(2024, 1, 3, 10), None, 2),
+            (1, datetime(2024, 1, 4, 10), 1, None),
+            (2, datetime(2024, 1, 4, 10), 1, None),
+        ]:
+            await record(activity_db_path, user_id, created_at, question_id, task_id)
+
+        incremental = await fetch_activity(activity_db_path)
+
+        async with aiosqlite.connect(activity_db_path) as conn:
+            await conn.execute("DELETE FROM daily_activity")
+            await rebuild_daily_activity(await conn.cursor())
+            await conn.commit()
+
+        assert await fetch_activity(activity_db_path) == incremental
+
+    async def test_refresh_only_touches_given_cohorts(self, activity_db_path):
+        await record(activity_db_path, 1, datetime(2024, 1, 1, 10), question_id=1)
+        await record(activity_db_path, 2, datetime(2024, 1, 1, 10), question_id=1)
+
+        async with aiosqlite.connect(activity_db_path) as conn:
+            # course 1 is taken out of cohort 1, so nothing counts there anymore
+            await conn.execute("DELETE FROM course_cohorts WHERE cohort_id = 1")
+            await conn.commit()
+
+        with patch(
+            "src.api.db.activity.get_new_db_connection",
+            lambda: aiosqlite.connect(activity_db_path),
+        ):
+            await refresh_daily_activity(cohort_ids=[1], user_ids=[1])
+
+        assert await fetch_activity(activity_db_path) == [
+            (1, 2, "2024-01-01", 1),
+            (2, 1, "2024-01-01", 1),
+        ]
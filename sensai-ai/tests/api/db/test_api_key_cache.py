@@ -0,0 +1,52 @@
+from unittest.mock import patch
+from api.db.api_key_cache import ApiKeyCache
+
+
+class TestApiKeyCache:
+    @patch("api.db.api_key_cache.time.monotonic")
+    def test_entries_expire_after_the_ttl(self, mock_monotonic):
+        cache = ApiKeyCache(max_size=10, ttl=60)
+        mock_monotonic.return_value = 1000
+        cache.put("hash", 1, cache.version)
+
+        mock_monotonic.return_value = 1059
+        assert cache.get("hash") == 1
+
+        mock_monotonic.return_value = 1060
+        assert cache.get("hash") is None
+        assert cache.get_stats()["size"] == 0
+
+    def test_least_recently_used_key_is_evicted(self):
+        cache = ApiKeyCache(max_size=2, ttl=60)
+        cache.put("hash_1", 1, cache.version)
+        cache.put("hash_2", 2, cache.version)
+        cache.get("hash_1")
+        cache.put("hash_3", 3, cache.version)
+
+        assert cache.get("hash_2") is None
+        assert cache.get("hash_1") == 1
+        assert cache.get("hash_3") == 3
+
+    def test_disabled_cache_stores_nothing(self):
+        for cache in [ApiKeyCache(max_size=0, ttl=60), ApiKeyCache(max_size=10, ttl=0)]:
+            cache.put("hash", 1, cache.version)
+            assert cache.get("hash") is None
+
+    def test_stats(self):
+        cache = ApiKeyCache(max_size=10, ttl=60)
+        cache.get("hash")
+        cache.put("hash", 1, cache.version)
+        cache.get("hash")
+        cache.get("hash")
+
+        assert cache.get_stats() == {
+            "size": 1,
+            "max_size": 10,
+            "ttl_seconds": 60,
+            "hits": 2,
+            "misses": 1,
+            "hit_rate": 0.6667,
+        }
+
+        cache.reset_stats()
+        assert cache.get_stats()["hit_rate"] == 0
@@ -1,9 +1,10 @@
 import pytest
-from datetime import datetime
-from unittest.mock import patch, AsyncMock, MagicMock
+from datetime import datetime, timezone, timedelta
+from unittest.mock import patch, MagicMock
 from src.api.db.chat import (
     store_messages,
     get_all_chat_history,
+    iterate_all_chat_history,
     convert_chat_message_to_dict,
     get_question_chat_history_for_user,
     get_task_chat_history_for_user,
@@ -19,16 +20,11 @@ from src.api.models import StoreMessageRequest, TaskType
 class TestStoreMessages:
     """Test message storage functionality."""
 
-    @patch("src.api.db.chat.get_new_db_connection")
+    @patch("src.api.db.chat.execute_group_committed_operations")
     @patch("src.api.db.chat.execute_db_operation")
-    async def test_store_messages_success(self, mock_execute, mock_get_conn):
+    async def test_store_messages_success(self, mock_execute, mock_group_commit):
         """Test successful message storage."""
-        mock_cursor = AsyncMock()
-        mock_cursor.lastrowid = 123
-        mock_conn = AsyncMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_conn.__aenter__.return_value = mock_conn
-        mock_get_conn.return_value = mock_conn
+        mock_group_commit.return_value = [123]
 
         # Mock the fetch result
         mock_execute.return_value = [
@@ -49,19 +45,23 @@ class TestStoreMessages:
         assert len(result) == 1
         assert result[0]["id"] == 123
         assert result[0]["content"] == "Hello"
-        mock_cursor.execute.assert_called()
-        mock_conn.commit.assert_called_once()
+        mock_group_commit.assert_called_once()
+        commands = mock_group_commit.call_args[0][0]
+        assert len(commands) == 2
+        assert "INSERT INTO chat_history" in commands[0][0]
+        assert commands[0][1][:5] == (1, 1, "user", "Hello", "text")
 
-    @patch("src.api.db.chat.get_new_db_connection")
+        # the activity rollup is updated in the same unit as the message
+        assert "INSERT INTO daily_activity" in commands[1][0]
+        assert commands[1][1] == (messages[0].created_at, 1, 1)
+
+    @patch("src.api.db.chat.execute_group_committed_operations")
     @patch("src.api.db.chat.execute_db_operation")
-    async def test_store_messages_with_completion(self, mock_execute, mock_get_conn):
+    async def test_store_messages_with_completion(
+        self, mock_execute, mock_group_commit
+    ):
         """Test message storage with task completion."""
-        mock_cursor = AsyncMock()
-        mock_cursor.lastrowid = 123
-        mock_conn = AsyncMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_conn.__aenter__.return_value = mock_conn
-        mock_get_conn.return_value = mock_conn
+        mock_group_commit.return_value = [123, 123]
 
         mock_execute.return_value = [
             (123, "2024-01-01 12:00:00", 1, 1, "user", "Hello", "text")
@@ -78,23 +78,18 @@ class TestStoreMessages:
 
         result = await store_messages(messages, 1, 1, True)
 
-        # Should insert completion record
-        assert (
-            mock_cursor.execute.call_count == 2
-        )  # One for message, one for completion
-        calls = [call[0][0] for call in mock_cursor.execute.call_args_list]
-        assert any("task_completions" in call for call in calls)
+        # Should insert completion record in the same unit as the message
+        commands = mock_group_commit.call_args[0][0]
+        assert len(commands) == 3  # message, completion and activity
+        assert "task_completions" in commands[1][0]
+        assert commands[1][1] == (1, 1)
+        assert len(result) == 1
 
-    @patch("src.api.db.chat.get_new_db_connection")
+    @patch("src.api.db.chat.execute_group_committed_operations")
     @patch("src.api.db.chat.execute_db_operation")
-    async def test_store_multiple_messages(self, mock_execute, mock_get_conn):
+    async def test_store_multiple_messages(self, mock_execute, mock_group_commit):
         """Test storing multiple messages."""
-        mock_cursor = AsyncMock()
-        mock_cursor.lastrowid = 123
-        mock_conn = AsyncMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_conn.__aenter__.return_value = mock_conn
-        mock_get_conn.return_value = mock_conn
+        mock_group_commit.return_value = [123, 124]
 
         mock_execute.return_value = [
             (123, "2024-01-01 12:00:00", 1, 1, "user", "Hello", "text"),
@@ -119,7 +114,10 @@ class TestStoreMessages:
         result = await store_messages(messages, 1, 1, False)
 
         assert len(result) == 2
-        assert mock_cursor.execute.call_count == 2  # One for each message
+        # one insert and one activity update for each message
+        assert len(mock_group_commit.call_args[0][0]) == 4
+        # the new ids are bound as a single JSON parameter
+        assert mock_execute.call_args[0][1] == ("[123, 124]",)
 
 
 @pytest.mark.asyncio
@@ -164,6 +162,60 @@ class TestGetChatHistory:
 
         mock_execute.assert_called_once()
 
+    @patch("src.api.db.chat.execute_db_operation")
+    async def test_get_all_chat_history_page(self, mock_execute):
+        """Test that a page of chat history is filtered on the id and time and limited."""
+        mock_execute.return_value = []
+
+        await get_all_chat_history(
+            1,
+            after_id=10,
+            since=datetime(2024, 1, 1, 17, 30, tzinfo=timezone(timedelta(hours=5, minutes=30))),
+            limit=100,
+        )
+
+        query, params = mock_execute.call_args[0]
+        assert "message.id > ?" in query
+        assert "message.created_at >= ?" in query
+        assert "ORDER BY message.id ASC" in query
+        assert "LIMIT ?" in query
+        # the time is compared in UTC, the way created_at is stored
+        assert params == (1, 10, "2024-01-01 12:00:00", 100)
+
+    @patch("src.api.db.chat.execute_db_operation")
+    async def test_iterate_all_chat_history(self, mock_execute):
+        """Test that the chat history is read one page per batch, each after the last id of the previous one."""
+
+        def row(message_id):
+            return (message_id, "2024-01-01 12:00:00", 1, "user@example.com", 1, 1, "user", "Hello", "text")
+
+        mock_execute.side_effect = [[row(1), row(2)], [row(3)]]
+
+        batches = [
+            batch async for batch in iterate_all_chat_history(1, batch_size=2)
+        ]
+
+        assert [[message["id"] for message in batch] for batch in batches] == [[1, 2], [3]]
+        assert batches[0][0]["user_email"] == "user@example.com"
+        assert [call.args[1] for call in mock_execute.call_args_list] == [(1, 2), (1, 2, 2)]
+
+    @patch("src.api.db.chat.execute_db_operation")
+    async def test_iterate_all_chat_history_stops_at_the_limit(self, mock_execute):
+        """Test that the last page only asks for the messages left under the limit."""
+
+        def row(message_id):
+            return (message_id, "2024-01-01 12:00:00", 1, "user@example.com", 1, 1, "user", "Hello", "text")
+
+        mock_execute.side_effect = [[row(1), row(2)], [row(3)]]
+
+        batches = [
+            batch
+            async for batch in iterate_all_chat_history(1, after_id=0, limit=3, batch_size=2)
+        ]
+
+        assert [len(batch) for batch in batches] == [2, 1]
+        assert [call.args[1] for call in mock_execute.call_args_list] == [(1, 0, 2), (1, 2, 1)]
+
     @patch("src.api.db.chat.execute_db_operation")
     async def test_get_question_chat_history_for_user_success(self, mock_execute):
         """Test successful retrieval of question chat history for user."""
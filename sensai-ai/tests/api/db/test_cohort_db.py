@@ -132,15 +132,17 @@ class TestCohortBasicOperations:
 
         mock_execute_multiple.assert_called_once()
         operations = mock_execute_multiple.call_args[0][0]
-        assert len(operations) == 3  # Should have 3 delete operations
+        assert len(operations) == 4  # Should have 4 delete operations
+        assert "daily_activity" in operations[1][0]
 
 
 @pytest.mark.asyncio
 class TestCohortCourseOperations:
     """Test cohort-course relationship operations."""
 
+    @patch("src.api.db.cohort.refresh_daily_activity")
     @patch("src.api.db.cohort.execute_many_db_operation")
-    async def test_add_courses_to_cohort(self, mock_execute_many):
+    async def test_add_courses_to_cohort(self, mock_execute_many, mock_refresh):
         """Test adding courses to cohort."""
         course_ids = [1, 2, 3]
         publish_at = datetime.now(timezone.utc)
@@ -161,6 +163,7 @@ class TestCohortCourseOperations:
         ]
 
         mock_execute_many.assert_called_once_with(ANY, expected_values)
+        mock_refresh.assert_called_once_with(cohort_ids=[1])
 
     @patch("src.api.db.cohort.execute_many_db_operation")
     async def test_add_courses_to_cohort_no_drip(self, mock_execute_many):
@@ -176,8 +179,9 @@ class TestCohortCourseOperations:
 
         mock_execute_many.assert_called_once_with(ANY, expected_values)
 
+    @patch("src.api.db.cohort.refresh_daily_activity")
     @patch("src.api.db.cohort.execute_many_db_operation")
-    async def test_add_course_to_cohorts(self, mock_execute_many):
+    async def test_add_course_to_cohorts(self, mock_execute_many, mock_refresh):
         """Test adding course to multiple cohorts."""
         cohort_ids = [1, 2, 3]
 
@@ -196,9 +200,11 @@ class TestCohortCourseOperations:
         ]
 
         mock_execute_many.assert_called_once_with(ANY, expected_values)
+        mock_refresh.assert_called_once_with(cohort_ids=[1, 2, 3])
 
+    @patch("src.api.db.cohort.refresh_daily_activity")
     @patch("src.api.db.cohort.execute_many_db_operation")
-    async def test_remove_course_from_cohorts(self, mock_execute_many):
+    async def test_remove_course_from_cohorts(self, mock_execute_many, mock_refresh):
         """Test removing course from multiple cohorts."""
         cohort_ids = [1, 2, 3]
 
@@ -206,9 +212,11 @@ class TestCohortCourseOperations:
 
         expected_params = [(1, 1), (1, 2), (1, 3)]
         mock_execute_many.assert_called_once_with(ANY, expected_params)
+        mock_refresh.assert_called_once_with(cohort_ids=[1, 2, 3])
 
+    @patch("src.api.db.cohort.refresh_daily_activity")
     @patch("src.api.db.cohort.execute_many_db_operation")
-    async def test_remove_courses_from_cohort(self, mock_execute_many):
+    async def test_remove_courses_from_cohort(self, mock_execute_many, mock_refresh):
         """Test removing multiple courses from cohort."""
         course_ids = [1, 2, 3]
 
@@ -216,6 +224,7 @@ class TestCohortCourseOperations:
 
         expected_params = [(1, 1), (1, 2), (1, 3)]
         mock_execute_many.assert_called_once_with(ANY, expected_params)
+        mock_refresh.assert_called_once_with(cohort_ids=[1])
 
 
 @pytest.mark.asyncio
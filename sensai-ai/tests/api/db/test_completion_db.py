@@ -0,0 +1,231 @@
+import pytest
+from unittest.mock import patch, AsyncMock
+from api.db.completion import (
+    CompletionMatrix,
+    CompletionCache,
+    completion_cache,
+    get_completion_matrix,
+)
+from src.api.db.task import mark_task_completed, delete_task
+from src.api.db.chat import store_messages
+from src.api.db.cohort import remove_members_from_cohort
+
+
+def make_matrix(course_ids=(1,), linked_task_ids=(101, 102, 103)):
+    return CompletionMatrix(
+        course_ids,
+        linked_task_ids,
+        [101],
+        [(102, 201), (102, 202), (103, None)],
+    )
+
+
+class TestCompletionMatrix:
+    def test_quiz_is_complete_when_all_questions_are(self):
+        matrix = make_matrix()
+        matrix.set_completions(
+            [1, 2, 3],
+            [
+                (1, 101, None),
+                (1, None, 201),
+                (1, None, 202),
+                (2, None, 201),
+                # not part of the matrix
+                (3, 999, None),
+                (4, 101, None),
+            ],
+        )
+
+        assert matrix.num_tasks == 3
+        assert matrix.count_completed_tasks([1, 2, 3]).tolist() == [2, 0, 0]
+        assert matrix.to_dict([2]) == {
+            2: {
+                101: {"is_complete": False},
+                102: {
+                    "is_complete": False,
+                    "questions": [
+                        {"question_id": 201, "is_complete": True},
+                        {"question_id": 202, "is_complete": False},
+                    ],
+                },
+                103: {
+                    "is_complete": False,
+                    "questions": [{"question_id": None, "is_complete": False}],
+                },
+            }
+        }
+
+    def test_rows_of_forgotten_users_are_reused(self):
+        matrix = make_matrix()
+        matrix.set_completions([1, 2], [(1, 101, None), (2, 101, None)])
+
+        matrix.forget_users([1])
+        assert matrix.missing_user_ids([1, 2, 2]) == [1]
+
+        # the freed row is reused and cleared
+        matrix.set_completions([3], [])
+        assert matrix.count_completed_tasks([2, 3]).tolist() == [1, 0]
+        assert matrix._task_completion.shape == (2, 1)
+
+    def test_copy_structure_has_no_learners(self):
+        matrix = make_matrix()
+        matrix.set_completions([1], [(1, 101, None)])
+
+        copy = matrix.copy_structure()
+
+        assert copy.missing_user_ids([1]) == [1]
+        copy.set_completions([1], [(1, None, 201), (1, None, 202)])
+        assert copy.count_completed_tasks([1]).tolist() == [1]
+        assert copy.to_dict([1])[1].keys() == matrix.to_dict([1])[1].keys()
+
+
+class TestCompletionCache:
+    def test_least_recently_used_matrix_is_evicted(self):
+        cache = CompletionCache(max_size=2, ttl=60)
+        cache.put((1, None), make_matrix(), cache.version)
+        cache.put((2, None), make_matrix(), cache.version)
+        cache.get((1, None))
+        cache.put((3, None), make_matrix(), cache.version)
+
+        assert cache.get((2, None)) is None
+        assert cache.get((1, None)) is not None
+        assert cache.get((3, None)) is not None
+
+    @patch("api.db.completion.time.monotonic")
+    def test_matrix_expires_after_the_ttl(self, mock_monotonic):
+        cache = CompletionCache(max_size=2, ttl=60)
+        mock_monotonic.return_value = 1000
+        cache.put((1, None), make_matrix(), cache.version)
+
+        mock_monotonic.return_value = 1059
+        assert cache.get((1, None)) is not None
+
+        mock_monotonic.return_value = 1060
+        assert cache.get((1, None)) is None
+
+    def test_matrix_loaded_before_an_invalidation_is_not_cached(self):
+        cache = CompletionCache(max_size=2, ttl=60)
+        version = cache.version
+        cache.invalidate_users([1])
+        cache.put((1, None), make_matrix(), version)
+
+        assert cache.get((1, None)) is None
+
+    def test_invalidation_only_drops_affected_matrices(self):
+        cache = CompletionCache(max_size=10, ttl=60)
+        cache.put((1, None), make_matrix(course_ids=[1, 2]), cache.version)
+        cache.put((1, 2), make_matrix(course_ids=[2], linked_task_ids=[201]), cache.version)
+        cache.put((2, None), make_matrix(course_ids=[3], linked_task_ids=[301]), cache.version)
+
+        cache.invalidate_tasks([201])
+        assert cache.get((1, 2)) is None
+        assert cache.get((1, None)) is not None
+
+        cache.invalidate_courses([1])
+        assert cache.get((1, None)) is None
+        assert cache.get((2, None)) is not None
+
+        cache.invalidate_cohorts([2])
+        assert cache.get((2, None)) is None
+
+    def test_forget_members_only_touches_the_cohort(self):
+        cache = CompletionCache(max_size=10, ttl=60)
+        for key in [(1, None), (2, None)]:
+            matrix = make_matrix()
+            matrix.set_completions([5], [])
+            cache.put(key, matrix, cache.version)
+
+        cache.forget_members(1, [5])
+
+        assert cache.get((1, None)).missing_user_ids([5]) == [5]
+        assert cache.get((2, None)).missing_user_ids([5]) == []
+
+
+@pytest.mark.asyncio
+class TestGetCompletionMatrix:
+    @patch("api.db.completion.execute_db_operation")
+    async def test_only_missing_rows_are_read(self, mock_db):
+        mock_db.side_effect = [
+            [(101, "learning_material", 1, None)],
+            [(1,)],
+            [(1, 101, None)],
+            [(2, 101, None)],
+        ]
+
+        await get_completion_matrix(1, [1])
+        matrix = await get_completion_matrix(1, [1, 2])
+
+        assert mock_db.call_count == 4
+        assert mock_db.call_args[0][1] == ("[2]",)
+        assert matrix.count_completed_tasks([1, 2]).tolist() == [1, 1]
+
+        # fully cached
+        await get_completion_matrix(1, [2, 1])
+        assert mock_db.call_count == 4
+
+    @patch("api.db.completion.execute_db_operation")
+    async def test_write_during_read_is_not_cached(self, mock_db):
+        async def execute(query, params=(), fetch_all=False):
+            if "task_completions" in query:
+                # a learner completes a task while their completions are being read
+                completion_cache.invalidate_users([1])
+                return [(1, 101, None)]
+            if "SELECT DISTINCT" in query:
+                return [(101, "learning_material", 1, None)]
+            return [(1,)]
+
+        mock_db.side_effect = execute
+
+        matrix = await get_completion_matrix(1, [1])
+
+        assert matrix.count_completed_tasks([1]).tolist() == [1]
+        # the tasks of the cohort are still cached, but not the completions of the learner
+        assert completion_cache.get((1, None)).missing_user_ids([1]) == [1]
+
+
+@pytest.mark.asyncio
+class TestCompletionInvalidation:
+    async def cache_rows(self, user_ids):
+        matrix = make_matrix(course_ids=[1], linked_task_ids=[101, 102, 103])
+        matrix.set_completions(user_ids, [])
+        completion_cache.put((1, None), matrix, completion_cache.version)
+        return matrix
+
+    @patch("src.api.db.task.execute_group_committed_operations")
+    async def test_mark_task_completed(self, mock_execute):
+        matrix = await self.cache_rows([1, 2])
+
+        await mark_task_completed(101, 1)
+
+        assert matrix.missing_user_ids([1, 2]) == [1]
+
+    @patch("src.api.db.chat.execute_db_operation")
+    @patch("src.api.db.chat.execute_group_committed_operations")
+    async def test_store_messages(self, mock_execute, mock_fetch):
+        mock_execute.return_value = []
+        mock_fetch.return_value = []
+        matrix = await self.cache_rows([1, 2])
+
+        await store_messages([], 2, 201, is_complete=False)
+        assert matrix.missing_user_ids([1, 2]) == []
+
+        await store_messages([], 2, 201, is_complete=True)
+        assert matrix.missing_user_ids([1, 2]) == [2]
+
+    @patch("src.api.db.task.execute_db_operation")
+    async def test_task_edit(self, mock_execute):
+        await self.cache_rows([1])
+
+        await delete_task(102)
+
+        assert completion_cache.get((1, None)) is None
+
+    @patch("src.api.db.cohort.execute_multiple_db_operations")
+    @patch("src.api.db.cohort.execute_db_operation", new_callable=AsyncMock)
+    async def test_member_removal(self, mock_execute, mock_execute_multiple):
+        mock_execute.return_value = [(2,)]
+        matrix = await self.cache_rows([1, 2])
+
+        await remove_members_from_cohort(1, [2])
+
+        assert matrix.missing_user_ids([1, 2]) == [2]
@@ -1,5 +1,7 @@
 import pytest
 import json
+import sqlite3
+import aiosqlite
 from unittest.mock import patch, AsyncMock, MagicMock, ANY, call
 from datetime import datetime, timezone, timedelta
 from collections import defaultdict
@@ -8,12 +10,14 @@ from src.api.db.course import (
     get_all_courses_for_org,
     convert_course_db_to_dict,
     get_course,
+    get_courses,
     get_course_org_id,
     update_course_name,
     delete_course,
     get_tasks_for_course,
     get_milestones_for_course,
     add_milestone_to_course,
+    add_generated_course_items,
     update_milestone_orders,
     swap_milestone_ordering_for_course,
     swap_task_ordering_for_course,
@@ -25,10 +29,10 @@ from src.api.db.course import (
     get_course_generation_job_details,
     update_course_generation_job_status,
     update_course_generation_job_status_and_details,
-    get_all_pending_course_structure_generation_jobs,
     add_course_modules,
     transfer_course_to_org,
     duplicate_course_to_org,
+    duplicate_courses_to_org,
     get_cohorts_for_course,
     calculate_milestone_unlock_dates,
     get_courses_for_cohort,
@@ -44,6 +48,19 @@ from src.api.models import (
     ScorecardStatus,
     GenerateTaskJobStatus,
 )
+from src.api.db import (
+    create_organizations_table,
+    create_courses_table,
+    create_milestones_table,
+    create_course_milestones_table,
+    create_tasks_table,
+    create_course_tasks_table,
+    create_questions_table,
+    create_scorecards_table,
+    create_question_scorecards_table,
+    create_chat_history_table,
+    add_chat_history_org_id,
+)
 
 
 @pytest.mark.asyncio
@@ -166,13 +183,14 @@ class TestCourseDetails:
     async def test_get_course_success_published_only(self, mock_execute):
         """Test getting course with published tasks only."""
         # Mock course data
-        course_data = (1, "Test Course", None)
+        course_data = [(1, "Test Course", None)]
         milestones_data = [
-            (1, "Module 1", "#123456", 0),
-            (2, "Module 2", "#654321", 1),
+            (1, 1, "Module 1", "#123456", 0),
+            (1, 2, "Module 2", "#654321", 1),
         ]
         tasks_data = [
             (
+                1,
                 1,
                 "Task 1",
                 TaskType.LEARNING_MATERIAL,
@@ -183,8 +201,20 @@ class TestCourseDetails:
                 None,
                 None,
             ),
-            (2, "Task 2", TaskType.QUIZ, TaskStatus.PUBLISHED, None, 1, 1, 5, None),
             (
+                1,
+                2,
+                "Task 2",
+                TaskType.QUIZ,
+                TaskStatus.PUBLISHED,
+                None,
+                1,
+                1,
+                5,
+                None,
+            ),
+            (
+                1,
                 3,
                 "Task 3",
                 TaskType.LEARNING_MATERIAL,
@@ -269,7 +299,7 @@ class TestCourseDetails:
     @patch("src.api.db.course.execute_db_operation")
     async def test_get_course_include_unpublished(self, mock_execute):
         """Test getting course including unpublished tasks."""
-        course_data = (1, "Test Course", GenerateCourseJobStatus.STARTED)
+        course_data = [(1, "Test Course", GenerateCourseJobStatus.STARTED)]
         milestones_data = []
         tasks_data = []
 
@@ -278,6 +308,83 @@ class TestCourseDetails:
         result = await get_course(1, only_published=False)
 
         assert result["course_generation_status"] == GenerateCourseJobStatus.STARTED
+        assert "AND t.status" not in mock_execute.call_args_list[2][0][0]
+
+    @patch("src.api.db.course.execute_db_operation")
+    async def test_get_courses_with_task_details(self, mock_execute):
+        """Test loading several course trees with task details in a fixed number of queries."""
+        courses_data = [(1, "Course 1", None), (2, "Course 2", None)]
+        milestones_data = [
+            (1, 10, "Module 1", "#123456", 0),
+            (2, 20, "Module 2", "#654321", 0),
+        ]
+        tasks_data = [
+            (
+                1,
+                100,
+                "LM",
+                str(TaskType.LEARNING_MATERIAL),
+                str(TaskStatus.PUBLISHED),
+                None,
+                10,
+                0,
+                None,
+                None,
+                '[{"type": "paragraph"}]',
+            ),
+            (
+                2,
+                200,
+                "Quiz",
+                str(TaskType.QUIZ),
+                str(TaskStatus.PUBLISHED),
+                None,
+                20,
+                0,
+                2,
+                None,
+                None,
+            ),
+        ]
+        questions_data = [
+            (200, 1, "objective", None, None, "text", "chat", 5, None, None, 1, True, "Q1"),
+            (200, 2, "objective", None, None, "text", "chat", None, None, None, 1, True, "Q2"),
+        ]
+        scorecards_data = [(5, "Scorecard", '[{"name": "clarity"}]', "published")]
+
+        mock_execute.side_effect = [
+            courses_data,
+            milestones_data,
+            tasks_data,
+            questions_data,
+            scorecards_data,
+        ]
+
+        result = await get_courses(
+            [1, 2], include_task_details=True, include_scorecards=True
+        )
+
+        assert mock_execute.call_count == 5
+        for call in mock_execute.call_args_list:
+            assert call[0][1] == ("[1, 2]",)
+
+        lm_task = result[1]["milestones"][0]["tasks"][0]
+        assert lm_task["blocks"] == [{"type": "paragraph"}]
+        assert "questions" not in lm_task
+
+        quiz_task = result[2]["milestones"][0]["tasks"][0]
+        assert [question["id"] for question in quiz_task["questions"]] == [1, 2]
+        assert quiz_task["questions"][0]["scorecard"] == {
+            "id": 5,
+            "title": "Scorecard",
+            "criteria": [{"name": "clarity"}],
+            "status": "published",
+        }
+        assert "scorecard" not in quiz_task["questions"][1]
+
+    async def test_get_courses_empty(self):
+        """Test that no queries are needed for an empty list of courses."""
+        assert await get_courses([]) == {}
 
     @patch("src.api.db.course.execute_db_operation")
     async def test_get_tasks_for_course_with_milestone(self, mock_execute):
@@ -548,7 +655,7 @@ class TestCourseGeneration:
         assert isinstance(result, str)
         mock_cursor.execute.assert_called_once()
 
-    @patch("src.api.db.course.get_new_db_connection")
+    @patch("src.api.db.course.get_read_db_connection")
     async def test_get_course_generation_job_details_success(self, mock_connection):
         """Test getting course generation job details successfully."""
         mock_cursor = AsyncMock()
@@ -561,7 +668,7 @@ class TestCourseGeneration:
 
         assert result == {"prompt": "Generate course"}
 
-    @patch("src.api.db.course.get_new_db_connection")
+    @patch("src.api.db.course.get_read_db_connection")
     async def test_get_course_generation_job_details_not_found(self, mock_connection):
         """Test getting course generation job details when not found."""
         mock_cursor = AsyncMock()
@@ -604,29 +711,6 @@ class TestCourseGeneration:
 
         mock_cursor.execute.assert_called_once()
 
-    @patch("src.api.db.course.get_new_db_connection")
-    async def test_get_all_pending_course_structure_generation_jobs(
-        self, mock_connection
-    ):
-        """Test getting all pending course generation jobs."""
-        mock_cursor = AsyncMock()
-        mock_cursor.fetchall.return_value = [
-            ("uuid1", 1, '{"prompt": "Course 1"}'),
-            ("uuid2", 2, '{"prompt": "Course 2"}'),
-        ]
-        mock_conn = AsyncMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_connection.return_value.__aenter__.return_value = mock_conn
-
-        result = await get_all_pending_course_structure_generation_jobs()
-
-        expected = [
-            {"uuid": "uuid1", "course_id": 1, "job_details": {"prompt": "Course 1"}},
-            {"uuid": "uuid2", "course_id": 2, "job_details": {"prompt": "Course 2"}},
-        ]
-
-        assert result == expected
-
 
 @pytest.mark.asyncio
 class TestCourseModules:
@@ -648,148 +732,272 @@ class TestCourseModules:
         assert mock_add_milestone.call_count == 3
 
 
+@pytest.fixture
+async def course_db_path(sqlite_db):
+    """A real SQLite database with two courses in org 1 that the course module writes to"""
+    db_path = await sqlite_db(
+        create_organizations_table,
+        create_courses_table,
+        create_milestones_table,
+        create_course_milestones_table,
+        create_tasks_table,
+        create_course_tasks_table,
+        create_questions_table,
+        create_scorecards_table,
+        create_question_scorecards_table,
+        create_chat_history_table,
+        add_chat_history_org_id,
+        script="""
+        INSERT INTO organizations (id, slug, name) VALUES (1, 'source', 'Source'), (2, 'target', 'Target');
+        INSERT INTO courses (id, org_id, name) VALUES (1, 1, 'Course 1'), (2, 1, 'Course 2');
+        INSERT INTO milestones (id, org_id, name, color) VALUES (1, 1, 'Module 1', '#111'), (2, 1, 'Module 2', '#222'), (3, 1, 'Module 3', '#333');
+        INSERT INTO course_milestones (course_id, milestone_id, ordering) VALUES (1, 2, 5), (1, 1, 2), (2, 3, 0);
+        INSERT INTO tasks (id, org_id, type, blocks, title, status, deleted_at) VALUES
+            (1, 1, 'learning_material', '[{"type": "paragraph"}]', 'Reading', 'published', NULL),
+            (2, 1, 'quiz', NULL, 'Quiz', 'published', NULL),
+            (3, 1, 'learning_material', NULL, 'Draft', 'draft', NULL),
+            (4, 1, 'learning_material', NULL, 'Deleted', 'published', '2024-01-01'),
+            (5, 1, 'quiz', NULL, 'Other quiz', 'published', NULL);
+        INSERT INTO course_tasks (course_id, task_id, milestone_id, ordering) VALUES
+            (1, 1, 1, 0), (1, 3, 1, 1), (1, 2, 1, 2), (1, 4, 2, 0), (2, 5, 3, 0);
+        INSERT INTO questions (id, task_id, type, blocks, input_type, response_type, position, is_feedback_shown, title) VALUES
+            (1, 2, 'subjective', '[]', 'text', 'chat', 3, 1, 'Second'),
+            (2, 2, 'subjective', '[]', 'text', 'chat', 1, 1, 'First'),
+            (3, 5, 'objective', '[]', 'text', 'chat', 0, 0, 'Only');
+        INSERT INTO scorecards (id, org_id, title, criteria, status) VALUES (1, 1, 'Rubric', '[]', 'draft');
+        INSERT INTO question_scorecards (question_id, scorecard_id) VALUES (1, 1), (2, 1);
+        INSERT INTO chat_history (user_id, question_id, role, content, org_id) VALUES
+            (1, 1, 'user', 'hi', 1), (1, 3, 'user', 'hi', 1);
+        """,
+    )
+
+    with patch(
+        "src.api.db.course.get_org_by_id",
+        AsyncMock(return_value={"id": 2, "slug": "target"}),
+    ), patch(
+        "src.api.db.course.send_slack_notification_for_new_course"
+    ):
+        yield db_path
+
+
+async def fetch_all(db_path, query, params=()):
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute(query, params)
+        return await cursor.fetchall()
+
+
 @pytest.mark.asyncio
 class TestCourseTransfer:
     """Test course transfer operations."""
 
-    @patch("src.api.db.course.execute_db_operation")
-    async def test_transfer_course_to_org(self, mock_execute):
-        """Test transferring course to organization."""
-        milestones = [(1,), (2,)]
-        tasks = [(10,), (11,)]
-        questions = [(100,), (101,)]
-        scorecards = [(1000,), (1001,)]
+    async def test_transfer_course_to_org(self, course_db_path):
+        """Test that a course and its content are moved to another organization."""
+        await transfer_course_to_org(1, 2)
+
+        assert await fetch_all(
+            course_db_path, "SELECT id, org_id FROM courses ORDER BY id"
+        ) == [(1, 2), (2, 1)]
+        assert await fetch_all(
+            course_db_path, "SELECT id, org_id FROM milestones ORDER BY id"
+        ) == [(1, 2), (2, 2), (3, 1)]
+        assert await fetch_all(
+            course_db_path, "SELECT id, org_id FROM tasks ORDER BY id"
+        ) == [(1, 2), (2, 2), (3, 2), (4, 2), (5, 1)]
+        assert await fetch_all(
+            course_db_path, "SELECT id, org_id FROM scorecards"
+        ) == [(1, 2)]
+        assert await fetch_all(
+            course_db_path, "SELECT question_id, org_id FROM chat_history ORDER BY id"
+        ) == [(1, 2), (3, 1)]
+
+    async def test_transfer_empty_course_to_org(self, course_db_path):
+        """Test transferring a course without any milestones or tasks."""
+        async with aiosqlite.connect(course_db_path) as conn:
+            await conn.execute(
+                "INSERT INTO courses (id, org_id, name) VALUES (3, 1, 'Empty')"
+            )
+            await conn.commit()
 
-        mock_execute.side_effect = [
-            None,  # Update course
-            milestones,  # Get milestones
-            None,  # Update milestone 1
-            None,  # Update milestone 2
-            tasks,  # Get tasks
-            questions,  # Get questions
-            scorecards,  # Get scorecards
-            None,  # Update scorecards
-            None,  # Update tasks
-        ]
+        await transfer_course_to_org(3, 2)
 
-        await transfer_course_to_org(1, 123)
+        assert await fetch_all(
+            course_db_path, "SELECT org_id FROM courses WHERE id = 3"
+        ) == [(2,)]
+        assert await fetch_all(
+            course_db_path, "SELECT DISTINCT org_id FROM tasks"
+        ) == [(1,)]
 
-        # Should call execute_db_operation multiple times
-        assert mock_execute.call_count == 9
+    async def test_transfer_course_to_org_is_atomic(self, course_db_path):
+        """Test that a failing transfer leaves the course where it was."""
+        async with aiosqlite.connect(course_db_path) as conn:
+            await conn.execute("DROP TABLE question_scorecards")
+            await conn.commit()
 
-    @patch("src.api.db.course.get_course")
-    @patch("src.api.db.course.create_course")
-    @patch("src.api.db.course.add_milestone_to_course")
-    @patch("src.api.db.course.create_draft_task_for_course")
-    @patch("src.api.db.course.get_task")
-    @patch("src.api.db.course.update_learning_material_task")
-    @patch("src.api.db.course.update_draft_quiz")
-    @patch("src.api.db.course.get_scorecard")
-    @patch("src.api.db.course.create_scorecard")
-    @patch("src.api.db.utils.execute_db_operation")
-    async def test_duplicate_course_to_org(
-        self,
-        mock_execute_db_operation,
-        mock_create_scorecard,
-        mock_get_scorecard,
-        mock_update_quiz,
-        mock_update_learning,
-        mock_get_task,
-        mock_create_task,
-        mock_add_milestone,
-        mock_create_course,
-        mock_get_course,
-    ):
-        """Test duplicating course to organization."""
-        # Mock course structure
-        course_data = {
-            "name": "Test Course",
-            "milestones": [
-                {
-                    "name": "Module 1",
-                    "color": "#123456",
-                    "tasks": [
-                        {"id": 1, "type": "learning_material"},
-                        {"id": 2, "type": "quiz"},
-                    ],
-                }
-            ],
-        }
+        with pytest.raises(sqlite3.OperationalError):
+            await transfer_course_to_org(1, 2)
 
-        learning_task = {
-            "id": 1,
-            "title": "Learning Task",
-            "type": "learning_material",
-            "status": "published",
-            "org_id": 999,
-            "scheduled_publish_at": None,
-            "blocks": [],
-        }
+        assert await fetch_all(
+            course_db_path, "SELECT DISTINCT org_id FROM courses"
+        ) == [(1,)]
+        assert await fetch_all(
+            course_db_path, "SELECT DISTINCT org_id FROM milestones"
+        ) == [(1,)]
 
-        quiz_task = {
-            "id": 2,
-            "title": "Quiz Task",
-            "type": "quiz",
-            "status": "published",
-            "org_id": 999,
-            "scheduled_publish_at": None,
-            "questions": [
+
+@pytest.mark.asyncio
+@patch("src.api.db.course.get_org_id_for_course", AsyncMock(return_value=1))
+class TestAddGeneratedCourseItems:
+    """Test writing a batch of generated modules and tasks to a real SQLite database."""
+
+    async def test_modules_and_tasks_are_added_after_the_existing_ones(
+        self, course_db_path
+    ):
+        result = await add_generated_course_items(
+            1,
+            [
                 {
-                    "id": 1,
-                    "type": "multiple_choice",
-                    "blocks": [],
-                    "answer": None,
-                    "input_type": "multiple_choice",
-                    "response_type": "single",
-                    "scorecard_id": 1,
-                    "context": None,
-                    "coding_languages": None,
-                    "max_attempts": 3,
-                    "is_feedback_shown": True,
-                    "text": "Question 1",
+                    "id": 2,
+                    "name": "Module 2",
+                    "color": "#222",
+                    "tasks": [{"name": "Added to module 2", "type": "quiz"}],
                 },
                 {
-                    "id": 2,
-                    "type": "multiple_choice",
-                    "blocks": [],
-                    "answer": None,
-                    "input_type": "multiple_choice",
-                    "response_type": "single",
-                    "scorecard_id": 1,
-                    "context": None,
-                    "coding_languages": None,
-                    "max_attempts": 3,
-                    "is_feedback_shown": True,
-                    "text": "Question 2",
+                    "id": None,
+                    "name": "New module",
+                    "color": "#444",
+                    "tasks": [
+                        {"name": "First", "type": "learning_material"},
+                        {"name": "Second", "type": "quiz"},
+                    ],
                 },
+                {"id": None, "name": "Empty module", "color": "#555", "tasks": []},
             ],
-        }
+        )
+
+        new_module_id = result[1]["id"]
+        assert result[0]["id"] == 2
+        assert result[0]["ordering"] is None
+        # module 2 only has a deleted task before the new one
+        assert result[0]["tasks"][0][1] == 0
+        assert result[1]["ordering"] == 6
+        assert [ordering for _, ordering in result[1]["tasks"]] == [0, 1]
+        assert result[2]["ordering"] == 7
+
+        assert await fetch_all(
+            course_db_path,
+            """SELECT m.name, m.org_id, cm.ordering FROM course_milestones cm
+            JOIN milestones m ON m.id = cm.milestone_id
+            WHERE cm.course_id = 1 AND cm.ordering > 5 ORDER BY cm.ordering""",
+        ) == [("New module", 1, 6), ("Empty module", 1, 7)]
+        assert await fetch_all(
+            course_db_path,
+            """SELECT t.title, t.type, t.status, ct.ordering FROM course_tasks ct
+            JOIN tasks t ON t.id = ct.task_id
+            WHERE ct.course_id = 1 AND ct.milestone_id = ? ORDER BY ct.ordering""",
+            (new_module_id,),
+        ) == [("First", "learning_material", "draft", 0), ("Second", "quiz", "draft", 1)]
+        assert await fetch_all(
+            course_db_path,
+            "SELECT ordering FROM course_tasks WHERE task_id = ?",
+            (result[0]["tasks"][0][0],),
+        ) == [(1,)]
 
-        original_scorecard = {
-            "title": "Original Scorecard",
-            "criteria": [],
+
+@pytest.mark.asyncio
+class TestDuplicateCourses:
+    """Test course duplication against a real SQLite database."""
+
+    async def test_duplicate_course_to_org(self, course_db_path):
+        """Test that the published content of a course is copied with remapped ids."""
+        result = await duplicate_course_to_org(1, 2)
+
+        new_course_id = result["course_ids"][1]
+        assert result["counts"] == {
+            "courses": 1,
+            "milestones": 2,
+            "tasks": 2,
+            "questions": 2,
+            "scorecards": 1,
         }
 
-        new_scorecard = {"id": 123}
+        assert await fetch_all(
+            course_db_path, "SELECT name, org_id FROM courses WHERE id = ?", (new_course_id,)
+        ) == [("Course 1", 2)]
+
+        # milestones keep their order but are renumbered from 0
+        assert await fetch_all(
+            course_db_path,
+            """SELECT m.name, m.org_id, cm.ordering FROM course_milestones cm
+            JOIN milestones m ON m.id = cm.milestone_id
+            WHERE cm.course_id = ? ORDER BY cm.ordering""",
+            (new_course_id,),
+        ) == [("Module 1", 2, 0), ("Module 2", 2, 1)]
+
+        # only published, non-deleted tasks are copied
+        tasks = await fetch_all(
+            course_db_path,
+            """SELECT t.id, t.title, t.org_id, t.blocks, t.status, m.name, ct.ordering FROM course_tasks ct
+            JOIN tasks t ON t.id = ct.task_id
+            JOIN milestones m ON m.id = ct.milestone_id
+            WHERE ct.course_id = ? ORDER BY ct.ordering""",
+            (new_course_id,),
+        )
+        assert [task[1:] for task in tasks] == [
+            ("Reading", 2, '[{"type": "paragraph"}]', "published", "Module 1", 0),
+            ("Quiz", 2, None, "published", "Module 1", 1),
+        ]
+        assert {task[0] for task in tasks}.isdisjoint({1, 2, 3, 4, 5})
+
+        questions = await fetch_all(
+            course_db_path,
+            """SELECT q.title, q.position, s.title, s.org_id, s.status FROM questions q
+            JOIN question_scorecards qs ON qs.question_id = q.id
+            JOIN scorecards s ON s.id = qs.scorecard_id
+            WHERE q.task_id = ? ORDER BY q.position""",
+            (tasks[1][0],),
+        )
+        assert questions == [
+            ("First", 0, "Rubric", 2, "published"),
+            ("Second", 1, "Rubric", 2, "published"),
+        ]
+
+        # the source course is left untouched
+        assert await fetch_all(
+            course_db_path, "SELECT COUNT(*) FROM course_tasks WHERE course_id = 1"
+        ) == [(4,)]
+
+    async def test_duplicate_multiple_courses(self, course_db_path):
+        """Test copying several courses at once."""
+        result = await duplicate_courses_to_org([1, 2, 1, 999], 2)
+
+        assert set(result["course_ids"]) == {1, 2}
+        assert result["counts"]["courses"] == 2
+        assert result["counts"]["tasks"] == 3
+        assert result["counts"]["questions"] == 3
 
-        # Mock the database call for getting org_id for the new course (ID 456)
-        # The get_org_id_for_course function expects a tuple with the org_id value
-        mock_execute_db_operation.return_value = (999,)
+        assert await fetch_all(
+            course_db_path,
+            """SELECT t.title FROM course_tasks ct JOIN tasks t ON t.id = ct.task_id
+            WHERE ct.course_id = ?""",
+            (result["course_ids"][2],),
+        ) == [("Other quiz",)]
 
-        mock_get_course.return_value = course_data
-        mock_create_course.return_value = 456
-        mock_add_milestone.return_value = (789, 0)
-        mock_create_task.side_effect = [(10, None), (11, None)]
-        mock_get_task.side_effect = [learning_task, quiz_task]
-        mock_get_scorecard.return_value = original_scorecard
-        mock_create_scorecard.return_value = new_scorecard
+    async def test_duplicate_course_is_atomic(self, course_db_path):
+        """Test that nothing is copied when a step of the copy fails."""
+        async with aiosqlite.connect(course_db_path) as conn:
+            await conn.execute("DROP TABLE question_scorecards")
+            await conn.commit()
 
-        await duplicate_course_to_org(1, 999)
+        with pytest.raises(sqlite3.OperationalError):
+            await duplicate_course_to_org(1, 2)
 
-        mock_get_course.assert_called_once_with(1)
-        mock_create_course.assert_called_once_with("Test Course", 999)
-        mock_update_learning.assert_called_once()
-        mock_update_quiz.assert_called_once()
+        assert await fetch_all(course_db_path, "SELECT COUNT(*) FROM courses") == [(2,)]
+        assert await fetch_all(course_db_path, "SELECT COUNT(*) FROM tasks") == [(5,)]
+
+    async def test_duplicate_course_to_missing_org(self, course_db_path):
+        with patch("src.api.db.course.get_org_by_id", AsyncMock(return_value=None)):
+            with pytest.raises(Exception, match="Organization with id '3' not found"):
+                await duplicate_course_to_org(1, 3)
 
 
 @pytest.mark.asyncio
@@ -868,11 +1076,11 @@ class TestCohortCourseRelations:
 
         assert result == expected
 
-    @patch("src.api.db.course.get_course")
+    @patch("src.api.db.course.get_courses")
     @patch("src.api.db.course.calculate_milestone_unlock_dates")
     @patch("src.api.db.course.execute_db_operation")
     async def test_get_courses_for_cohort_with_tree(
-        self, mock_execute, mock_calculate_unlock, mock_get_course
+        self, mock_execute, mock_calculate_unlock, mock_get_courses
     ):
         """Test getting courses for cohort with tree structure."""
         courses_data = [
@@ -882,14 +1090,14 @@ class TestCohortCourseRelations:
         calculated_course = {"id": 1, "name": "Course 1", "milestones": []}
 
         mock_execute.return_value = courses_data
-        mock_get_course.return_value = course_details
+        mock_get_courses.return_value = {1: course_details}
         mock_calculate_unlock.return_value = calculated_course
 
         joined_at = datetime.now(timezone.utc)
         result = await get_courses_for_cohort(1, include_tree=True, joined_at=joined_at)
 
         assert len(result) == 1
-        mock_get_course.assert_called_once_with(1)
+        mock_get_courses.assert_called_once_with([1])
         mock_calculate_unlock.assert_called_once()
 
 
@@ -1067,74 +1275,69 @@ class TestMilestoneUnlockDates:
 class TestUserCourses:
     """Test user course operations."""
 
-    @patch("src.api.db.course.get_new_db_connection")
-    @patch("src.api.db.course.get_user_cohorts")
-    @patch("src.api.db.course.get_courses_for_cohort")
-    @patch("src.api.db.course.get_user_organizations")
-    @patch("src.api.db.course.get_all_courses_for_org")
-    async def test_get_user_courses_comprehensive(
-        self,
-        mock_get_org_courses,
-        mock_get_user_orgs,
-        mock_get_cohort_courses,
-        mock_get_user_cohorts,
-        mock_connection,
-    ):
+    @patch("src.api.db.course.execute_db_operation")
+    async def test_get_user_courses_comprehensive(self, mock_execute):
         """Test getting user courses with multiple roles."""
-        # Mock database connection
-        mock_cursor = AsyncMock()
-        mock_cursor.fetchone.side_effect = [
-            (1, "Course 1", 1, "Org 1", "org-1"),
-            (2, "Course 2", 1, "Org 1", "org-1"),
-            (3, "Course 3", 2, "Org 2", "org-2"),
+        mock_execute.return_value = [
+            (1, "Course 1", 1, "Org 1", "org-1", 1, "learner", 0, 1, 1),
+            (2, "Course 2", 1, "Org 1", "org-1", 2, "mentor", 0, 2, 2),
+            (3, "Course 3", 2, "Org 2", "org-2", None, "admin", 1, -1, -3),
         ]
-        mock_conn = AsyncMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_connection.return_value.__aenter__.return_value = mock_conn
 
-        # Mock user cohorts
-        mock_get_user_cohorts.return_value = [
-            {"id": 1, "role": "learner"},
-            {"id": 2, "role": "mentor"},
-        ]
+        result = await get_user_courses(123)
 
-        # Mock cohort courses
-        mock_get_cohort_courses.side_effect = [
-            [{"id": 1, "name": "Course 1"}],
-            [{"id": 2, "name": "Course 2"}],
+        assert result == [
+            {
+                "id": 1,
+                "name": "Course 1",
+                "org": {"id": 1, "name": "Org 1", "slug": "org-1"},
+                "role": "learner",
+                "cohort_id": 1,
+            },
+            {
+                "id": 2,
+                "name": "Course 2",
+                "org": {"id": 1, "name": "Org 1", "slug": "org-1"},
+                "role": "mentor",
+            },
+            {
+                "id": 3,
+                "name": "Course 3",
+                "org": {"id": 2, "name": "Org 2", "slug": "org-2"},
+                "role": "admin",
+            },
         ]
 
-        # Mock user organizations
-        mock_get_user_orgs.return_value = [
-            {"id": 2, "role": "admin"},
-        ]
+        # everything is fetched with a single query
+        mock_execute.assert_called_once()
+        assert mock_execute.call_args[0][1] == (123, 123)
 
-        # Mock organization courses
-        mock_get_org_courses.return_value = [
-            {"id": 3, "name": "Course 3"},
+    @patch("src.api.db.course.execute_db_operation")
+    async def test_get_user_courses_role_precedence(self, mock_execute):
+        """Admin access wins over cohort roles and the last cohort role wins otherwise."""
+        mock_execute.return_value = [
+            (1, "Course 1", 1, "Org 1", "org-1", 1, "learner", 0, 1, 1),
+            (2, "Course 2", 1, "Org 1", "org-1", 1, "learner", 0, 1, 2),
+            (2, "Course 2", 1, "Org 1", "org-1", 2, "mentor", 0, 2, 3),
+            (3, "Course 3", 1, "Org 1", "org-1", 3, "mentor", 0, 3, 4),
+            (3, "Course 3", 1, "Org 1", "org-1", 4, "learner", 0, 4, 5),
+            (1, "Course 1", 1, "Org 1", "org-1", None, "admin", 1, -1, -1),
         ]
 
         result = await get_user_courses(123)
 
-        assert len(result) == 3
-        assert result[0]["role"] == "learner"
+        assert [course["id"] for course in result] == [1, 2, 3]
+        assert result[0]["role"] == "admin"
+        assert "cohort_id" not in result[0]
         assert result[1]["role"] == "mentor"
-        assert result[2]["role"] == "admin"
+        assert "cohort_id" not in result[1]
+        assert result[2]["role"] == "learner"
+        assert result[2]["cohort_id"] == 4
 
-    @patch("src.api.db.course.get_new_db_connection")
-    @patch("src.api.db.course.get_user_cohorts")
-    @patch("src.api.db.course.get_user_organizations")
-    async def test_get_user_courses_no_courses(
-        self, mock_get_user_orgs, mock_get_user_cohorts, mock_connection
-    ):
+    @patch("src.api.db.course.execute_db_operation")
+    async def test_get_user_courses_no_courses(self, mock_execute):
         """Test getting user courses when user has no courses."""
-        mock_cursor = AsyncMock()
-        mock_conn = AsyncMock()
-        mock_conn.cursor.return_value = mock_cursor
-        mock_connection.return_value.__aenter__.return_value = mock_conn
-
-        mock_get_user_cohorts.return_value = []
-        mock_get_user_orgs.return_value = []
+        mock_execute.return_value = []
 
         result = await get_user_courses(123)
 
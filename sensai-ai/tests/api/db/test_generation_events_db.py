@@ -0,0 +1,46 @@
+import pytest
+from unittest.mock import patch
+from src.api.db import create_generation_events_table
+from api.db.generation_events import (
+    store_generation_event,
+    get_last_generation_event_id,
+    get_generation_events_after,
+    delete_generation_events_before,
+)
+
+
+@pytest.fixture
+async def generation_events_db_path(sqlite_db):
+    """A real SQLite database with an empty generation events table"""
+    return await sqlite_db(create_generation_events_table)
+
+
+@pytest.mark.asyncio
+class TestGenerationEvents:
+    async def test_events_are_read_in_order_after_an_id(
+        self, generation_events_db_path
+    ):
+        assert await get_last_generation_event_id() == 0
+
+        for index in range(3):
+            await store_generation_event(1, {"event": "task_created", "index": index})
+
+        assert await get_last_generation_event_id() == 3
+        assert await get_generation_events_after(1, 10) == [
+            (2, 1, {"event": "task_created", "index": 1}),
+            (3, 1, {"event": "task_created", "index": 2}),
+        ]
+        assert len(await get_generation_events_after(0, 2)) == 2
+
+    @patch("api.db.generation_events.time.time")
+    async def test_old_events_are_deleted(
+        self, mock_time, generation_events_db_path
+    ):
+        mock_time.return_value = 1000
+        await store_generation_event(1, {"event": "old"})
+        mock_time.return_value = 2000
+        await store_generation_event(1, {"event": "new"})
+
+        await delete_generation_events_before(1500)
+
+        assert await get_generation_events_after(0, 10) == [(2, 1, {"event": "new"})]
@@ -1,4 +1,6 @@
+import os
 import pytest
+import aiosqlite
 from unittest.mock import patch, AsyncMock, MagicMock
 from src.api.db import (
     create_organizations_table,
@@ -20,8 +22,14 @@ from src.api.db import (
     create_course_generation_jobs_table,
     create_task_generation_jobs_table,
     create_code_drafts_table,
+    create_routing_decisions_table,
+    create_semantic_cache_table,
+    create_generation_events_table,
     init_db,
     delete_useless_tables,
+    run_schema_migrations,
+    schema_migrations,
+    add_chat_history_org_id,
 )
 
 
@@ -207,8 +215,8 @@ class TestTableCreationFunctions:
 
         await create_chat_history_table(mock_cursor)
 
-        # Should execute CREATE TABLE and 2 CREATE INDEX statements
-        assert mock_cursor.execute.call_count == 3
+        # Should only execute CREATE TABLE, the indexes come from the schema migrations
+        assert mock_cursor.execute.call_count == 1
 
     async def test_create_task_completion_table(self):
         """Test creating task completion table."""
@@ -216,8 +224,8 @@ class TestTableCreationFunctions:
 
         await create_task_completion_table(mock_cursor)
 
-        # Should execute CREATE TABLE and 3 CREATE INDEX statements
-        assert mock_cursor.execute.call_count == 4
+        # Should execute CREATE TABLE and 2 CREATE INDEX statements
+        assert mock_cursor.execute.call_count == 3
 
     async def test_create_course_generation_jobs_table(self):
         """Test creating course generation jobs table."""
@@ -260,6 +268,47 @@ class TestTableCreationFunctions:
 
         assert any("CREATE TABLE IF NOT EXISTS code_drafts" in call for call in calls)
 
+    async def test_create_routing_decisions_table(self):
+        """Test creating routing decisions table."""
+        mock_cursor = AsyncMock()
+
+        await create_routing_decisions_table(mock_cursor)
+
+        # Should execute CREATE TABLE and the CREATE INDEX used for eviction
+        assert mock_cursor.execute.call_count == 2
+        calls = [call[0][0] for call in mock_cursor.execute.call_args_list]
+
+        assert any(
+            "CREATE TABLE IF NOT EXISTS routing_decisions" in call for call in calls
+        )
+        assert any("idx_routing_decisions_last_used_at" in call for call in calls)
+
+    async def test_create_semantic_cache_table(self):
+        """Test creating semantic cache table."""
+        mock_cursor = AsyncMock()
+
+        await create_semantic_cache_table(mock_cursor)
+
+        # Should execute CREATE TABLE and 2 CREATE INDEX statements
+        assert mock_cursor.execute.call_count == 3
+        calls = [call[0][0] for call in mock_cursor.execute.call_args_list]
+
+        assert any("CREATE TABLE IF NOT EXISTS semantic_cache" in call for call in calls)
+
+    async def test_create_generation_events_table(self):
+        """Test creating generation events table."""
+        mock_cursor = AsyncMock()
+
+        await create_generation_events_table(mock_cursor)
+
+        # Should execute CREATE TABLE and the CREATE INDEX used for pruning
+        assert mock_cursor.execute.call_count == 2
+        calls = [call[0][0] for call in mock_cursor.execute.call_args_list]
+
+        assert any(
+            "CREATE TABLE IF NOT EXISTS generation_events" in call for call in calls
+        )
+
 
 @pytest.mark.asyncio
 class TestDatabaseInitialization:
@@ -348,12 +397,14 @@ class TestDatabaseInitialization:
         mock_conn.__aenter__.return_value = mock_conn
         mock_get_conn.return_value = mock_conn
         mock_check_table.return_value = False
+        mock_cursor.fetchone.return_value = (0,)  # PRAGMA user_version
 
         await init_db()
 
         # Verify that cursor.execute was called multiple times (for all table creations)
         assert mock_cursor.execute.call_count > 20  # We have many tables to create
-        mock_conn.commit.assert_called_once()
+        # the tables, the daily activity backfill and each migration are committed separately
+        assert mock_conn.commit.call_count == 2 + len(schema_migrations)
 
     @patch("src.api.db.sqlite_db_path", "/test/path/test.db")
     @patch("src.api.db.exists")
@@ -501,3 +552,130 @@ class TestDatabaseInitialization:
         assert mock_cursor.execute.call_count >= 8  # At least 8 DROP TABLE statements
         calls = [call[0][0] for call in mock_cursor.execute.call_args_list]
         assert any("DROP TABLE" in call for call in calls)
+
+
+@pytest.mark.asyncio
+class TestSchemaMigrations:
+    """Test the versioned schema migrations on a real database."""
+
+    async def get_indexes(self, cursor):
+        await cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'"
+        )
+        return {name for name, in await cursor.fetchall()}
+
+    async def test_migrations_replace_single_column_indexes(self, tmp_path):
+        """Test that an existing database gets the composite indexes exactly once."""
+        async with aiosqlite.connect(str(tmp_path / "test.db")) as conn:
+            cursor = await conn.cursor()
+            await create_tasks_table(cursor)
+            await create_questions_table(cursor)
+            await create_chat_history_table(cursor)
+            await create_task_completion_table(cursor)
+            await create_course_generation_jobs_table(cursor)
+            await create_task_generation_jobs_table(cursor)
+            # the indexes that databases created before the migrations have
+            await cursor.execute(
+                "CREATE INDEX idx_chat_history_user_id ON chat_history (user_id)"
+            )
+            await cursor.execute(
+                "CREATE INDEX idx_task_completion_user_id ON task_completions (user_id)"
+            )
+
+            await run_schema_migrations(conn)
+
+            await cursor.execute("PRAGMA user_version")
+            assert (await cursor.fetchone())[0] == len(schema_migrations)
+
+            indexes = await self.get_indexes(cursor)
+            assert {
+                "idx_chat_history_user_id_created_at",
+                "idx_chat_history_question_id_user_id",
+                "idx_task_completion_user_id_task_id",
+            } <= indexes
+            assert "idx_chat_history_user_id" not in indexes
+            assert "idx_task_completion_user_id" not in indexes
+
+            # an index dropped by hand is not recreated as the database is up to date
+            await cursor.execute("DROP INDEX idx_chat_history_user_id_created_at")
+            await run_schema_migrations(conn)
+
+            assert "idx_chat_history_user_id_created_at" not in await self.get_indexes(
+                cursor
+            )
+
+    async def test_chat_history_org_id_is_backfilled(self, tmp_path):
+        """Test that the messages stored before the migration get the org of their task."""
+        async with aiosqlite.connect(str(tmp_path / "test.db")) as conn:
+            cursor = await conn.cursor()
+            await create_tasks_table(cursor)
+            await create_questions_table(cursor)
+            await create_chat_history_table(cursor)
+            await cursor.executescript(
+                """
+                INSERT INTO tasks (id, org_id, type, title, status) VALUES (1, 7, 'quiz', 'Quiz', 'published');
+                INSERT INTO questions (id, task_id, type, blocks, input_type, response_type, position, is_feedback_shown, title) VALUES
+                    (1, 1, 'objective', '[]', 'text', 'chat', 0, 1, 'Question');
+                INSERT INTO chat_history (user_id, question_id, role, content) VALUES (1, 1, 'user', 'hi');
+                """
+            )
+
+            await add_chat_history_org_id(cursor)
+
+            await cursor.execute("SELECT org_id FROM chat_history")
+            assert await cursor.fetchall() == [(7,)]
+            assert "idx_chat_history_org_id_id" in await self.get_indexes(cursor)
+
+    async def test_failed_migration_is_rolled_back_and_retried(self, tmp_path):
+        """Test that a failed migration leaves the database at the last version that succeeded."""
+        attempts = []
+
+        async def add_table(cursor):
+            await cursor.execute("CREATE TABLE added (id INTEGER)")
+
+        async def fail_halfway(cursor):
+            attempts.append(len(attempts))
+            await cursor.execute("CREATE TABLE half_done (id INTEGER)")
+            if len(attempts) == 1:
+                raise Exception("disk full")
+
+        db_path = str(tmp_path / "test.db")
+
+        with patch("src.api.db.schema_migrations", [add_table, fail_halfway]):
+            async with aiosqlite.connect(db_path) as conn:
+                with pytest.raises(Exception, match="disk full"):
+                    await run_schema_migrations(conn)
+
+                cursor = await conn.cursor()
+                await cursor.execute("PRAGMA user_version")
+                assert (await cursor.fetchone())[0] == 1
+                assert await self.get_tables(cursor) == {"added"}
+
+                await run_schema_migrations(conn)
+
+                await cursor.execute("PRAGMA user_version")
+                assert (await cursor.fetchone())[0] == 2
+                assert await self.get_tables(cursor) == {"added", "half_done"}
+
+    async def get_tables(self, cursor):
+        await cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        return {name for name, in await cursor.fetchall()}
+
+    async def test_init_db_keeps_the_database_when_a_migration_fails(self, tmp_path):
+        """Test that a failed migration of an existing database never deletes it."""
+        db_path = str(tmp_path / "test.db")
+
+        async def fail(cursor):
+            raise Exception("database is locked")
+
+        with patch("src.api.db.sqlite_db_path", db_path), patch(
+            "api.utils.db.sqlite_db_path", db_path
+        ), patch("src.api.db.schema_migrations", schema_migrations + [fail]):
+            with pytest.raises(Exception, match="database is locked"):
+                await init_db()
+
+        assert os.path.exists(db_path)
+
+        async with aiosqlite.connect(db_path) as conn:
+            cursor = await conn.execute("PRAGMA user_version")
+            assert (await cursor.fetchone())[0] == len(schema_migrations)
@@ -0,0 +1,169 @@
+import json
+import pytest
+import aiosqlite
+from unittest.mock import patch
+from src.api.db import (
+    create_task_generation_jobs_table,
+    add_generation_job_leases,
+    create_course_generation_jobs_table,
+)
+from api.db.job_queue import GenerationJobQueue
+from api.models import GenerateTaskJobStatus
+
+
+@pytest.fixture
+async def job_queue_db_path(sqlite_db):
+    """A real SQLite database with three started task generation jobs"""
+
+    async def add_jobs(conn):
+        await add_generation_job_leases(await conn.cursor())
+
+        for index in range(3):
+            await conn.execute(
+                "INSERT INTO task_generation_jobs (uuid, task_id, course_id, status, job_details) VALUES (?, ?, ?, ?, ?)",
+                (
+                    f"job-{index}",
+                    index,
+                    1,
+                    str(GenerateTaskJobStatus.STARTED),
+                    json.dumps({"task": index}),
+                ),
+            )
+
+    return await sqlite_db(
+        create_course_generation_jobs_table,
+        create_task_generation_jobs_table,
+        setup=add_jobs,
+    )
+
+
+def get_queue(worker_id, lease_seconds=60, max_attempts=2):
+    return GenerationJobQueue(
+        "task_generation_jobs",
+        GenerateTaskJobStatus,
+        lease_seconds=lease_seconds,
+        max_attempts=max_attempts,
+        worker_id=worker_id,
+    )
+
+
+async def get_job(db_path, job_uuid):
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute(
+            "SELECT status, attempts, locked_by, last_error FROM task_generation_jobs WHERE uuid = ?",
+            (job_uuid,),
+        )
+        return await cursor.fetchone()
+
+
+@pytest.mark.asyncio
+class TestGenerationJobQueue:
+    async def test_a_job_is_only_claimed_by_one_worker(self, job_queue_db_path):
+        first, second = get_queue("first"), get_queue("second")
+
+        first_jobs = await first.claim(2)
+        second_jobs = await second.claim(2)
+
+        assert [job["uuid"] for job in first_jobs] == ["job-0", "job-1"]
+        assert first_jobs[0] == {
+            "uuid": "job-0",
+            "course_id": 1,
+            "job_details": {"task": 0},
+            "attempts": 1,
+        }
+        assert [job["uuid"] for job in second_jobs] == ["job-2"]
+        assert await first.claim(2) == []
+
+    async def test_finished_jobs_are_not_claimed(self, job_queue_db_path):
+        async with aiosqlite.connect(job_queue_db_path) as conn:
+            await conn.execute(
+                "UPDATE task_generation_jobs SET status = ? WHERE uuid != 'job-1'",
+                (str(GenerateTaskJobStatus.COMPLETED),),
+            )
+            await conn.commit()
+
+        jobs = await get_queue("first").claim(10)
+
+        assert [job["uuid"] for job in jobs] == ["job-1"]
+
+    @patch("api.db.job_queue.time.time")
+    async def test_expired_leases_are_claimed_again(
+        self, mock_time, job_queue_db_path
+    ):
+        first, second = get_queue("first"), get_queue("second")
+
+        mock_time.return_value = 1000
+        await first.claim(1)
+
+        mock_time.return_value = 1059
+        assert [job["uuid"] for job in await second.claim(1)] == ["job-1"]
+
+        # the heartbeat keeps the lease of the first worker alive
+        assert await first.heartbeat() == 1
+        mock_time.return_value = 1100
+        assert [job["uuid"] for job in await second.claim(1)] == ["job-2"]
+
+        mock_time.return_value = 1120
+        reclaimed = await second.claim(1)
+        assert reclaimed[0]["uuid"] == "job-0"
+        assert reclaimed[0]["attempts"] == 2
+
+    async def test_failed_job_is_retried_then_dead_lettered(self, job_queue_db_path):
+        queue = get_queue("first")
+
+        await queue.claim(1)
+        assert await queue.release("job-0", "first failure") == str(
+            GenerateTaskJobStatus.STARTED
+        )
+        assert await get_job(job_queue_db_path, "job-0") == (
+            "started",
+            1,
+            None,
+            "first failure",
+        )
+
+        assert (await queue.claim(1))[0]["uuid"] == "job-0"
+        assert await queue.release("job-0", "second failure") == str(
+            GenerateTaskJobStatus.DEAD
+        )
+        assert (await get_job(job_queue_db_path, "job-0"))[0] == "dead"
+
+        assert [job["uuid"] for job in await queue.claim(10)] == ["job-1", "job-2"]
+
+    async def test_release_needs_the_lease(self, job_queue_db_path):
+        await get_queue("first").claim(1)
+
+        assert await get_queue("second").release("job-0", "failure") is None
+        assert (await get_job(job_queue_db_path, "job-0"))[2] == "first"
+
+    @patch("api.db.job_queue.time.time")
+    async def test_expired_jobs_without_attempts_left_are_dead_lettered(
+        self, mock_time, job_queue_db_path
+    ):
+        queue = get_queue("first", max_attempts=1)
+
+        mock_time.return_value = 1000
+        await queue.claim(1)
+        assert await queue.dead_letter_expired() == []
+
+        mock_time.return_value = 1061
+        dead_jobs = await queue.dead_letter_expired()
+
+        assert [job["uuid"] for job in dead_jobs] == ["job-0"]
+        assert await get_job(job_queue_db_path, "job-0") == (
+            "dead",
+            1,
+            None,
+            "lease expired",
+        )
+
+    async def test_abandoned_jobs_are_claimable_without_losing_an_attempt(
+        self, job_queue_db_path
+    ):
+        first = get_queue("first")
+        await first.claim(3)
+
+        await first.abandon()
+
+        jobs = await get_queue("second").claim(3)
+        assert [job["attempts"] for job in jobs] == [1, 1, 1]
@@ -26,6 +26,7 @@ from src.api.db.org import (
     clear_org_openai_api_key,
     add_user_to_org_by_user_id,
 )
+from api.db.api_key_cache import api_key_cache
 
 
 @pytest.mark.asyncio
@@ -96,7 +97,7 @@ class TestOrganizationOperations:
         ):
             await create_organization_with_user("Test Org", "test-org", 1)
 
-    @patch("src.api.db.org.get_new_db_connection")
+    @patch("src.api.db.org.get_read_db_connection")
     async def test_get_all_orgs(self, mock_db_conn):
         """Test retrieving all organizations."""
         mock_cursor = AsyncMock()
@@ -229,6 +230,32 @@ class TestOrganizationOperations:
 
             assert result == 123
 
+    @patch("src.api.db.org.execute_db_operation")
+    async def test_get_org_id_from_api_key_is_cached(self, mock_execute):
+        """Test that a verified key is not looked up again until its entry expires."""
+        api_key, hashed_key = generate_api_key(123)
+        mock_execute.return_value = [(hashed_key,)]
+
+        assert await get_org_id_from_api_key(api_key) == 123
+        assert await get_org_id_from_api_key(api_key) == 123
+        assert mock_execute.call_count == 1
+        assert api_key_cache.get_stats()["hits"] == 1
+
+    @patch("src.api.db.org.execute_db_operation")
+    async def test_key_changed_during_verification_is_not_cached(self, mock_execute):
+        """Test that a verification that raced with a change to the keys is not cached."""
+        api_key, hashed_key = generate_api_key(123)
+
+        async def execute(query, params=(), fetch_all=False):
+            # a key is created by another request while this one reads the keys
+            api_key_cache.invalidate_keys([hashed_key])
+            return [(hashed_key,)]
+
+        mock_execute.side_effect = execute
+
+        assert await get_org_id_from_api_key(api_key) == 123
+        assert api_key_cache.get(hashed_key) is None
+
     async def test_get_org_id_from_api_key_invalid_format(self):
         """Test API key with invalid format."""
         with pytest.raises(ValueError, match="Invalid API key"):
@@ -412,8 +439,8 @@ class TestOrganizationOperations:
         await remove_members_from_org(1, [123, 456])
 
         mock_execute.assert_called_once_with(
-            "DELETE FROM user_organizations WHERE org_id = ? AND user_id IN (123, 456)",
-            (1,),
+            "DELETE FROM user_organizations WHERE org_id = ? AND user_id IN (SELECT value FROM json_each(?))",
+            (1, "[123, 456]"),
         )
 
     @patch("src.api.db.org.execute_db_operation")
@@ -0,0 +1,174 @@
+import re
+from datetime import datetime
+import pytest
+import aiosqlite
+from unittest.mock import patch
+import api.utils.db
+from src.api.db import (
+    create_organizations_table,
+    create_users_table,
+    create_user_organizations_table,
+    create_milestones_table,
+    create_cohort_tables,
+    create_courses_table,
+    create_course_cohorts_table,
+    create_tasks_table,
+    create_questions_table,
+    create_chat_history_table,
+    create_task_completion_table,
+    create_course_tasks_table,
+    create_course_milestones_table,
+    create_daily_activity_table,
+    create_course_generation_jobs_table,
+    create_task_generation_jobs_table,
+    run_schema_migrations,
+)
+from src.api.db import analytics, user, cohort, chat
+from api.models import LeaderboardViewType
+
+# queries that aggregate over every row of a table by design
+FULL_SCANS_ALLOWED = {
+    "get_usage_summary_by_organization": {"chat_history"},
+    "get_all_users": {"users"},
+}
+
+QUERIES = [
+    (analytics.get_usage_summary_by_organization, ()),
+    (analytics.get_usage_summary_by_organization, ("last_day",)),
+    (analytics.get_cohort_completion, (1, [1, 2])),
+    (analytics.get_cohort_completion, (1, [1, 2], 1)),
+    (analytics.get_cohort_completion_counts, (1, [1, 2])),
+    (analytics.get_cohort_task_completion, (1, [1, 2], 1)),
+    (analytics.get_cohort_course_attempt_data, ([1, 2], 1)),
+    (analytics.get_cohort_streaks, (LeaderboardViewType.WEEKLY, 1)),
+    (user.get_user_organizations, (1,)),
+    (user.get_user_org_cohorts, (1, 1)),
+    (user.get_all_users, ()),
+    (user.get_user_by_email, ("learner1@example.com",)),
+    (user.get_user_by_id, (1,)),
+    (user.get_user_cohorts, (1,)),
+    (user.get_user_active_in_last_n_days, (1, 7, 1)),
+    (user.get_user_activity_for_year, (1, 2024)),
+    (user.get_user_streak, (1, 1)),
+    (user.update_user_email, ("learner2@example.com", "learner3@example.com")),
+    (cohort.get_cohorts_for_org, (1,)),
+    (cohort.get_all_cohorts_for_org, (1,)),
+    (cohort.get_cohort_by_id, (1,)),
+    (cohort.is_user_in_cohort, (1, 1)),
+    (cohort.get_cohort_analytics_metrics_for_tasks, (1, [1, 2])),
+    (cohort.get_cohort_attempt_data_for_tasks, (1, [1, 2])),
+    (cohort.update_cohort_name, (1, "Renamed")),
+    (cohort.add_members_to_cohort, (1, "org", 1, ["new@example.com"], ["learner"])),
+    (cohort.remove_members_from_cohort, (1, [2])),
+    (cohort.remove_courses_from_cohort, (1, [1])),
+    (cohort.add_courses_to_cohort, (2, [1])),
+    (cohort.create_cohort, ("New cohort", 1)),
+    (cohort.delete_cohort, (2,)),
+    (chat.get_all_chat_history, (1,)),
+    (chat.get_all_chat_history, (1, 1, datetime(2024, 3, 1), 100)),
+]
+
+
+@pytest.fixture
+async def traced_db(sqlite_db):
+    """A migrated SQLite database, yielding the list every executed statement is appended to"""
+    db_path = await sqlite_db(
+        create_organizations_table,
+        create_users_table,
+        create_user_organizations_table,
+        create_milestones_table,
+        create_cohort_tables,
+        create_courses_table,
+        create_course_cohorts_table,
+        create_tasks_table,
+        create_questions_table,
+        create_chat_history_table,
+        create_task_completion_table,
+        create_course_tasks_table,
+        create_course_milestones_table,
+        create_daily_activity_table,
+        create_course_generation_jobs_table,
+        create_task_generation_jobs_table,
+        setup=run_schema_migrations,
+        script="""
+        INSERT INTO organizations (id, slug, name) VALUES (1, 'org', 'Org');
+        INSERT INTO users (id, email) VALUES (1, 'learner1@example.com'), (2, 'learner2@example.com'), (3, 'admin@example.com');
+        INSERT INTO user_organizations (user_id, org_id, role) VALUES (3, 1, 'owner');
+        INSERT INTO cohorts (id, name, org_id) VALUES (1, 'Cohort 1', 1), (2, 'Cohort 2', 1);
+        INSERT INTO user_cohorts (user_id, cohort_id, role) VALUES (1, 1, 'learner'), (2, 1, 'learner');
+        INSERT INTO courses (id, org_id, name) VALUES (1, 1, 'Course');
+        INSERT INTO course_cohorts (course_id, cohort_id) VALUES (1, 1);
+        INSERT INTO milestones (id, org_id, name) VALUES (1, 1, 'Milestone');
+        INSERT INTO course_milestones (course_id, milestone_id, ordering) VALUES (1, 1, 0);
+        INSERT INTO tasks (id, org_id, type, title, status) VALUES (1, 1, 'learning_material', 'Reading', 'published'), (2, 1, 'quiz', 'Quiz', 'published');
+        INSERT INTO course_tasks (course_id, task_id, milestone_id, ordering) VALUES (1, 1, 1, 0), (1, 2, 1, 1);
+        INSERT INTO questions (id, task_id, type, blocks, input_type, response_type, position, is_feedback_shown, title) VALUES
+            (1, 2, 'objective', '[]', 'text', 'chat', 0, 1, 'Question');
+        INSERT INTO chat_history (user_id, question_id, role, content, created_at, org_id) VALUES
+            (1, 1, 'user', 'hi', '2024-03-01 10:00:00', 1), (1, 1, 'assistant', 'hello', '2024-03-01 10:00:01', 1);
+        INSERT INTO task_completions (user_id, task_id) VALUES (1, 1);
+        INSERT INTO task_completions (user_id, question_id) VALUES (1, 1);
+        """,
+    )
+
+    statements = []
+    configure_connection = api.utils.db.configure_connection
+
+    async def configure_traced_connection(conn):
+        await configure_connection(conn)
+        await conn.set_trace_callback(statements.append)
+
+    with patch("api.utils.db.configure_connection", configure_traced_connection):
+        yield db_path, statements
+
+
+async def get_full_scans(db_path, statements):
+    """The tables read row by row, without an index, by any of the statements"""
+    full_scans = {}
+
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = {name for name, in await cursor.fetchall()}
+
+        for statement in statements:
+            if not re.match(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE)", statement, re.I):
+                continue
+
+            # the plan refers to tables by their alias
+            aliases = {}
+            for table, alias in re.findall(
+                r"(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?",
+                statement,
+                re.I,
+            ):
+                aliases[table] = table
+                if alias:
+                    aliases[alias] = table
+
+            cursor = await conn.execute(f"EXPLAIN QUERY PLAN {statement}")
+            for *_, detail in await cursor.fetchall():
+                match = re.fullmatch(r"SCAN (\w+)", detail)
+                if match and aliases.get(match.group(1)) in tables:
+                    full_scans.setdefault(aliases[match.group(1)], statement)
+
+    return full_scans
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "func, args",
+    QUERIES,
+    ids=[f"{func.__module__.split('.')[-1]}.{func.__name__}" for func, _ in QUERIES],
+)
+async def test_query_does_not_scan_full_tables(traced_db, func, args):
+    db_path, statements = traced_db
+
+    await func(*args)
+
+    assert statements, "no statement was traced"
+
+    full_scans = await get_full_scans(db_path, statements)
+    for table in FULL_SCANS_ALLOWED.get(func.__name__, ()):
+        full_scans.pop(table, None)
+
+    assert not full_scans, f"full table scans: {full_scans}"
@@ -0,0 +1,119 @@
+import pytest
+from unittest.mock import patch
+from src.api.db import create_routing_decisions_table
+from api.utils.db import execute_db_operation
+from api.db.routing import (
+    RoutingDecisionCache,
+    get_chat_turn_bucket,
+    hash_question_content,
+)
+
+
+@pytest.fixture
+async def routing_db_path(sqlite_db):
+    """A real SQLite database with an empty routing decisions table"""
+    return await sqlite_db(create_routing_decisions_table)
+
+
+def test_get_chat_turn_bucket():
+    assert [get_chat_turn_bucket(turns) for turns in [0, 1, 2, 3, 4, 7, 8, 100]] == [
+        0,
+        1,
+        2,
+        2,
+        3,
+        3,
+        4,
+        4,
+    ]
+
+
+def test_hash_question_content():
+    assert hash_question_content("Task") == hash_question_content("Task")
+    assert hash_question_content("Task") != hash_question_content("Edited task")
+
+
+@pytest.mark.asyncio
+class TestRoutingDecisionCache:
+    async def test_decisions_are_read_back(self, routing_db_path):
+        cache = RoutingDecisionCache(max_size=10)
+        content_hash = hash_question_content("Task")
+
+        assert await cache.get(1, content_hash, 0) is None
+
+        await cache.put(1, content_hash, 0, True)
+        await cache.put(1, content_hash, 1, False)
+
+        assert await cache.get(1, content_hash, 0) is True
+        assert await cache.get(1, content_hash, 1) is False
+        assert await cache.get(1, hash_question_content("Edited task"), 0) is None
+        assert await cache.get(2, content_hash, 0) is None
+
+    async def test_least_recently_used_decision_is_evicted(self, routing_db_path):
+        cache = RoutingDecisionCache(max_size=2, touch_interval=0)
+
+        await cache.put(1, "hash", 0, True)
+        await cache.put(2, "hash", 0, True)
+        await cache.get(1, "hash", 0)
+        await cache.put(3, "hash", 0, False)
+
+        assert await cache.get(2, "hash", 0) is None
+        assert await cache.get(1, "hash", 0) is True
+        assert await cache.get(3, "hash", 0) is False
+
+    @patch("api.db.routing.time.time")
+    async def test_lookups_only_write_once_the_last_use_is_old(
+        self, mock_time, routing_db_path
+    ):
+        cache = RoutingDecisionCache(max_size=10, touch_interval=60)
+        mock_time.return_value = 1000
+        await cache.put(1, "hash", 0, True)
+
+        with patch(
+            "api.db.routing.execute_db_operation", wraps=execute_db_operation
+        ) as mock_execute:
+            mock_time.return_value = 1059
+            assert await cache.get(1, "hash", 0) is True
+            assert mock_execute.call_count == 1
+            assert mock_execute.call_args.args[0].lstrip().startswith("SELECT")
+
+            mock_time.return_value = 1060
+            assert await cache.get(1, "hash", 0) is True
+            assert mock_execute.call_count == 3
+            assert mock_execute.call_args.args[0].lstrip().startswith("UPDATE")
+
+            mock_time.return_value = 1061
+            await cache.get(1, "hash", 0)
+            assert mock_execute.call_count == 4
+
+        row = await execute_db_operation(
+            "SELECT last_used_at FROM routing_decisions", fetch_one=True
+        )
+        assert row[0] == 1060
+
+    async def test_disabled_cache_stores_nothing(self, routing_db_path):
+        cache = RoutingDecisionCache(max_size=0)
+
+        await cache.put(1, "hash", 0, True)
+
+        assert await cache.get(1, "hash", 0) is None
+        assert (await cache.get_stats())["size"] == 0
+
+    async def test_stats(self, routing_db_path):
+        cache = RoutingDecisionCache(max_size=10)
+
+        await cache.get(1, "hash", 0)
+        await cache.put(1, "hash", 0, True)
+        await cache.get(1, "hash", 0)
+        await cache.get(1, "hash", 0)
+
+        assert await cache.get_stats() == {
+            "size": 1,
+            "max_size": 10,
+            "hits": 2,
+            "misses": 1,
+            "hit_rate": 0.6667,
+        }
+
+        cache.reset_stats()
+        assert (await cache.get_stats())["hit_rate"] == 0
@@ -0,0 +1,107 @@
+import pytest
+import numpy as np
+from unittest.mock import patch
+from src.api.db import create_semantic_cache_table
+from api.db.semantic_cache import (
+    SemanticCache,
+    hash_material,
+    normalize_embedding,
+    normalize_query,
+)
+
+
+@pytest.fixture
+async def semantic_cache_db_path(sqlite_db):
+    """A real SQLite database with an empty semantic cache table"""
+    return await sqlite_db(create_semantic_cache_table)
+
+
+def test_normalize_query():
+    assert normalize_query("  What is   a\nVariable? ") == "what is a variable?"
+
+
+def test_normalize_embedding():
+    assert np.allclose(normalize_embedding([3, 4]), [0.6, 0.8])
+    assert np.allclose(normalize_embedding([0, 0]), [0, 0])
+
+
+@pytest.mark.asyncio
+class TestSemanticCache:
+    async def test_similar_query_is_a_hit(self, semantic_cache_db_path):
+        cache = SemanticCache(similarity_threshold=0.9, ttl=60, max_entries=10)
+        material_hash = hash_material("material")
+
+        await cache.put(
+            1, 1, material_hash, normalize_embedding([1, 0]), {"response": "first"}
+        )
+        await cache.put(
+            1, 1, material_hash, normalize_embedding([0, 1]), {"response": "second"}
+        )
+
+        response, similarity = await cache.get(
+            1, 1, material_hash, normalize_embedding([0.1, 1])
+        )
+
+        assert response == {"response": "second"}
+        assert similarity == pytest.approx(0.995, abs=1e-3)
+
+    async def test_dissimilar_query_is_a_miss(self, semantic_cache_db_path):
+        cache = SemanticCache(similarity_threshold=0.9, ttl=60, max_entries=10)
+
+        await cache.put(1, 1, "hash", normalize_embedding([1, 0]), {"response": "a"})
+
+        response, similarity = await cache.get(
+            1, 1, "hash", normalize_embedding([1, 1])
+        )
+
+        assert response is None
+        assert similarity == pytest.approx(0.7071, abs=1e-4)
+
+    async def test_entries_are_isolated_by_org_task_and_material(
+        self, semantic_cache_db_path
+    ):
+        cache = SemanticCache(similarity_threshold=0.9, ttl=60, max_entries=10)
+        embedding = normalize_embedding([1, 0])
+
+        await cache.put(1, 1, "hash", embedding, {"response": "a"})
+
+        assert (await cache.get(2, 1, "hash", embedding))[0] is None
+        assert (await cache.get(1, 2, "hash", embedding))[0] is None
+        assert (await cache.get(1, 1, "edited", embedding))[0] is None
+        assert (await cache.get(1, 1, "hash", embedding))[0] == {"response": "a"}
+
+    @patch("api.db.semantic_cache.time.time")
+    async def test_entries_expire_after_the_ttl(
+        self, mock_time, semantic_cache_db_path
+    ):
+        cache = SemanticCache(similarity_threshold=0.9, ttl=60, max_entries=10)
+        embedding = normalize_embedding([1, 0])
+
+        mock_time.return_value = 1000
+        await cache.put(1, 1, "hash", embedding, {"response": "a"})
+
+        mock_time.return_value = 1059
+        assert (await cache.get(1, 1, "hash", embedding))[0] == {"response": "a"}
+
+        mock_time.return_value = 1060
+        assert (await cache.get(1, 1, "hash", embedding))[0] is None
+
+    @patch("api.db.semantic_cache.time.time")
+    async def test_oldest_entries_are_evicted(
+        self, mock_time, semantic_cache_db_path
+    ):
+        cache = SemanticCache(similarity_threshold=0.9, ttl=60, max_entries=2)
+
+        for index, embedding in enumerate([[1, 0], [0, 1], [-1, 0]]):
+            mock_time.return_value = 1000 + index
+            await cache.put(
+                1, 1, "hash", normalize_embedding(embedding), {"response": index}
+            )
+
+        assert (await cache.get(1, 1, "hash", normalize_embedding([1, 0])))[0] is None
+        assert (await cache.get(1, 1, "hash", normalize_embedding([0, 1])))[0] == {
+            "response": 1
+        }
+        assert (await cache.get(1, 1, "hash", normalize_embedding([-1, 0])))[0] == {
+            "response": 2
+        }
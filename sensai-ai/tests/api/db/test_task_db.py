@@ -27,7 +27,6 @@ from src.api.db.task import (
     store_task_generation_request,
     update_task_generation_job_status,
     get_course_task_generation_jobs_status,
-    get_all_pending_task_generation_jobs,
     drop_task_completions_table,
     get_all_scorecards_for_org,
     create_scorecard,
@@ -582,13 +581,17 @@ class TestTaskOperations:
         args = mock_execute.call_args[0]
         assert "UPDATE tasks" in args[0]
         assert "deleted_at" in args[0]
+        assert "json_each(?)" in args[0]
+        assert args[1][1] == "[1, 2, 3]"
 
-    @patch("src.api.db.task.execute_db_operation")
+    @patch("src.api.db.task.execute_group_committed_operations")
     async def test_mark_task_completed(self, mock_execute):
         """Test marking task as completed."""
         await mark_task_completed(1, 123)
 
-        mock_execute.assert_called_once_with(
+        mock_execute.assert_called_once()
+        commands = mock_execute.call_args[0][0]
+        assert commands[0] == (
             """
         INSERT OR IGNORE INTO task_completions (user_id, task_id)
         VALUES (?, ?)
@@ -596,6 +599,10 @@ class TestTaskOperations:
             (123, 1),
         )
 
+        # the activity rollup is updated along with the completion
+        assert "INSERT INTO daily_activity" in commands[1][0]
+        assert commands[1][1] == (None, 123, 1)
+
     @patch("src.api.db.task.execute_db_operation")
     async def test_delete_completion_history_for_task_with_task_id(self, mock_execute):
         """Test deleting completion history with task ID."""
@@ -673,7 +680,7 @@ class TestTaskOperations:
         mock_cursor.execute.assert_called_once()
         mock_conn_instance.commit.assert_called_once()
 
-    @patch("src.api.db.task.get_new_db_connection")
+    @patch("src.api.db.task.get_read_db_connection")
     async def test_get_course_task_generation_jobs_status(self, mock_db_conn):
         """Test getting course task generation jobs status."""
         mock_cursor = AsyncMock()
@@ -696,28 +703,6 @@ class TestTaskOperations:
 
         assert result == expected
 
-    @patch("src.api.db.task.get_new_db_connection")
-    async def test_get_all_pending_task_generation_jobs(self, mock_db_conn):
-        """Test getting all pending task generation jobs."""
-        mock_cursor = AsyncMock()
-        mock_cursor.fetchall.return_value = [
-            ("uuid1", '{"type": "quiz"}'),
-            ("uuid2", '{"type": "learning_material"}'),
-        ]
-        mock_conn_instance = AsyncMock()
-        mock_conn_instance.cursor.return_value = mock_cursor
-        mock_conn_instance.__aenter__.return_value = mock_conn_instance
-        mock_db_conn.return_value = mock_conn_instance
-
-        result = await get_all_pending_task_generation_jobs()
-
-        expected = [
-            {"uuid": "uuid1", "job_details": {"type": "quiz"}},
-            {"uuid": "uuid2", "job_details": {"type": "learning_material"}},
-        ]
-
-        assert result == expected
-
     @patch("src.api.db.task.get_new_db_connection")
     async def test_drop_task_completions_table(self, mock_db_conn):
         """Test dropping task completions table."""
@@ -1209,7 +1194,7 @@ class TestScorecardOperations:
         assert result == mock_scorecard
         mock_execute.assert_called_once()
 
-    @patch("src.api.db.task.execute_db_operation")
+    @patch("src.api.db.task.execute_multiple_db_operations")
     @patch("src.api.db.task.get_scorecard")
     async def test_update_scorecard(self, mock_get_scorecard, mock_execute):
         """Test updating scorecard."""
@@ -1235,6 +1220,10 @@ class TestScorecardOperations:
 
         assert result == mock_scorecard
         mock_execute.assert_called_once()
+        # the routing decisions of the questions using the scorecard are dropped
+        commands = mock_execute.call_args[0][0]
+        assert "routing_decisions" in commands[1][0]
+        assert commands[1][1] == (123,)
 
 
 @pytest.mark.asyncio
@@ -8,6 +8,7 @@ from src.api.db.user import (
     get_user_by_email,
     insert_or_return_user,
     get_user_streak_from_usage_dates,
+    get_current_streak,
     update_user_email,
     get_user_organizations,
     get_user_org_cohorts,
@@ -292,19 +293,19 @@ class TestUserDatabaseOperations:
     async def test_get_user_active_in_last_n_days_success(self, mock_execute):
         """Test successful retrieval of user activity."""
         mock_execute.return_value = [
-            ("2023-01-01", 3),
-            ("2023-01-02", 5),
-            ("2023-01-03", 2),
-        ]  # (date, count) tuples
+            ("2023-01-01",),
+            ("2023-01-02",),
+            ("2023-01-03",),
+        ]
 
         result = await get_user_active_in_last_n_days(1, 7, 1)
 
-        # Function returns a list but order isn't guaranteed since it uses a set internally
-        assert isinstance(result, list)
-        assert len(result) == 3
-        assert "2023-01-01" in result
-        assert "2023-01-02" in result
-        assert "2023-01-03" in result
+        assert result == ["2023-01-01", "2023-01-02", "2023-01-03"]
+
+        # read from the daily activity rollup
+        query, params = mock_execute.call_args[0]
+        assert "FROM daily_activity" in query
+        assert params == (1, 1, "-7 days")
 
     @patch("src.api.db.user.execute_db_operation")
     async def test_get_user_activity_for_year_success(self, mock_execute):
@@ -326,17 +327,26 @@ class TestUserDatabaseOperations:
 
     @patch("src.api.db.user.execute_db_operation")
     async def test_get_user_streak_success(self, mock_execute):
-        """Test successful calculation of user streak."""
-        mock_execute.return_value = [
-            ("2023-01-01 12:00:00",),  # Single tuple elements with timestamp strings
-            ("2023-01-02 12:00:00",),
-            ("2023-01-03 12:00:00",),
-        ]
+        """Test that the streak is read from the latest day in the activity rollup."""
+        today = datetime.now(timezone(timedelta(hours=5, minutes=30))).date()
+        yesterday = today - timedelta(days=1)
+        mock_execute.return_value = (yesterday.isoformat(), 3)
 
         result = await get_user_streak(1, 1)
 
-        # get_user_streak_from_usage_dates returns a list of date strings
-        assert isinstance(result, list)
+        assert result == [
+            (yesterday - timedelta(days=index)).isoformat() for index in range(3)
+        ]
+        query, params = mock_execute.call_args[0]
+        assert "FROM daily_activity" in query
+        assert params == (1, 1)
+        assert mock_execute.call_args[1] == {"fetch_one": True}
+
+    @patch("src.api.db.user.execute_db_operation")
+    async def test_get_user_streak_no_activity(self, mock_execute):
+        mock_execute.return_value = None
+
+        assert await get_user_streak(1, 1) == []
 
 
 class TestUserInsertOperations:
@@ -617,3 +627,26 @@ class TestUserStreakFunctions:
         # Should only include today and yesterday, then break due to gap
         assert isinstance(result, list)
         assert len(result) <= 2  # Should stop at the gap
+
+    def test_get_current_streak(self):
+        """Test that the streak ending on the last active day is expanded into its days."""
+        today = datetime.now(timezone(timedelta(hours=5, minutes=30))).date()
+
+        result = get_current_streak(today.isoformat(), 3)
+
+        assert result == [(today - timedelta(days=index)).isoformat() for index in range(3)]
+
+    def test_get_current_streak_broken(self):
+        """Test that a streak that did not continue yesterday or today is broken."""
+        today = datetime.now(timezone(timedelta(hours=5, minutes=30))).date()
+
+        assert get_current_streak((today - timedelta(days=2)).isoformat(), 10) == []
+        assert get_current_streak(None, None) == []
+
+    def test_get_current_streak_in_window(self):
+        """Test that only the days of the streak within the window are counted."""
+        today = datetime.now(timezone(timedelta(hours=5, minutes=30))).date()
+
+        assert len(get_current_streak(today.isoformat(), 10, today - timedelta(days=1))) == 2
+        assert get_current_streak(today.isoformat(), 10, today + timedelta(days=1)) == []
+        assert len(get_current_streak(today.isoformat(), 2, today - timedelta(days=5))) == 2
@@ -0,0 +1,77 @@
+from unittest.mock import patch, AsyncMock
+from fastapi.testclient import TestClient
+from src.api.routes.admin import router
+from fastapi import FastAPI
+
+# Create a test app with the admin router
+app = FastAPI()
+app.include_router(router, prefix="/admin")
+client = TestClient(app)
+
+
+class TestAdminRoutes:
+    """Test admin route endpoints."""
+
+    @patch("src.api.routes.admin.query_profiler")
+    def test_get_db_query_stats(self, mock_query_profiler):
+        """Test retrieving the query profile."""
+        mock_stats = {
+            "sample_rate": 0.1,
+            "queries": [{"fingerprint": "SELECT ?", "count": 1}],
+            "slow_queries": [],
+        }
+        mock_query_profiler.get_stats.return_value = mock_stats
+
+        response = client.get("/admin/db/query_stats")
+
+        assert response.status_code == 200
+        assert response.json() == mock_stats
+
+    @patch("src.api.routes.admin.query_profiler")
+    def test_reset_db_query_stats(self, mock_query_profiler):
+        """Test resetting the query profile."""
+        response = client.delete("/admin/db/query_stats")
+
+        assert response.status_code == 200
+        assert response.json() == {"success": True}
+        mock_query_profiler.reset.assert_called_once()
+
+    @patch("src.api.routes.admin.api_key_cache")
+    def test_get_api_key_cache_stats(self, mock_api_key_cache):
+        """Test retrieving the hit rate of the API key cache."""
+        mock_stats = {"size": 1, "hits": 3, "misses": 1, "hit_rate": 0.75}
+        mock_api_key_cache.get_stats.return_value = mock_stats
+
+        response = client.get("/admin/api_key_cache/stats")
+
+        assert response.status_code == 200
+        assert response.json() == mock_stats
+
+    @patch("src.api.routes.admin.api_key_cache")
+    def test_reset_api_key_cache_stats(self, mock_api_key_cache):
+        """Test resetting the counters of the API key cache."""
+        response = client.delete("/admin/api_key_cache/stats")
+
+        assert response.status_code == 200
+        assert response.json() == {"success": True}
+        mock_api_key_cache.reset_stats.assert_called_once()
+
+    @patch("src.api.routes.admin.routing_decision_cache")
+    def test_get_routing_cache_stats(self, mock_routing_decision_cache):
+        """Test retrieving the hit rate of the routing decision cache."""
+        mock_stats = {"size": 2, "hits": 1, "misses": 1, "hit_rate": 0.5}
+        mock_routing_decision_cache.get_stats = AsyncMock(return_value=mock_stats)
+
+        response = client.get("/admin/routing_cache/stats")
+
+        assert response.status_code == 200
+        assert response.json() == mock_stats
+
+    @patch("src.api.routes.admin.routing_decision_cache")
+    def test_reset_routing_cache_stats(self, mock_routing_decision_cache):
+        """Test resetting the counters of the routing decision cache."""
+        response = client.delete("/admin/routing_cache/stats")
+
+        assert response.status_code == 200
+        assert response.json() == {"success": True}
+        mock_routing_decision_cache.reset_stats.assert_called_once()
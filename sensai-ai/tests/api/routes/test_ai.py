@@ -0,0 +1,796 @@
+import asyncio
+import json
+import aiosqlite
+import pytest
+from unittest.mock import patch, AsyncMock
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from src.api.routes.ai import router
+from src.api.config import openai_plan_to_model_name
+from src.api.utils.concurrency import discard_task
+
+app = FastAPI()
+app.include_router(router, prefix="/ai")
+client = TestClient(app)
+
+
+class Chunk(BaseModel):
+    response: str
+
+
+class FakeLLM:
+    """Stands in for the LLM calls, with the router answering only once `router_gate` is set"""
+
+    def __init__(self, use_reasoning_model=False):
+        self.use_reasoning_model = use_reasoning_model
+        self.router_gate = None
+        self.stream_models = []
+        self.stream_messages = []
+        self.closed_streams = []
+
+    async def run(self, api_key, model, messages, response_model, **kwargs):
+        if "rewritten_query" in response_model.model_fields:
+            return response_model(rewritten_query="rewritten")
+
+        await self.router_gate.wait()
+        return response_model(use_reasoning_model=self.use_reasoning_model)
+
+    async def stream(self, api_key, model, messages, response_model, **kwargs):
+        self.stream_models.append(model)
+        self.stream_messages.append(messages)
+
+        async def generate():
+            try:
+                # the router only answers once the speculative stream has started
+                self.router_gate.set()
+                yield Chunk(response=f"from {model}")
+                yield Chunk(response=f"more from {model}")
+            finally:
+                self.closed_streams.append(model)
+
+        return generate()
+
+
+def post_learning_material_chat(**fields):
+    return client.post(
+        "/ai/chat",
+        json={
+            "user_response": "what is a variable?",
+            "task_type": "learning_material",
+            "chat_history": [],
+            "user_id": 1,
+            "task_id": 1,
+            **fields,
+        },
+    )
+
+
+@pytest.fixture
+def fake_llm():
+    fake_llm = FakeLLM()
+
+    with patch(
+        "src.api.routes.ai.get_task", new_callable=AsyncMock
+    ) as mock_get_task, patch(
+        "src.api.routes.ai.get_task_metadata", new_callable=AsyncMock
+    ) as mock_get_task_metadata, patch(
+        "src.api.routes.ai.run_llm_with_instructor", side_effect=fake_llm.run
+    ), patch(
+        "src.api.routes.ai.stream_llm_with_instructor", side_effect=fake_llm.stream
+    ), patch(
+        "src.api.routes.ai.routing_decision_cache"
+    ) as mock_routing_decision_cache, patch(
+        # the router of the fake only answers once a stream has started
+        "src.api.routes.ai.settings.chat_pipeline_enabled",
+        True,
+    ):
+        mock_get_task.return_value = {"blocks": [], "org_id": 1}
+        mock_get_task_metadata.return_value = None
+        mock_routing_decision_cache.get = AsyncMock(return_value=None)
+        mock_routing_decision_cache.put = AsyncMock()
+        fake_llm.router_gate = asyncio.Event()
+        fake_llm.routing_decision_cache = mock_routing_decision_cache
+        yield fake_llm
+
+
+QUESTION = {
+    "type": "objective",
+    "response_type": "chat",
+    "input_type": "text",
+    "blocks": [],
+    "answer": [],
+    "context": None,
+}
+
+
+def post_quiz_chat():
+    return client.post(
+        "/ai/chat",
+        json={
+            "user_response": "x = 1",
+            "task_type": "quiz",
+            "question_id": 1,
+            "user_id": 1,
+            "task_id": 1,
+        },
+    )
+
+
+class TestPipelinedChat:
+    def test_speculative_stream_is_used_when_router_picks_the_default_model(
+        self, fake_llm
+    ):
+        response = post_learning_material_chat()
+
+        assert response.status_code == 200
+        assert [json.loads(line) for line in response.text.splitlines()] == [
+            {"response": f"from {openai_plan_to_model_name['text']}"},
+            {"response": f"more from {openai_plan_to_model_name['text']}"},
+        ]
+        assert fake_llm.stream_models == [openai_plan_to_model_name["text"]]
+        messages = fake_llm.stream_messages[0]
+        assert "rewritten" in messages[-1]["content"]
+        # the reference material comes before the turns of the chat
+        assert messages[1]["content"].startswith("Reference Material:")
+
+    def test_speculative_stream_is_discarded_when_router_picks_the_reasoning_model(
+        self, fake_llm
+    ):
+        fake_llm.use_reasoning_model = True
+
+        response = post_learning_material_chat()
+
+        assert response.status_code == 200
+        assert response.text.splitlines()[0] == json.dumps(
+            {"response": f"from {openai_plan_to_model_name['reasoning']}"}
+        )
+        assert fake_llm.stream_models == [
+            openai_plan_to_model_name["text"],
+            openai_plan_to_model_name["reasoning"],
+        ]
+        assert fake_llm.closed_streams[0] == openai_plan_to_model_name["text"]
+
+    def test_sequential_mode_only_streams_the_routed_model(self, fake_llm):
+        fake_llm.use_reasoning_model = True
+        fake_llm.router_gate.set()
+
+        with patch("src.api.routes.ai.settings.chat_pipeline_enabled", False):
+            response = post_learning_material_chat()
+
+        assert response.status_code == 200
+        assert fake_llm.stream_models == [openai_plan_to_model_name["reasoning"]]
+
+    @patch("src.api.routes.ai.get_question", new_callable=AsyncMock)
+    @patch("src.api.routes.ai.get_question_chat_history_for_user", new_callable=AsyncMock)
+    def test_linked_materials_are_added_to_the_feedback_prompt(
+        self, mock_get_chat_history, mock_get_question, fake_llm
+    ):
+        fake_llm.router_gate.set()
+        mock_get_chat_history.return_value = []
+        mock_get_question.return_value = dict(
+            QUESTION, context={"linkedMaterialIds": ["2", "3"], "blocks": []}
+        )
+
+        with patch("src.api.routes.ai.get_task", new_callable=AsyncMock) as mock_get_task:
+            mock_get_task.side_effect = lambda task_id: {
+                "blocks": [
+                    {
+                        "type": "paragraph",
+                        "content": [{"type": "text", "text": f"material {task_id}"}],
+                    }
+                ]
+            }
+
+            response = post_quiz_chat()
+
+        assert response.status_code == 200
+        assert sorted(call.args for call in mock_get_task.call_args_list) == [(2,), (3,)]
+        messages = fake_llm.stream_messages[0]
+        assert messages[2]["content"].startswith("Context:")
+        assert "material 2" in messages[2]["content"]
+        assert "material 3" in messages[2]["content"]
+        assert messages[-1]["content"].startswith("Student's Response:")
+
+    def test_failed_router_is_awaited_when_the_cache_answers_first(
+        self, fake_llm, semantic_cache
+    ):
+        semantic_cache.get.return_value = ({"response": "cached"}, 0.99)
+
+        async def run(api_key, model, messages, response_model, **kwargs):
+            if "rewritten_query" in response_model.model_fields:
+                # the router has failed by the time the cache answers
+                await asyncio.sleep(0.01)
+                return response_model(rewritten_query="rewritten")
+
+            raise Exception("router failed")
+
+        with patch("src.api.routes.ai.run_llm_with_instructor", side_effect=run), patch(
+            "src.api.routes.ai.discard_task", side_effect=discard_task
+        ) as mock_discard_task:
+            response = post_learning_material_chat()
+
+        assert response.status_code == 200
+        (router_task,) = mock_discard_task.await_args.args
+        assert str(router_task.exception()) == "router failed"
+
+
+@patch("src.api.routes.ai.get_question", new_callable=AsyncMock)
+@patch("src.api.routes.ai.get_question_chat_history_for_user", new_callable=AsyncMock)
+class TestRoutingDecisionCache:
+    def test_cached_decision_skips_the_router(
+        self, mock_get_chat_history, mock_get_question, fake_llm
+    ):
+        mock_get_chat_history.return_value = []
+        mock_get_question.return_value = QUESTION
+        fake_llm.routing_decision_cache.get.return_value = True
+
+        with patch("src.api.routes.ai.run_llm_with_instructor") as mock_run_llm:
+            response = post_quiz_chat()
+
+        assert response.status_code == 200
+        mock_run_llm.assert_not_called()
+        assert fake_llm.stream_models == [openai_plan_to_model_name["reasoning"]]
+        fake_llm.routing_decision_cache.put.assert_not_called()
+
+    def test_router_decision_is_cached_per_question_content_and_turn_bucket(
+        self, mock_get_chat_history, mock_get_question, fake_llm
+    ):
+        mock_get_chat_history.return_value = [
+            {"role": "user", "content": "x = 0"},
+            {"role": "assistant", "content": json.dumps({"feedback": "Not quite"})},
+        ]
+        mock_get_question.return_value = QUESTION
+        fake_llm.use_reasoning_model = True
+
+        response = post_quiz_chat()
+
+        assert response.status_code == 200
+        question_id, content_hash, turn_bucket = (
+            fake_llm.routing_decision_cache.get.call_args.args
+        )
+        assert (question_id, turn_bucket) == (1, 1)
+        fake_llm.routing_decision_cache.put.assert_called_once_with(
+            question_id, content_hash, turn_bucket, True
+        )
+
+    def test_questions_without_an_id_are_not_cached(
+        self, mock_get_chat_history, mock_get_question, fake_llm
+    ):
+        fake_llm.router_gate.set()
+
+        response = post_learning_material_chat()
+
+        assert response.status_code == 200
+        fake_llm.routing_decision_cache.get.assert_not_called()
+        fake_llm.routing_decision_cache.put.assert_not_called()
+
+
+class Feedback(BaseModel):
+    feedback: str
+    scorecard: list
+
+
+class TestPatchStream:
+    def test_each_line_only_has_the_changes_to_the_response(self, fake_llm):
+        fake_llm.router_gate.set()
+
+        async def stream(*args, **kwargs):
+            async def generate():
+                yield Feedback(feedback="Good", scorecard=[])
+                yield Feedback(feedback="Good", scorecard=[])
+                yield Feedback(feedback="Good start", scorecard=[{"score": 1}])
+                yield Feedback(feedback="Good start", scorecard=[{"score": 2}])
+
+            return generate()
+
+        with patch("src.api.routes.ai.stream_llm_with_instructor", side_effect=stream):
+            response = post_learning_material_chat(stream_format="patch")
+
+        assert response.status_code == 200
+        # the unchanged second chunk is not sent
+        assert [json.loads(line) for line in response.text.splitlines()] == [
+            [
+                {"op": "add", "path": "/feedback", "value": "Good"},
+                {"op": "add", "path": "/scorecard", "value": []},
+            ],
+            [
+                {"op": "append", "path": "/feedback", "value": " start"},
+                {"op": "add", "path": "/scorecard/-", "value": {"score": 1}},
+            ],
+            [{"op": "replace", "path": "/scorecard/0/score", "value": 2}],
+        ]
+
+    def test_snapshots_are_streamed_by_default(self, fake_llm):
+        fake_llm.router_gate.set()
+
+        response = post_learning_material_chat(stream_format="snapshot")
+
+        assert response.status_code == 200
+        assert json.loads(response.text.splitlines()[-1]) == {
+            "response": f"more from {openai_plan_to_model_name['text']}"
+        }
+
+
+@pytest.fixture
+def semantic_cache():
+    with patch("src.api.routes.ai.settings.semantic_cache_enabled", True), patch(
+        "src.api.routes.ai.get_embedding", new_callable=AsyncMock
+    ) as mock_get_embedding, patch(
+        "src.api.routes.ai.semantic_cache"
+    ) as mock_semantic_cache:
+        mock_get_embedding.return_value = [3, 4]
+        mock_semantic_cache.get = AsyncMock(return_value=(None, 0.5))
+        mock_semantic_cache.put = AsyncMock()
+        yield mock_semantic_cache
+
+
+class TestSemanticCache:
+    def test_hit_is_replayed_without_calling_the_model(self, fake_llm, semantic_cache):
+        semantic_cache.get.return_value = ({"response": "cached"}, 0.99)
+
+        response = post_learning_material_chat()
+
+        assert response.status_code == 200
+        assert response.text == json.dumps({"response": "cached"}) + "\n"
+        assert fake_llm.stream_models == []
+        semantic_cache.put.assert_not_called()
+
+        org_id, task_id, material_hash, query_embedding = (
+            semantic_cache.get.call_args.args
+        )
+        assert (org_id, task_id) == (1, 1)
+        assert list(query_embedding) == pytest.approx([0.6, 0.8])
+
+    def test_miss_stores_the_final_response(self, fake_llm, semantic_cache):
+        response = post_learning_material_chat()
+
+        assert response.status_code == 200
+        assert fake_llm.stream_models == [openai_plan_to_model_name["text"]]
+
+        org_id, task_id, material_hash, query_embedding, stored_response = (
+            semantic_cache.put.call_args.args
+        )
+        assert (org_id, task_id) == (1, 1)
+        assert material_hash == semantic_cache.get.call_args.args[2]
+        assert stored_response == {
+            "response": f"more from {openai_plan_to_model_name['text']}"
+        }
+
+    @patch("src.api.routes.ai.get_embedding", new_callable=AsyncMock)
+    def test_failed_lookup_falls_back_to_the_model(
+        self, mock_get_embedding, fake_llm, semantic_cache
+    ):
+        mock_get_embedding.side_effect = Exception("embedding failed")
+
+        response = post_learning_material_chat()
+
+        assert response.status_code == 200
+        assert fake_llm.stream_models == [openai_plan_to_model_name["text"]]
+        semantic_cache.put.assert_not_called()
+
+    @patch("src.api.routes.ai.get_embedding", new_callable=AsyncMock)
+    def test_cache_is_opt_in(self, mock_get_embedding, fake_llm):
+        response = post_learning_material_chat()
+
+        assert response.status_code == 200
+        mock_get_embedding.assert_not_called()
+
+
+def task_generation_job(index):
+    return {
+        "uuid": f"job-{index}",
+        "course_id": 1,
+        "job_details": {
+            "task": {"id": index},
+            "concept": {},
+            "openai_file_id": "file",
+            "course_job_uuid": "course-job",
+            "course_id": 1,
+        },
+        "attempts": 1,
+    }
+
+
+@pytest.mark.asyncio
+@patch("src.api.routes.ai.get_course_task_generation_jobs_status", new_callable=AsyncMock)
+@patch("src.api.routes.ai.update_course_generation_job_status", new_callable=AsyncMock)
+@patch("src.api.routes.ai.generate_course_task", new_callable=AsyncMock)
+@patch("src.api.routes.ai.task_generation_job_queue")
+class TestTaskGenerationJobs:
+    async def run_claimed_jobs(self, mock_job_queue, jobs):
+        from src.api.routes.ai import (
+            claim_task_generation_jobs,
+            running_task_generation_jobs,
+        )
+        from api.utils.concurrency import RateLimitedScheduler
+
+        mock_job_queue.claim = AsyncMock(return_value=jobs)
+        scheduler = RateLimitedScheduler(max_concurrency=2)
+
+        with patch("src.api.routes.ai.task_generation_scheduler", scheduler):
+            await claim_task_generation_jobs()
+            await asyncio.gather(*running_task_generation_jobs)
+
+        # room for a window of jobs beyond the ones running
+        mock_job_queue.claim.assert_awaited_once_with(4)
+
+    async def test_claimed_jobs_are_run_through_the_scheduler(
+        self,
+        mock_job_queue,
+        mock_generate_course_task,
+        mock_update_course_job_status,
+        mock_get_course_jobs_status,
+    ):
+        mock_job_queue.release = AsyncMock()
+
+        await self.run_claimed_jobs(
+            mock_job_queue, [task_generation_job(index) for index in range(3)]
+        )
+
+        assert [call.args[4] for call in mock_generate_course_task.call_args_list] == [
+            "job-0",
+            "job-1",
+            "job-2",
+        ]
+        mock_job_queue.release.assert_not_awaited()
+
+    async def test_failed_job_is_released_for_another_attempt(
+        self,
+        mock_job_queue,
+        mock_generate_course_task,
+        mock_update_course_job_status,
+        mock_get_course_jobs_status,
+    ):
+        mock_generate_course_task.side_effect = Exception("failed")
+        mock_job_queue.release = AsyncMock(return_value="started")
+
+        await self.run_claimed_jobs(mock_job_queue, [task_generation_job(0)])
+
+        mock_job_queue.release.assert_awaited_once_with("job-0", "failed")
+        mock_get_course_jobs_status.assert_not_awaited()
+
+    async def test_course_is_completed_when_its_last_job_is_dead(
+        self,
+        mock_job_queue,
+        mock_generate_course_task,
+        mock_update_course_job_status,
+        mock_get_course_jobs_status,
+    ):
+        mock_generate_course_task.side_effect = Exception("failed")
+        mock_job_queue.release = AsyncMock(return_value="dead")
+        mock_get_course_jobs_status.return_value = {"completed": 2, "started": 0}
+
+        await self.run_claimed_jobs(mock_job_queue, [task_generation_job(0)])
+
+        mock_update_course_job_status.assert_awaited_once()
+        assert mock_update_course_job_status.call_args.args[0] == "course-job"
+
+
+class GeneratedItem(BaseModel):
+    name: str
+    type: str = "quiz"
+
+
+class FakeCourseStore:
+    """Stands in for `add_generated_course_items`, numbering modules from 100 and tasks from 1"""
+
+    def __init__(self):
+        self.batches = []
+        self.num_modules = 0
+        self.num_tasks = 0
+
+    async def add(self, course_id, modules, job_uuid=None):
+        self.batches.append(modules)
+        added_modules = []
+
+        for module in modules:
+            ordering = None
+            if module["id"] is None:
+                ordering = self.num_modules
+                self.num_modules += 1
+
+            tasks = []
+            for task in module["tasks"]:
+                self.num_tasks += 1
+                tasks.append((self.num_tasks, len(tasks)))
+
+            added_modules.append(
+                {
+                    "id": module["id"] or 100 + ordering,
+                    "ordering": ordering,
+                    "tasks": tasks,
+                }
+            )
+
+        return added_modules
+
+
+@pytest.fixture
+def course_store():
+    course_store = FakeCourseStore()
+
+    with patch(
+        "src.api.routes.ai.add_generated_course_items", side_effect=course_store.add
+    ), patch("src.api.routes.ai.get_manager") as mock_get_manager:
+        course_store.send_item_updates = AsyncMock()
+        mock_get_manager.return_value.send_item_updates = (
+            course_store.send_item_updates
+        )
+        yield course_store
+
+
+@pytest.mark.asyncio
+class TestCourseStructureWriter:
+    async def test_items_are_written_in_batches_of_chunks(self, course_store):
+        from src.api.routes.ai import CourseStructureWriter
+
+        writer = CourseStructureWriter(1, max_chunks=2, max_delay=60)
+
+        module = writer.add_module(GeneratedItem(name="Module"))
+        writer.chunk_done()
+        assert course_store.batches == []
+
+        first_task = writer.add_task(module, GeneratedItem(name="First"))
+        writer.chunk_done()
+        second_task = writer.add_task(module, GeneratedItem(name="Second"))
+        await writer.close()
+
+        assert len(course_store.batches) == 2
+        # the second batch adds to the module written by the first
+        assert course_store.batches[1] == [
+            {
+                "id": 100,
+                "name": "Module",
+                "color": module["color"],
+                "tasks": [second_task],
+            }
+        ]
+        assert (module["id"], first_task["id"], second_task["id"]) == (100, 1, 2)
+
+        updates = [
+            update
+            for call in course_store.send_item_updates.await_args_list
+            for update in call.args[1]
+        ]
+        assert [update["event"] for update in updates] == [
+            "module_created",
+            "task_created",
+            "task_created",
+        ]
+        assert updates[0]["module"]["ordering"] == 0
+        assert updates[2]["task"] == {
+            "id": 2,
+            "module_id": 100,
+            "ordering": 0,
+            "type": "quiz",
+            "name": "Second",
+        }
+
+    @patch("src.api.routes.ai.time.monotonic")
+    async def test_items_are_written_once_old_enough(
+        self, mock_monotonic, course_store
+    ):
+        from src.api.routes.ai import CourseStructureWriter
+
+        writer = CourseStructureWriter(1, max_chunks=100, max_delay=0.25)
+
+        mock_monotonic.return_value = 10
+        writer.add_module(GeneratedItem(name="Module"))
+        writer.chunk_done()
+
+        mock_monotonic.return_value = 10.25
+        writer.chunk_done()
+        await writer.close()
+
+        assert len(course_store.batches) == 1
+
+    async def test_nothing_is_written_after_a_failed_batch(self, course_store):
+        from src.api.routes.ai import CourseStructureWriter
+
+        writer = CourseStructureWriter(1, max_chunks=1, max_delay=60)
+
+        with patch(
+            "src.api.routes.ai.add_generated_course_items",
+            AsyncMock(side_effect=Exception("database is locked")),
+        ) as mock_add:
+            module = writer.add_module(GeneratedItem(name="Module"))
+            writer.chunk_done()
+            writer.add_task(module, GeneratedItem(name="Task"))
+            writer.chunk_done()
+
+            with pytest.raises(Exception, match="database is locked"):
+                await writer.close()
+
+        mock_add.assert_awaited_once()
+        course_store.send_item_updates.assert_not_awaited()
+
+    async def test_abort_waits_for_the_running_write_without_raising(
+        self, course_store
+    ):
+        from src.api.routes.ai import CourseStructureWriter
+
+        writer = CourseStructureWriter(1, max_chunks=1, max_delay=60)
+
+        with patch(
+            "src.api.routes.ai.add_generated_course_items",
+            AsyncMock(side_effect=Exception("database is locked")),
+        ) as mock_add:
+            module = writer.add_module(GeneratedItem(name="Module"))
+            writer.chunk_done()
+            writer.add_task(module, GeneratedItem(name="Task"))
+
+            await writer.abort()
+
+        # only the batch already being written was tried
+        mock_add.assert_awaited_once()
+        assert writer._write_task.done()
+
+
+class GeneratedTask(BaseModel):
+    name: str
+    description: str = ""
+    type: str = "quiz"
+
+
+class GeneratedConcept(BaseModel):
+    name: str
+    tasks: list[GeneratedTask]
+
+
+class GeneratedModule(BaseModel):
+    name: str
+    concepts: list[GeneratedConcept]
+
+
+class GeneratedStructure(BaseModel):
+    modules: list[GeneratedModule]
+
+
+def course_structure_stream(num_modules, fail_after=None):
+    """Streams a structure one module at a time, raising after `fail_after` of them"""
+
+    async def stream():
+        for index in range(num_modules):
+            if index == fail_after:
+                raise Exception("connection reset")
+
+            yield GeneratedStructure(
+                modules=[
+                    GeneratedModule(
+                        name=f"Module {module}",
+                        concepts=[
+                            GeneratedConcept(
+                                name="Concept",
+                                tasks=[GeneratedTask(name=f"Task {module}")],
+                            )
+                        ],
+                    )
+                    for module in range(index + 1)
+                ]
+            )
+
+    return stream()
+
+
+@pytest.mark.asyncio
+class TestCourseStructureGenerationJobs:
+    async def test_retry_after_a_failed_stream_does_not_duplicate_items(
+        self, sqlite_db
+    ):
+        from src.api.db import (
+            create_organizations_table,
+            create_courses_table,
+            create_milestones_table,
+            create_course_milestones_table,
+            create_tasks_table,
+            create_course_tasks_table,
+            create_course_generation_jobs_table,
+        )
+        from src.api.routes.ai import run_course_structure_generation_job
+
+        job_details = {
+            "course_description": "Course",
+            "intended_audience": "Learners",
+            "instructions": "",
+            "openai_file_id": "file",
+        }
+        db_path = await sqlite_db(
+            create_organizations_table,
+            create_courses_table,
+            create_milestones_table,
+            create_course_milestones_table,
+            create_tasks_table,
+            create_course_tasks_table,
+            create_course_generation_jobs_table,
+            script=f"""
+            INSERT INTO organizations (id, slug, name) VALUES (1, 'org', 'Org');
+            INSERT INTO courses (id, org_id, name) VALUES (1, 1, 'Course');
+            INSERT INTO course_generation_jobs (uuid, course_id, status, job_details) VALUES
+                ('job', 1, 'started', '{json.dumps(job_details)}');
+            """,
+        )
+
+        async def claim_job():
+            async with aiosqlite.connect(db_path) as conn:
+                cursor = await conn.execute(
+                    "SELECT job_details FROM course_generation_jobs WHERE uuid = 'job'"
+                )
+                details = json.loads((await cursor.fetchone())[0])
+
+            return {"uuid": "job", "course_id": 1, "job_details": details}
+
+        with patch(
+            "src.api.routes.ai.stream_llm_with_instructor", new_callable=AsyncMock
+        ) as mock_stream, patch(
+            "src.api.routes.ai.course_generation_job_queue"
+        ) as mock_job_queue, patch(
+            "src.api.routes.ai.get_manager"
+        ) as mock_get_manager, patch(
+            "src.api.routes.ai.settings.course_structure_write_batch_chunks", 1
+        ):
+            mock_job_queue.release = AsyncMock()
+            mock_get_manager.return_value.send_item_update = AsyncMock()
+            mock_get_manager.return_value.send_item_updates = AsyncMock()
+
+            mock_stream.return_value = course_structure_stream(3, fail_after=2)
+            await run_course_structure_generation_job(await claim_job())
+            mock_job_queue.release.assert_awaited_once_with("job", "connection reset")
+
+            mock_stream.return_value = course_structure_stream(3)
+            await run_course_structure_generation_job(await claim_job())
+
+        async with aiosqlite.connect(db_path) as conn:
+            cursor = await conn.execute(
+                """SELECT m.name FROM course_milestones cm
+                JOIN milestones m ON m.id = cm.milestone_id
+                WHERE cm.course_id = 1 ORDER BY cm.ordering"""
+            )
+            modules = [name for name, in await cursor.fetchall()]
+
+            cursor = await conn.execute(
+                """SELECT t.title FROM course_tasks ct
+                JOIN tasks t ON t.id = ct.task_id
+                WHERE ct.course_id = 1 AND t.deleted_at IS NULL ORDER BY t.id"""
+            )
+            tasks = [title for title, in await cursor.fetchall()]
+
+        assert modules == ["Module 0", "Module 1", "Module 2"]
+        assert tasks == ["Task 0", "Task 1", "Task 2"]
+
+        job = await claim_job()
+        assert "written_module_ids" not in job["job_details"]
+        assert len(job["job_details"]["course_structure"]["modules"]) == 3
+
+    async def test_failed_stream_is_reported_rather_than_a_failed_write(
+        self, course_store
+    ):
+        from src.api.routes.ai import run_course_structure_generation_job
+
+        with patch(
+            "src.api.routes.ai.stream_llm_with_instructor",
+            AsyncMock(return_value=course_structure_stream(3, fail_after=1)),
+        ), patch(
+            "src.api.routes.ai.add_generated_course_items",
+            AsyncMock(side_effect=Exception("database is locked")),
+        ), patch(
+            "src.api.routes.ai.course_generation_job_queue"
+        ) as mock_job_queue, patch(
+            "src.api.routes.ai.settings.course_structure_write_batch_chunks", 1
+        ):
+            mock_job_queue.release = AsyncMock()
+
+            await run_course_structure_generation_job(
+                {
+                    "uuid": "job",
+                    "course_id": 1,
+                    "job_details": {
+                        "course_description": "Course",
+                        "intended_audience": "Learners",
+                        "instructions": "",
+                        "openai_file_id": "file",
+                    },
+                }
+            )
+
+        mock_job_queue.release.assert_awaited_once_with("job", "connection reset")
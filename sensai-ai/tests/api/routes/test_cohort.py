@@ -1,6 +1,19 @@
 import pytest
 from fastapi import status
 from unittest.mock import patch, MagicMock
+import numpy as np
+
+
+def to_task_completion(completion_data):
+    """The task ids and learners × tasks completion matrix of per-learner completion dicts"""
+    task_ids = list(next(iter(completion_data.values())))
+    return task_ids, np.array(
+        [
+            [task_completion[task_id]["is_complete"] for task_id in task_ids]
+            for task_completion in completion_data.values()
+        ],
+        dtype=bool,
+    ).reshape(len(completion_data), len(task_ids))
 
 
 @pytest.mark.asyncio
@@ -344,8 +357,8 @@ async def test_get_leaderboard_data(client, mock_db):
     with patch(
         "api.routes.cohort.get_cohort_streaks_from_db"
     ) as mock_get_streaks, patch(
-        "api.routes.cohort.get_cohort_completion_from_db"
-    ) as mock_get_completion:
+        "api.routes.cohort.get_cohort_completion_counts_from_db"
+    ) as mock_get_completion_counts:
 
         cohort_id = 1
 
@@ -374,12 +387,8 @@ async def test_get_leaderboard_data(client, mock_db):
         ]
         mock_get_streaks.return_value = streak_data
 
-        # Mock completion data
-        completion_data = {
-            1: {"task_1": {"is_complete": True}, "task_2": {"is_complete": False}},
-            2: {"task_1": {"is_complete": True}, "task_2": {"is_complete": True}},
-        }
-        mock_get_completion.return_value = completion_data
+        # Mock the number of tasks and the tasks completed by each user
+        mock_get_completion_counts.return_value = (2, {1: 1, 2: 2})
 
         response = client.get(f"/cohorts/{cohort_id}/leaderboard")
 
@@ -387,9 +396,13 @@ async def test_get_leaderboard_data(client, mock_db):
         result = response.json()
         assert "stats" in result
         assert "metadata" in result
-        assert "num_tasks" in result["metadata"]
+        assert result["metadata"] == {"num_tasks": 2}
+        assert [
+            (user_data["user"]["id"], user_data["tasks_completed"])
+            for user_data in result["stats"]
+        ] == [(1, 1), (2, 2)]
         mock_get_streaks.assert_called_with(cohort_id=cohort_id)
-        mock_get_completion.assert_called_with(cohort_id, [1, 2])
+        mock_get_completion_counts.assert_called_with(cohort_id, [1, 2])
 
 
 @pytest.mark.asyncio
@@ -400,7 +413,7 @@ async def test_get_cohort_metrics_for_course(client, mock_db):
     with patch("api.routes.cohort.get_course_from_db") as mock_get_course, patch(
         "api.routes.cohort.get_cohort_by_id_from_db"
     ) as mock_get_cohort, patch(
-        "api.routes.cohort.get_cohort_completion_from_db"
+        "api.routes.cohort.get_cohort_task_completion_from_db"
     ) as mock_get_completion, patch(
         "api.routes.cohort.get_cohort_course_attempt_data_from_db"
     ) as mock_get_attempt_data:
@@ -434,7 +447,7 @@ async def test_get_cohort_metrics_for_course(client, mock_db):
             1: {1: {"is_complete": True}, 2: {"is_complete": False}},
             2: {1: {"is_complete": False}, 2: {"is_complete": True}},
         }
-        mock_get_completion.return_value = completion_data
+        mock_get_completion.return_value = to_task_completion(completion_data)
 
         # Mock attempt data
         attempt_data = {
@@ -457,6 +470,14 @@ async def test_get_cohort_metrics_for_course(client, mock_db):
         assert result["num_active_learners"] == 1
         # Each learner completed 1 out of 2 tasks, so average completion is 0.5
         assert result["average_completion"] == 0.5
+        assert result["task_type_metrics"] == {
+            "quiz": {"completion_rate": 0.5, "count": 1, "completions": {"1": 1, "2": 0}},
+            "learning_material": {
+                "completion_rate": 0.5,
+                "count": 1,
+                "completions": {"1": 0, "2": 1},
+            },
+        }
 
 
 @pytest.mark.asyncio
@@ -672,7 +693,7 @@ async def test_get_cohort_metrics_for_course_no_tasks(client, mock_db):
     with patch("api.routes.cohort.get_course_from_db") as mock_get_course, patch(
         "api.routes.cohort.get_cohort_by_id_from_db"
     ) as mock_get_cohort, patch(
-        "api.routes.cohort.get_cohort_completion_from_db"
+        "api.routes.cohort.get_cohort_task_completion_from_db"
     ) as mock_get_completion, patch(
         "api.routes.cohort.get_cohort_course_attempt_data_from_db"
     ) as mock_get_attempt_data:
@@ -692,7 +713,7 @@ async def test_get_cohort_metrics_for_course_no_tasks(client, mock_db):
 
         # Mock completion data with no tasks (empty for the first learner)
         completion_data = {1: {}, 2: {}}
-        mock_get_completion.return_value = completion_data
+        mock_get_completion.return_value = to_task_completion(completion_data)
 
         # Mock attempt data
         attempt_data = {
@@ -718,7 +739,7 @@ async def test_get_cohort_metrics_for_course_completed_task_not_in_metadata(
     with patch("api.routes.cohort.get_course_from_db") as mock_get_course, patch(
         "api.routes.cohort.get_cohort_by_id_from_db"
     ) as mock_get_cohort, patch(
-        "api.routes.cohort.get_cohort_completion_from_db"
+        "api.routes.cohort.get_cohort_task_completion_from_db"
     ) as mock_get_completion, patch(
         "api.routes.cohort.get_cohort_course_attempt_data_from_db"
     ) as mock_get_attempt_data:
@@ -756,7 +777,7 @@ async def test_get_cohort_metrics_for_course_completed_task_not_in_metadata(
                 },  # Task 3 does NOT exist in course metadata - triggers continue
             }
         }
-        mock_get_completion.return_value = completion_data
+        mock_get_completion.return_value = to_task_completion(completion_data)
 
         # Mock attempt data
         attempt_data = {
@@ -1,4 +1,11 @@
+import asyncio
+import gc
+import json
+import weakref
+import httpx
+import openai
 import pytest
+from instructor.exceptions import InstructorRetryException
 from unittest.mock import patch, MagicMock, AsyncMock
 from pydantic import BaseModel
 from src.api.llm import (
@@ -7,7 +14,22 @@ from src.api.llm import (
     run_llm_with_instructor,
     stream_llm_with_instructor,
     stream_llm_with_openai,
+    get_embedding,
+    assemble_messages,
+    AsyncHttpxClient,
+    OpenAIClientRegistry,
+    hash_api_key,
+    retry_unless_rate_limited,
 )
+from src.api.utils.concurrency import (
+    RateLimitedScheduler,
+    get_retry_after,
+    is_rate_limit_error,
+)
+
+
+class Answer(BaseModel):
+    text: str
 
 
 class TestIsReasoningModel:
@@ -119,17 +141,16 @@ class TestRunLlmWithInstructor:
     class MockResponseModel(BaseModel):
         response: str
 
-    @patch("src.api.llm.instructor.from_openai")
-    @patch("src.api.llm.openai.AsyncOpenAI")
+    @patch("src.api.llm.openai_clients")
     @patch("src.api.llm.is_reasoning_model")
     async def test_run_llm_with_instructor_non_reasoning(
-        self, mock_is_reasoning, mock_async_openai, mock_instructor
+        self, mock_is_reasoning, mock_openai_clients
     ):
         """Test run_llm_with_instructor with non-reasoning model."""
         # Setup mocks
         mock_is_reasoning.return_value = False
         mock_client = AsyncMock()
-        mock_instructor.return_value = mock_client
+        mock_openai_clients.get_instructor_client.return_value = mock_client
         mock_response = {"response": "test response"}
         mock_client.chat.completions.create.return_value = mock_response
 
@@ -144,25 +165,23 @@ class TestRunLlmWithInstructor:
 
         # Assertions
         assert result == mock_response
-        mock_async_openai.assert_called_once_with(api_key="test_key")
-        mock_instructor.assert_called_once()
+        mock_openai_clients.get_instructor_client.assert_called_once_with("test_key")
         mock_client.chat.completions.create.assert_called_once()
 
         # Check that temperature was set for non-reasoning model
         call_kwargs = mock_client.chat.completions.create.call_args[1]
         assert call_kwargs["temperature"] == 0
 
-    @patch("src.api.llm.instructor.from_openai")
-    @patch("src.api.llm.openai.AsyncOpenAI")
+    @patch("src.api.llm.openai_clients")
     @patch("src.api.llm.is_reasoning_model")
     async def test_run_llm_with_instructor_reasoning(
-        self, mock_is_reasoning, mock_async_openai, mock_instructor
+        self, mock_is_reasoning, mock_openai_clients
     ):
         """Test run_llm_with_instructor with reasoning model."""
         # Setup mocks
         mock_is_reasoning.return_value = True
         mock_client = AsyncMock()
-        mock_instructor.return_value = mock_client
+        mock_openai_clients.get_instructor_client.return_value = mock_client
         mock_response = {"response": "reasoning response"}
         mock_client.chat.completions.create.return_value = mock_response
 
@@ -177,8 +196,7 @@ class TestRunLlmWithInstructor:
 
         # Assertions
         assert result == mock_response
-        mock_async_openai.assert_called_once_with(api_key="test_key")
-        mock_instructor.assert_called_once()
+        mock_openai_clients.get_instructor_client.assert_called_once_with("test_key")
         mock_client.chat.completions.create.assert_called_once()
 
         # Check that temperature was NOT set for reasoning model
@@ -193,17 +211,16 @@ class TestStreamLlmWithInstructor:
     class MockResponseModel(BaseModel):
         response: str
 
-    @patch("src.api.llm.instructor.from_openai")
-    @patch("src.api.llm.openai.AsyncOpenAI")
+    @patch("src.api.llm.openai_clients")
     @patch("src.api.llm.is_reasoning_model")
     async def test_stream_llm_with_instructor_success(
-        self, mock_is_reasoning, mock_async_openai, mock_instructor
+        self, mock_is_reasoning, mock_openai_clients
     ):
         """Test stream_llm_with_instructor function."""
         # Setup mocks
         mock_is_reasoning.return_value = False
         mock_client = MagicMock()
-        mock_instructor.return_value = mock_client
+        mock_openai_clients.get_instructor_client.return_value = mock_client
         mock_stream = AsyncMock()
         mock_client.chat.completions.create_partial.return_value = mock_stream
 
@@ -219,8 +236,7 @@ class TestStreamLlmWithInstructor:
 
         # Assertions
         assert result == mock_stream
-        mock_async_openai.assert_called_once_with(api_key="test_key")
-        mock_instructor.assert_called_once()
+        mock_openai_clients.get_instructor_client.assert_called_once_with("test_key")
         mock_client.chat.completions.create_partial.assert_called_once()
 
         # Check that extra kwargs were passed
@@ -232,14 +248,14 @@ class TestStreamLlmWithInstructor:
 class TestStreamLlmWithOpenai:
     """Test the stream_llm_with_openai function."""
 
-    @patch("src.api.llm.openai.OpenAI")
+    @patch("src.api.llm.openai_clients")
     @patch("src.api.llm.is_reasoning_model")
-    def test_stream_llm_with_openai_non_reasoning(self, mock_is_reasoning, mock_openai):
+    def test_stream_llm_with_openai_non_reasoning(self, mock_is_reasoning, mock_openai_clients):
         """Test stream_llm_with_openai with non-reasoning model."""
         # Setup mocks
         mock_is_reasoning.return_value = False
         mock_client = MagicMock()
-        mock_openai.return_value = mock_client
+        mock_openai_clients.get_sync_client.return_value = mock_client
         mock_stream = MagicMock()
         mock_client.chat.completions.create.return_value = mock_stream
 
@@ -253,7 +269,7 @@ class TestStreamLlmWithOpenai:
 
         # Assertions
         assert result == mock_stream
-        mock_openai.assert_called_once_with(api_key="test_key")
+        mock_openai_clients.get_sync_client.assert_called_once_with("test_key")
         mock_client.chat.completions.create.assert_called_once()
 
         # Check that temperature was set and stream is True
@@ -261,14 +277,14 @@ class TestStreamLlmWithOpenai:
         assert call_kwargs["temperature"] == 0
         assert call_kwargs["stream"] is True
 
-    @patch("src.api.llm.openai.OpenAI")
+    @patch("src.api.llm.openai_clients")
     @patch("src.api.llm.is_reasoning_model")
-    def test_stream_llm_with_openai_reasoning(self, mock_is_reasoning, mock_openai):
+    def test_stream_llm_with_openai_reasoning(self, mock_is_reasoning, mock_openai_clients):
         """Test stream_llm_with_openai with reasoning model."""
         # Setup mocks
         mock_is_reasoning.return_value = True
         mock_client = MagicMock()
-        mock_openai.return_value = mock_client
+        mock_openai_clients.get_sync_client.return_value = mock_client
         mock_stream = MagicMock()
         mock_client.chat.completions.create.return_value = mock_stream
 
@@ -282,10 +298,408 @@ class TestStreamLlmWithOpenai:
 
         # Assertions
         assert result == mock_stream
-        mock_openai.assert_called_once_with(api_key="test_key")
+        mock_openai_clients.get_sync_client.assert_called_once_with("test_key")
         mock_client.chat.completions.create.assert_called_once()
 
         # Check that temperature was NOT set for reasoning model
         call_kwargs = mock_client.chat.completions.create.call_args[1]
         assert "temperature" not in call_kwargs
         assert call_kwargs["stream"] is True
+
+
+
+@pytest.mark.asyncio
+class TestGetEmbedding:
+    """Test the get_embedding function."""
+
+    @patch("src.api.llm.openai_clients")
+    async def test_get_embedding(self, mock_openai_clients):
+        mock_client = MagicMock()
+        mock_client.embeddings.create = AsyncMock()
+        mock_client.embeddings.create.return_value.data = [
+            MagicMock(embedding=[0.1, 0.2])
+        ]
+        mock_openai_clients.get_client.return_value = mock_client
+
+        result = await get_embedding(
+            api_key="test_key", model="text-embedding-3-small", text="hello"
+        )
+
+        assert result == [0.1, 0.2]
+        mock_openai_clients.get_client.assert_called_once_with("test_key")
+        mock_client.embeddings.create.assert_called_once_with(
+            model="text-embedding-3-small", input="hello"
+        )
+
+class TestOpenAIClientRegistry:
+    """Test the OpenAIClientRegistry class."""
+
+    def get_registry(self, http2=False):
+        return OpenAIClientRegistry(
+            max_connections=10,
+            max_keepalive_connections=5,
+            keepalive_expiry=30,
+            http2=http2,
+        )
+
+    def test_clients_are_reused_per_api_key(self):
+        registry = self.get_registry()
+
+        client = registry.get_client("key_1")
+
+        assert registry.get_client("key_1") is client
+        assert registry.get_client("key_2") is not client
+        assert client.api_key == "key_1"
+        assert registry.get_sync_client("key_1") is registry.get_sync_client("key_1")
+
+    def test_instructor_client_wraps_the_shared_client(self):
+        registry = self.get_registry()
+
+        client = registry.get_instructor_client("key_1")
+
+        assert registry.get_instructor_client("key_1") is client
+        assert client.client is registry.get_client("key_1")
+
+    @patch("src.api.llm.importlib.util.find_spec")
+    def test_http2_requires_h2(self, mock_find_spec):
+        mock_find_spec.return_value = None
+        assert self.get_registry(http2=True).http2 is False
+
+        mock_find_spec.return_value = MagicMock()
+        assert self.get_registry(http2=True).http2 is True
+        assert self.get_registry(http2=False).http2 is False
+
+    @pytest.mark.asyncio
+    async def test_close_closes_and_forgets_every_client(self):
+        registry = self.get_registry()
+        client = registry.get_client("key_1")
+        sync_client = registry.get_sync_client("key_1")
+
+        with patch.object(client, "close", new_callable=AsyncMock) as mock_close, patch.object(
+            sync_client, "close"
+        ) as mock_sync_close:
+            await registry.close()
+
+        mock_close.assert_awaited_once()
+        mock_sync_close.assert_called_once()
+        assert registry.get_client("key_1") is not client
+
+    @pytest.mark.asyncio
+    async def test_least_recently_used_key_is_evicted(self):
+        registry = OpenAIClientRegistry(
+            max_connections=10,
+            max_keepalive_connections=5,
+            keepalive_expiry=30,
+            http2=False,
+            max_keys=2,
+        )
+        client_1 = registry.get_client("key_1")
+        client_2 = registry.get_client("key_2")
+        registry.get_rate_limit_budget("key_1", "gpt-4o")
+
+        registry.get_client("key_3")
+
+        assert registry.get_client("key_2") is client_2
+        assert registry.get_client("key_1") is not client_1
+        assert len(registry._rate_limit_budgets) == 0
+
+        await registry.close()
+
+    @pytest.mark.asyncio
+    async def test_evicted_client_is_closed_only_once_its_requests_are_done(self):
+        registry = OpenAIClientRegistry(
+            max_connections=10,
+            max_keepalive_connections=5,
+            keepalive_expiry=30,
+            http2=False,
+            max_keys=1,
+        )
+        client = registry.get_client("key_1")
+        http_client = weakref.ref(client._client)
+        requested = asyncio.Event()
+        respond = asyncio.Event()
+
+        async def handler(request):
+            requested.set()
+            await respond.wait()
+            return httpx.Response(
+                200,
+                json={
+                    "id": "1",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": "gpt-4o",
+                    "choices": [],
+                },
+            )
+
+        client._client._transport = httpx.MockTransport(handler)
+        request = asyncio.create_task(
+            client.chat.completions.create(
+                model="gpt-4o", messages=[{"role": "user", "content": "hi"}]
+            )
+        )
+        await requested.wait()
+        del client
+        # the clients that earlier tests left behind
+        gc.collect()
+
+        with patch.object(
+            AsyncHttpxClient, "aclose", new_callable=AsyncMock
+        ) as mock_aclose:
+            registry.get_client("key_2")
+            gc.collect()
+            await asyncio.sleep(0)
+
+            assert http_client() is not None
+            mock_aclose.assert_not_awaited()
+
+            respond.set()
+            assert (await request).id == "1"
+
+            del request
+            gc.collect()
+            await asyncio.sleep(0)
+
+        assert http_client() is None
+        mock_aclose.assert_awaited_once()
+
+        await registry.close()
+
+    def test_clients_are_not_kept_by_the_plaintext_key(self):
+        registry = self.get_registry()
+        registry.get_client("sk-secret")
+
+        assert list(registry._clients) == [hash_api_key("sk-secret")]
+        assert "sk-secret" not in list(registry._clients)
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_headers_update_the_budget_of_the_model(self):
+        registry = self.get_registry()
+        client = registry.get_client("key_1")
+
+        def handler(request):
+            return httpx.Response(
+                200,
+                headers={
+                    "x-ratelimit-remaining-requests": "9",
+                    "x-ratelimit-reset-requests": "6s",
+                    "x-ratelimit-remaining-tokens": "1000",
+                    "x-ratelimit-reset-tokens": "1s",
+                },
+                json={
+                    "id": "1",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": "gpt-4o",
+                    "choices": [],
+                },
+            )
+
+        client._client._transport = httpx.MockTransport(handler)
+
+        await client.chat.completions.create(
+            model="gpt-4o", messages=[{"role": "user", "content": "hi"}]
+        )
+
+        budget = registry.get_rate_limit_budget("key_1", "gpt-4o")
+        assert budget.remaining_requests == 9
+        assert budget.remaining_tokens == 1000
+        assert registry.get_rate_limit_budget("key_1", "o3-mini").remaining_tokens is None
+        assert registry.get_rate_limit_budget("key_2", "gpt-4o").remaining_tokens is None
+
+    def rate_limited_transport(self, requests):
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(
+                429,
+                headers={"retry-after-ms": "1"},
+                json={"error": {"message": "Rate limit reached", "type": "requests"}},
+            )
+
+        return httpx.MockTransport(handler)
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_is_found_through_instructor_retries(self):
+        registry = self.get_registry()
+        client = registry.get_instructor_client("key_1")
+        requests = []
+        client.client._client._transport = self.rate_limited_transport(requests)
+
+        with pytest.raises(InstructorRetryException) as exception_info:
+            await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": "hi"}],
+                response_model=Answer,
+            )
+
+        # the 429s were already retried by both the OpenAI SDK and instructor
+        assert len(requests) > 1
+        assert getattr(exception_info.value, "status_code", None) is None
+        assert is_rate_limit_error(exception_info.value)
+        assert get_retry_after(exception_info.value) == 0.001
+
+        await registry.close()
+
+    @pytest.mark.asyncio
+    async def test_scheduled_instructor_client_leaves_429s_to_the_scheduler(self):
+        registry = self.get_registry()
+        client = registry.get_scheduled_instructor_client("key_1")
+        requests = []
+        registry.get_client("key_1")._client._transport = self.rate_limited_transport(
+            requests
+        )
+        scheduler = RateLimitedScheduler(max_concurrency=4, max_retries=1)
+
+        async def job():
+            return await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": "hi"}],
+                response_model=Answer,
+                max_retries=retry_unless_rate_limited(),
+            )
+
+        with pytest.raises(openai.RateLimitError):
+            await scheduler.submit(job)
+
+        # one request per attempt of the scheduler, halved by the retried one
+        assert len(requests) == 2
+        assert scheduler.concurrency == 2
+        assert registry.get_scheduled_instructor_client("key_1") is client
+
+        await registry.close()
+
+
+
+class TestAssembleMessages:
+    """Test the assemble_messages function."""
+
+    def test_static_content_comes_before_the_turns(self):
+        turns = [
+            {"role": "user", "content": "first"},
+            {"role": "assistant", "content": "reply"},
+            {"role": "user", "content": "latest"},
+        ]
+
+        messages = assemble_messages("system", ["task", "context"], turns)
+
+        assert messages == [
+            {"role": "system", "content": "system"},
+            {"role": "user", "content": "task"},
+            {"role": "user", "content": "context"},
+        ] + turns
+
+
+@pytest.mark.asyncio
+class TestPromptCacheLogging:
+    """Test that the instructor clients log the cached prompt tokens."""
+
+    class Output(BaseModel):
+        response: str
+
+    USAGE = {
+        "prompt_tokens": 2000,
+        "completion_tokens": 5,
+        "total_tokens": 2005,
+        "prompt_tokens_details": {"cached_tokens": 1920},
+    }
+
+    def get_registry(self, handler):
+        registry = OpenAIClientRegistry(
+            max_connections=10,
+            max_keepalive_connections=5,
+            keepalive_expiry=30,
+            http2=False,
+        )
+        registry.get_client("test_key")._client._transport = httpx.MockTransport(
+            handler
+        )
+        return registry
+
+    def get_tool_call(self):
+        return {
+            "id": "call",
+            "type": "function",
+            "function": {"name": "Output", "arguments": '{"response": "hi"}'},
+        }
+
+    @patch("src.api.llm.logger")
+    async def test_streamed_response(self, mock_logger):
+        requests = []
+
+        def handler(request):
+            requests.append(json.loads(request.content))
+            chunk = {"id": "1", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4.1"}
+            chunks = [
+                dict(
+                    chunk,
+                    choices=[
+                        {
+                            "index": 0,
+                            "delta": {"tool_calls": [dict(self.get_tool_call(), index=0)]},
+                            "finish_reason": None,
+                        }
+                    ],
+                ),
+                dict(chunk, choices=[], usage=self.USAGE),
+            ]
+            body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks)
+            return httpx.Response(
+                200,
+                text=body + "data: [DONE]\n\n",
+                headers={"content-type": "text/event-stream"},
+            )
+
+        with patch("src.api.llm.openai_clients", self.get_registry(handler)):
+            stream = await stream_llm_with_instructor(
+                api_key="test_key",
+                model="gpt-4.1",
+                messages=[{"role": "user", "content": "hello"}],
+                response_model=self.Output,
+                max_completion_tokens=100,
+            )
+            outputs = [output async for output in stream]
+
+        assert outputs[-1].response == "hi"
+        assert requests[0]["stream_options"] == {"include_usage": True}
+        mock_logger.info.assert_called_once_with(
+            "Prompt tokens for gpt-4.1: 2000 (1920 cached)"
+        )
+
+    @patch("src.api.llm.logger")
+    async def test_response(self, mock_logger):
+        def handler(request):
+            return httpx.Response(
+                200,
+                json={
+                    "id": "1",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": "gpt-4.1",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "tool_calls": [self.get_tool_call()],
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": self.USAGE,
+                },
+            )
+
+        with patch("src.api.llm.openai_clients", self.get_registry(handler)):
+            output = await run_llm_with_instructor(
+                api_key="test_key",
+                model="gpt-4.1",
+                messages=[{"role": "user", "content": "hello"}],
+                response_model=self.Output,
+                max_completion_tokens=100,
+            )
+
+        assert output.response == "hi"
+        mock_logger.info.assert_called_once_with(
+            "Prompt tokens for gpt-4.1: 2000 (1920 cached)"
+        )
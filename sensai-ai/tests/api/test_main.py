@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
 from fastapi.testclient import TestClient
@@ -8,29 +9,52 @@ import os
 class TestLifespan:
     """Test the lifespan context manager."""
 
+    @patch("src.api.main.openai_clients", new_callable=AsyncMock)
+    @patch("src.api.main.close_db_pool", new_callable=AsyncMock)
+    @patch("src.api.main.init_db_pool", new_callable=AsyncMock)
     @patch("src.api.main.scheduler")
     @patch("src.api.main.os.makedirs")
     @patch("src.api.main.asyncio.create_task")
     @patch("src.api.main.settings")
     async def test_lifespan_startup_and_shutdown(
-        self, mock_settings, mock_create_task, mock_makedirs, mock_scheduler
+        self,
+        mock_settings,
+        mock_create_task,
+        mock_makedirs,
+        mock_scheduler,
+        mock_init_db_pool,
+        mock_close_db_pool,
+        mock_openai_clients,
     ):
         """Test the lifespan context manager startup and shutdown."""
         from src.api.main import lifespan
 
         # Setup mocks
         mock_settings.local_upload_folder = "/test/uploads"
+        mock_settings.db_pool_size = 4
+        mock_settings.db_group_commit_window_ms = 0
         mock_app = MagicMock()
+        generation_jobs = asyncio.get_running_loop().create_future()
+
+        def create_task(coroutine):
+            coroutine.close()
+            return generation_jobs
+
+        mock_create_task.side_effect = create_task
 
         # Test the lifespan context manager
         async with lifespan(mock_app):
             # Verify startup actions
             mock_scheduler.start.assert_called_once()
+            mock_init_db_pool.assert_called_once_with(4)
             mock_makedirs.assert_called_once_with("/test/uploads", exist_ok=True)
-            assert mock_create_task.call_count == 2  # Two async tasks created
+            assert mock_create_task.call_count == 1  # the generation jobs poller
 
         # Verify shutdown actions
         mock_scheduler.shutdown.assert_called_once()
+        assert generation_jobs.cancelled()
+        mock_close_db_pool.assert_called_once()
+        mock_openai_clients.close.assert_awaited_once()
 
 
 class TestAppConfiguration:
@@ -1,3 +1,4 @@
+import json
 import pytest
 from unittest.mock import patch, AsyncMock
 from fastapi.testclient import TestClient
@@ -88,6 +89,70 @@ class TestGetAllChatHistory:
         assert response.status_code == 200
         assert response.json() == mock_chat_data
 
+    @patch("src.api.public.validate_api_key")
+    @patch("src.api.public.get_all_chat_history_from_db")
+    def test_get_all_chat_history_page(self, mock_get_chat_history, mock_validate):
+        """Test that the pagination and time filters are passed on."""
+        mock_get_chat_history.return_value = []
+
+        response = client.get(
+            "/chat_history?org_id=123&after_id=10&limit=50&since=2024-01-01T00:00:00Z",
+            headers={"api-key": "valid_key"},
+        )
+
+        assert response.status_code == 200
+        kwargs = mock_get_chat_history.call_args.kwargs
+        assert kwargs["after_id"] == 10
+        assert kwargs["limit"] == 50
+        assert kwargs["since"].isoformat() == "2024-01-01T00:00:00+00:00"
+
+    @patch("src.api.public.validate_api_key")
+    def test_get_all_chat_history_page_too_large(self, mock_validate):
+        """Test that a page cannot be larger than the maximum page size."""
+        response = client.get(
+            "/chat_history?org_id=123&limit=100000", headers={"api-key": "valid_key"}
+        )
+
+        assert response.status_code == 422
+
+    @patch("src.api.public.validate_api_key")
+    @patch("src.api.public.iterate_all_chat_history")
+    def test_get_all_chat_history_stream(self, mock_iterate, mock_validate):
+        """Test that the chat history is streamed as NDJSON."""
+        message = {
+            "id": 1,
+            "created_at": "2023-01-01T00:00:00Z",
+            "user_id": 123,
+            "question_id": 456,
+            "role": "user",
+            "content": "Hello",
+            "response_type": "text",
+            "task_id": 789,
+            "user_email": "test@example.com",
+        }
+
+        async def iterate(org_id, after_id, since, limit):
+            yield [message, {**message, "id": 2}]
+            yield [{**message, "id": 3}]
+
+        mock_iterate.side_effect = iterate
+
+        response = client.get(
+            "/chat_history?org_id=123&stream=true&after_id=0",
+            headers={"api-key": "valid_key"},
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["id"] for line in lines] == [1, 2, 3]
+        assert lines[0]["user_email"] == "test@example.com"
+        assert mock_iterate.call_args.kwargs == {
+            "after_id": 0,
+            "since": None,
+            "limit": None,
+        }
+
     @patch("src.api.public.validate_api_key")
     def test_get_all_chat_history_invalid_api_key(self, mock_validate):
         """Test chat history retrieval with invalid API key."""
@@ -113,10 +178,8 @@ class TestGetTasksForCourse:
     @patch("src.api.public.get_course_org_id")
     @patch("src.api.public.validate_api_key")
     @patch("src.api.public.get_course_from_db")
-    @patch("src.api.public.get_task_from_db")
     def test_get_tasks_for_course_success_learning_material(
         self,
-        mock_get_task,
         mock_get_course,
         mock_validate,
         mock_get_course_org_id,
@@ -148,6 +211,14 @@ class TestGetTasksForCourse:
                             "ordering": 0,
                             "num_questions": None,
                             "is_generating": False,
+                            "blocks": [
+                                {
+                                    "type": "paragraph",
+                                    "content": [
+                                        {"type": "text", "text": "block1", "styles": {}}
+                                    ],
+                                }
+                            ],
                         },
                         {
                             "id": 2,
@@ -158,6 +229,22 @@ class TestGetTasksForCourse:
                             "ordering": 1,
                             "num_questions": 1,
                             "is_generating": False,
+                            "questions": [
+                                {
+                                    "id": 1,
+                                    "type": "objective",
+                                    "blocks": [],
+                                    "answer": [],
+                                    "input_type": "text",
+                                    "response_type": "chat",
+                                    "scorecard_id": None,
+                                    "context": None,
+                                    "coding_languages": None,
+                                    "max_attempts": None,
+                                    "is_feedback_shown": True,
+                                    "title": "question",
+                                }
+                            ],
                         },
                     ],
                 }
@@ -165,38 +252,6 @@ class TestGetTasksForCourse:
         }
         mock_get_course.return_value = mock_course_data
 
-        # Mock task details
-        mock_get_task.side_effect = [
-            {
-                "id": 1,
-                "blocks": [
-                    {
-                        "type": "paragraph",
-                        "content": [{"type": "text", "text": "block1", "styles": {}}],
-                    }
-                ],
-            },  # Learning material
-            {
-                "id": 2,
-                "questions": [
-                    {
-                        "id": 1,
-                        "type": "objective",
-                        "blocks": [],
-                        "answer": [],
-                        "input_type": "text",
-                        "response_type": "chat",
-                        "scorecard_id": None,
-                        "context": None,
-                        "coding_languages": None,
-                        "max_attempts": None,
-                        "is_feedback_shown": True,
-                        "title": "question",
-                    }
-                ],
-            },  # Quiz
-        ]
-
         # Make request
         response = client.get("/course/1", headers={"api-key": "valid_key"})
 
@@ -210,6 +265,13 @@ class TestGetTasksForCourse:
         assert "questions" in result["milestones"][0]["tasks"][1]
         assert result["milestones"][0]["tasks"][1]["questions"][0]["title"] == "question"
 
+        # The whole tree is loaded in one go instead of one task at a time
+        mock_get_course.assert_called_once_with(course_id=1, include_task_details=True)
+
+        # the key is verified only once per request
+        mock_get_org_id.assert_called_once_with("valid_key")
+        mock_validate.assert_not_called()
+
     @patch("src.api.public.get_org_id_from_api_key")
     def test_get_tasks_for_course_invalid_api_key(self, mock_get_org_id):
         """Test course retrieval with invalid API key."""
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+from src.api.websockets import (
+    get_manager,
+    manager,
+    relay_generation_events,
+    stored_update_publisher,
+)
+
+
+def test_get_manager_stores_updates_when_generation_runs_in_workers():
+    with patch("src.api.websockets.settings.generation_worker_enabled", False):
+        assert get_manager() is manager
+
+    with patch("src.api.websockets.settings.generation_worker_enabled", True):
+        assert get_manager() is stored_update_publisher
+
+
+@pytest.mark.asyncio
+@patch("src.api.websockets.store_generation_event", new_callable=AsyncMock)
+async def test_stored_update_publisher(mock_store_generation_event):
+    await stored_update_publisher.send_item_update(1, {"event": "task_created"})
+
+    mock_store_generation_event.assert_awaited_once_with(1, {"event": "task_created"})
+
+
+@pytest.mark.asyncio
+@patch("src.api.websockets.settings.generation_event_poll_interval_seconds", 0)
+@patch("src.api.websockets.get_generation_events_after", new_callable=AsyncMock)
+@patch("src.api.websockets.get_last_generation_event_id", new_callable=AsyncMock)
+async def test_relay_sends_the_events_stored_since_it_started(
+    mock_get_last_event_id, mock_get_events_after
+):
+    mock_get_last_event_id.return_value = 10
+    relayed = asyncio.Event()
+    mock_get_events_after.side_effect = [
+        [(11, 1, {"event": "module_created"}), (12, 2, {"event": "task_created"})],
+        Exception("database is locked"),
+        [(13, 1, {"event": "task_completed"})],
+    ] + [[]] * 100
+
+    with patch.object(manager, "send_item_update", new_callable=AsyncMock) as mock_send:
+        mock_send.side_effect = lambda *args: (
+            relayed.set() if mock_send.await_count == 3 else None
+        )
+        relay = asyncio.create_task(relay_generation_events())
+        await asyncio.wait_for(relayed.wait(), 1)
+        relay.cancel()
+
+    assert [call.args for call in mock_send.await_args_list] == [
+        (1, {"event": "module_created"}),
+        (2, {"event": "task_created"}),
+        (1, {"event": "task_completed"}),
+    ]
+    # the failed read is retried from the last event that was sent
+    assert [call.args[0] for call in mock_get_events_after.await_args_list[:3]] == [
+        10,
+        12,
+        12,
+    ]
@@ -0,0 +1,30 @@
+import pytest
+from unittest.mock import patch, AsyncMock
+
+
+@pytest.mark.asyncio
+@patch("src.api.worker.openai_clients", new_callable=AsyncMock)
+@patch("src.api.worker.close_db_pool", new_callable=AsyncMock)
+@patch("src.api.worker.init_db_pool", new_callable=AsyncMock)
+@patch("src.api.worker.init_db", new_callable=AsyncMock)
+@patch("src.api.worker.run_generation_jobs", new_callable=AsyncMock)
+@patch("src.api.worker.settings")
+async def test_worker_runs_generation_jobs_until_they_stop(
+    mock_settings,
+    mock_run_generation_jobs,
+    mock_init_db,
+    mock_init_db_pool,
+    mock_close_db_pool,
+    mock_openai_clients,
+):
+    from src.api.worker import main
+
+    mock_settings.db_pool_size = 2
+
+    await main()
+
+    mock_init_db.assert_awaited_once()
+    mock_init_db_pool.assert_awaited_once_with(2)
+    mock_run_generation_jobs.assert_awaited_once()
+    mock_openai_clients.close.assert_awaited_once()
+    mock_close_db_pool.assert_awaited_once()
@@ -1,7 +1,17 @@
 import pytest
 import asyncio
-from unittest.mock import patch, AsyncMock
-from src.api.utils.concurrency import async_batch_gather, async_index_wrapper
+from unittest.mock import patch, AsyncMock, MagicMock
+from src.api.utils.concurrency import (
+    async_batch_gather,
+    async_index_wrapper,
+    prefetch_stream,
+    discard_task,
+    parse_rate_limit_reset,
+    get_retry_after,
+    is_rate_limit_error,
+    RateLimitBudget,
+    RateLimitedScheduler,
+)
 
 
 @pytest.mark.asyncio
@@ -95,3 +105,269 @@ class TestAsyncIndexWrapper:
 
         # Check the results
         assert result == (42, "test-value")
+
+
+@pytest.mark.asyncio
+class TestPrefetchStream:
+    async def test_prefetch_stream_starts_the_stream(self):
+        """Test that the first item is awaited before the stream is iterated."""
+        started = []
+
+        async def stream():
+            started.append(True)
+            yield 1
+            yield 2
+
+        prefetched = await prefetch_stream(stream())
+
+        assert started == [True]
+        assert [item async for item in prefetched] == [1, 2]
+
+    async def test_prefetch_stream_empty(self):
+        """Test prefetch_stream with a stream that yields nothing."""
+
+        async def stream():
+            return
+            yield
+
+        prefetched = await prefetch_stream(stream())
+
+        assert [item async for item in prefetched] == []
+
+
+@pytest.mark.asyncio
+class TestDiscardTask:
+    async def test_discard_task_cancels_a_pending_task(self):
+        """Test that a task that has not finished is cancelled."""
+        task = asyncio.create_task(asyncio.sleep(10))
+
+        await discard_task(task)
+
+        assert task.cancelled()
+
+    async def test_discard_task_closes_the_stream_of_a_finished_task(self):
+        """Test that the stream returned by a finished task is closed."""
+        closed = []
+
+        async def stream():
+            try:
+                yield 1
+                yield 2
+            finally:
+                closed.append(True)
+
+        task = asyncio.create_task(prefetch_stream(stream()))
+        await asyncio.sleep(0)
+
+        await discard_task(task)
+
+        assert closed == [True]
+
+    async def test_discard_task_ignores_errors(self):
+        """Test that the error of a failed task is not raised."""
+
+        async def fail():
+            raise ValueError("failed")
+
+        task = asyncio.create_task(fail())
+        await asyncio.sleep(0)
+
+        await discard_task(task)
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, headers=None):
+        self.response = MagicMock(headers=headers or {})
+
+
+def test_parse_rate_limit_reset():
+    assert parse_rate_limit_reset("1s") == 1
+    assert parse_rate_limit_reset("120ms") == pytest.approx(0.12)
+    assert parse_rate_limit_reset("6m0s") == 360
+    assert parse_rate_limit_reset("1h2m3.5s") == 3723.5
+    assert parse_rate_limit_reset("") == 0
+
+
+def test_get_retry_after():
+    assert get_retry_after(RateLimitError({"retry-after-ms": "1500"})) == 1.5
+    assert get_retry_after(RateLimitError({"retry-after": "2"})) == 2
+    assert get_retry_after(RateLimitError()) is None
+    assert get_retry_after(ValueError()) is None
+
+
+def test_rate_limit_error_is_found_in_the_errors_wrapping_it():
+    rate_limit_error = RateLimitError({"retry-after": "2"})
+
+    try:
+        raise RuntimeError("retries exhausted") from rate_limit_error
+    except RuntimeError as error:
+        raised_from = error
+
+    for error in [rate_limit_error, ValueError(rate_limit_error), raised_from]:
+        assert is_rate_limit_error(error)
+        assert get_retry_after(error) == 2
+
+    assert not is_rate_limit_error(ValueError("failed"))
+
+
+@patch("src.api.utils.concurrency.time.monotonic")
+class TestRateLimitBudget:
+    def test_unknown_budget_holds_nothing_back(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+
+        assert RateLimitBudget().get_delay(1000) == 0
+
+    def test_delay_until_the_window_resets(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        budget = RateLimitBudget()
+        budget.update(
+            {
+                "x-ratelimit-remaining-requests": "10",
+                "x-ratelimit-reset-requests": "1s",
+                "x-ratelimit-remaining-tokens": "20000",
+                "x-ratelimit-reset-tokens": "6s",
+            }
+        )
+
+        assert budget.get_delay(16000) == 0
+        budget.reserve(16000)
+
+        assert budget.remaining_requests == 9
+        assert budget.get_delay(16000) == 6
+
+        mock_monotonic.return_value = 106
+        assert budget.get_delay(16000) == 0
+        assert budget.remaining_tokens is None
+
+    def test_delay_when_out_of_requests(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        budget = RateLimitBudget()
+        budget.update(
+            {
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": "120ms",
+            }
+        )
+
+        assert budget.get_delay(0) == pytest.approx(0.12)
+
+
+@pytest.mark.asyncio
+class TestRateLimitedScheduler:
+    async def test_results_are_returned(self):
+        scheduler = RateLimitedScheduler(max_concurrency=2)
+
+        async def double(value):
+            return value * 2
+
+        futures = [scheduler.submit(lambda value=value: double(value)) for value in range(5)]
+
+        assert await asyncio.gather(*futures) == [0, 2, 4, 6, 8]
+        assert scheduler.running == 0
+
+    async def test_next_job_starts_as_soon_as_one_finishes(self):
+        scheduler = RateLimitedScheduler(max_concurrency=2)
+        slow = asyncio.Event()
+        started = []
+
+        async def job(name, event=None):
+            started.append(name)
+            if event is not None:
+                await event.wait()
+
+        futures = [
+            scheduler.submit(lambda: job("slow", slow)),
+            scheduler.submit(lambda: job("fast")),
+            scheduler.submit(lambda: job("next")),
+        ]
+        await asyncio.sleep(0.01)
+
+        # a fixed batch would wait for the slow job before starting the third
+        assert started == ["slow", "fast", "next"]
+        slow.set()
+        await asyncio.gather(*futures)
+
+    async def test_errors_are_set_on_the_future(self):
+        scheduler = RateLimitedScheduler(max_concurrency=2)
+
+        async def fail():
+            raise ValueError("failed")
+
+        with pytest.raises(ValueError):
+            await scheduler.submit(fail)
+
+    async def test_groups_are_taken_in_turn(self):
+        scheduler = RateLimitedScheduler(max_concurrency=1)
+        gate = asyncio.Event()
+        started = []
+
+        async def job(name):
+            started.append(name)
+            await gate.wait()
+
+        futures = [scheduler.submit(lambda: job("blocker"), group="blocker")]
+        futures += [
+            scheduler.submit(lambda index=index: job(f"large {index}"), group="large")
+            for index in range(3)
+        ]
+        futures += [
+            scheduler.submit(lambda index=index: job(f"small {index}"), group="small")
+            for index in range(2)
+        ]
+        gate.set()
+        await asyncio.gather(*futures)
+
+        assert started == [
+            "blocker",
+            "large 0",
+            "small 0",
+            "large 1",
+            "small 1",
+            "large 2",
+        ]
+
+    async def test_rate_limited_job_is_retried_after_backing_off(self):
+        scheduler = RateLimitedScheduler(max_concurrency=4)
+        attempts = []
+
+        async def job():
+            attempts.append(asyncio.get_running_loop().time())
+            if len(attempts) == 1:
+                raise RateLimitError({"retry-after-ms": "50"})
+            return "done"
+
+        assert await scheduler.submit(job) == "done"
+        assert len(attempts) == 2
+        assert attempts[1] - attempts[0] >= 0.04
+        # halved on the 429, then grown back by one
+        assert scheduler.concurrency == 3
+
+    async def test_rate_limited_job_gives_up_after_max_retries(self):
+        scheduler = RateLimitedScheduler(max_concurrency=4, max_retries=1)
+        job = AsyncMock(side_effect=RateLimitError({"retry-after": "0"}))
+
+        with pytest.raises(RateLimitError):
+            await scheduler.submit(job)
+
+        assert job.await_count == 2
+        assert scheduler.concurrency == 2
+
+    async def test_jobs_wait_for_the_rate_limit_budget(self):
+        scheduler = RateLimitedScheduler(max_concurrency=4)
+        budget = RateLimitBudget()
+        budget.update(
+            {
+                "x-ratelimit-remaining-tokens": "0",
+                "x-ratelimit-reset-tokens": "50ms",
+            }
+        )
+        loop = asyncio.get_running_loop()
+        submitted_at = loop.time()
+
+        started_at = await scheduler.submit(
+            AsyncMock(side_effect=lambda: loop.time()), budget=budget, tokens=100
+        )
+
+        assert started_at - submitted_at >= 0.04
@@ -1,3 +1,5 @@
+import asyncio
+import time
 import pytest
 import sqlite3
 import aiosqlite
@@ -10,8 +12,23 @@ from src.api.utils.db import (
     execute_multiple_db_operations,
     serialise_list_to_str,
     deserialise_list_from_str,
-    trace_callback,
+    serialise_list_to_json,
+    JSON_LIST_PLACEHOLDER,
     check_table_exists,
+    record_query,
+    DBConnectionPool,
+    DBWriter,
+    init_db_pool,
+    close_db_pool,
+    get_db_pool,
+    get_db_writer,
+    get_read_db_connection,
+    is_read_only_query,
+    GroupCommitter,
+    execute_group_committed_operations,
+    start_group_commit,
+    stop_group_commit,
+    get_group_committer,
 )
 
 
@@ -48,14 +65,61 @@ class TestSerialiseDeserialise:
         result = deserialise_list_from_str(None)
         assert result == []
 
+    def test_serialise_list_to_json(self):
+        """Test serialising any iterable to a JSON array."""
+        assert serialise_list_to_json(iter([1, 2, 3])) == "[1, 2, 3]"
+        assert serialise_list_to_json([]) == "[]"
+
+    def test_json_list_placeholder_binds_list(self):
+        """Test that a JSON list bound to the placeholder works as an IN list."""
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, email TEXT)")
+        conn.executemany(
+            "INSERT INTO t VALUES (?, ?)",
+            [(1, "a@x.com"), (2, "b@x.com"), (3, "c@x.com")],
+        )
 
-class TestTraceCallback:
-    @patch("src.api.utils.db.logger")
-    def test_trace_callback(self, mock_logger):
-        """Test that trace_callback logs SQL operations."""
-        sql = "SELECT * FROM test"
-        trace_callback(sql)
-        mock_logger.info.assert_called_once_with(f"Executing operation: {sql}")
+        query = f"SELECT id FROM t WHERE id IN {JSON_LIST_PLACEHOLDER} ORDER BY id"
+        assert conn.execute(query, (serialise_list_to_json([1, 3]),)).fetchall() == [
+            (1,),
+            (3,),
+        ]
+        assert conn.execute(query, (serialise_list_to_json([]),)).fetchall() == []
+
+        query = f"SELECT id FROM t WHERE email IN {JSON_LIST_PLACEHOLDER}"
+        assert conn.execute(
+            query, (serialise_list_to_json(["b@x.com"]),)
+        ).fetchall() == [(2,)]
+
+
+class TestRecordQuery:
+    @patch("src.api.utils.db.query_profiler")
+    def test_record_query(self, mock_profiler):
+        """Test that record_query hands the elapsed time to the profiler."""
+        record_query("SELECT * FROM test", time.perf_counter(), 3)
+
+        sql, duration, row_count = mock_profiler.record.call_args[0]
+        assert sql == "SELECT * FROM test"
+        assert 0 <= duration < 1
+        assert row_count == 3
+
+    @patch("src.api.utils.db.query_profiler")
+    @patch("src.api.utils.db.get_read_db_connection")
+    async def test_execute_db_operation_records_query(
+        self, mock_get_read_conn, mock_profiler
+    ):
+        """Test that execute_db_operation profiles the statement with its row count."""
+        mock_conn = AsyncMock()
+        mock_cursor = AsyncMock()
+        mock_cursor.fetchall.return_value = [(1,), (2,)]
+        mock_conn.cursor.return_value = mock_cursor
+        mock_get_read_conn.return_value.__aenter__.return_value = mock_conn
+
+        await execute_db_operation("SELECT id FROM t", fetch_all=True)
+
+        mock_profiler.record.assert_called_once()
+        assert mock_profiler.record.call_args[0][0] == "SELECT id FROM t"
+        assert mock_profiler.record.call_args[0][2] == 2
 
 
 @pytest.mark.asyncio
@@ -104,7 +168,6 @@ class TestDbConnections:
             assert conn == mock_conn
             # Now mock the methods used inside the context manager
             mock_conn.execute.assert_called_once_with("PRAGMA synchronous=NORMAL;")
-            mock_conn.set_trace_callback.assert_called_once()
 
         # Check that close was called after exiting the context
         mock_conn.close.assert_called_once()
@@ -274,6 +337,44 @@ class TestDbOperations:
         mock_conn.commit.assert_called_once()
 
 
+@pytest.mark.asyncio
+class TestExecuteDbOperationRouting:
+    @patch("src.api.utils.db.get_read_db_connection")
+    @patch("src.api.utils.db.get_new_db_connection")
+    async def test_select_uses_reader(self, mock_get_conn, mock_get_read_conn):
+        """Test that fetching SELECTs go to the read pool."""
+        mock_conn = AsyncMock()
+        mock_cursor = AsyncMock()
+        mock_cursor.fetchall.return_value = [(1,)]
+        mock_conn.cursor.return_value = mock_cursor
+        mock_get_read_conn.return_value.__aenter__.return_value = mock_conn
+
+        result = await execute_db_operation("SELECT id FROM t", fetch_all=True)
+
+        assert result == [(1,)]
+        mock_get_read_conn.assert_called_once()
+        mock_get_conn.assert_not_called()
+
+    @patch("src.api.utils.db.get_read_db_connection")
+    @patch("src.api.utils.db.get_new_db_connection")
+    async def test_returning_mutation_uses_writer(
+        self, mock_get_conn, mock_get_read_conn
+    ):
+        """Test that mutations go to the writer even when they fetch rows."""
+        mock_conn = AsyncMock()
+        mock_cursor = AsyncMock()
+        mock_cursor.fetchall.return_value = [(1,)]
+        mock_conn.cursor.return_value = mock_cursor
+        mock_get_conn.return_value.__aenter__.return_value = mock_conn
+
+        await execute_db_operation(
+            "UPDATE t SET x = 1 RETURNING id", fetch_all=True
+        )
+
+        mock_get_conn.assert_called_once()
+        mock_get_read_conn.assert_not_called()
+
+
 @pytest.mark.asyncio
 class TestDbConnectionExceptions:
     @patch("src.api.utils.db.aiosqlite.connect")
@@ -289,12 +390,11 @@ class TestDbConnectionExceptions:
         # Make connect return the coroutine
         mock_connect.return_value = mock_connect_coroutine()
 
-        # Make execute work normally but set_trace_callback raise an exception
-        mock_conn.execute.return_value = AsyncMock()
-        mock_conn.set_trace_callback.side_effect = Exception("Trace callback error")
+        # Make configuring the connection raise an exception
+        mock_conn.execute.side_effect = Exception("Pragma error")
 
         # Test that exception is re-raised and rollback is called
-        with pytest.raises(Exception, match="Trace callback error"):
+        with pytest.raises(Exception, match="Pragma error"):
             async with get_new_db_connection() as conn:
                 pass
 
@@ -320,6 +420,441 @@ class TestDbConnectionExceptions:
         mock_connect.assert_called_once()
 
 
+@pytest.mark.asyncio
+class TestDBConnectionPool:
+    async def test_pool_reuses_connections(self, tmp_path):
+        """Test that released connections are handed out again instead of reopened."""
+        pool = DBConnectionPool(str(tmp_path / "test.db"), size=2)
+
+        async with pool.connection() as conn_1:
+            await conn_1.execute("CREATE TABLE t (id INTEGER)")
+            await conn_1.commit()
+
+        async with pool.connection() as conn_2:
+            assert conn_2 is conn_1
+
+        assert pool.num_open == 1
+        assert pool.num_idle == 1
+
+        await pool.close()
+        assert pool.num_open == 0
+
+    async def test_pool_is_bounded(self, tmp_path):
+        """Test that acquire waits once all connections are checked out."""
+        pool = DBConnectionPool(str(tmp_path / "test.db"), size=1)
+
+        conn = await pool.acquire()
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool.acquire(), timeout=0.05)
+
+        await pool.release(conn)
+
+        assert await asyncio.wait_for(pool.acquire(), timeout=1) is conn
+
+        await pool.release(conn)
+        await pool.close()
+
+    async def test_pool_rolls_back_on_exception(self, tmp_path):
+        """Test that an exception rolls back the transaction before the connection is reused."""
+        pool = DBConnectionPool(str(tmp_path / "test.db"), size=1)
+
+        async with pool.connection() as conn:
+            await conn.execute("CREATE TABLE t (id INTEGER)")
+            await conn.commit()
+
+        with pytest.raises(ValueError):
+            async with pool.connection() as conn:
+                await conn.execute("INSERT INTO t VALUES (1)")
+                raise ValueError("boom")
+
+        async with pool.connection() as conn:
+            assert not conn.in_transaction
+            cursor = await conn.execute("SELECT COUNT(*) FROM t")
+            assert (await cursor.fetchone())[0] == 0
+
+        await pool.close()
+
+    async def test_pool_replaces_unhealthy_connection(self, tmp_path):
+        """Test that a stale connection failing the health check is replaced."""
+        pool = DBConnectionPool(
+            str(tmp_path / "test.db"), size=1, health_check_interval=0
+        )
+
+        conn = await pool.acquire()
+        await pool.release(conn)
+
+        # close it behind the pool's back so that the health check fails
+        await conn.close()
+
+        new_conn = await pool.acquire()
+        assert new_conn is not conn
+        assert pool.num_open == 1
+
+        await pool.release(new_conn)
+        await pool.close()
+
+    async def test_pool_invalid_size(self):
+        """Test that a pool must hold at least one connection."""
+        with pytest.raises(ValueError):
+            DBConnectionPool(size=0)
+
+    async def test_acquire_after_close(self, tmp_path):
+        """Test that a closed pool refuses to hand out connections."""
+        pool = DBConnectionPool(str(tmp_path / "test.db"), size=1)
+        await pool.close()
+
+        with pytest.raises(RuntimeError):
+            await pool.acquire()
+
+    async def test_read_only_pool_rejects_writes(self, tmp_path):
+        """Test that read-only pooled connections refuse to write."""
+        db_path = str(tmp_path / "test.db")
+        async with aiosqlite.connect(db_path) as conn:
+            await conn.execute("CREATE TABLE t (id INTEGER)")
+            await conn.commit()
+
+        pool = DBConnectionPool(db_path, size=1, read_only=True)
+
+        with pytest.raises(sqlite3.OperationalError):
+            async with pool.connection() as conn:
+                await conn.execute("INSERT INTO t VALUES (1)")
+
+        async with pool.connection() as conn:
+            cursor = await conn.execute("SELECT COUNT(*) FROM t")
+            assert (await cursor.fetchone())[0] == 0
+
+        await pool.close()
+
+    async def test_connections_route_to_writer_and_readers(self, tmp_path):
+        """Test that writes go through the writer and reads through the reader pool."""
+        db_path = str(tmp_path / "test.db")
+        async with aiosqlite.connect(db_path) as conn:
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("CREATE TABLE t (id INTEGER)")
+            await conn.commit()
+
+        pool = await init_db_pool(2, db_path)
+
+        try:
+            assert get_db_pool() is pool
+            assert get_db_writer().is_running
+
+            async with get_new_db_connection() as conn_1:
+                await conn_1.execute("INSERT INTO t VALUES (1)")
+                await conn_1.commit()
+
+            async with get_new_db_connection() as conn_2:
+                assert conn_2 is conn_1
+
+            async with get_read_db_connection() as read_conn:
+                assert read_conn is not conn_1
+                cursor = await read_conn.execute("SELECT COUNT(*) FROM t")
+                assert (await cursor.fetchone())[0] == 1
+        finally:
+            await close_db_pool()
+
+        assert get_db_pool() is None
+        assert get_db_writer() is None
+        assert pool.num_open == 0
+
+
+@pytest.mark.asyncio
+class TestDBWriter:
+    async def test_writer_serializes_leases(self, tmp_path):
+        """Test that only one caller holds the writer connection at a time."""
+        writer = DBWriter(str(tmp_path / "test.db"))
+        await writer.start()
+
+        events = []
+
+        async def write(name):
+            async with writer.connection():
+                events.append(f"{name}-start")
+                await asyncio.sleep(0.01)
+                events.append(f"{name}-end")
+
+        await asyncio.gather(write("a"), write("b"), write("c"))
+
+        assert events == [
+            "a-start",
+            "a-end",
+            "b-start",
+            "b-end",
+            "c-start",
+            "c-end",
+        ]
+
+        await writer.close()
+
+    async def test_writer_lease_is_reentrant(self, tmp_path):
+        """Test that a nested lease in the same task reuses the connection instead of deadlocking."""
+        writer = DBWriter(str(tmp_path / "test.db"))
+        await writer.start()
+
+        async with writer.connection() as outer:
+            async with writer.connection() as inner:
+                assert inner.in_transaction
+                assert inner._conn is outer
+
+        await writer.close()
+
+    async def test_nested_lease_cannot_commit_the_outer_transaction(self, tmp_path):
+        """Test that a commit in a nested lease leaves the outer transaction to its owner."""
+        writer = DBWriter(str(tmp_path / "test.db"))
+        await writer.start()
+
+        async with writer.connection() as conn:
+            await conn.execute("CREATE TABLE t (id INTEGER)")
+            await conn.commit()
+
+        with pytest.raises(ValueError):
+            async with writer.connection() as outer:
+                await outer.execute("INSERT INTO t VALUES (1)")
+
+                async with writer.connection() as inner:
+                    await inner.execute("INSERT INTO t VALUES (2)")
+                    await inner.commit()
+
+                raise ValueError("outer failed halfway")
+
+        async with writer.connection() as conn:
+            cursor = await conn.execute("SELECT COUNT(*) FROM t")
+            assert (await cursor.fetchone())[0] == 0
+
+        await writer.close()
+
+    async def test_nested_lease_only_rolls_back_its_own_work(self, tmp_path):
+        """Test that a failing nested lease keeps the work of the outer lease."""
+        writer = DBWriter(str(tmp_path / "test.db"))
+        await writer.start()
+
+        async with writer.connection() as conn:
+            await conn.execute("CREATE TABLE t (id INTEGER)")
+            await conn.commit()
+
+        async with writer.connection() as outer:
+            await outer.execute("INSERT INTO t VALUES (1)")
+
+            async with writer.connection() as inner:
+                await inner.execute("INSERT INTO t VALUES (2)")
+                await inner.rollback()
+
+            with pytest.raises(ValueError):
+                async with writer.connection() as inner:
+                    await inner.execute("INSERT INTO t VALUES (3)")
+                    raise ValueError("inner failed")
+
+            await outer.commit()
+
+        async with writer.connection() as conn:
+            cursor = await conn.execute("SELECT id FROM t")
+            assert await cursor.fetchall() == [(1,)]
+
+        await writer.close()
+
+    async def test_nested_lease_commits_when_the_outer_lease_has_no_transaction(
+        self, tmp_path
+    ):
+        """Test that a nested lease outside of any transaction is committed when it ends."""
+        writer = DBWriter(str(tmp_path / "test.db"))
+        await writer.start()
+
+        async with writer.connection() as conn:
+            await conn.execute("CREATE TABLE t (id INTEGER)")
+            await conn.commit()
+
+        async with writer.connection() as outer:
+            async with writer.connection() as inner:
+                await inner.execute("INSERT INTO t VALUES (1)")
+                await inner.commit()
+
+            assert not outer.in_transaction
+
+        async with writer.connection() as conn:
+            cursor = await conn.execute("SELECT COUNT(*) FROM t")
+            assert (await cursor.fetchone())[0] == 1
+
+        await writer.close()
+
+    async def test_writer_rolls_back_unfinished_transaction(self, tmp_path):
+        """Test that an uncommitted transaction is rolled back when the lease ends."""
+        writer = DBWriter(str(tmp_path / "test.db"))
+        await writer.start()
+
+        async with writer.connection() as conn:
+            await conn.execute("CREATE TABLE t (id INTEGER)")
+            await conn.commit()
+
+        async with writer.connection() as conn:
+            await conn.execute("INSERT INTO t VALUES (1)")
+
+        async with writer.connection() as conn:
+            assert not conn.in_transaction
+            cursor = await conn.execute("SELECT COUNT(*) FROM t")
+            assert (await cursor.fetchone())[0] == 0
+
+        await writer.close()
+
+    async def test_writer_skips_cancelled_waiters(self, tmp_path):
+        """Test that a caller cancelled while queued does not block later callers."""
+        writer = DBWriter(str(tmp_path / "test.db"))
+        await writer.start()
+
+        holder_entered = asyncio.Event()
+        release_holder = asyncio.Event()
+
+        async def hold():
+            async with writer.connection():
+                holder_entered.set()
+                await release_holder.wait()
+
+        async def wait_for_lease():
+            async with writer.connection():
+                pass
+
+        holder = asyncio.create_task(hold())
+        await holder_entered.wait()
+
+        waiter = asyncio.create_task(wait_for_lease())
+        await asyncio.sleep(0)
+        waiter.cancel()
+
+        release_holder.set()
+        await holder
+
+        await asyncio.wait_for(wait_for_lease(), timeout=1)
+
+        await writer.close()
+
+    async def test_writer_not_running(self, tmp_path):
+        """Test that leasing from a writer that was never started fails."""
+        writer = DBWriter(str(tmp_path / "test.db"))
+
+        with pytest.raises(RuntimeError):
+            async with writer.connection():
+                pass
+
+
+@pytest.mark.asyncio
+class TestGroupCommit:
+    @pytest.fixture
+    async def db_path(self, tmp_path):
+        db_path = str(tmp_path / "test.db")
+        async with aiosqlite.connect(db_path) as conn:
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute(
+                "CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, value TEXT UNIQUE)"
+            )
+            await conn.commit()
+
+        # undo the autouse mock so that the committer talks to the real database
+        with patch("src.api.utils.db.get_new_db_connection", get_new_db_connection):
+            await init_db_pool(1, db_path)
+            yield db_path
+            await close_db_pool()
+
+    async def test_concurrent_writes_share_a_commit(self, db_path):
+        """Test that writes arriving together are committed as one batch with their own row ids."""
+        committer = start_group_commit(0.05)
+
+        results = await asyncio.gather(
+            *[
+                execute_group_committed_operations(
+                    [
+                        ("INSERT INTO t (value) VALUES (?)", (f"{i}-a",)),
+                        ("INSERT INTO t (value) VALUES (?)", (f"{i}-b",)),
+                    ]
+                )
+                for i in range(5)
+            ]
+        )
+
+        assert committer.num_batches == 1
+        assert committer.num_units == 5
+
+        async with get_read_db_connection() as conn:
+            cursor = await conn.execute("SELECT id, value FROM t")
+            rows = dict(await cursor.fetchall())
+
+        for i, row_ids in enumerate(results):
+            assert [rows[row_id] for row_id in row_ids] == [f"{i}-a", f"{i}-b"]
+
+    async def test_failing_unit_is_isolated(self, db_path):
+        """Test that a failing unit is rolled back without affecting the rest of the batch."""
+        start_group_commit(0.05)
+
+        results = await asyncio.gather(
+            execute_group_committed_operations(
+                [("INSERT INTO t (value) VALUES (?)", ("ok-1",))]
+            ),
+            execute_group_committed_operations(
+                [
+                    ("INSERT INTO t (value) VALUES (?)", ("partial",)),
+                    ("INSERT INTO t (value) VALUES (?)", ("ok-1",)),
+                ]
+            ),
+            execute_group_committed_operations(
+                [("INSERT INTO t (value) VALUES (?)", ("ok-2",))]
+            ),
+            return_exceptions=True,
+        )
+
+        assert isinstance(results[1], sqlite3.IntegrityError)
+
+        async with get_read_db_connection() as conn:
+            cursor = await conn.execute("SELECT value FROM t ORDER BY id")
+            values = [row[0] for row in await cursor.fetchall()]
+
+        assert values == ["ok-1", "ok-2"]
+
+    async def test_stop_flushes_pending_writes(self, db_path):
+        """Test that stopping the committer commits writes that are still queued."""
+        start_group_commit(10)
+
+        pending = asyncio.create_task(
+            execute_group_committed_operations(
+                [("INSERT INTO t (value) VALUES (?)", ("queued",))]
+            )
+        )
+        await asyncio.sleep(0.01)
+
+        await stop_group_commit()
+
+        assert len(await pending) == 1
+        assert get_group_committer() is None
+
+    async def test_without_group_commit(self, db_path):
+        """Test that commands run in their own transaction when group commit is disabled."""
+        row_ids = await execute_group_committed_operations(
+            [("INSERT INTO t (value) VALUES (?)", ("solo",))]
+        )
+
+        assert row_ids == [1]
+
+    async def test_submit_when_not_running(self):
+        """Test that submitting to a committer that was never started fails."""
+        with pytest.raises(RuntimeError):
+            await GroupCommitter().submit([("SELECT 1", ())])
+
+
+class TestIsReadOnlyQuery:
+    def test_select(self):
+        assert is_read_only_query("  SELECT * FROM users WHERE updated_at > ?")
+
+    def test_cte_select(self):
+        assert is_read_only_query("WITH x AS (SELECT 1) SELECT * FROM x")
+
+    def test_cte_mutation(self):
+        assert not is_read_only_query(
+            "WITH x AS (SELECT 1) DELETE FROM users WHERE id IN x"
+        )
+
+    def test_mutations(self):
+        assert not is_read_only_query("INSERT INTO users (email) VALUES (?)")
+        assert not is_read_only_query("UPDATE tasks SET status = ? RETURNING id")
+
+
 # Test for set_db_defaults would require mocking sqlite3.connect and executescript
 # which is more complex as it's not an async function
 class TestSetDbDefaults:
@@ -0,0 +1,63 @@
+import copy
+import pytest
+from src.api.utils.json_patch import diff_json, apply_json_patch
+
+
+class TestDiffJson:
+    def test_growing_string_is_appended(self):
+        assert diff_json({"feedback": "Go"}, {"feedback": "Good"}) == [
+            {"op": "append", "path": "/feedback", "value": "od"}
+        ]
+
+    def test_changed_string_is_replaced(self):
+        assert diff_json({"feedback": "Good"}, {"feedback": "Bad"}) == [
+            {"op": "replace", "path": "/feedback", "value": "Bad"}
+        ]
+
+    def test_equal_values_have_no_operations(self):
+        value = {"feedback": "Good", "scorecard": [{"score": 1}]}
+
+        assert diff_json(value, copy.deepcopy(value)) == []
+
+    def test_booleans_are_not_numbers(self):
+        assert diff_json({"correct": 1}, {"correct": True}) == [
+            {"op": "replace", "path": "/correct", "value": True}
+        ]
+
+    def test_keys_and_items_are_added_and_removed(self):
+        assert diff_json({"a": 1, "b": [1, 2, 3]}, {"b": [1], "c": None}) == [
+            {"op": "remove", "path": "/a"},
+            {"op": "remove", "path": "/b/2"},
+            {"op": "remove", "path": "/b/1"},
+            {"op": "add", "path": "/c", "value": None},
+        ]
+
+    def test_keys_are_escaped(self):
+        assert diff_json({}, {"a/b~c": 1}) == [
+            {"op": "add", "path": "/a~1b~0c", "value": 1}
+        ]
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ({}, {"feedback": "Good", "scorecard": [{"category": "a/b", "score": 1}]}),
+        (
+            {"feedback": "Go", "scorecard": [{"category": "x", "feedback": "ok"}]},
+            {
+                "feedback": "Good",
+                "scorecard": [
+                    {"category": "x", "feedback": "okay", "score": 2},
+                    {"category": "y~z"},
+                ],
+            },
+        ),
+        ({"items": [1, 2, 3], "removed": True}, {"items": [4]}),
+        ("partial", "partial string"),
+        ([1], {"a": 1}),
+    ],
+)
+def test_apply_json_patch_rebuilds_the_new_value(old, new):
+    operations = diff_json(old, new)
+
+    assert apply_json_patch(copy.deepcopy(old), operations) == new
@@ -0,0 +1,138 @@
+import itertools
+from unittest.mock import patch
+from src.api.utils.query_profiler import (
+    QueryProfiler,
+    QueryStats,
+    fingerprint_query,
+)
+
+
+class TestFingerprintQuery:
+    def test_literals_are_normalised(self):
+        """Test that queries differing only in literal values share a fingerprint."""
+        assert fingerprint_query(
+            "SELECT * FROM tasks WHERE id = 12 AND type = 'quiz'"
+        ) == fingerprint_query("SELECT * FROM tasks WHERE id = 7 AND type = 'learning_material'")
+
+    def test_in_lists_are_collapsed(self):
+        """Test that IN lists of any length share a fingerprint."""
+        assert (
+            fingerprint_query("SELECT * FROM users WHERE id IN (1, 2, 3)")
+            == fingerprint_query("SELECT * FROM users WHERE id IN (4)")
+            == "SELECT * FROM users WHERE id IN (...)"
+        )
+
+    def test_whitespace_and_comments_are_removed(self):
+        """Test that formatting does not affect the fingerprint."""
+        assert (
+            fingerprint_query(
+                """
+            SELECT id -- the id
+            FROM   users
+            """
+            )
+            == "SELECT id FROM users"
+        )
+
+    def test_identifiers_with_digits_are_kept(self):
+        """Test that digits inside identifiers are not treated as literals."""
+        assert fingerprint_query("SELECT col_1 FROM t2") == "SELECT col_1 FROM t2"
+
+
+class TestQueryStats:
+    def test_add(self):
+        """Test that durations land in the right histogram buckets."""
+        stats = QueryStats()
+        stats.add(0.5, 2)
+        stats.add(30, None)
+        stats.add(5000, 1)
+
+        result = stats.to_dict()
+
+        assert result["count"] == 3
+        assert result["rows"] == 3
+        assert result["max_ms"] == 5000
+        assert result["histogram"]["le_1ms"] == 1
+        assert result["histogram"]["le_50ms"] == 1
+        assert result["histogram"]["inf"] == 1
+
+
+class TestQueryProfiler:
+    def test_record_groups_by_fingerprint(self):
+        """Test that statements are aggregated per fingerprint."""
+        profiler = QueryProfiler(sample_rate=1.0, slow_query_threshold_ms=1000)
+
+        profiler.record("SELECT * FROM users WHERE id = 1", 0.002, 1)
+        profiler.record("SELECT * FROM users WHERE id = 2", 0.004, 1)
+        profiler.record("DELETE FROM users WHERE id = 2", 0.001, 1)
+
+        stats = profiler.get_stats()
+
+        assert len(stats["queries"]) == 2
+        assert stats["queries"][0]["fingerprint"] == "SELECT * FROM users WHERE id = ?"
+        assert stats["queries"][0]["count"] == 2
+        assert stats["queries"][0]["total_ms"] == 6
+        assert stats["slow_queries"] == []
+
+    @patch("src.api.utils.query_profiler.random.random")
+    def test_sampling(self, mock_random):
+        """Test that statements outside the sample are skipped."""
+        profiler = QueryProfiler(sample_rate=0.1, slow_query_threshold_ms=1000)
+
+        mock_random.return_value = 0.5
+        profiler.record("SELECT 1", 0.001)
+        assert profiler.get_stats()["queries"] == []
+
+        mock_random.return_value = 0.05
+        profiler.record("SELECT 1", 0.001)
+        assert profiler.get_stats()["queries"][0]["count"] == 10
+        assert profiler.get_stats()["queries"][0]["samples"] == 1
+
+    @patch("src.api.utils.query_profiler.random.random")
+    def test_sampled_counts_are_unbiased(self, mock_random):
+        """Test that sampled fast statements are scaled up and slow ones are counted once."""
+        profiler = QueryProfiler(sample_rate=0.1, slow_query_threshold_ms=100)
+        # exactly one draw in ten falls in the sample
+        mock_random.side_effect = itertools.cycle([index / 10 + 0.05 for index in range(10)])
+
+        with patch("src.api.utils.query_profiler.logger"):
+            for _ in range(1000):
+                profiler.record("SELECT * FROM users WHERE id = 1", 0.002, 1)
+            for _ in range(100):
+                profiler.record("SELECT * FROM users WHERE id = 1", 0.2, 1)
+
+        stats = profiler.get_stats()["queries"][0]
+        assert stats["count"] == 1100
+        assert stats["samples"] == 200
+        assert stats["total_ms"] == 1000 * 2 + 100 * 200
+        assert stats["mean_ms"] == 20
+        assert stats["rows"] == 1100
+        assert stats["histogram"]["le_2ms"] == 1000
+        assert stats["histogram"]["le_250ms"] == 100
+        assert len(profiler.get_stats()["slow_queries"]) == 100
+
+    @patch("src.api.utils.query_profiler.logger")
+    def test_slow_queries_are_always_recorded(self, mock_logger):
+        """Test that slow statements bypass sampling and are logged."""
+        profiler = QueryProfiler(sample_rate=0, slow_query_threshold_ms=100)
+
+        profiler.record("SELECT * FROM chat_history WHERE user_id = 5", 0.25, 10)
+
+        stats = profiler.get_stats()
+        assert stats["queries"][0]["count"] == 1
+        assert stats["slow_queries"][0]["fingerprint"] == (
+            "SELECT * FROM chat_history WHERE user_id = ?"
+        )
+        assert stats["slow_queries"][0]["duration_ms"] == 250
+        mock_logger.warning.assert_called_once()
+
+    def test_reset(self):
+        """Test that reset clears the collected statistics."""
+        profiler = QueryProfiler(sample_rate=1.0, slow_query_threshold_ms=0)
+        profiler.record("SELECT 1", 0.001)
+
+        profiler.reset()
+
+        stats = profiler.get_stats()
+        assert stats["queries"] == []
+        assert stats["slow_queries"] == []
@@ -1,5 +1,7 @@
 import os
 import sys
+from contextlib import ExitStack
+import aiosqlite
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, AsyncMock
@@ -11,6 +13,8 @@ if root_dir not in sys.path:
     sys.path.insert(0, root_dir)
 
 from api.main import app
+from api.db.completion import completion_cache
+from api.db.api_key_cache import api_key_cache
 
 
 @pytest.fixture(autouse=True)
@@ -52,6 +56,63 @@ def mock_database_operations():
         }
 
 
+@pytest.fixture(autouse=True)
+def clear_completion_cache():
+    """
+    Auto-use fixture so that completion matrices cached by one test are not seen by the next.
+    """
+    completion_cache.clear()
+    yield
+    completion_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_api_key_cache():
+    """
+    Auto-use fixture so that API keys verified by one test are not trusted by the next.
+    """
+    api_key_cache.clear()
+    api_key_cache.reset_stats()
+    yield
+    api_key_cache.clear()
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """
+    Makes a real SQLite database for a test: `await sqlite_db(*create_tables,
+    script=..., setup=...)` creates the tables of each `create_*` function,
+    which is given a cursor, runs `setup`, which is given the connection, and
+    then the SQL `script` (e.g. the rows of the test), commits and returns the
+    path. Unless `patch_db_path` is False, `api.utils.db` connects to it for the
+    rest of the test.
+    """
+    with ExitStack() as patches:
+
+        async def create(*create_tables, script="", setup=None, patch_db_path=True):
+            db_path = str(tmp_path / "test.db")
+
+            async with aiosqlite.connect(db_path) as conn:
+                cursor = await conn.cursor()
+                for create_table in create_tables:
+                    await create_table(cursor)
+
+                if setup is not None:
+                    await setup(conn)
+
+                if script:
+                    await cursor.executescript(script)
+
+                await conn.commit()
+
+            if patch_db_path:
+                patches.enter_context(patch("api.utils.db.sqlite_db_path", db_path))
+
+            return db_path
+
+        yield create
+
+
 @pytest.fixture
 def client():
     """